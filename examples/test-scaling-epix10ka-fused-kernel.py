@@ -0,0 +1,101 @@
+"""
+Benchmark of per-event work of det.calib for epix10ka on synthetic data and configuration for <nsegs>-panel detector:
+  - configuration control bits, 7 gain range maps and np.select gathers of constants in calib_epix10ka_nda,
+    as in calib_epix10ka_v2 with fused=False
+  - config_bits check of configuration for the step, set_step_constants and calib_epix10ka_fused -
+    single-pass gather of per-step pairs of constants by data bit 14 per segment, as in calib_epix10ka_v2,
+    for config store returning the same configuration object in the step or its new wrapper for each event
+  - the same with calib_epix10ka_fused per segment in the thread pool of DetCache
+
+python Detector/examples/test-scaling-epix10ka-fused-kernel.py [<nsegs>] [<cmode>] [<nthreads>]
+python Detector/examples/test-scaling-epix10ka-fused-kernel.py 16 0 4
+"""
+import os
+import sys
+import numpy as np
+from time import time
+from Detector.GlobalUtils import info_ndarr
+import Detector.UtilsEpix10ka as ue
+from Detector.UtilsCalibCache import thread_pool
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'test'))
+from UtilsSyntheticData import synthetic_epix10ka_constants, SyntheticDetCacheEpix10ka, SyntheticDetectorEpix10ka
+
+
+def synthetic_data(nsegs=16, seed=1234):
+    """returns pixel config arrays, raw with data bit 14, peds, gfac, mask shaped as for <nsegs>-panel epix10ka"""
+    rng = np.random.default_rng(seed)
+    sh = (nsegs, 352, 384)
+    pcas = np.zeros(sh, dtype=np.uint16) # AHL with trbit=1
+    raw = rng.integers(1000, 4000, size=sh).astype(np.uint16) | (rng.choice((0,1), size=sh, p=(0.9,0.1))<<14).astype(np.uint16)
+    peds, gfac, mask = synthetic_epix10ka_constants(sh, seed)
+    return pcas, raw, peds, gfac, mask
+
+
+def gain_maps_v0(cbits, raw):
+    """7 gain range maps as in gain_maps_epix10ka_any_v0 for control bits from configuration"""
+    c = cbits | ((raw & ue.B14) >> 9)
+    return (c & 28) == 28, (c & 28) == 12, (c & 12) == 8,\
+           (c & 60) == 16, (c & 60) ==  0, (c & 60) == 48, (c & 60) == 32
+
+
+def time_per_event(f, nevents):
+    t0_sec = time()
+    for i in range(nevents): f()
+    return (time() - t0_sec)/nevents
+
+
+def test_fused_kernel(nsegs=16, cmode=0, nthreads=4, nevents=10):
+    cmps = (7, cmode, 100, 10)
+    pcas, raw, peds, gfac, mask = synthetic_data(nsegs)
+    odc = SyntheticDetCacheEpix10ka(peds, gfac, mask, cmps)
+    det = SyntheticDetectorEpix10ka(pcas, name='epix10ka-same-config-object')
+    detw = SyntheticDetectorEpix10ka(pcas, new_wrappers=True, name='epix10ka-new-config-wrappers')
+    print(info_ndarr(raw, 'raw '))
+
+    def calib_select(): # per-event work of det.calib with fused=False
+        cbits = ue.cbits_config_epix10ka_any(det.env, det.source)
+        gmap = np.array(gain_maps_v0(cbits, raw))
+        return ue.calib_epix10ka_nda(raw, gfac, peds, mask, cmps, gmap, odc.aone)
+
+    def calib_fused(det=det): # per-event work of det.calib with fused=True
+        ocb = ue.config_bits(det)
+        odc.set_step_constants(ocb)
+        return ue.calib_epix10ka_fused(raw, odc)
+
+    ref = calib_select()
+    res = calib_fused()
+    assert np.array_equal(ref, res), 'results of kernels are different'
+    print('results of kernels are identical')
+
+    dt_select = time_per_event(calib_select, nevents)
+    dt_fused = time_per_event(calib_fused, nevents)
+    calib_fused(detw) # the 1st event of the step sets step constants
+    dt_fusedw = time_per_event(lambda: calib_fused(detw), nevents)
+
+    print('nsegs: %d cmps: %s time per event (sec) config + gain maps + np.select: %.4f'%\
+          (nsegs, str(cmps), dt_select)\
+          +'\n  config check + fused: %.4f speedup: %.2f'%\
+          (dt_fused, dt_select/dt_fused)\
+          +'\n  config check for new config wrapper in each event + fused: %.4f speedup: %.2f'%\
+          (dt_fusedw, dt_select/dt_fusedw))
+
+    pool = thread_pool(odc, nthreads)
+    def calib_segs():
+        odc.set_step_constants(ue.config_bits(det))
+        pool.map(lambda i: ue.calib_epix10ka_fused(raw, odc, i), range(nsegs))
+    odc.outa[:] = 0
+    calib_segs()
+    assert np.array_equal(ref, odc.outa), 'results of per-segment threads are different'
+
+    dt_threads = time_per_event(calib_segs, nevents)
+    print('  config check + fused in %d threads: %.4f speedup: %.2f' % (nthreads, dt_threads, dt_select/dt_threads))
+
+
+if __name__ == "__main__":
+    nsegs = int(sys.argv[1]) if len(sys.argv)>1 else 16
+    cmode = int(sys.argv[2]) if len(sys.argv)>2 else 0
+    nthreads = int(sys.argv[3]) if len(sys.argv)>3 else 4
+    test_fused_kernel(nsegs, cmode, nthreads)
+    sys.exit('End of %s' % sys.argv[0])
+
+# EOF
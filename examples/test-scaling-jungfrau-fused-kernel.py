@@ -0,0 +1,64 @@
+"""
+Benchmark of jungfrau calibration kernels on synthetic data for <nsegs>-panel detector:
+  - calib_jungfrau_single_panel - np.select gathers of constants for gain ranges
+  - calib_jungfrau_fused        - single-pass gather of constants from pixel-major interleaved layout
+  - calib_jungfrau_fused per segment in the thread pool of DetCache
+
+python Detector/examples/test-scaling-jungfrau-fused-kernel.py [<nsegs>] [<cmode>] [<nthreads>]
+python Detector/examples/test-scaling-jungfrau-fused-kernel.py 8 0 4
+"""
+import os
+import sys
+import numpy as np
+from time import time
+from Detector.GlobalUtils import info_ndarr
+import Detector.UtilsJungfrau as uj
+from Detector.UtilsCalibCache import thread_pool
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'test'))
+from UtilsSyntheticData import synthetic_jungfrau, SyntheticDetCacheJungfrau
+
+
+def test_fused_kernel(nsegs=8, cmode=0, nthreads=4, nevents=20):
+    cmps = (7, cmode, 200, 10)
+    raw, poff, gfac, mask = synthetic_jungfrau(nsegs)
+    odc = SyntheticDetCacheJungfrau(poff, gfac, mask, cmps)
+    print(info_ndarr(raw, 'raw '))
+
+    ref = uj.calib_jungfrau_single_panel(raw, gfac, poff, mask, cmps)
+    res = uj.calib_jungfrau_fused(raw, odc)
+    assert np.array_equal(ref, res), 'results of kernels are different'
+    print('results of kernels are identical')
+
+    t0_sec = time()
+    for i in range(nevents): uj.calib_jungfrau_single_panel(raw, gfac, poff, mask, cmps)
+    dt_select = (time() - t0_sec)/nevents
+
+    t0_sec = time()
+    for i in range(nevents): uj.calib_jungfrau_fused(raw, odc)
+    dt_fused = (time() - t0_sec)/nevents
+
+    print('nsegs: %d cmps: %s time per event (sec) np.select: %.4f fused: %.4f speedup: %.2f'%\
+          (nsegs, str(cmps), dt_select, dt_fused, dt_select/dt_fused))
+
+    pool = thread_pool(odc, nthreads)
+    calib_segs = lambda: pool.map(lambda i: uj.calib_jungfrau_fused(raw, odc, i), range(nsegs))
+    odc.outa[:] = 0
+    calib_segs()
+    assert np.array_equal(ref, odc.outa), 'results of per-segment threads are different'
+
+    t0_sec = time()
+    for i in range(nevents): calib_segs()
+    dt_threads = (time() - t0_sec)/nevents
+
+    print('nsegs: %d cmps: %s time per event (sec) fused in %d threads: %.4f speedup: %.2f'%\
+          (nsegs, str(cmps), nthreads, dt_threads, dt_select/dt_threads))
+
+
+if __name__ == "__main__":
+    nsegs = int(sys.argv[1]) if len(sys.argv)>1 else 8
+    cmode = int(sys.argv[2]) if len(sys.argv)>2 else 0
+    nthreads = int(sys.argv[3]) if len(sys.argv)>3 else 4
+    test_fused_kernel(nsegs, cmode, nthreads)
+    sys.exit('End of %s' % sys.argv[0])
+
+# EOF
@@ -81,6 +81,12 @@ Usage::
 
     # get raw data
     nda_raw = det.raw(evt)
+    # the same in preallocated array or in reusable per-detector buffer
+    nda_raw = det.raw(evt, out=det.buffer('raw', shape, dtype=np.int16))
+
+    # out=<preallocated array> is accepted by det.raw, det.calib, det.image, det.photons
+    nda_cdata = det.calib(evt, out=det.buffer('calib', shape))
+    img = det.image(evt, out=det.buffer('image', img_shape))
 
     # get calibrated data (applied corrections: pedestals, common mode, gain mask, gain, pixel status mask)
     nda_cdata = det.calib(evt)
@@ -91,6 +97,11 @@ Usage::
     # NEW - common mode correction for pnCCD:
     nda_cdata = det.calib(evt, (8,5,500), mask=mask)
 
+    # calibrated data for a batch of events from the same run shaped as (<nevts>,) + det.shape()
+    nda_block = det.calib_batch(evts, cmpars=None, out=None, **kwargs)
+    # the same for stack of raw data shaped as (<nevts>,) + det.shape(), par defines calibration constants
+    nda_block = det.calib_batch_nda(par, nda_raws, cmpars=None, out=None, **kwargs)
+
     # common mode correction for pedestal-subtracted numpy array nda:
     det.common_mode_apply(par, nda)
     cm_corr_nda = det.common_mode_correction(par, nda)
@@ -224,8 +235,8 @@ from   PSCalib.GeometryObject import data2x2ToTwo2x1, two2x1ToData2x2
 from   Detector.PyDetectorAccess import PyDetectorAccess
 from   Detector.GlobalUtils import info_ndarr
 
-from Detector.UtilsJungfrau import calib_jungfrau_v2 # calib_jungfrau
-from Detector.UtilsEpix10ka import calib_epix10ka_v2, calib_epix10ka_any
+from Detector.UtilsJungfrau import calib_jungfrau_v2, calib_jungfrau_batch # calib_jungfrau
+from Detector.UtilsEpix10ka import calib_epix10ka_v2, calib_epix10ka_any, calib_epix10ka_batch
 
 DTYPE_MASK = gu.dic_calib_type_to_dtype[gu.PIXEL_MASK]
 
@@ -270,6 +281,37 @@ class AreaDetector():
         self.do_reshape_2d_to_3d(flag=False)    # Chuck - mandatory re-shaping 2-d to 3-d arrays
 
         self.alg_photons = None
+        self._buffers = {} # {name:np.array} - pool of reusable output buffers
+
+
+    def buffer(self, name, shape, dtype=np.float32):
+        """Returns reusable per-detector buffer for out= parameter of det.raw/calib/image/photons methods.
+
+           Buffer is allocated at first call and re-allocated if shape or dtype is changed,
+           its content is overwritten by each call of the method using it.
+
+           Parameters
+
+           - name  : str - buffer name, e.g. 'calib'.
+           - shape : tuple - buffer shape.
+           - dtype : np.dtype - buffer data type.
+
+           Returns
+
+           - np.array - buffer.
+        """
+        buf = self._buffers.get(name, None)
+        if buf is None or buf.shape != tuple(shape) or buf.dtype != dtype:
+            buf = self._buffers[name] = np.empty(shape, dtype=dtype)
+        return buf
+
+
+    def _out_(self, out, nda):
+        """Returns nda copied in out if out is specified and nda is not already in out."""
+        if out is None or nda is None or nda is out: return nda
+        if nda.size == out.size and nda.ctypes.data == out.ctypes.data: return nda
+        np.copyto(out, nda.reshape(out.shape))
+        return out
 
 
     def set_source(self, srcpar, set_sub=True):
@@ -357,6 +399,16 @@ class AreaDetector():
         self.da.setMode(0 if do_offset else 1)
 
 
+    def set_geo_cache_dir(self, dircache=None):
+        """Sets directory for on-disk cache of pixel coordinate and index arrays re-used by jobs with the same geometry.
+
+           Parameter
+
+           - dircache : str - directory name, None - arrays are not saved (default, or $DIR_GEO_CACHE)
+        """
+        self.pyda.set_geo_cache_dir(dircache)
+
+
     def runnum(self, par):
         """Returns integer run number from different options of input parameter.
 
@@ -883,12 +935,13 @@ class AreaDetector():
         return self.raw(evt)
 
 
-    def raw(self, evt):
+    def raw(self, evt, out=None):
         """Returns per-pixel array of intensities from raw data.
 
            Parameter
 
            - evt : psana.Event() - psana event object.
+           - out : np.array - optional preallocated output array, e.g. det.buffer('raw', shape, dtype=np.int16).
 
            Returns
 
@@ -901,9 +954,9 @@ class AreaDetector():
         #    elif self.dettype == gu.PNCCD   : rdata = self.da.data_uint16_3(evt, self.env)
         #    else:                             rdata = self.da.data_uint16_2(evt, self.env)
         #else:
-        rdata = self.pyda.raw_data(evt, self.env)
+        rdata = self.pyda.raw_data(evt, self.env, out)
 
-        if rdata is not None: return self._shaped_array_(self.runnum(evt), rdata)
+        if rdata is not None: return self._out_(out, self._shaped_array_(self.runnum(evt), rdata))
 
         if self.pbits:
             print('WARNING: AreaDetector.raw - data for source %s is not found in %s interface.'%\
@@ -993,7 +1046,7 @@ class AreaDetector():
         self._gain_mask_factor = gfactor
 
 
-    def calib(self, evt, cmpars=None, mbits=None, **kwargs):
+    def calib(self, evt, cmpars=None, mbits=None, out=None, **kwargs):
         """Returns per-pixel array of calibrated data intensities.
 
            Gets raw data ndarray, applys baic corrections and return thus calibrated data.
@@ -1015,6 +1068,7 @@ class AreaDetector():
                     By default uses parameters from calib directory.
                     0 - common mode is not applied.
            - mbits  : int - DEPRECATED mask control bit-word, optional.
+           - out    : np.array - optional preallocated output array dtype=np.float32, e.g. det.buffer('calib', shape).
 
            - **kwargs : dict - parameters for mask, common mode correction algorithm etc., i.e. for pnccd: cmpars=(8,5,500).
                 method mask_v2 - descriptin of mask parameters
@@ -1027,10 +1081,10 @@ class AreaDetector():
 
         if self.is_jungfrau():
             kwargs['mbits']=mbits
-            return calib_jungfrau_v2(self, evt, cmpars, **kwargs)
+            return calib_jungfrau_v2(self, evt, cmpars, out=out, **kwargs)
         if self.is_epix10ka_any():
             kwargs['mbits']=mbits
-            return calib_epix10ka_v2(self, evt, cmpars, **kwargs)
+            return calib_epix10ka_v2(self, evt, cmpars, out=out, **kwargs)
             #return calib_epix10ka_any(self, evt, cmpars, **kwargs)
 
         rnum = self.runnum(evt)
@@ -1043,7 +1097,7 @@ class AreaDetector():
         peds = self.pedestals(evt)
         if peds is None:
             if self.pbits & 32: self._print_warning('calib(...) - pedestals are missing, return raw data.')
-            return np.array(raw, dtype=np.float32, copy=True)
+            return np.array(raw, dtype=np.float32, copy=True) if out is None else self._out_(out, raw)
 
         if raw.shape != peds.shape:
             if self.pbits & 32:
@@ -1053,8 +1107,8 @@ class AreaDetector():
             try   : peds.shape = raw.shape
             except: return None
 
-        cdata = np.array(raw, dtype=np.float32, copy=True)
-        cdata -= peds  # for cspad2x2 (2, 185, 388)
+        cdata = np.empty(raw.shape, dtype=np.float32) if out is None else out.reshape(raw.shape)
+        np.subtract(raw, peds, out=cdata)  # for cspad2x2 (2, 185, 388)
 
         if self.is_cspad2x2(): cdata = two2x1ToData2x2(cdata) # convert to DAQ shape for cspad2x2 ->(185, 388, 2)
 
@@ -1091,6 +1145,116 @@ class AreaDetector():
             mask.shape = cdata.shape
             cdata *= mask
 
+        return self._out_(out, cdata)
+
+
+    def calib_batch(self, evts, cmpars=None, mbits=None, out=None, **kwargs):
+        """Returns block of calibrated data intensities for a batch of events.
+
+           Raw data of all events are collected in a single stack and calibrated by det.calib_batch_nda
+           with constants for the run of the first event.
+
+           Parameters
+
+           - evts   : list of psana.Event() - psana event objects from the same run.
+           - cmpars : list - common mode parameters, the same as in det.calib.
+           - mbits  : int - DEPRECATED mask control bit-word, optional.
+           - out    : np.array - optional preallocated output block shaped as (<nevts>,) + det.shape() dtype=np.float32.
+           - **kwargs : dict - the same as in det.calib.
+
+           Returns
+
+           - np.array - per-event per-pixel array of calibrated intensities shaped as (<nevts>,) + det.shape()
+             or None if raw data are missing for any event.
+        """
+        evts = list(evts)
+        if not evts: return None
+        raws = None
+        for i,evt in enumerate(evts):
+            raw = self.raw(evt)
+            if raw is None:
+                if self.pbits & 32: self._print_warning('calib_batch(...) - raw data are missing in event %d.' % i)
+                return None
+            if raws is None: raws = np.empty((len(evts),) + raw.shape, dtype=raw.dtype)
+            raws[i] = raw
+        return self.calib_batch_nda(evts[0], raws, cmpars, mbits, out, **kwargs)
+
+
+    def calib_batch_nda(self, par, nda_raws, cmpars=None, mbits=None, out=None, **kwargs):
+        """Returns block of calibrated data intensities for stack of raw data.
+
+           Calibration constants, mask and gain factors are retrieved once for the batch,
+           broadcasted over all frames and frames are calibrated directly in the output block.
+           Corrections are the same as in det.calib.
+
+           Parameters
+
+           - par      : int or psana.Event() - integer run number or psana event object to define constants.
+           - nda_raws : np.array - stack of raw data shaped as (<nevts>,) + det.raw(evt).shape.
+           - cmpars   : list - common mode parameters, the same as in det.calib.
+           - mbits    : int - DEPRECATED mask control bit-word, optional.
+           - out      : np.array - optional preallocated output block shaped as nda_raws dtype=np.float32.
+           - **kwargs : dict - the same as in det.calib.
+
+           Returns
+
+           - np.array - per-event per-pixel array of calibrated intensities shaped as nda_raws.
+        """
+        if nda_raws is None: return None
+
+        if self.is_jungfrau():
+            kwargs['mbits']=mbits
+            return calib_jungfrau_batch(self, par, nda_raws, cmpars, out, **kwargs)
+        if self.is_epix10ka_any():
+            kwargs['mbits']=mbits
+            return calib_epix10ka_batch(self, par, nda_raws, cmpars, out, **kwargs)
+
+        rnum = self.runnum(par)
+        shfr = nda_raws.shape[1:]
+
+        peds = self.pedestals(par)
+        if peds is None:
+            if self.pbits & 32: self._print_warning('calib_batch_nda(...) - pedestals are missing, return raw data.')
+            if out is None: return np.array(nda_raws, dtype=np.float32, copy=True)
+            out[:] = nda_raws
+            return out
+
+        if peds.shape != shfr:
+            if self.pbits & 32:
+                msg = 'calib_batch_nda(...) - raw.shape = %s is different from peds.shape = %s. Try reshaping to data...' \
+                      % (str(shfr), str(peds.shape))
+                self._print_warning(msg)
+            try   : peds = peds.reshape(shfr)
+            except: return None
+
+        cdata = np.empty(nda_raws.shape, dtype=np.float32) if out is None else out
+        np.subtract(nda_raws, peds, out=cdata)
+
+        for i in range(cdata.shape[0]):
+            frame = cdata[i]
+            if self.is_cspad2x2(): frame = two2x1ToData2x2(frame)
+            self.common_mode_apply(rnum, frame, cmpars, **kwargs)
+            if self.is_cspad2x2(): cdata[i] = data2x2ToTwo2x1(frame)
+
+        if self.is_cspad():
+            gainmask = self.gain_mask_non_zero(rnum, gain=self._gain_mask_factor)
+            if gainmask is None:
+                if self.pbits & 32: self._print_warning('calib_batch_nda(...) - gain_mask calibration in config store is missing.')
+            else:
+                cdata *= gainmask.reshape(shfr)
+
+        gain = self.gain(par)
+        if gain is None:
+            if self.pbits & 32: self._print_warning('calib_batch_nda(...) - pixel_gain calibration file is missing.')
+        else:
+            cdata *= gain.reshape(shfr)
+
+        mask = self.mask_total(par, **kwargs)
+        if mask is None:
+            if self.pbits & 32: self._print_warning('combined mask is missing.')
+        else:
+            cdata *= mask.reshape(shfr)
+
         return cdata
 
 
@@ -1607,9 +1771,11 @@ class AreaDetector():
         return self.pyda.image_yaxis(par, pix_scale_size_um, y0_off_pix)
 
 
-    def image(self, evt, nda_in=None, pix_scale_size_um=None, xy0_off_pix=None, do_update=False, **kwargs):
+    def image(self, evt, nda_in=None, pix_scale_size_um=None, xy0_off_pix=None, do_update=False, out=None, **kwargs):
         """Returns 2-d array of intensities for imaging.
 
+           Image is assembled using cached flat image indexes of pixels without intermediate copy of n-d array.
+
            Parameters
 
            - evt               : psana.Event() - psana event object.
@@ -1617,6 +1783,7 @@ class AreaDetector():
            - pix_scale_size_um : float - pixel scale size [um] which is used to convert coordinate in index.
            - xy0_off_pix       : list of floats - image (x,y) origin offset in order to make all indexes positively defined.
            - do_update         : bool - force to update cached array.
+           - out               : np.array - optional preallocated 2-d output image, dtype=np.float32 by default.
 
            Returns
 
@@ -1658,8 +1825,7 @@ class AreaDetector():
             return nda
 
         if self.is_cspad2x2(): nda = two2x1ToData2x2(nda) # convert to DAQ shape for cspad2x2
-        nda_img = np.array(nda, dtype=np.double).flatten()
-        return self._nda_or_none_(self.pyda.image(rnum, nda_img, pix_scale_size_um, xy0_off_pix, do_update))
+        return self._nda_or_none_(self.pyda.image(rnum, nda, pix_scale_size_um, xy0_off_pix, do_update, out))
 
 
     def ndarray_from_image(self, par, image, pix_scale_size_um=None, xy0_off_pix=None, do_update=False):
@@ -1737,7 +1903,7 @@ class AreaDetector():
         return self.pyda.load_txtnda(fname)
 
 
-    def photons(self, evt, nda_calib=None, mask=None, adu_per_photon=None, thr_fraction=0.9):
+    def photons(self, evt, nda_calib=None, mask=None, adu_per_photon=None, thr_fraction=0.9, out=None):
         """Returns 2-d or 3-d array of integer number of merged photons - algorithm suggested by Chuck.
 
            Parameters
@@ -1747,6 +1913,7 @@ class AreaDetector():
            - mask           : (DTYPE_MASK/np.uint8) numpy.array user defined mask.
            - adu_per_photon : float conversion factor which is applied as nda_calib/adu_per_photon.
            - thr_fraction   : float - fraction of the merged intensity which gets converted to one photon, def=0.9.
+           - out            : np.array - optional preallocated output array, the result is copied in it.
 
            Returns
 
@@ -1766,7 +1933,7 @@ class AreaDetector():
         msk = self.mask(evt, calib=True, status=True, edges=True, central=True, unbond=True, unbondnbrs=True) \
               if mask is None else mask
 
-        return self.alg_photons(nda, msk, thr_fraction)
+        return self._out_(out, self.alg_photons(nda, msk, thr_fraction))
 
 
     def shape_config(self, env):
@@ -38,6 +38,13 @@ Usage::
     img      = det.image(evt, nda_in=raw, xy0_off_pix=(550,550))
     img_at_z = det.image_at_z(evt, zplane=500000, nda_in=raw, xy0_off_pix=(550,550))
 
+    # optional processing of sub-detectors in threads and compound output buffers
+    det = AreaDetectorCompound(detnames, env, nthreads=2, use_buffers=True)
+    det.set_nthreads(2)       # sub-detector methods are called in the pool of 2 threads, 0 or 1 - sequentially
+    det.set_use_buffers(True) # results of raw, calib, pedestals, etc. are returned in reusable per-method buffers
+    calib    = det.calib(evt) # each sub-detector writes directly in its slice of the compound buffer
+    calib    = det.calib(evt, out=det.buffer('calib', shape, dtype=np.float32)) # or in explicitly specified buffer
+
 Pages about how to generate class methods dynamically
   - https://stackoverflow.com/questions/8307602/programmatically-generate-methods-for-a-class
   - https://stackoverflow.com/questions/533382/dynamic-runtime-method-creation-code-generation-in-python
@@ -61,8 +68,8 @@ from __future__ import print_function
 import sys
 import numpy as np
 
-from PSCalib.GeometryAccess import img_from_pixel_arrays
-from Detector.GlobalUtils import info_ndarr, print_ndarr
+from Detector.GlobalUtils import info_ndarr, print_ndarr, image_assembly_plan, img_from_flat_indexes
+from Detector.UtilsCalibCache import new_thread_pool
 from Detector.AreaDetector import AreaDetector # can't use just a Detector due to circular dependency
 
 
@@ -83,11 +90,16 @@ class AreaDetectorCompound(object):
 
     WRAP_METHODS_2NDA  = ['coords_xy', 'indexes_xy', 'indexes_xy_at_z']
 
+    # Subset of WRAP_METHODS_NDA with out parameter of AreaDetector methods
+    WRAP_METHODS_OUT  = ['raw', 'calib', 'photons']
+
 
-    def __init__(self, detnames, env):
+    def __init__(self, detnames, env, nthreads=0, use_buffers=False):
         """Constructor of the class:class:`AreaDetectorCompound`.
            Parameters
            - detnames: (list of str) - list of detector names, e.g. ['CxiDs2.0:Cspad.0','CxiDs2.0:Cspad.1']
+           - nthreads: (int) - number of threads to call methods of sub-detectors, 0 or 1 - sequentially
+           - use_buffers: (bool) - return results of WRAP_METHODS_NDA in reusable per-method buffers
         """
         # convert str like 'compound Jungfrau1M Jungfrau512k'
         # to the list ['Jungfrau1M', 'Jungfrau512k']
@@ -106,9 +118,66 @@ class AreaDetectorCompound(object):
         for det in self.list_dets : det.do_reshape_2d_to_3d(flag=True)
         #for det in self.list_dets : det.set_print_bits(511)
 
+        self.pool = None
+        self.pool_nthreads = 0
+        self.nthreads = nthreads
+        self.use_buffers = use_buffers
+        self._buffers = {} # {metname: buffer}
+        self._layouts = {} # {metname: (concaxis, list of sub-detector shapes, dtype)} of the last call
+        self._img_plans = {} # {name: (list of sub-detector index arrays, flat image indexes, image shape)}
+
         self.add_methods()
 
 
+    def set_nthreads(self, nthreads=0):
+        """Sets number of threads to call methods of sub-detectors, 0 or 1 - sequentially."""
+        self.nthreads = nthreads
+
+
+    def set_use_buffers(self, flag=True):
+        """On/off returning results of WRAP_METHODS_NDA in reusable per-method buffers,
+           their content is overwritten by the next call of the same method.
+        """
+        self.use_buffers = flag
+
+
+    def buffer(self, name, shape, dtype=np.float32):
+        """Returns reusable compound detector buffer, re-allocated if shape or dtype is changed, as AreaDetector.buffer."""
+        buf = self._buffers.get(name, None)
+        if buf is None or buf.shape != tuple(shape) or buf.dtype != dtype:
+            buf = self._buffers[name] = np.empty(shape, dtype=dtype)
+        return buf
+
+
+    def thread_pool(self):
+        """Returns persistent pool of self.nthreads threads, re-created if nthreads is changed, terminated at exit."""
+        if self.pool is None or self.pool_nthreads != self.nthreads:
+            if self.pool is not None: self.pool.close()
+            self.pool = new_thread_pool(self.nthreads)
+            self.pool_nthreads = self.nthreads
+        return self.pool
+
+
+    def _call_dets(self, metname, args, kwargs, outs=None):
+        """Returns list of results of method metname for sub-detectors, in the thread pool if self.nthreads>1.
+           Sub-detector i gets out=outs[i] if outs is specified.
+        """
+        def _call(i):
+            kwa = kwargs if outs is None else dict(kwargs, out=outs[i])
+            return getattr(self.list_dets[i], metname)(*args, **kwa)
+        inds = range(len(self.list_dets))
+        return self.thread_pool().map(_call, inds) if self.nthreads > 1 else [_call(i) for i in inds]
+
+
+    def _slices(self, buf, concaxis, shapes):
+        """Returns list of views of buf for sub-detectors with shapes concatenated for concaxis."""
+        i0, views = 0, []
+        for sh in shapes:
+            views.append(buf[(slice(None),)*concaxis + (slice(i0, i0+sh[concaxis]),)])
+            i0 += sh[concaxis]
+        return views
+
+
     def add_method_list(self, metname):
         """ Adds to self-class method with specified name like (for metname='raw'):
             def raw(self, *args, **kwargs) :
@@ -121,7 +190,19 @@ class AreaDetectorCompound(object):
 
     def add_method_nda(self, metname):
         def _prototype(*args, **kwargs) :
-            list_nda=[getattr(o, metname)(*args, **kwargs) for o in self.list_dets]
+            out = kwargs.pop('out', None)
+            lay = self._layouts.get(metname, None)
+            if metname in self.WRAP_METHODS_OUT and lay is not None and (out is not None or self.use_buffers):
+                # sub-detectors write directly in their slices of the compound buffer
+                concaxis, shapes, dtype = lay
+                shape = list(shapes[0])
+                shape[concaxis] = sum(sh[concaxis] for sh in shapes)
+                buf = out if out is not None else self.buffer(metname, shape, dtype)
+                if buf.shape == tuple(shape) and buf.flags.c_contiguous:
+                    list_nda = self._call_dets(metname, args, kwargs, self._slices(buf, concaxis, shapes))
+                    if any(nda is None for nda in list_nda): return None
+                    if all(nda.shape == sh for nda, sh in zip(list_nda, shapes)): return buf
+            list_nda = self._call_dets(metname, args, kwargs)
             #for i,nda in enumerate(list_nda) : print('  XXX add_method_nda det:%d shape = %s' % (i,str(nda.shape)))
             # ATTENTION !!! IMPORTANT for Jungfrau, Epix, etc. multi-gain detectors)
             # concatinate for index preceding the 2d shape
@@ -129,13 +210,22 @@ class AreaDetectorCompound(object):
             # --- raw          (2, 512, 1024) (+)    (1, 512, 1024) (=)    (3, 512, 1024)
             # --- pedestals (3, 2, 512, 1024) (+) (3, 1, 512, 1024) (=) (3, 3, 512, 1024)
             concaxis = list_nda[0].ndim - 3
-            return np.concatenate(list_nda, axis=concaxis) # concatinates for axis=0, other dimensions should be the same...
+            if out is None and not self.use_buffers:
+                return np.concatenate(list_nda, axis=concaxis) # concatinates for axis=0, other dimensions should be the same...
+            shapes = [nda.shape for nda in list_nda]
+            dtype = np.result_type(*list_nda)
+            self._layouts[metname] = (concaxis, shapes, dtype)
+            if out is None:
+                shape = list(shapes[0])
+                shape[concaxis] = sum(sh[concaxis] for sh in shapes)
+                out = self.buffer(metname, shape, dtype)
+            return np.concatenate(list_nda, axis=concaxis, out=out)
         setattr(self, metname, _prototype)
 
 
     def add_method_double_nda(self, metname):
         def _prototype(*args, **kwargs) :
-            list_double_nda=[getattr(o, metname)(*args, **kwargs) for o in self.list_dets]
+            list_double_nda = self._call_dets(metname, args, kwargs)
             list_nda0 = [v[0] for v in list_double_nda]
             list_nda1 = [v[1] for v in list_double_nda]
             concaxis = list_nda0[0].ndim - 3
@@ -152,40 +242,56 @@ class AreaDetectorCompound(object):
 
 
     #def image(self, *args, **kwargs) :
-    def image(self, evt, nda_in=None, pix_scale_size_um=None, xy0_off_pix=None, do_update=False) :
-        """ returns 2d image for compound detector (consisting of two or more regular Detectors).
+    def image(self, evt, nda_in=None, pix_scale_size_um=None, xy0_off_pix=None, do_update=False, out=None) :
+        """ returns 2d image for compound detector (consisting of two or more regular Detectors),
+            assembled with image plan cached for index arrays of sub-detectors, out - optional 2-d output buffer.
             NOTICE:
                - xy0_off_pix=(VERT,HORIZ) on regular image
                - do_update=True is required if indexes_x/y were called earlier with different xy0_off_pix
         """
         #ix = self.indexes_x(evt, pix_scale_size_um, xy0_off_pix, do_update)
         #iy = self.indexes_y(evt, pix_scale_size_um, xy0_off_pix, do_update)
-        ix, iy = self.indexes_xy(evt, pix_scale_size_um, xy0_off_pix, do_update)
+        #ix, iy = self.indexes_xy(evt, pix_scale_size_um, xy0_off_pix, do_update)
+        list_ixy = [o.indexes_xy(evt, pix_scale_size_um, xy0_off_pix, do_update) for o in self.list_dets]
+        inds, shape = self._image_plan('image', list_ixy)
 
         if False :
             el_begin, el_end = 1000, 1005
             print_ndarr(nda_in, name='image nda_in', first=el_begin, last=el_end)
-            print_ndarr(ix,     name='image ix    ', first=el_begin, last=el_end)
-            print_ndarr(iy,     name='image iy    ', first=el_begin, last=el_end)
+            print_ndarr(inds,   name='image inds  ', first=el_begin, last=el_end)
+
+        return img_from_flat_indexes(inds, shape, nda_in, out)
 
-        return img_from_pixel_arrays(ix, iy, nda_in)
+
+    def _image_plan(self, name, list_ixy):
+        """Returns flat image indexes and image shape for list of sub-detector index arrays [(ix, iy),...].
+           Plan is cached and re-evaluated only if any sub-detector returns new index arrays.
+        """
+        ixs = [v[0] for v in list_ixy] + [v[1] for v in list_ixy]
+        plan = self._img_plans.get(name, None)
+        if plan is None or len(plan[0]) != len(ixs) or any(a is not b for a, b in zip(plan[0], ixs)):
+            concaxis = list_ixy[0][0].ndim - 3
+            ix = np.concatenate([v[0] for v in list_ixy], axis=concaxis)
+            iy = np.concatenate([v[1] for v in list_ixy], axis=concaxis)
+            plan = self._img_plans[name] = (ixs,) + image_assembly_plan(ix, iy)
+        return plan[1], plan[2]
 
 
-    def image_at_z(self, evt, zplane=None, nda_in=None, pix_scale_size_um=None, xy0_off_pix=None, do_update=False) :
+    def image_at_z(self, evt, zplane=None, nda_in=None, pix_scale_size_um=None, xy0_off_pix=None, do_update=False, out=None) :
         """ returns 2d image for compound detector projected on plane at z (um).
             NOTICE:
                - xy0_off_pix=(VERT,HORIZ) on regular image
                - do_update=True is required if indexes_x/y were called earlier with different xy0_off_pix
         """
-        ix, iy = self.indexes_xy_at_z(evt, zplane, pix_scale_size_um, xy0_off_pix, do_update)
+        list_ixy = [o.indexes_xy_at_z(evt, zplane, pix_scale_size_um, xy0_off_pix, do_update) for o in self.list_dets]
+        inds, shape = self._image_plan('image_at_z', list_ixy)
 
         if False :
             el_begin, el_end = 1000, 1005
             print_ndarr(nda_in, name='image nda_in', first=el_begin, last=el_end)
-            print_ndarr(ix,     name='image ix    ', first=el_begin, last=el_end)
-            print_ndarr(iy,     name='image iy    ', first=el_begin, last=el_end)
+            print_ndarr(inds,   name='image inds  ', first=el_begin, last=el_end)
 
-        return img_from_pixel_arrays(ix, iy, nda_in)
+        return img_from_flat_indexes(inds, shape, nda_in, out)
 
 
     def common_mode(self, par) :
@@ -10,6 +10,8 @@ Author Mikhail Dubrovin
 """
 import sys
 import numpy as np
+import logging
+logger = logging.getLogger(__name__)
 
 
 def info_ndarr(nda, name='', first=0, last=5):
@@ -83,4 +85,37 @@ def selected_record(n):
        or (n<500 and not n%100)\
        or (not n%1000)
 
+
+def image_assembly_plan(rows, cols):
+    """Returns flat image indexes of pixels and image shape for pixel index arrays rows, cols,
+       the same image as in PSCalib.GeometryAccess.img_from_pixel_arrays(rows, cols, W).
+    """
+    _rows, _cols = rows.ravel(), cols.ravel()
+    shape = (int(_rows.max())+1, int(_cols.max())+1)
+    return np.ravel_multi_index((_rows, _cols), shape).astype(np.intp), shape
+
+
+def img_default(shape=(10,10), dtype=np.float32):
+    """Returns default image, the same as PSCalib.GeometryAccess.img_default."""
+    arr = np.arange(shape[0]*shape[1], dtype=dtype)
+    arr.shape = shape
+    return arr
+
+
+def img_from_flat_indexes(inds, shape, nda, out=None, vbase=0, dtype=np.float32):
+    """Returns image shaped as shape with pixel values from nda placed in flat image indexes inds,
+       for pixels with equal indexes the last value is used, other bins are filled by vbase.
+       Pixel values are converted to the image dtype on the fly w/o intermediate copy of nda.
+       If out is not None it is used as output buffer of the image.
+       If number of pixels in nda and inds is different returns img_default() as img_from_pixel_arrays.
+    """
+    if nda.size != inds.size:
+        logger.warning('img_from_flat_indexes: number of pixels in nda %d is different from %d in image plan'%\
+                       (nda.size, inds.size))
+        return img_default()
+    img = np.empty(shape, dtype=dtype) if out is None else out
+    img.fill(vbase)
+    np.put(img, inds, nda)
+    return img
+
 # EOF
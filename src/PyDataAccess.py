@@ -12,6 +12,15 @@ Usage ::
     o  = get_jungfrau_data_object(env, src)
     co = get_jungfrau_config_object(env, src)
 
+    # statistics of resolved type cache
+    set_probe_stats(True)
+    print(probe_stats())  # {(types, src): [hits, misses], ...}
+    reset_resolved_types()
+
+Each getter probes versioned types of data/config object from module constant TYPES_* in the order of preference,
+the type resolved for (types, src) is cached and tried first in the next call,
+full probe is done only on a miss.
+
 This software was developed for the SIT project.
 If you use all or part of it, please give an appropriate acknowledgment.
 
@@ -21,559 +30,460 @@ Created by Mikhail Dubrovin
 import _psana
 from time import strftime, localtime
 
+MAX_RESOLVED_TYPES = 1000 # limit of cache size for src objects created per call
+PROBE_STATS = False # collect statistics of resolved type cache, see set_probe_stats
 
-def get_cspad_data_object(evt, src):
-    """get cspad data object
-    """
-    o = evt.get(_psana.CsPad.DataV2, src)
-    if o is not None: return o
+dic_resolved_types = {} # {(types, src): resolved type}
+dic_probe_stats = {}    # {(types, src): [number of hits, number of misses]}
 
-    o = evt.get(_psana.CsPad.DataV1, src)
-    if o is not None: return o
 
+def resolved_object(get, src, types):
+    """Returns object from get(type, src) for the 1st type in types returning not None or None.
+       Type resolved in previous call for the same (types, src) is tried first,
+       all types are probed in order only if it misses. Single type is probed without cache.
+    """
+    if len(types) == 1: return get(types[0], src)
+    try:
+        key = (types, src)
+        t0 = dic_resolved_types.get(key)
+    except TypeError: # unhashable src
+        key = (types, str(src))
+        t0 = dic_resolved_types.get(key)
+    if t0 is not None:
+        o = get(t0, src)
+        if o is not None:
+            if PROBE_STATS: count_probe(key, 0)
+            return o
+    if PROBE_STATS: count_probe(key, 1)
+    for t in types:
+        if t is t0: continue
+        o = get(t, src)
+        if o is not None:
+            if len(dic_resolved_types) >= MAX_RESOLVED_TYPES: dic_resolved_types.clear()
+            dic_resolved_types[key] = t
+            return o
     return None
 
 
-def get_cspad_config_object(env, src):
-    """get cspad config object
+def count_probe(key, i):
+    """Increments number of hits (i=0) or misses (i=1) for key of resolved type cache."""
+    stats = dic_probe_stats.get(key)
+    if stats is None: stats = dic_probe_stats[key] = [0, 0]
+    stats[i] += 1
+
+
+def data_object(evt, src, types):
+    """Returns event data object of the 1st available type in types or None."""
+    return resolved_object(evt.get, src, types)
+
+
+def config_object(env, src, types):
+    """Returns config store object of the 1st available type in types or None."""
+    return resolved_object(env.configStore().get, src, types)
+
+
+def set_probe_stats(on=True):
+    """Turns on/off collection of statistics of resolved type cache, it is off by default."""
+    global PROBE_STATS
+    PROBE_STATS = on
+
+
+def probe_stats():
+    """Returns dict {(types, src): [number of hits, number of misses]} of resolved type cache,
+       statistics is collected after set_probe_stats(True) for getters of multiple types.
     """
-    cfg = env.configStore()
-    o = cfg.get(_psana.CsPad.ConfigV5, src)
-    if o is not None: return o
+    return dic_probe_stats
 
-    o = cfg.get(_psana.CsPad.ConfigV4, src)
-    if o is not None: return o
 
-    o = cfg.get(_psana.CsPad.ConfigV3, src)
-    if o is not None: return o
+def reset_resolved_types():
+    """Resets cache of resolved types and probe statistics."""
+    dic_resolved_types.clear()
+    dic_probe_stats.clear()
 
-    o = cfg.get(_psana.CsPad.ConfigV2, src)
-    if o is not None: return o
 
-    return None
+TYPES_CSPAD_DATA = (_psana.CsPad.DataV2,\
+                    _psana.CsPad.DataV1)
+
+def get_cspad_data_object(evt, src):
+    """get cspad data object
+    """
+    return data_object(evt, src, TYPES_CSPAD_DATA)
+
+
+TYPES_CSPAD_CONFIG = (_psana.CsPad.ConfigV5,\
+                      _psana.CsPad.ConfigV4,\
+                      _psana.CsPad.ConfigV3,\
+                      _psana.CsPad.ConfigV2)
+
+def get_cspad_config_object(env, src):
+    """get cspad config object
+    """
+    return config_object(env, src, TYPES_CSPAD_CONFIG)
 
 
+TYPES_CSPAD2X2_DATA = (_psana.CsPad2x2.ElementV1,)
+
 def get_cspad2x2_data_object(evt, src):
     """get cspad2x2 data object
     """
-    o = evt.get(_psana.CsPad2x2.ElementV1, src)
-    if o is not None: return o
+    return data_object(evt, src, TYPES_CSPAD2X2_DATA)
 
-    return None
 
+TYPES_CSPAD2X2_CONFIG = (_psana.CsPad2x2.ConfigV2,\
+                         _psana.CsPad2x2.ConfigV1)
 
 def get_cspad2x2_config_object(env, src):
     """get cspad2x2 config object
     """
-    cfg = env.configStore()
-    o = cfg.get(_psana.CsPad2x2.ConfigV2, src)
-    if o is not None: return o
+    return config_object(env, src, TYPES_CSPAD2X2_CONFIG)
 
-    o = cfg.get(_psana.CsPad2x2.ConfigV1, src)
-    if o is not None: return o
-
-    return None
 
+TYPES_CAMERA_DATA = (_psana.Camera.FrameV1,)
 
 def get_camera_data_object(evt, src):
     """get camera data object
     """
-    o = evt.get(_psana.Camera.FrameV1, src)
-    if o is not None: return o
+    return data_object(evt, src, TYPES_CAMERA_DATA)
 
-    return None
 
+TYPES_CAMERA_CONFIG = (_psana.Camera.FrameFexConfigV1,)
 
 def get_camera_config_object(env, src):
     """get camera config object
     """
-    cfg = env.configStore()
-    o = cfg.get(_psana.Camera.FrameFexConfigV1, src)
-    if o is not None: return o
+    return config_object(env, src, TYPES_CAMERA_CONFIG)
 
-    return None
 
+TYPES_OPAL1K_CONFIG = (_psana.Opal1k.ConfigV1,)
 
 def get_opal1k_config_object(env, src):
     """get camera config object
     """
-    cfg = env.configStore()
-    o = cfg.get(_psana.Opal1k.ConfigV1, src)
-    if o is not None: return o
+    return config_object(env, src, TYPES_OPAL1K_CONFIG)
 
-    return None
 
+TYPES_PRINCETON_DATA = (_psana.Princeton.FrameV2,\
+                        _psana.Princeton.FrameV1,\
+                        _psana.Pimax.FrameV1,\
+                        _psana.Pixis.FrameV1)
 
 def get_princeton_data_object(evt, src):
     """get princeton data object
     """
-    o = evt.get(_psana.Princeton.FrameV2, src)
-    if o is not None: return o
+    return data_object(evt, src, TYPES_PRINCETON_DATA)
 
-    o = evt.get(_psana.Princeton.FrameV1, src)
-    if o is not None: return o
-
-    o = evt.get(_psana.Pimax.FrameV1, src)
-    if o is not None: return o
-
-    o = evt.get(_psana.Pixis.FrameV1, src)
-    if o is not None: return o
-
-    return None
 
+TYPES_PRINCETON_CONFIG = (_psana.Princeton.ConfigV5,\
+                          _psana.Princeton.ConfigV4,\
+                          _psana.Princeton.ConfigV3,\
+                          _psana.Princeton.ConfigV2,\
+                          _psana.Princeton.ConfigV1,\
+                          _psana.Pimax.ConfigV1,\
+                          _psana.Pixis.ConfigV1)
 
 def get_princeton_config_object(env, src):
     """get princeton config object
     """
-    cfg = env.configStore()
-    o = cfg.get(_psana.Princeton.ConfigV5, src)
-    if o is not None: return o
+    return config_object(env, src, TYPES_PRINCETON_CONFIG)
 
-    o = cfg.get(_psana.Princeton.ConfigV4, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Princeton.ConfigV3, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Princeton.ConfigV2, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Princeton.ConfigV1, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Pimax.ConfigV1, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Pixis.ConfigV1, src)
-    if o is not None: return o
-
-    return None
 
+TYPES_PNCCD_DATA = (_psana.PNCCD.FramesV1,)
 
 def get_pnccd_data_object(evt, src):
     """get pnccd data object
     """
-    o = evt.get(_psana.PNCCD.FramesV1, src)
-    if o is not None: return o
+    return data_object(evt, src, TYPES_PNCCD_DATA)
 
-    return None
 
+TYPES_PNCCD_CONFIG = (_psana.PNCCD.ConfigV2,\
+                      _psana.PNCCD.ConfigV1)
 
 def get_pnccd_config_object(env, src):
     """get pnccd config object
     """
-    cfg = env.configStore()
-    o = cfg.get(_psana.PNCCD.ConfigV2, src)
-    if o is not None: return o
+    return config_object(env, src, TYPES_PNCCD_CONFIG)
 
-    o = cfg.get(_psana.PNCCD.ConfigV1, src)
-    if o is not None: return o
-
-    return None
 
+TYPES_ANDOR_DATA = (_psana.Andor3d.FrameV1,\
+                    _psana.Andor.FrameV1)
 
 def get_andor_data_object(evt, src):
     """get andor data object
     """
-    o = evt.get(_psana.Andor3d.FrameV1, src)
-    if o is not None: return o
+    return data_object(evt, src, TYPES_ANDOR_DATA)
 
-    o = evt.get(_psana.Andor.FrameV1, src)
-    if o is not None: return o
-
-    return None
 
+TYPES_ANDOR_CONFIG = (_psana.Andor3d.ConfigV1,\
+                      _psana.Andor.ConfigV1)
 
 def get_andor_config_object(env, src):
     """get andor config object
     """
-    cfg = env.configStore()
-
-    o = cfg.get(_psana.Andor3d.ConfigV1, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Andor.ConfigV1, src)
-    if o is not None: return o
-
-    return None
+    return config_object(env, src, TYPES_ANDOR_CONFIG)
 
 
 get_fccd_data_object = get_camera_data_object
 
 
+TYPES_FCCD_CONFIG = (_psana.FCCD.FccdConfigV2,\
+                     _psana.FCCD.FccdConfigV1,\
+                     _psana.FCCD.FccdConfig)
+
 def get_fccd_config_object(env, src):
     """get fccd config object
     """
-    cfg = env.configStore()
-    o = cfg.get(_psana.FCCD.FccdConfigV2, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.FCCD.FccdConfigV1, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.FCCD.FccdConfig, src)
-    if o is not None: return o
-
-    return None
+    return config_object(env, src, TYPES_FCCD_CONFIG)
 
 
 get_fccd960_data_object = get_camera_data_object
 get_fccd960_config_object = get_fccd_config_object
 
 
+TYPES_EPIX_DATA = (_psana.Epix.ElementV3,\
+                   _psana.Epix.ElementV2,\
+                   _psana.Epix.ElementV1,\
+                   _psana.Epix.ArrayV1)
+
 def get_epix_data_object(evt, src):
     """get epix data object
     """
-    o = evt.get(_psana.Epix.ElementV3, src)
-    if o is not None: return o
-
-    o = evt.get(_psana.Epix.ElementV2, src)
-    if o is not None: return o
-
-    o = evt.get(_psana.Epix.ElementV1, src)
-    if o is not None: return o
+    return data_object(evt, src, TYPES_EPIX_DATA)
 
-    o = evt.get(_psana.Epix.ArrayV1, src)
-    if o is not None: return o
-
-    return None
 
+TYPES_EPIX_CONFIG = (_psana.Epix.Config100aV2,\
+                     _psana.Epix.Config100aV1,\
+                     _psana.Epix.Config10ka2MV2,\
+                     _psana.Epix.Config10ka2MV1,\
+                     _psana.Epix.Config10kaQuadV2,\
+                     _psana.Epix.Config10kaQuadV1,\
+                     _psana.Epix.Config10kaV2,\
+                     _psana.Epix.Config10kaV1,\
+                     _psana.Epix.Config10KV1,\
+                     _psana.Epix.ConfigV1)
 
 def get_epix_config_object(env, src):
     """get epix config object
     """
-    cfg = env.configStore()
-    o = cfg.get(_psana.Epix.Config100aV2, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Epix.Config100aV1, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Epix.Config10ka2MV2, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Epix.Config10ka2MV1, src)
-    if o is not None: return o
+    return config_object(env, src, TYPES_EPIX_CONFIG)
 
-    o = cfg.get(_psana.Epix.Config10kaQuadV2, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Epix.Config10kaQuadV1, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Epix.Config10kaV2, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Epix.Config10kaV1, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Epix.Config10KV1, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Epix.ConfigV1, src)
-    if o is not None: return o
-
-    return None
 
+TYPES_EPIX10KA_ANY_CONFIG = (_psana.Epix.Config10ka2MV2,\
+                             _psana.Epix.Config10ka2MV1,\
+                             _psana.Epix.Config10kaQuadV2,\
+                             _psana.Epix.Config10kaQuadV1,\
+                             _psana.Epix.Config10kaV2,\
+                             _psana.Epix.Config10kaV1)
 
 def get_epix10ka_any_config_object(env, src):
     """get epix10ka2m config object
     """
-    cfg = env.configStore()
-    o = cfg.get(_psana.Epix.Config10ka2MV2, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Epix.Config10ka2MV1, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Epix.Config10kaQuadV2, src)
-    if o is not None: return o
+    return config_object(env, src, TYPES_EPIX10KA_ANY_CONFIG)
 
-    o = cfg.get(_psana.Epix.Config10kaQuadV1, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Epix.Config10kaV2, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Epix.Config10kaV1, src)
-    if o is not None: return o
-
-    return None
 
+TYPES_EPIX10KA_CONFIG = (_psana.Epix.Config10kaV2,\
+                         _psana.Epix.Config10kaV1)
 
 def get_epix10ka_config_object(env, src):
     """get epix10ka config object faster than from get_epix_config_object
     """
-    cfg = env.configStore()
-    o = cfg.get(_psana.Epix.Config10kaV2, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Epix.Config10kaV1, src)
-    if o is not None: return o
+    return config_object(env, src, TYPES_EPIX10KA_CONFIG)
 
-    return None
 
+TYPES_EPIX10KA2M_CONFIG = (_psana.Epix.Config10ka2MV2,\
+                           _psana.Epix.Config10ka2MV1)
 
 def get_epix10ka2m_config_object(env, src):
     """get epix10ka2m config object
     """
-    cfg = env.configStore()
-    o = cfg.get(_psana.Epix.Config10ka2MV2, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Epix.Config10ka2MV1, src)
-    if o is not None: return o
+    return config_object(env, src, TYPES_EPIX10KA2M_CONFIG)
 
-    return None
 
+TYPES_EPIX10KA2M_DATA = (_psana.Epix.ArrayV1,)
 
 def get_epix10ka2m_data_object(evt, src):
     """get epix10ka2m data object
     """
-    o = evt.get(_psana.Epix.ArrayV1, src)
-    if o is not None: return o
+    return data_object(evt, src, TYPES_EPIX10KA2M_DATA)
 
-    return None
 
+TYPES_EPIX10KAQUAD_CONFIG = (_psana.Epix.Config10kaQuadV2,\
+                             _psana.Epix.Config10kaQuadV1)
 
 def get_epix10kaquad_config_object(env, src):
     """get epix10kaquad config object
     """
-    cfg = env.configStore()
-    o = cfg.get(_psana.Epix.Config10kaQuadV2, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Epix.Config10kaQuadV1, src)
-    if o is not None: return o
-
-    return None
+    return config_object(env, src, TYPES_EPIX10KAQUAD_CONFIG)
 
 
 get_epix10kaquad_data_object = get_epix10ka2m_data_object
 
 
+TYPES_TM6740_CONFIG = (_psana.Pulnix.TM6740ConfigV1,\
+                       _psana.Pulnix.TM6740ConfigV2)
+
 def get_tm6740_config_object(env, src):
     """get pulnix tm6740 config object
     """
-    cfg = env.configStore()
-    o = cfg.get(_psana.Pulnix.TM6740ConfigV1, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Pulnix.TM6740ConfigV2, src)
-    if o is not None: return o
-
-    return None
+    return config_object(env, src, TYPES_TM6740_CONFIG)
 
 
 get_quartz_data_object = get_camera_data_object
 
 
+TYPES_QUARTZ_CONFIG = (_psana.Quartz.ConfigV2,\
+                       _psana.Quartz.ConfigV1)
+
 def get_quartz_config_object(env, src):
     """get quartz config object
     """
-    cfg = env.configStore()
-    o = cfg.get(_psana.Quartz.ConfigV2, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Quartz.ConfigV1, src)
-    if o is not None: return o
-
-    return None
+    return config_object(env, src, TYPES_QUARTZ_CONFIG)
 
 
 get_rayonix_data_object = get_camera_data_object
 
 
+TYPES_RAYONIX_CONFIG = (_psana.Rayonix.ConfigV2,\
+                        _psana.Rayonix.ConfigV1)
+
 def get_rayonix_config_object(env, src):
     """get rayonix config object
     """
-    cfg = env.configStore()
-    o = cfg.get(_psana.Rayonix.ConfigV2, src)
-    if o is not None: return o
+    return config_object(env, src, TYPES_RAYONIX_CONFIG)
 
-    o = cfg.get(_psana.Rayonix.ConfigV1, src)
-    if o is not None: return o
-
-    return None
 
+TYPES_TIMEPIX_DATA = (_psana.Timepix.DataV2,\
+                      _psana.Timepix.DataV1)
 
 def get_timepix_data_object(evt, src):
     """get timepix data object
     """
-    o = evt.get(_psana.Timepix.DataV2, src)
-    if o is not None: return o
-
-    o = evt.get(_psana.Timepix.DataV1, src)
-    if o is not None: return o
+    return data_object(evt, src, TYPES_TIMEPIX_DATA)
 
-    return None
 
+TYPES_TIMEPIX_CONFIG = (_psana.Timepix.ConfigV3,\
+                        _psana.Timepix.ConfigV2,\
+                        _psana.Timepix.ConfigV1)
 
 def get_timepix_config_object(env, src):
     """get timepix config object
     """
-    cfg = env.configStore()
-    o = cfg.get(_psana.Timepix.ConfigV3, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Timepix.ConfigV2, src)
-    if o is not None: return o
+    return config_object(env, src, TYPES_TIMEPIX_CONFIG)
 
-    o = cfg.get(_psana.Timepix.ConfigV1, src)
-    if o is not None: return o
-
-    return None
 
+TYPES_FLI_DATA = (_psana.Fli.FrameV1,)
 
 def get_fli_data_object(evt, src):
     """get fli data object
     """
-    o = evt.get(_psana.Fli.FrameV1, src)
-    if o is not None: return o
+    return data_object(evt, src, TYPES_FLI_DATA)
 
-    return None
 
+TYPES_FLI_CONFIG = (_psana.Fli.ConfigV1,)
 
 def get_fli_config_object(env, src):
     """get fli config object
     """
-    cfg = env.configStore()
+    return config_object(env, src, TYPES_FLI_CONFIG)
 
-    o = cfg.get(_psana.Fli.ConfigV1, src)
-    if o is not None: return o
-
-    return None
 
+TYPES_PIMAX_DATA = (_psana.Pimax.FrameV1,)
 
 def get_pimax_data_object(evt, src):
     """get pimax data object
     """
-    o = evt.get(_psana.Pimax.FrameV1, src)
-    if o is not None: return o
+    return data_object(evt, src, TYPES_PIMAX_DATA)
 
-    return None
 
+TYPES_PIMAX_CONFIG = (_psana.Pimax.ConfigV1,)
 
 def get_pimax_config_object(env, src):
     """get pimax config object
     """
-    cfg = env.configStore()
+    return config_object(env, src, TYPES_PIMAX_CONFIG)
 
-    o = cfg.get(_psana.Pimax.ConfigV1, src)
-    if o is not None: return o
-
-    return None
 
+TYPES_PIXIS_DATA = (_psana.Pixis.FrameV1,)
 
 def get_pixis_data_object(evt, src):
     """get pixis data object
     """
-    o = evt.get(_psana.Pixis.FrameV1, src)
-    if o is not None: return o
+    return data_object(evt, src, TYPES_PIXIS_DATA)
 
-    return None
 
+TYPES_PIXIS_CONFIG = (_psana.Pixis.ConfigV1,)
 
 def get_pixis_config_object(env, src):
     """get pixis config object
     """
-    cfg = env.configStore()
-
-    o = cfg.get(_psana.Pixis.ConfigV1, src)
-    if o is not None: return o
+    return config_object(env, src, TYPES_PIXIS_CONFIG)
 
-    return None
 
+TYPES_ORCA_CONFIG = (_psana.Orca.ConfigV1,)
 
 def get_orca_config_object(env, src):
     """get orca config object
     """
-    cfg = env.configStore()
-
-    o = cfg.get(_psana.Orca.ConfigV1, src)
-    if o is not None: return o
+    return config_object(env, src, TYPES_ORCA_CONFIG)
 
-    return None
 
+TYPES_ZYLA_DATA = (_psana.Zyla.FrameV1,)
 
 def get_zyla_data_object(evt, src):
     """get zyla data object
     """
-    o = evt.get(_psana.Zyla.FrameV1, src)
-    if o is not None: return o
+    return data_object(evt, src, TYPES_ZYLA_DATA)
 
-    return None
 
+TYPES_ZYLA_CONFIG = (_psana.Zyla.ConfigV1,)
 
 def get_zyla_config_object(env, src):
     """get zyla config object
     """
-    cfg = env.configStore()
-    o = cfg.get(_psana.Zyla.ConfigV1, src)
-    if o is not None: return o
+    return config_object(env, src, TYPES_ZYLA_CONFIG)
 
-    return None
 
+TYPES_ISTAR_CONFIG = (_psana.iStar.ConfigV1,)
 
 def get_istar_config_object(env, src):
     """get istar config object
     """
-    cfg = env.configStore()
-    o = cfg.get(_psana.iStar.ConfigV1, src)
-    if o is not None: return o
+    return config_object(env, src, TYPES_ISTAR_CONFIG)
 
-    return None
 
+TYPES_VIMBA_DATA = (_psana.Vimba.FrameV1,)
 
 def get_vimba_data_object(evt, src):
     """get vimba data object
     """
-    o = evt.get(_psana.Vimba.FrameV1, src)
-    if o is not None: return o
+    return data_object(evt, src, TYPES_VIMBA_DATA)
 
-    return None
 
+TYPES_ALVIUM_CONFIG = (_psana.Vimba.AlviumConfigV1,)
 
 def get_alvium_config_object(env, src):
     """get alvium config object
     """
-    cfg = env.configStore()
-    o = cfg.get(_psana.Vimba.AlviumConfigV1, src)
-    if o is not None: return o
+    return config_object(env, src, TYPES_ALVIUM_CONFIG)
 
-    return None
 
+TYPES_JUNGFRAU_DATA = (_psana.Jungfrau.ElementV2,\
+                       _psana.Jungfrau.ElementV1)
 
 def get_jungfrau_data_object(evt, src):
     """get jungfrau data object
     """
-    o = evt.get(_psana.Jungfrau.ElementV2, src)
-    if o is not None: return o
-
-    o = evt.get(_psana.Jungfrau.ElementV1, src)
-    if o is not None: return o
+    return data_object(evt, src, TYPES_JUNGFRAU_DATA)
 
-    return None
 
+TYPES_JUNGFRAU_CONFIG = (_psana.Jungfrau.ConfigV4,\
+                         _psana.Jungfrau.ConfigV3,\
+                         _psana.Jungfrau.ConfigV2,\
+                         _psana.Jungfrau.ConfigV1)
 
 def get_jungfrau_config_object(env, src):
     if src is None: return None
 
-    cfg = env.configStore()
-
-    o = cfg.get(_psana.Jungfrau.ConfigV4, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Jungfrau.ConfigV3, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Jungfrau.ConfigV2, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Jungfrau.ConfigV1, src)
-    if o is not None: return o
-
-    return None
+    return config_object(env, src, TYPES_JUNGFRAU_CONFIG)
 
 
 def get_jungfrau_gain_mode_object(env, src):
@@ -583,118 +493,95 @@ def get_jungfrau_gain_mode_object(env, src):
     return co.gainMode()
 
 
+TYPES_EPICSCAM_CONFIG = (_psana.Camera.ControlsCameraConfigV1,)
+
 def get_epicscam_config_object(env, src):
     """get epics camera config object
     """
-    cfg = env.configStore()
-    o = cfg.get(_psana.Camera.ControlsCameraConfigV1, src)
-    if o is not None: return o
-
-    return None
+    return config_object(env, src, TYPES_EPICSCAM_CONFIG)
 
 ##---- For WFDetector.py ------
 
+TYPES_ACQIRIS_DATA = (_psana.Acqiris.DataDescV1,)
+
 def get_acqiris_data_object(evt, src):
     """get acqiris data object
     """
-    o = evt.get(_psana.Acqiris.DataDescV1, src)
-    if o is not None: return o
+    return data_object(evt, src, TYPES_ACQIRIS_DATA)
 
-    return None
 
+TYPES_ACQIRIS_CONFIG = (_psana.Acqiris.ConfigV1,)
 
 def get_acqiris_config_object(env, src):
     """get acqiris config object
     """
-    cfg = env.configStore()
-    o = cfg.get(_psana.Acqiris.ConfigV1, src)
-    if o is not None: return o
+    return config_object(env, src, TYPES_ACQIRIS_CONFIG)
 
-    return None
 
+TYPES_IMP_DATA = (_psana.Imp.ElementV1,)
 
 def get_imp_data_object(evt, src):
     """get imp data object
     """
-    o = evt.get(_psana.Imp.ElementV1, src)
-    if o is not None: return o
+    return data_object(evt, src, TYPES_IMP_DATA)
 
-    return None
 
+TYPES_IMP_CONFIG = (_psana.Imp.ConfigV1,)
 
 def get_imp_config_object(env, src):
     """get imp config object
     """
-    cfg = env.configStore()
-    o = cfg.get(_psana.Imp.ConfigV1, src)
-    if o is not None: return o
+    return config_object(env, src, TYPES_IMP_CONFIG)
 
-    return None
 
+TYPES_UXI_DATA = (_psana.Uxi.FrameV1,)
 
 def get_uxi_data_object(evt, src):
     """get uxi data object
     """
-    o = evt.get(_psana.Uxi.FrameV1, src)
-    if o is not None: return o
+    return data_object(evt, src, TYPES_UXI_DATA)
 
-    return None
 
+TYPES_UXI_CONFIG = (_psana.Uxi.ConfigV3,\
+                    _psana.Uxi.ConfigV2,\
+                    _psana.Uxi.ConfigV1)
 
 def get_uxi_config_object(env, src):
     """get uxi config object
     """
-    cfg = env.configStore()
-
-    o = cfg.get(_psana.Uxi.ConfigV3, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Uxi.ConfigV2, src)
-    if o is not None: return o
-
-    o = cfg.get(_psana.Uxi.ConfigV1, src)
-    if o is not None: return o
-
-    return None
+    return config_object(env, src, TYPES_UXI_CONFIG)
 
 
 get_streak_data_object = get_camera_data_object
 
 
+TYPES_STREAK_CONFIG = (_psana.Streak.ConfigV1,)
+
 def get_streak_config_object(env, src):
     """get streak config object
     """
-    cfg = env.configStore()
-    o = cfg.get(_psana.Streak.ConfigV1, src)
-    if o is not None: return o
-
-    return None
+    return config_object(env, src, TYPES_STREAK_CONFIG)
 
 
 get_archon_data_object = get_camera_data_object
 
 
+TYPES_ARCHON_CONFIG = (_psana.Archon.ConfigV3,)
+
 def get_archon_config_object(env, src):
     """get streak config object
     """
-    cfg = env.configStore()
-    o = cfg.get(_psana.Archon.ConfigV3, src)
-    if o is not None: return o
-
-    return None
+    return config_object(env, src, TYPES_ARCHON_CONFIG)
 
 ##----- Other data objects ----
 
+TYPES_EVR_DATA = (_psana.EvrData.DataV4,\
+                  _psana.EvrData.DataV3)
+
 def get_evr_data_object(evt, src):
     """get evr data object for event codes
     """
-    o = evt.get(_psana.EvrData.DataV4, src)
-    if o is not None: return o
-
-    o = evt.get(_psana.EvrData.DataV3, src)
-    if o is not None: return o
-
-    return None
+    return data_object(evt, src, TYPES_EVR_DATA)
 
 
 def time_pars_evt(evt):
@@ -38,7 +38,11 @@ Author Mikhail Dubrovin
 #logger = logging.getLogger(__name__)
 #logging.basicConfig(format='[%(levelname).1s]: %(message)s', level=logging.DEBUG)
 
+import os
 import sys
+import copy
+import hashlib
+import tempfile
 import numpy as np
 import _psana
 import Detector.PyDataAccess as pda
@@ -46,10 +50,19 @@ from Detector.UtilsPNCCD import common_mode_pnccd
 import PSCalib.GlobalUtils as gu
 from PSCalib.CalibParsStore import cps
 from PSCalib.CalibFileFinder import CalibFileFinder
-from PSCalib.GeometryAccess import GeometryAccess, img_from_pixel_arrays
+from PSCalib.GeometryAccess import GeometryAccess
 from PSCalib.NDArrIO import save_txt, load_txt
+from Detector.UtilsCalibCache import calib_cache, calib_files_key
+from Detector.GlobalUtils import image_assembly_plan, img_from_flat_indexes
 from pyimgalgos.cm_epix import cm_epix
 
+CPSTORE_CALIB_TYPES = ('pedestals', 'pixel_rms', 'pixel_gain', 'pixel_offset', 'pixel_mask', 'pixel_bkgd',\
+                       'pixel_status', 'common_mode') # loaded by CalibParsStore from calib directory or from DCS
+DIR_GEO_CACHE = os.environ.get('DIR_GEO_CACHE', None) # None - pixel coordinate and index arrays are not saved on disk
+GEO_STATE_ATTRS = ('geo', 'geo_load_status', 'iX', 'iY', 'iX_at_Z', 'iY_at_Z',\
+                   'coords_x_arr', 'coords_y_arr', 'coords_z_arr', 'cframe_old', 'areas_arr', 'mask_geo_arr',\
+                   'mbits', 'pixel_size_val', 'img_inds', 'img_shape', 'img_plan_iX')
+
 
 def split_str_matrix_segment(mtrx):
     """Splits string like 'MTRX:V2:1920:1920:88:88' for two parts 'MTRX:V2','1920:1920:88:88'
@@ -60,6 +73,27 @@ def split_str_matrix_segment(mtrx):
     return  mtype, '%s:%s:%s:%s' % (nrows, ncols, sizerow, sizecol)
 
 
+def gain_mask_2x1s(gm, n2x1):
+    """Returns uint8 gain mask shaped as (n2x1,185,388) of 1/0 for low/high gain pixels unpacked from
+       CSPAD gain map gm shaped as (185,194), where bits 2*i and 2*i+1 are for the left and right asic of 2x1 i.
+    """
+    bits = (np.asarray(gm)[None,:,:] >> np.arange(2*n2x1)[:,None,None]) & 1
+    bits = bits.reshape((n2x1, 2) + bits.shape[1:]).transpose(0, 2, 1, 3).reshape(n2x1, 185, 388)
+    return (bits == 0).astype(np.uint8)
+
+
+def cspad_segment_indexes(roim):
+    """Returns arrays of indexes of 2x1 segments in quad which are stored and missing in data for roiMask roim."""
+    inds = np.array([s for s in range(8) if roim & (1<<s)], dtype=np.int64)
+    return inds, np.setdiff1d(np.arange(8), inds)
+
+
+def geo_file_key(tag, fname):
+    """Returns key of geometry source (tag, path, mtime, size) for geometry file."""
+    st = os.stat(fname)
+    return (tag, fname, st.st_mtime, st.st_size)
+
+
 def str_rayonix_geo_matrix_segment(d):
     import Detector.UtilsGeometryDeploy as ugd
     return ugd.str_rayonix_geo_matrix_segment(d)
@@ -87,15 +121,28 @@ class PyDetectorAccess():
         self.dettype = gu.det_type_from_source(self.str_src)
         self.do_offset = False # works for camera
         self.correct_time = True # works for acqiris
+        self.acqiris_dtype = np.dtype(np.float64) # works for acqiris
+        self.acqiris_tgrid = None # acqiris time grid np.arange(nbrSamplesInSeg)*sampInterval
+        self.acqiris_tgrid_key = None
         self.do_calib_imp = False # works for imp
         if self.pbits & 1: self.print_attributes()
 
         self.cpst = None
         self.runnum_cps = -1
+        self.cps_key = None
+
+        self.calib_key = None
+        self.runnum_key = -1
 
         self.geo = None
         self.runnum_geo = -1
         self.mbits      = None
+        self.geo_key    = None # resolved geometry source, key of geometry and derived arrays in calib_cache
+        self.geo_dircache = DIR_GEO_CACHE
+
+        self.img_inds   = None # image assembly plan: flat image indexes of pixels
+        self.img_shape  = None # image assembly plan: image shape
+        self.img_plan_iX = None # iX used to evaluate the image assembly plan
 
         self.cfg_gain_mask_is_loaded = False
         self.runnum_cfg = -1
@@ -103,6 +150,7 @@ class PyDetectorAccess():
 
         self.counter_cspad2x2_msg = 0
         self.reshape_to_3d = False
+        self.cspad_plan = {} # cspad assembly plan: {roiMask: (indexes of stored, missing 2x1 segments in quad)}
 
 
     def runnum(self, par):
@@ -125,18 +173,78 @@ class PyDetectorAccess():
         return par if isinstance(par,_psana.Event) else self.env
 
 
+    def calib_files_key(self, par): # par = evt or runnum
+        """Returns tuple of (ctype, path, mtime, size) for calibration files valid for run
+           or None if constants are not loaded from files in calib directory.
+        """
+        runnum = self.runnum(par)
+        if runnum != self.runnum_key:
+            self.runnum_key = runnum
+            group = gu.dic_det_type_to_calib_group[self.dettype]
+            self.calib_key = calib_files_key(self.env.calibDir().replace('//','/'), group, self.str_src, runnum)
+        return self.calib_key
+
+
+    def cpstore_key(self, par): # par = evt or runnum
+        """Returns key of CalibParsStore object shared between runs or None if it should be created for run.
+           Key is a tuple of (ctype, path, mtime, size) records of calibration files from calib_files_key
+           completed by (ctype, 'dcs', md5, 0) records for CPSTORE_CALIB_TYPES which are not found in files,
+           because CalibParsStore loads them from DCS for the event time.
+        """
+        key = self.calib_files_key(par)
+        if key is None: return None
+        found = set(rec[0] for rec in key)
+        missing = [ctype for ctype in CPSTORE_CALIB_TYPES if ctype not in found]
+        if not missing: return key
+        if not isinstance(par, _psana.Event): return None # DCS constants are defined by event time
+
+        import PSCalib.DCMethods as dcm
+        cdir = self.env.calibDir().replace('//','/')
+        recs = []
+        for ctype in missing:
+            data = dcm.get_constants(par, self.env, self.str_src, ctype=gu.dic_calib_name_to_type[ctype], calibdir=cdir,\
+                                     vers=None, verb=self.pbits & 16)
+            md5 = None if data is None else\
+                  hashlib.md5(np.ascontiguousarray(data) if isinstance(data, np.ndarray) else str(data).encode()).hexdigest()
+            recs.append((ctype, 'dcs', md5, 0))
+        return key + tuple(recs)
+
+
     def cpstore(self, par): # par = evt or runnum
         runnum = self.runnum(par)
         if runnum != self.runnum_cps or self.cpst is None:
             self.runnum_cps = runnum
-            group = gu.dic_det_type_to_calib_group[self.dettype]
-            #self.cpst = cps.Create(self.env.calibDir(), group, self.str_src, runnum, self.pbits)
-            self.cpst = cps.CreateForEvtEnv(self.env.calibDir().replace('//','/'), group, self.str_src, par, self.env, self.pbits & 0o377)
-            if self.pbits & 1: print('PSCalib.CalibParsStore object is created for run %d' % runnum)
+            key = self.cpstore_key(par)
+            if key is not None and key == self.cps_key and self.cpst is not None:
+                if self.pbits & 1: print('PSCalib.CalibParsStore object is re-used for run %d' % runnum)
+                return self.cpst
+
+            cpst = None if key is None else calib_cache.get(('cpstore', self.str_src, key))
+            if cpst is not None:
+                self.cpst = cpst
+                if self.pbits & 1: print('PSCalib.CalibParsStore object is taken from calib_cache for run %d' % runnum)
+            else:
+                group = gu.dic_det_type_to_calib_group[self.dettype]
+                #self.cpst = cps.Create(self.env.calibDir(), group, self.str_src, runnum, self.pbits)
+                self.cpst = cps.CreateForEvtEnv(self.env.calibDir().replace('//','/'), group, self.str_src, par, self.env, self.pbits & 0o377)
+                if self.pbits & 1: print('PSCalib.CalibParsStore object is created for run %d' % runnum)
+                if key is not None: calib_cache.put(('cpstore', self.str_src, key), self.cpst, self.cpstore_nbytes(key))
+            self.cps_key = key
 
         return self.cpst
 
 
+    def cpstore_nbytes(self, key):
+        """Returns estimated size in bytes of constants of CalibParsStore object for calib_cache;
+           constants are loaded lazily, so size is estimated as size of pedestals times itemsize of dtype
+           for each calibration type in key of (ctype, path, mtime, size) records.
+        """
+        size = self.cpst.size(gu.PEDESTALS)
+        if not size: return 0
+        return sum(int(size) * np.dtype(gu.dic_calib_type_to_dtype.get(gu.dic_calib_name_to_type.get(rec[0]), np.float64)).itemsize\
+                   for rec in key)
+
+
     def default_geometry(self):
         """Returns default geometry object for some of detectors"""
         import CalibManager.AppDataPath as apputils
@@ -156,10 +264,13 @@ class PyDetectorAccess():
             return
 
         fname = apputils.AppDataPath(defname).path()
+        key = geo_file_key('default', fname)
+        if self._geo_cache_get(key): return
         if self.pbits: print('%s: Load default geometry from file %s' % (self.__class__.__name__, fname))
 
         self.geo = GeometryAccess(fname, 0o377 if self.pbits else 0)
         if self.geo is not None: self.geo_load_status = self.GEO_LOADED_DEFAULT
+        self.geo_key = key
         #return GeometryAccess(fname, 0o377 if self.pbits else 0)
 
 
@@ -183,11 +294,15 @@ class PyDetectorAccess():
 
         if data is None: return
 
+        key = ('dcs', hashlib.md5(str(data).encode()).hexdigest())
+        if self._geo_cache_get(key): return
+
         self.geo = GeometryAccess(pbits=0o377 if self.pbits else 0)
         if self.geo is not None:
             self.geo.load_pars_from_str(data)
             #self.geo.print_list_of_geos()
             self.geo_load_status = self.GEO_LOADED_DCS
+            self.geo_key = key
 
 
     def geoaccess_calib(self, runnum):
@@ -197,9 +312,14 @@ class PyDetectorAccess():
         cff = CalibFileFinder(self.env.calibDir().replace('//','/'), group, 0o377 if self.pbits else 0)
         fname = cff.findCalibFile(self.str_src, 'geometry', runnum)
         if fname:
+            key = geo_file_key('calib', fname)
+            if self._geo_cache_get(key):
+                if self.pbits & 1: print('PSCalib.GeometryAccess object is re-used for run %d' % runnum)
+                return
             self.geo = GeometryAccess(fname, 0o377 if self.pbits else 0)
             if self.pbits & 1: print('PSCalib.GeometryAccess object is created for run %d' % runnum)
             if self.geo.valid: self.geo_load_status = self.GEO_LOADED_CALIB
+            self.geo_key = key
         else:
             self.geo = None
             if self.pbits & 1: print('WARNING: PSCalib.GeometryAccess object is NOT created for run %d - geometry file is missing.' % runnum)
@@ -242,9 +362,10 @@ class PyDetectorAccess():
         if  runnum != self.runnum_geo:
             # for 1st entry and when run is changing:
             self.runnum_geo = runnum
-            self.geo_load_status = self.GEO_NOT_LOADED
-            self.geo = None
+            self._geo_cache_put() # keep geometry and derived arrays for next runs with the same geometry source
+            self._reset_geo_state()
 
+            # geometry object and derived arrays are taken from calib_cache if geometry source is not changed
             # 1) load geometry object from calib store
             self.geoaccess_calib(runnum)
 
@@ -258,24 +379,80 @@ class PyDetectorAccess():
 
             if self.dettype == gu.RAYONIX:
                 self.check_rayonix_geo()
-
-            # arrays for caching
-            self.iX             = None
-            self.iY             = None
-            self.iX_at_Z        = None
-            self.iY_at_Z        = None
-            self.coords_x_arr   = None
-            self.coords_y_arr   = None
-            self.coords_z_arr   = None
-            self.cframe_old     = None
-            self.areas_arr      = None
-            self.mask_geo_arr   = None
-            self.mbits          = None
-            self.pixel_size_val = None
+                self.geo_key = None # geometry is corrected by run configuration, is not cached
 
         return self.geo
 
 
+    def _reset_geo_state(self):
+        """Resets geometry object and arrays for caching."""
+        for k in GEO_STATE_ATTRS: setattr(self, k, None)
+        self.geo_load_status = self.GEO_NOT_LOADED
+        self.geo_key = None
+
+
+    def _geo_cache_put(self):
+        """Puts geometry object and derived arrays in calib_cache for the key of geometry source."""
+        if self.geo is None or self.geo_key is None: return
+        calib_cache.put(('geometry', self.str_src, self.geo_key), {k:getattr(self, k) for k in GEO_STATE_ATTRS})
+
+
+    def _geo_cache_get(self, key):
+        """Restores geometry object and derived arrays for the key of geometry source from calib_cache,
+           returns True if they are found.
+        """
+        d = calib_cache.get(('geometry', self.str_src, key))
+        if d is None: return False
+        for k,v in d.items(): setattr(self, k, v)
+        self.geo_key = key
+        return True
+
+
+    def _geo_cache_detach(self):
+        """Replaces geometry object, which may be shared through calib_cache with other runs and detector objects,
+           by its private copy and turns off its caching, e.g. before modification of geometry object.
+        """
+        if self.geo_key is None: return
+        self.geo = copy.deepcopy(self.geo)
+        self.geo_key = None
+
+
+    def set_geo_cache_dir(self, dircache=DIR_GEO_CACHE):
+        """Sets directory for on-disk cache of pixel coordinate and index arrays, None - arrays are not saved.
+        """
+        self.geo_dircache = dircache
+
+
+    def _geo_arrays(self, name, pars, func):
+        """Returns tuple of arrays from func() for geometry or from on-disk cache in directory geo_dircache
+           where they are saved in .npz file with name defined by geometry source and parameters.
+        """
+        if self.geo_dircache is None or self.geo_key is None: return func()
+        h = hashlib.md5(repr((self.str_src, self.geo_key, name, pars)).encode()).hexdigest()
+        fname = os.path.join(self.geo_dircache, 'geo-%s-%s.npz' % (name, h))
+        if os.path.exists(fname):
+            try:
+                with np.load(fname) as npz:
+                    arrs = tuple(npz['arr_%d' % i] for i in range(len(npz.files)))
+                if self.pbits & 1: print('geometry arrays %s are loaded from %s' % (name, fname))
+                return arrs
+            except (IOError, ValueError, KeyError) as err:
+                print('WARNING: corrupted geometry cache file %s: %s' % (fname, err))
+        arrs = func()
+        if any(a is None for a in arrs): return arrs
+        ftmp = None
+        try:
+            if not os.path.exists(self.geo_dircache): os.makedirs(self.geo_dircache)
+            fd, ftmp = tempfile.mkstemp(suffix='.npz', dir=self.geo_dircache) # unique for processes on all nodes
+            with os.fdopen(fd, 'wb') as f: np.savez(f, *arrs)
+            os.chmod(ftmp, 0o664)
+            os.rename(ftmp, fname) # atomic, concurrent readers never see partially saved file
+        except (IOError, OSError) as err:
+            if self.pbits & 1: print('geometry arrays %s are not saved: %s' % (name, err))
+            if ftmp is not None and os.path.exists(ftmp): os.remove(ftmp)
+        return arrs
+
+
     def print_attributes(self):
         print('PyDetectorAccess attributes:\n  source: %s\n  dtype: %d\n  pbits: %d' % \
               (self.source, self.dettype, self.pbits), \
@@ -394,7 +571,8 @@ class PyDetectorAccess():
         if self.geoaccess(par) is None: return False
         else:
             if  self.coords_x_arr is None or do_update or cframe != self.cframe_old:
-                self.coords_x_arr, self.coords_y_arr, self.coords_z_arr = self.geo.get_pixel_coords(cframe=cframe)
+                self.coords_x_arr, self.coords_y_arr, self.coords_z_arr =\
+                    self._geo_arrays('coords', (cframe,), lambda: self.geo.get_pixel_coords(cframe=cframe))
                 self.cframe_old = cframe
             if  self.coords_x_arr is None: return False
         return True
@@ -438,12 +616,12 @@ class PyDetectorAccess():
     # mbits = +1-edges; +2-wide central cols; +4-non-bond; +8/+16-four/eight non-bond neighbors
     def mask_geo(self, par, mbits=15, **kwargs):
 
-        if mbits != self.mbits: # check if update is required
-            self.mbits = mbits
-            self.mask_geo_arr = None
-
         if self.geoaccess(par) is None: return None
         else:
+            if mbits != self.mbits: # check if update is required, mbits and mask may come from calib_cache with geometry
+                self.mbits = mbits
+                self.mask_geo_arr = None
+
             if  self.mask_geo_arr is None:
                 self.mask_geo_arr = self.geo.get_pixel_mask(mbits=mbits, **kwargs)
         return  self._shaped_geo_array(self.mask_geo_arr)
@@ -455,9 +633,10 @@ class PyDetectorAccess():
         if self.geoaccess(par) is None: return False
         else:
             if  self.iX is None or do_update:
-                self.iX, self.iY = self.geo.get_pixel_coord_indexes(oname=None, oindex=0,\
+                self.iX, self.iY = self._geo_arrays('indexes', (pix_scale_size_um, xy0_off_pix),\
+                    lambda: self.geo.get_pixel_coord_indexes(oname=None, oindex=0,\
                                                        pix_scale_size_um=pix_scale_size_um,\
-                                                       xy0_off_pix=xy0_off_pix, do_tilt=True)
+                                                       xy0_off_pix=xy0_off_pix, do_tilt=True))
             if  self.iX is None: return False
         return True
 
@@ -468,10 +647,10 @@ class PyDetectorAccess():
         if self.geoaccess(par) is None: return False
         else:
             if  self.iX_at_Z is None or do_update:
-                self.iX_at_Z, self.iY_at_Z =\
-                      self.geo.get_pixel_xy_inds_at_z(zplane=zplane, oname=None, oindex=0,\
+                self.iX_at_Z, self.iY_at_Z = self._geo_arrays('indexes_at_z', (zplane, pix_scale_size_um, xy0_off_pix),\
+                      lambda: self.geo.get_pixel_xy_inds_at_z(zplane=zplane, oname=None, oindex=0,\
                                                       pix_scale_size_um=pix_scale_size_um,\
-                                                      xy0_off_pix=xy0_off_pix, do_tilt=True)
+                                                      xy0_off_pix=xy0_off_pix, do_tilt=True))
             if  self.iX_at_Z is None: return False
         return True
 
@@ -548,12 +727,16 @@ class PyDetectorAccess():
 
     def move_geo(self, par, dx, dy, dz):
         if self.geoaccess(par) is None: pass
-        else: return self.geo.move_geo(None, 0, dx, dy, dz)
+        else:
+            self._geo_cache_detach() # moved geometry is different from its source
+            return self.geo.move_geo(None, 0, dx, dy, dz)
 
 
     def tilt_geo(self, par, dtx, dty, dtz):
         if self.geoaccess(par) is None: pass
-        else: return self.geo.tilt_geo(None, 0, dtx, dty, dtz)
+        else:
+            self._geo_cache_detach() # tilted geometry is different from its source
+            return self.geo.tilt_geo(None, 0, dtx, dty, dtz)
 
 
     def image_xaxis(self, par, pix_scale_size_um=None, x0_off_pix=None):
@@ -578,9 +761,20 @@ class PyDetectorAccess():
             return np.arange(cmin-pix_size*y0_off_pix, cmax, pix_size)
 
 
-    def image(self, par, img_nda, pix_scale_size_um=None, xy0_off_pix=None, do_update=False):
-        if not self._update_index_arrays(par, pix_scale_size_um, xy0_off_pix, do_update): return None
-        return img_from_pixel_arrays(self.iX, self.iY, img_nda)
+    def _update_image_plan(self, par, pix_scale_size_um=None, xy0_off_pix=None, do_update=False):
+        """ Returns True if image assembly plan is available, othervise False.
+            Plan is re-evaluated when pixel index arrays are updated.
+        """
+        if not self._update_index_arrays(par, pix_scale_size_um, xy0_off_pix, do_update): return False
+        if self.img_plan_iX is not self.iX:
+            self.img_inds, self.img_shape = image_assembly_plan(self.iX, self.iY)
+            self.img_plan_iX = self.iX
+        return True
+
+
+    def image(self, par, img_nda, pix_scale_size_um=None, xy0_off_pix=None, do_update=False, out=None):
+        if not self._update_image_plan(par, pix_scale_size_um, xy0_off_pix, do_update): return None
+        return img_from_flat_indexes(self.img_inds, self.img_shape, img_nda, out)
 
 
     def do_reshape_2d_to_3d(self, flag=False):
@@ -627,6 +821,12 @@ class PyDetectorAccess():
         self.correct_time = correct_time
 
 
+    def set_acqiris_dtype(self, dtype=np.float64):
+        """Sets dtype of acqiris waveforms and times, e.g. np.float32
+        """
+        self.acqiris_dtype = np.dtype(dtype)
+
+
     def set_calib_imp(self, do_calib_imp=False):
         """On/off imp calibration
         """
@@ -664,13 +864,15 @@ class PyDetectorAccess():
         return gm
 
 
-    def raw_data(self, evt, env):
+    def raw_data(self, evt, env, out=None):
+        """Returns raw data array, out - optional preallocated array used by detectors assembling raw data from parts.
+        """
 
         #print('XXXX dettype', dettype)
         #print('TypeId.Type.Id_CspadElement: ', TypeId.Type.Id_CspadElement)
         #print('TypeId.Type.Id_CspadConfig: ',  TypeId.Type.Id_CspadConfig)
 
-        if   self.dettype == gu.CSPAD     : return self.raw_data_cspad(evt, env)     # 3   ms
+        if   self.dettype == gu.CSPAD     : return self.raw_data_cspad(evt, env, out)# 3   ms
         elif self.dettype == gu.CSPAD2X2  : return self.raw_data_cspad2x2(evt, env)  # 0.6 ms
         elif self.dettype == gu.PRINCETON : return self.raw_data_princeton(evt, env) # 0.7 ms
         elif self.dettype == gu.PNCCD     : return self.raw_data_pnccd(evt, env)     # 0.8 ms
@@ -685,7 +887,7 @@ class PyDetectorAccess():
                               gu.FCCD, gu.EPICSCAM, gu.STREAK, gu.ARCHON)\
                                           : return self.raw_data_camera(evt, env)
         elif self.dettype == gu.FCCD960   : return self.raw_data_fccd960(evt, env)   # 11  ms
-        elif self.dettype == gu.ACQIRIS   : return self.raw_data_acqiris(evt, env)
+        elif self.dettype == gu.ACQIRIS   : return self.raw_data_acqiris(evt, env, out)
         elif self.dettype == gu.IMP       : return self.raw_data_imp(evt, env)
         elif self.dettype == gu.TIMEPIX   : return self.raw_data_timepix(evt, env)
         elif self.dettype == gu.FLI       : return self.raw_data_fli(evt, env)
@@ -698,7 +900,7 @@ class PyDetectorAccess():
         else                              : return None
 
 
-    def raw_data_cspad(self, evt, env):
+    def raw_data_cspad(self, evt, env, out=None):
 
         # data object
         d = pda.get_cspad_data_object(evt, self.source)
@@ -717,7 +919,11 @@ class PyDetectorAccess():
 
         if self.pbits & 8: print('nquads in data: %d and config: %d' % (nquads, nquads_c))
 
-        arr = np.zeros((4,8,185,388), dtype=np.int16) if nquads<4 else np.empty((4,8,185,388), dtype=np.int16)
+        if out is not None and out.size == 4*8*185*388 and out.dtype == np.int16 and out.flags.c_contiguous:
+            arr = out.reshape((4,8,185,388))
+            if nquads<4: arr.fill(0)
+        else:
+            arr = np.zeros((4,8,185,388), dtype=np.int16) if nquads<4 else np.empty((4,8,185,388), dtype=np.int16)
 
         for iq in range(nquads):
             q = d.quads(iq)
@@ -732,13 +938,11 @@ class PyDetectorAccess():
 
             else:
                 if self.pbits: print('PyDetectorAccessr: quad configuration has non-complete mask = %d of included 2x1' % roim)
-                qdata_full = np.zeros((8,185,388), dtype=qdata.dtype)
-                i = 0
-                for s in range(8):
-                    if roim & (1<<s):
-                        qdata_full[s,:] = qdata[i,:]
-                        i += 1
-                arr[qnum,:,:] = qdata_full
+                plan = self.cspad_plan.get(roim)
+                if plan is None: plan = self.cspad_plan[roim] = cspad_segment_indexes(roim)
+                inds, inds_missing = plan
+                arr[qnum, inds] = qdata
+                arr[qnum, inds_missing] = 0
 
         if self.pbits & 8: print('arr.shape: ', arr.shape)
         arr.shape = (32,185,388)
@@ -963,7 +1167,91 @@ class PyDetectorAccess():
         return nda if nda is not None else None
 
 
-    def raw_data_acqiris(self, evt, env):
+    def raw_data_acqiris(self, evt, env, out=None, do_wf=True, do_wt=True):
+        """returns two 2-d ndarrays wf,wt with shape=(nbrChannels, nbrSamples) or None,
+           - out - optional tuple of preallocated C-contiguous arrays (wf, wt) of shape and dtype self.acqiris_dtype to fill,
+           - do_wf, do_wt - if False, None is returned in place of wf or wt and it is not evaluated.
+           All segments of channel are copied with a single fancy-index assignment,
+           sample times are taken from the time grid cached per (nbrSamplesInSeg, sampInterval).
+        """
+        # data object
+        d = pda.get_acqiris_data_object(evt, self.source)
+        if d is None: return None
+
+        # configuration object
+        c = pda.get_acqiris_config_object(env, self.source)
+        if c is None: return None
+
+        #nchan = d.data_shape()[0]
+        nbrChannels = c.nbrChannels()
+
+        h = c.horiz()
+        sampInterval = h.sampInterval()
+        nbrSamples = h.nbrSamples()
+
+        if self.pbits & 4: print('  nbrChannels: %d, H-nbrSamples: %d, H-sampInterval: %g' \
+           % (nbrChannels, nbrSamples, sampInterval))
+
+        shape = (nbrChannels, nbrSamples)
+        dtype = self.acqiris_dtype
+        wf, wt = (None, None) if out is None else out
+        if do_wf:
+            if wf is None or wf.shape != shape or wf.dtype != dtype or not wf.flags.c_contiguous: wf = np.zeros(shape, dtype=dtype)
+            else: wf.fill(0)
+        if do_wt:
+            if wt is None or wt.shape != shape or wt.dtype != dtype or not wt.flags.c_contiguous: wt = np.zeros(shape, dtype=dtype)
+            else: wt.fill(0)
+
+        vert = c.vert()
+
+        for chan in range(nbrChannels):
+            elem = d.data(chan)
+
+            nbrSegments     = elem.nbrSegments()
+            nbrSamplesInSeg = elem.nbrSamplesInSeg()
+            indexFirstPoint = elem.indexFirstPoint()
+            tstamps         = elem.timestamp()
+
+            if self.pbits & 4:
+                print('    chan: %d,  nbrSegments: %d,  nbrSamplesInSeg: %d,  indexFirstPoint: %d,' \
+                  % (chan, nbrSegments, nbrSamplesInSeg, indexFirstPoint), \
+                  '  V-slope: %f,  V-offset: %f,  H-pos[seg=0]: %g' % (vert[chan].slope(), vert[chan].offset(), tstamps[0].pos()))
+
+            # per segment first sample index and size as in raw_data_acqiris_v0
+            segs = np.arange(nbrSegments)
+            pos = np.array([tstamps[seg].pos() for seg in segs], dtype=np.float64)
+            i0_seg = segs * nbrSamplesInSeg
+            if self.correct_time: i0_seg += (pos/sampInterval).astype(np.int64)
+            size = np.minimum(nbrSamplesInSeg, nbrSamples - i0_seg)
+            if self.correct_time: size = np.minimum(size, nbrSamplesInSeg - indexFirstPoint)
+
+            isamp = np.arange(nbrSamplesInSeg)
+            sel = isamp[None,:] < size[:,None] # (nbrSegments, nbrSamplesInSeg)
+            iseg = np.broadcast_to(segs[:,None], sel.shape)[sel]
+            jsamp = np.broadcast_to(isamp[None,:], sel.shape)[sel]
+            inds = i0_seg[iseg] + jsamp
+
+            if do_wf:
+                wforms = elem.waveforms()
+                jraw = jsamp + indexFirstPoint if self.correct_time else jsamp
+                wf[chan, inds] = wforms[iseg, jraw] * vert[chan].slope() - vert[chan].offset()
+
+            if do_wt:
+                wt[chan, inds] = self.acqiris_time_grid(nbrSamplesInSeg, sampInterval)[jsamp] + pos[iseg]
+
+        return (wf if do_wf else None), (wt if do_wt else None)
+
+
+    def acqiris_time_grid(self, nbrSamplesInSeg, sampInterval):
+        """returns cached np.arange(nbrSamplesInSeg)*sampInterval"""
+        key = (nbrSamplesInSeg, sampInterval)
+        if self.acqiris_tgrid_key != key:
+            self.acqiris_tgrid = np.arange(nbrSamplesInSeg)*sampInterval
+            self.acqiris_tgrid_key = key
+        return self.acqiris_tgrid
+
+
+    def raw_data_acqiris_v0(self, evt, env):
         """returns two 2-d ndarrays wf,wt with shape=(nbrChannels, nbrSamples) or None
         """
         # data object
@@ -1092,18 +1380,9 @@ class PyDetectorAccess():
             return None
 
         self.gm = np.zeros((32,185,388), dtype=np.uint8)
-        asic1   = np.ones((185,194), dtype=np.uint8)
 
         for iquad in range(c.quads_shape()[0]):
-            # need in copy to right shift bits
-            gm = np.array(c.quads(iquad).gm().gainMap())
-
-            for i2x1 in range(8):
-                gmasic0 = gm & 1 # take the lowest bit only
-                gm = np.right_shift(gm, asic1)
-                gm2x1 = np.hstack((gmasic0, gm & 1))
-                self.gm[i2x1+iquad*8][:][:] = np.logical_not(gm2x1)
-                if i2x1 < 7: gm = np.right_shift(gm, asic1) # do not shift for last asic
+            self.gm[iquad*8:(iquad+1)*8] = gain_mask_2x1s(c.quads(iquad).gm().gainMap(), 8)
 
         self.cfg_gain_mask_is_loaded = True
 
@@ -1128,10 +1407,7 @@ class PyDetectorAccess():
             return None
 
         #self.gm = np.empty((2,185,388), dtype=np.uint8)
-        self.gm = np.zeros((2,185,388), dtype=np.uint8)
-        asic1   = np.ones((185,194), dtype=np.uint8)
-
-        gm = np.array(c.quad().gm().gainMap())
+        gm = c.quad().gm().gainMap()
 
         # see the DAQ pdsapp/config/Cspad2x2GainMap.cc:export_() to see that
         # the 4 bits in each element of the gainmap array correspond to the
@@ -1142,12 +1418,7 @@ class PyDetectorAccess():
         #   0 2
         # I am assuming the above corresponds to the 2x2 "natural shape"
         # of [2,185,388] in a natural way.
-        for i2x1 in range(2):
-            gmasic0 = gm & 1 # take the lowest bit only
-            gm = np.right_shift(gm, asic1)
-            gm2x1 = np.hstack((gmasic0, gm & 1))
-            self.gm[i2x1][:][:] = np.logical_not(gm2x1)
-            if i2x1 < 1: gm = np.right_shift(gm, asic1) # do not shift for last asic
+        self.gm = gain_mask_2x1s(gm, 2)
 
         self.cfg_gain_mask_is_loaded = True
 
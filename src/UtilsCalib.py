@@ -10,6 +10,10 @@ Usage::
     from Detector.UtilsCalib import proc_block, DarkProc, evaluate_limits
     from Detector.UtilsCalib import tstamps_run_and_now, tstamp_for_dataset
     gate_lo, gate_hi, arr_med, arr_abs_dev = proc_block(block, **kwa)
+    dpo = DarkProc(stream=True, nrecs0=10, **kwa) # gates are streaming estimates, no block of nrecs1 frames
+    dpo = DarkProc(comm=mpi_comm(), **kwa) # events are split between MPI ranks, see DarkProc.is_own_event
+    if dpo.reduce_stats(): dpo.summary()   # DarkStats of all ranks are merged in rank 0
+    stats.merge(DarkStats.load(fname))     # or DarkStats.deserialize(bytes) from stats.serialize()
 
     lo, hi = evaluate_limits(arr, nneg=5, npos=5, lim_lo=1, lim_hi=1000, cmt='')
     ts_run, ts_now = tstamps_run_and_now(env, fmt=TSTAMP_FORMAT)
@@ -17,6 +21,10 @@ Usage::
 
     save_log_record_at_start(dirrepo, fname, dirmode=0o2775, filemode=0o664)
     fname = find_file_for_timestamp(dirname, pattern, tstamp)
+    fname = repoman.find_file_for_timestamp(dirname, pattern, tstamp) # bisect in TimestampIndex of directory
+    nda = load_textfile_cached(fname, dtype=np.float32) # np.loadtxt via memory-mapped .npy sidecar
+    nda = load_repo_array(fname, dtype=np.float32)      # memory-mapped .npy or text file of the repository
+    fnames = save_merged_panels(dic_consts, fmerge_prefix, dic_fmt, repofmt='npy', nprocs=4)
 
 This software was developed for the SIT project.
 If you use all or part of it, please give an appropriate acknowledgment.
@@ -27,6 +35,8 @@ import logging
 logger = logging.getLogger(__name__)
 
 import os
+import re
+import tempfile
 import numpy as np
 from time import time, strftime, localtime
 from psana import EventId, DataSource
@@ -37,6 +47,9 @@ import PSCalib.GlobalUtils as cgu
 log_rec_at_start, create_directory, save_textfile, merge_masks =\
   cgu.log_rec_at_start, cgu.create_directory, cgu.save_textfile, cgu.merge_masks
 TSTAMP_FORMAT = '%Y%m%d%H%M%S'
+DIR_NPY_CACHE = os.environ.get('DIR_NPY_CACHE', None) # None - .npy sidecar files are saved next to text files
+MAX_CHUNK_BYTES = 256<<20 # memory budget for float64 copy of pixel chunk of data block in block_* functions
+SA_CHUNK_PIXELS = 1<<15   # pixels per chunk of streaming gate update, buffers of the chunk stay in CPU cache
 
 def str_tstamp(fmt='%Y-%m-%dT%H:%M:%S', time_sec=None):
     """Returns string timestamp for specified format and time in sec or current time by default
@@ -191,6 +204,8 @@ class RepoManager():
         self.year        = kwa.get('year', str_tstamp(fmt='%Y'))
         self.tstamp      = kwa.get('tstamp', str_tstamp(fmt='%Y-%m-%dT%H%M%S'))
         self.dir_log_at_start = kwa.get('dir_log_at_start', '/cds/group/psdm/logs/atstart')
+        self.repofmt     = kwa.get('repofmt', 'txt') # 'txt' or 'npy' - format of constants saved by save_array
+        self.tsindex     = kwa.get('tsindex', TSTAMP_INDEX) # TimestampIndex of repository directories
 
 
     def makedir(self, d):
@@ -290,6 +305,24 @@ class RepoManager():
         return dirs
 
 
+    def find_file_for_timestamp(self, dirname, pattern, tstamp):
+        """returns file name in dirname containing pattern for the nearest timestamp <= tstamp or None
+        """
+        return self.tsindex.find(dirname, pattern, tstamp)
+
+
+    def save_array(self, nda, fname, fmt='%.3f'):
+        """saves array in repository file fname or its binary .npy version for repofmt='npy', returns name of saved file
+        """
+        return save_repo_array(nda, fname, self.filemode, fmt, self.umask, self.group, self.repofmt)
+
+
+    def load_array(self, fname, dtype=np.float32):
+        """returns array from repository text or memory-mapped binary .npy file
+        """
+        return load_repo_array(fname, dtype)
+
+
     def logname_at_start(self, scrname, year=None):
         _year = str_tstamp(fmt='%Y') if year is None else str(year)
         return '%s/%s_log_%s.txt' % (self.makedir_logs(), _year, scrname)
@@ -362,6 +395,7 @@ def proc_dark_block(block, **kwa):
     frachi     = kwa.get('frachi', 0.95)    # fraction of statistics below high gate limit
     frac05     = 0.5
     nrecs1     = kwa.get('nrecs1', None)    # number of records for the 1st stage processing
+    max_bytes  = kwa.get('max_chunk_bytes', MAX_CHUNK_BYTES) # memory budget for pixel chunk of the block
 
     logger.debug('in proc_dark_block for exp=%s det=%s, block.shape=%s' % (exp, detname, str(block.shape)))
     logger.info(info_ndarr(block, 'begin pricessing of the data block:\n    ', first=100, last=105))
@@ -389,18 +423,15 @@ def proc_dark_block(block, **kwa):
     - use nrecs1 (< nrecs) due to memory and time consumption
     """
 
-    blockf64 = block[:nrecs1,:]
-    arr_med = np.quantile(blockf64, frac05, axis=0, interpolation='linear')
-    arr_qlo = np.quantile(blockf64, fraclo, axis=0, interpolation='lower')
-    arr_qhi = np.quantile(blockf64, frachi, axis=0, interpolation='higher')
+    arr_med, arr_qlo, arr_qhi = block_quantiles(block[:nrecs1,:],\
+        ((frac05, 'linear'), (fraclo, 'lower'), (frachi, 'higher')), max_bytes=max_bytes)
     logger.debug('block array median/quantile(0.5) for med, qlo, qhi time = %.3f sec' % (time()-t1_sec))
 
     med_med = np.median(arr_med)
     med_qlo = np.median(arr_qlo)
     med_qhi = np.median(arr_qhi)
 
-    arr_dev_3d = block[:,] - arr_med # .astype(dtype=np.float64)
-    arr_abs_dev = np.median(np.abs(arr_dev_3d), axis=0)
+    arr_abs_dev = block_median_abs_dev(block, arr_med, max_bytes=max_bytes)
     med_abs_dev = np.median(arr_abs_dev)
 
     logger.info(info_ndarr(arr_med,     '    arr_med[100:105] ', first=100, last=105))
@@ -421,12 +452,6 @@ def proc_dark_block(block, **kwa):
     # 2nd loop over recs in block to evaluate gated parameters
     logger.debug('begin 2nd iteration')
 
-    sta_int_lo = np.zeros(shape, dtype=np.uint64)
-    sta_int_hi = np.zeros(shape, dtype=np.uint64)
-
-    arr_max = np.zeros(shape, dtype=block.dtype)
-    arr_min = np.ones (shape, dtype=block.dtype) * 0x3fff
-
     gate_lo = np.maximum(arr_qlo, arr1_u16 * int_lo).astype(dtype=block.dtype)
     gate_hi = np.minimum(arr_qhi, arr1_u16 * int_hi).astype(dtype=block.dtype)
     cond = gate_hi>gate_lo
@@ -435,27 +460,9 @@ def proc_dark_block(block, **kwa):
     logger.debug(info_ndarr(gate_lo, '    gate_lo '))
     logger.debug(info_ndarr(gate_hi, '    gate_hi '))
 
-    arr_sum0 = np.zeros(shape, dtype=np.uint64)
-    arr_sum1 = np.zeros(shape, dtype=np.float64)
-    arr_sum2 = np.zeros(shape, dtype=np.float64)
-
-    for nrec in range(nrecs):
-        raw    = block[nrec,:]
-        rawdbl = raw.astype(dtype=np.uint64) # blockdbl[nrec,:]
-
-        logger.debug('nrec:%03d median(raw-ave): %f' % (nrec, np.median(raw.astype(dtype=np.float64) - arr_med)))
-
-        condlist = (np.logical_not(np.logical_or(raw<gate_lo, raw>gate_hi)),)
-
-        arr_sum0 += np.select(condlist, (arr1,), 0)
-        arr_sum1 += np.select(condlist, (rawdbl,), 0)
-        arr_sum2 += np.select(condlist, (np.square(rawdbl),), 0)
-
-        sta_int_lo += np.select((raw<int_lo,), (arr1,), 0)
-        sta_int_hi += np.select((raw>int_hi,), (arr1,), 0)
-
-        arr_max = np.maximum(arr_max, raw)
-        arr_min = np.minimum(arr_min, raw)
+    arr_sum0, arr_sum1, arr_sum2, sta_int_lo, sta_int_hi =\
+        block_gated_sums(block, gate_lo, gate_hi, int_lo, int_hi, max_bytes=max_bytes)
+    logger.debug('2nd iteration time = %.3f sec' % (time()-t0_sec))
 
     arr_av1 = divide_protected(arr_sum1, arr_sum0)
     arr_av2 = divide_protected(arr_sum2, arr_sum0)
@@ -510,6 +517,114 @@ def proc_dark_block(block, **kwa):
     return arr_av1, arr_rms, arr_sta
 
 
+def quantile(a, q, axis=0, method='linear'):
+    """Returns np.quantile with method for numpy>=1.22 or with interpolation parameter for older versions."""
+    try: return np.quantile(a, q, axis=axis, method=method)
+    except TypeError: return np.quantile(a, q, axis=axis, interpolation=method)
+
+
+def block_chunks(block, max_bytes=MAX_CHUNK_BYTES, itemsize=8, max_pixels=None):
+    """Yields slices of axis 1 of block shaped as (nrecs, <raw-detector-shape>),
+       such that pixel chunk block[:,slice] of items with itemsize is within max_bytes (at least one index of axis 1)
+       and, if max_pixels is specified, has at most max_pixels pixels.
+    """
+    n1 = block.shape[1]
+    step = max(1, int(max_bytes // (itemsize * block[:,0].size)))
+    if max_pixels is not None: step = max(1, min(step, max_pixels // block[0,0].size))
+    for i in range(0, n1, step): yield slice(i, min(i+step, n1))
+
+
+def chunk_pixel_major(block, sl, datbits=None, nrecs_tile=64):
+    """Returns pixel-major copy shaped as (npix, nrecs) of pixel chunk block[:,sl] & datbits in block.dtype.
+       Transposition is done in tiles of nrecs_tile records which fit in cache.
+    """
+    n = block.shape[0]
+    c = block[:,sl].reshape(n, -1)
+    t = np.empty(c.shape[::-1], dtype=block.dtype)
+    for i in range(0, n, nrecs_tile): t[:,i:i+nrecs_tile] = c[i:i+nrecs_tile].T
+    if datbits is not None: t &= datbits
+    return t
+
+
+def sorted_quantile(c, q, method='linear'):
+    """Returns float64 quantile q of pixel-major array c shaped as (npix, nrecs) sorted along axis 1,
+       the same as np.quantile(c, q, axis=1, method=method) for method 'linear', 'lower', 'higher'.
+    """
+    n = c.shape[1]
+    if method == 'lower': return c[:,int(np.floor((n-1)*q))].astype(np.float64)
+    if method == 'higher': return c[:,int(np.ceil((n-1)*q))].astype(np.float64)
+    v = (n-1)*q
+    i0 = int(np.floor(v))
+    a, b = c[:,i0].astype(np.float64), c[:,min(i0+1, n-1)].astype(np.float64)
+    t = v - i0
+    d = b - a
+    return b - d*(1-t) if t >= 0.5 else a + d*t # as np.lib._function_base_impl._lerp
+
+
+def median_abs_dev(c, med):
+    """Returns median(abs(c - med), axis=1) for pixel-major array c shaped as (npix, nrecs) and med shaped as (npix,).
+       For integer c and med in half-integers, as for median of integers, deviations are evaluated exactly
+       in doubled integers which are sorted much faster than float64.
+    """
+    med2 = 2*med
+    if c.dtype.kind in 'iu' and np.array_equal(med2, np.rint(med2)):
+        d = 2*c.astype(np.int32)
+        d -= med2.astype(np.int32)[:,None]
+        scale = 0.5
+    else:
+        d = c - med[:,None]
+        scale = 1
+    np.abs(d, out=d)
+    d.sort(axis=1)
+    return sorted_quantile(d, 0.5) * scale
+
+
+def block_quantiles(block, qpars=((0.5, 'linear'),), datbits=None, abs_dev=False, max_bytes=MAX_CHUNK_BYTES, max_pixels=4096):
+    """Returns list of float64 arrays shaped as block.shape[1:] of quantiles along axis 0 of block & datbits
+       for qpars=((q, method),...), the same as quantile(block & datbits, q, axis=0, method=method).
+       If abs_dev, appends median(abs(block & datbits - q0)), where q0 is the 1st quantile in the list, usually median.
+       Block is processed in pixel chunks within max_bytes and max_pixels, each chunk is sorted once in block.dtype
+       for all quantiles, the full float copy of block or array of deviations are not created.
+    """
+    res = [np.empty(block.shape[1:], dtype=np.float64) for i in range(len(qpars) + int(abs_dev))]
+    for sl in block_chunks(block, max_bytes, block.dtype.itemsize, max_pixels):
+        c = chunk_pixel_major(block, sl, datbits)
+        c.sort(axis=1)
+        qs = [sorted_quantile(c, q, method) for q, method in qpars]
+        if abs_dev: qs.append(median_abs_dev(c, qs[0]))
+        for r, q in zip(res, qs): r[sl] = q.reshape(r[sl].shape)
+    return res
+
+
+def block_median_abs_dev(block, arr_med, datbits=None, max_bytes=MAX_CHUNK_BYTES, max_pixels=4096):
+    """Returns median(abs(block & datbits - arr_med), axis=0) evaluated in pixel chunks within max_bytes and max_pixels."""
+    res = np.empty(block.shape[1:], dtype=np.float64)
+    for sl in block_chunks(block, max_bytes, block.dtype.itemsize, max_pixels):
+        c = chunk_pixel_major(block, sl, datbits)
+        res[sl] = median_abs_dev(c, arr_med[sl].reshape(-1)).reshape(res[sl].shape)
+    return res
+
+
+def block_gated_sums(block, gate_lo, gate_hi, int_lo, int_hi, max_bytes=MAX_CHUNK_BYTES):
+    """Returns arr_sum0, arr_sum1, arr_sum2, sta_int_lo, sta_int_hi shaped as block.shape[1:] -
+       number of records, sums of intensities and their squares (dtype:float64) in the gate [gate_lo, gate_hi]
+       and number of records with intensities below int_lo and above int_hi, accumulated over axis 0
+       in pixel chunks within max_bytes. Sums are evaluated in integers, so they are identical to per-record float64 sums.
+    """
+    sh = block.shape[1:]
+    res = [np.empty(sh, dtype=dt) for dt in (np.uint64, np.float64, np.float64, np.uint64, np.uint64)]
+    for sl in block_chunks(block, max_bytes, itemsize=8):
+        b = block[:,sl]
+        good = np.logical_and(b >= gate_lo[sl], b <= gate_hi[sl])
+        c = np.where(good, b, 0).astype(np.uint32)
+        res[0][sl] = good.sum(axis=0, dtype=np.uint64)
+        res[1][sl] = c.sum(axis=0, dtype=np.uint64)
+        res[2][sl] = np.square(c, out=c).sum(axis=0, dtype=np.uint64)
+        res[3][sl] = (b < int_lo).sum(axis=0, dtype=np.uint64)
+        res[4][sl] = (b > int_hi).sum(axis=0, dtype=np.uint64)
+    return res
+
+
 def proc_block(block, **kwa):
     """Dark data 1st stage processing to define gate limits.
        block.shape = (nrecs, <raw-detector-shape>),
@@ -532,6 +647,7 @@ def proc_block(block, **kwa):
     frac05     = 0.5
     datbits    = kwa.get('datbits', 0x3fff) # data bits 0x3fff is 14-bit mask for epix10ka and Jungfrau
     #nrecs1     = kwa.get('nrecs1', None)   # number of records for the 1st stage processing
+    max_bytes  = kwa.get('max_chunk_bytes', MAX_CHUNK_BYTES) # memory budget for pixel chunk of the block
 
     logger.debug('in proc_block for exp=%s det=%s, block.shape=%s' % (exp, detname, str(block.shape)))
     logger.info(info_ndarr(block, 'begin pricessing of the data block', first=100, last=105))
@@ -563,20 +679,15 @@ def proc_block(block, **kwa):
     #                                 +' add random [0,1)-0.5 time = %.3f sec'%\
     #                                  (time()-t1_sec), first=100, last=105))
 
-    blockf64 = block & datbits
     #arr_med = np.median(block, axis=0)
-    arr_med = np.quantile(blockf64, frac05, axis=0, interpolation='linear')
-    arr_qlo = np.quantile(blockf64, fraclo, axis=0, interpolation='lower')
-    arr_qhi = np.quantile(blockf64, frachi, axis=0, interpolation='higher')
+    arr_med, arr_qlo, arr_qhi, arr_abs_dev = block_quantiles(block,\
+        ((frac05, 'linear'), (fraclo, 'lower'), (frachi, 'higher')), datbits=datbits, abs_dev=True, max_bytes=max_bytes)
 
-    logger.debug('block array median/quantile(frac) for med, qlo, qhi time = %.3f sec' % (time()-t1_sec))
+    logger.debug('block array median/quantile(frac) for med, qlo, qhi and median(abs(raw-med)) time = %.3f sec' % (time()-t1_sec))
 
     med_med = np.median(arr_med)
     med_qlo = np.median(arr_qlo)
     med_qhi = np.median(arr_qhi)
-
-    arr_dev_3d = blockf64[:,] - arr_med # .astype(dtype=np.float64)
-    arr_abs_dev = np.median(np.abs(arr_dev_3d), axis=0)
     med_abs_dev = np.median(arr_abs_dev)
 
     s = 'proc_block pre-processing time %.3f sec' % (time()-t0_sec)\
@@ -606,6 +717,99 @@ def proc_block(block, **kwa):
     return gate_lo, gate_hi, arr_med, arr_abs_dev
 
 
+class DarkStats():
+    """Mergeable accumulators of dark data statistics for DarkProc.
+       Each array is accumulated per event in add and merged with array of other object by ufunc from self.ops,
+       so statistics collected in parallel for subsets of events can be reduced before DarkProc.summary.
+    """
+    def __init__(self, shape=None, dtype=np.uint16):
+        self.nrecs = 0    # number of accumulated records
+        self.arrays = {}  # {name:array}
+        self.ops = {}     # {name:ufunc} to merge arrays in place
+        if shape is None: return
+        for name, dt, val, op in (\
+            ('arr_sum0',   np.uint64,  0,      np.add),\
+            ('arr_sum1',   np.float64, 0,      np.add),\
+            ('arr_sum2',   np.float64, 0,      np.add),\
+            ('sta_int_lo', np.uint64,  0,      np.add),\
+            ('sta_int_hi', np.uint64,  0,      np.add),\
+            ('arr_max',    dtype,      0,      np.maximum),\
+            ('arr_min',    dtype,      0xffff, np.minimum)):
+            self.add_array(name, np.full(shape, val, dtype=dt), op)
+
+    def add_array(self, name, arr, op):
+        """Adds array accumulated outside of this class, e.g. in DarkProc subclass, returns arr."""
+        self.arrays[name] = arr
+        self.ops[name] = op
+        return arr
+
+    def add(self, raw, gate_lo, gate_hi, int_lo, int_hi):
+        """Accumulates gated sums, statistics of intensities below int_lo / above int_hi and max/min of raw data bits."""
+        a = self.arrays
+        good = np.logical_and(raw >= gate_lo, raw <= gate_hi)
+        raw_f64 = np.where(good, raw, 0).astype(np.float64)
+        a['arr_sum0'] += good
+        a['arr_sum1'] += raw_f64
+        a['arr_sum2'] += np.square(raw_f64)
+        a['sta_int_lo'] += raw < int_lo
+        a['sta_int_hi'] += raw > int_hi
+        np.maximum(a['arr_max'], raw, out=a['arr_max'])
+        np.minimum(a['arr_min'], raw, out=a['arr_min'])
+        self.nrecs += 1
+
+    def merge(self, other):
+        """Merges statistics of other DarkStats object in place, returns self."""
+        for k, arr in self.arrays.items():
+            self.ops[k](arr, other.arrays[k], out=arr)
+        self.nrecs += other.nrecs
+        return self
+
+    def serialize(self):
+        """Returns bytes of .npz file with arrays, names of their merge ufuncs and number of records."""
+        from io import BytesIO
+        f = BytesIO()
+        np.savez(f, _nrecs=self.nrecs, _ops=np.array(['%s:%s' % (k, op.__name__) for k, op in self.ops.items()]), **self.arrays)
+        return f.getvalue()
+
+    @staticmethod
+    def deserialize(b):
+        """Returns DarkStats object for bytes from serialize."""
+        from io import BytesIO
+        return DarkStats.from_npz(np.load(BytesIO(b)))
+
+    @staticmethod
+    def from_npz(d):
+        o = DarkStats()
+        o.nrecs = int(d['_nrecs'])
+        for rec in d['_ops']:
+            k, op = str(rec).split(':')
+            o.add_array(k, d[k], getattr(np, op))
+        return o
+
+    def save(self, fname):
+        """Saves statistics in .npz file, e.g. partial statistics of independent jobs."""
+        with open(fname, 'wb') as f: f.write(self.serialize())
+
+    @staticmethod
+    def load(fname):
+        return DarkStats.from_npz(np.load(fname))
+
+
+def merge_dark_stats(a, b):
+    """Returns merged DarkStats objects a and b, any of them can be None, e.g. reduction operation for MPI comm.reduce."""
+    if a is None: return b
+    if b is None: return a
+    return a.merge(b)
+
+
+def mpi_comm():
+    """Returns MPI.COMM_WORLD if job is launched by mpirun with more than one rank, None otherwise or if mpi4py is missing."""
+    try: from mpi4py import MPI
+    except ImportError: return None
+    comm = MPI.COMM_WORLD
+    return comm if comm.Get_size() > 1 else None
+
+
 class DarkProc():
     """dark data accumulation and processing
     """
@@ -625,11 +829,24 @@ class DarkProc():
         self.rmsnlo = kwa.get('rmsnlo', 6.0)     # rms ditribution number-of-sigmas low
         self.rmsnhi = kwa.get('rmsnhi', 6.0)     # rms ditribution number-of-sigmas high
         self.datbits= kwa.get('datbits', 0x3fff) # data bits 0x3fff is 14-bit mask for epix10ka and Jungfrau
+        self.stream = kwa.get('stream', False)   # streaming gates, memory is independent of nrecs1
+        self.nrecs0 = kwa.get('nrecs0', 10)      # number of records for initial gates in streaming mode
+        self.fraclo = kwa.get('fraclo', 0.05)    # fraction of statistics below low gate limit
+        self.frachi = kwa.get('frachi', 0.95)    # fraction of statistics below high gate limit
+        self.nblock = self.nrecs0 if self.stream else self.nrecs1 # number of records in the data block
+        self.comm   = kwa.get('comm', None)      # MPI communicator to split events between ranks, see mpi_comm
+        self.rank   = kwa.get('rank',   0 if self.comm is None else self.comm.Get_rank())
+        self.nranks = kwa.get('nranks', 1 if self.comm is None else self.comm.Get_size())
+        # records in this rank: data block and candidate events ncand<nrecs of stage 2 with ncand % nranks == rank
+        self.nrecs_rank = self.nrecs if self.nrecs <= self.nblock else\
+                          self.nblock + (self.nrecs-1-self.rank)//self.nranks - (self.nblock-1-self.rank)//self.nranks
+        self.stats  = None
 
         self.status = 0 # 0/1/2 stage
         self.kwa    = kwa
         self.block  = None
         self.irec   = -1
+        self.ncand  = -1 # counter of candidate events, the same in all ranks, see is_own_event
 
 
     def accumulate_block(self, raw):
@@ -638,8 +855,9 @@ class DarkProc():
 
     def proc_block(self):
         t0_sec = time()
-        block = self.block if self.irec > self.nrecs1-1 else self.block[:self.irec+1,:]
+        block = self.block if self.irec > self.nblock-1 else self.block[:self.irec+1,:]
         self.gate_lo, self.gate_hi, self.arr_med, self.abs_dev = proc_block(block, **self.kwa)
+        if self.stream: self.init_stream(block)
         logger.info('data block processing total time %.3f sec' % (time()-t0_sec)\
               +info_ndarr(self.arr_med, '\n  arr_med[100:105]', first=100, last=105)\
               +info_ndarr(self.abs_dev, '\n  abs_dev[100:105]', first=100, last=105)\
@@ -647,6 +865,59 @@ class DarkProc():
               +info_ndarr(self.gate_hi, '\n  gate_hi[100:105]', first=100, last=105))
 
 
+    def init_stream(self, block):
+        """Initializes streaming estimators of quantiles fraclo, 0.5, frachi and median(abs(raw-med))
+           by the small block of nrecs0 records. Estimators are updated for each next event in update_gates
+           by stochastic approximation q += scale/n * (p - (raw<q)) / pdf(q), where pdf is approximated
+           by normal distribution with sigma = 1.4826*abs_dev, so memory does not depend on nrecs1.
+        """
+        from statistics import NormalDist
+        nd = NormalDist()
+        self.arr_qlo, self.arr_qhi = [q.astype(np.float32) for q in block_quantiles(block,\
+            ((self.fraclo, 'lower'), (self.frachi, 'higher')), datbits=self.datbits)] # the same as in proc_block
+        self.arr_med = self.arr_med.astype(np.float32)
+        self.abs_dev = self.abs_dev.astype(np.float32)
+        self.sa_coefs = [1./nd.pdf(nd.inv_cdf(p)) for p in (self.fraclo, 0.5, self.frachi)]\
+                      + [1./(2*nd.pdf(nd.inv_cdf(0.75)))] # for half-normal distribution of abs(raw-med)
+        self.nstream = block.shape[0]
+        n = min(SA_CHUNK_PIXELS, self.arr_med.size)
+        self.sa_bufs = [np.empty(n, dtype=np.float32) for i in range(4)] + [np.empty(n, dtype=bool)]
+
+    def update_gates(self, raw):
+        """Updates streaming quantile estimators by the data bits of raw and sets gate_lo, gate_hi as in proc_block.
+           Updates are done in place by chunks of SA_CHUNK_PIXELS pixels in buffers sa_bufs preallocated in init_stream.
+        """
+        self.nstream += 1
+        fstep = np.float32(1.4826/self.nstream)
+        arrs = [a.reshape(-1) for a in (raw, self.arr_qlo, self.arr_med, self.arr_qhi, self.abs_dev, self.gate_lo, self.gate_hi)]
+        for i in range(0, arrs[0].size, SA_CHUNK_PIXELS):
+            self.update_gates_chunk(fstep, *[a[i:i+SA_CHUNK_PIXELS] for a in arrs])
+
+    def update_gates_chunk(self, fstep, raw, qlo, qmed, qhi, qdev, gate_lo, gate_hi):
+        """Stochastic approximation step q += scale/n * (p - (raw<q)) / pdf(q) for 1-d chunks of arrays."""
+        step, stepc, dif, adev, cmp = [b[:raw.size] for b in self.sa_bufs]
+        np.maximum(qdev, np.float32(0.5), out=step)
+        step *= fstep
+        np.subtract(raw, qmed, out=adev)
+        np.abs(adev, out=adev)
+        for q, p, c, x in ((qlo,  self.fraclo, self.sa_coefs[0], raw),\
+                           (qmed, 0.5,         self.sa_coefs[1], raw),\
+                           (qhi,  self.frachi, self.sa_coefs[2], raw),\
+                           (qdev, 0.5,         self.sa_coefs[3], adev)):
+            np.multiply(step, np.float32(c), out=stepc)
+            np.less(x, q, out=cmp)
+            np.subtract(np.float32(p), cmp, out=dif)
+            stepc *= dif
+            q += stepc
+        np.floor(qlo, out=dif)
+        np.maximum(dif, self.int_lo, out=dif)
+        np.copyto(gate_lo, dif, casting='unsafe')
+        np.ceil(qhi, out=dif)
+        np.minimum(dif, self.int_hi, out=dif)
+        np.copyto(gate_hi, dif, casting='unsafe')
+        np.less_equal(gate_hi, gate_lo, out=cmp)
+        np.add(gate_hi, cmp, out=gate_hi, casting='unsafe')
+
     def init_proc(self):
 
         shape_raw = self.arr_med.shape
@@ -654,26 +925,58 @@ class DarkProc():
 
         logger.info('Stage 2 initialization for raw shape %s and dtype %s' % (str(shape_raw), str(dtype_raw)))
 
-        self.arr_sum0   = np.zeros(shape_raw, dtype=np.uint64)
-        self.arr_sum1   = np.zeros(shape_raw, dtype=np.float64)
-        self.arr_sum2   = np.zeros(shape_raw, dtype=np.float64)
-
         self.arr0       = np.zeros(shape_raw, dtype=dtype_raw)
         self.arr1       = np.ones (shape_raw, dtype=dtype_raw)
         self.arr1u64    = np.ones (shape_raw, dtype=np.uint64)
 
-        self.sta_int_lo = np.zeros(shape_raw, dtype=np.uint64)
-        self.sta_int_hi = np.zeros(shape_raw, dtype=np.uint64)
-
-        self.arr_sum0   = np.zeros(shape_raw, dtype=np.uint64)
-        self.arr_sum1   = np.zeros(shape_raw, dtype=np.float64)
-        self.arr_sum2   = np.zeros(shape_raw, dtype=np.float64)
-
         self.gate_hi    = np.minimum(self.arr1 * self.int_hi, self.gate_hi)
         self.gate_lo    = np.maximum(self.arr1 * self.int_lo, self.gate_lo)
 
-        self.arr_max    = np.zeros(shape_raw, dtype=dtype_raw)
-        self.arr_min    = np.ones (shape_raw, dtype=dtype_raw) * 0xffff
+        self.stats = DarkStats(shape_raw, dtype_raw) # arr_sum0/1/2, sta_int_lo/hi, arr_max/min
+        self.set_stats_arrays()
+
+
+    def set_stats_arrays(self):
+        """Sets arrays of self.stats as attributes of self."""
+        for k, v in self.stats.arrays.items(): setattr(self, k, v)
+
+
+    def merge_stats(self, stats):
+        """Merges DarkStats object accumulated for other subset of events, e.g. by other process."""
+        if stats is None: return
+        if self.stats is None:
+            self.stats = stats
+            self.set_stats_arrays()
+        else: self.stats.merge(stats)
+        self.irec = self.stats.nrecs - 1
+
+
+    def reduce_stats(self):
+        """Merges statistics of all ranks of self.comm in rank 0. Should be called by all ranks before summary,
+           returns True in rank 0 or if comm is None, that is if summary and saving of results should be done.
+        """
+        if self.comm is None: return True
+        t0_sec = time()
+        stats = self.comm.reduce(self.stats, op=merge_dark_stats, root=0)
+        if self.rank != 0: return False
+        if stats is not None:
+            self.stats = stats
+            self.set_stats_arrays()
+            self.irec = stats.nrecs - 1
+        logger.info('statistics of %d ranks are reduced in %.3f sec' % (self.nranks, time()-t0_sec))
+        return True
+
+
+    def is_own_event(self, nev=None):
+        """Returns True if the next candidate event should be processed in this rank.
+           Should be called in all ranks for each selected event with valid raw data,
+           events are split between ranks by the internal counter of candidate events ncand,
+           so events dropped by evcode, evskip or raw=None do not unbalance ranks.
+           All ranks process events for the data block in order to get identical gates.
+           - nev (int) - event number, is not used, kept for backward compatibility.
+        """
+        self.ncand += 1
+        return self.nranks == 1 or self.ncand < self.nblock or self.ncand % self.nranks == self.rank
 
 
     def summary(self):
@@ -702,15 +1005,16 @@ class DarkProc():
         nevlm = int(fraclm * counter)
         self.counter = counter
 
-        nrecs1  = self.nrecs1
+        nblock  = self.nblock
         irec    = self.irec
 
-        if irec<nrecs1:
+        if irec<nblock:
         #if False:
-            logger.warning('irec=%d < nrecs1=%d - process block for small number of events' % (irec, nrecs1))
+            logger.warning('irec=%d < %s=%d - process block for small number of events'%\
+                           (irec, 'nrecs0' if self.stream else 'nrecs1', nblock))
             self.proc_block()
             self.init_proc()
-            self.add_block()
+            if self.rank == 0: self.add_block()
 
         arr_av1 = divide_protected(self.arr_sum1, self.arr_sum0)
         arr_av2 = divide_protected(self.arr_sum2, self.arr_sum0)
@@ -768,22 +1072,9 @@ class DarkProc():
         logger.debug(info_ndarr(raw, 'add_event %3d raw' % irec))
 
         _raw = raw & self.datbits # use data bits only (14 for jf and epix10ka)
+        self.stats.add(_raw, self.gate_lo, self.gate_hi, self.int_lo, self.int_hi)
 
-        cond_lo = _raw<self.gate_lo
-        cond_hi = _raw>self.gate_hi
-        condlist = (np.logical_not(np.logical_or(cond_lo, cond_hi)),)
-
-        raw_f64 = _raw.astype(np.float64)
-
-        self.arr_sum0   += np.select(condlist, (self.arr1u64,), 0)
-        self.arr_sum1   += np.select(condlist, (raw_f64,), 0)
-        self.arr_sum2   += np.select(condlist, (np.square(raw_f64),), 0)
-
-        self.sta_int_lo += np.select((_raw<self.int_lo,), (self.arr1u64,), 0)
-        self.sta_int_hi += np.select((_raw>self.int_hi,), (self.arr1u64,), 0)
-
-        np.maximum(self.arr_max, _raw, out=self.arr_max)
-        np.minimum(self.arr_min, _raw, out=self.arr_min)
+        if self.stream and irec >= self.nblock: self.update_gates(_raw)
 
 
     def add_block(self):
@@ -800,26 +1091,27 @@ class DarkProc():
 
         if raw is None: return self.status
 
-        if self.block is None:
-           self.block=np.zeros((self.nrecs1,)+tuple(raw.shape), dtype=raw.dtype)
+        if self.block is None and self.irec < self.nblock:
+           self.block=np.zeros((self.nblock,)+tuple(raw.shape), dtype=raw.dtype)
            logger.info(info_ndarr(self.block,'created empty data block'))
 
         self.irec +=1
-        if self.irec < self.nrecs1:
+        if self.irec < self.nblock:
             self.accumulate_block(raw)
 
-        elif self.irec > self.nrecs1:
+        elif self.irec > self.nblock:
             self.add_event(raw, self.irec)
 
         else:
             self.proc_block()
             self.init_proc()
-            self.add_block()
+            if self.rank == 0: self.add_block() # block is the same in all ranks
+            if self.stream: self.block = None # gates are updated in add_event
             print('1st stage event block processing is completed')
             self.add_event(raw, self.irec)
             self.status = 1
 
-        if self.irec > self.nrecs-2:
+        if self.irec > self.nrecs_rank-2:
             logger.info('record %d event loop is terminated, --nrecs=%d' % (self.irec, self.nrecs))
             self.status = 2
 
@@ -850,8 +1142,8 @@ class DarkProc():
         if plotim &  32: plot_image(self.arr_min,    tit=titpref + 'minimum')
         if plotim &  64: plot_image(self.sta_int_lo, tit=titpref + 'statistics below threshold')
         if plotim & 128: plot_image(self.sta_int_hi, tit=titpref + 'statistics above threshold')
-        if plotim & 256: plot_image(self.arr_med,    tit=titpref + 'median after 1st stage processing of %d frames' % self.nrecs1)
-        if plotim & 512: plot_image(self.abs_dev,    tit=titpref + 'abs_dev after 1st stage processing of %d frames' % self.nrecs1)
+        if plotim & 256: plot_image(self.arr_med,    tit=titpref + 'median after 1st stage processing of %d frames' % self.nblock)
+        if plotim & 512: plot_image(self.abs_dev,    tit=titpref + 'abs_dev after 1st stage processing of %d frames' % self.nblock)
         if plotim &1024: plot_image(self.arr_av1 - self.arr_med, tit=titpref + 'ave - dev')
 
 
@@ -869,8 +1161,8 @@ def plot_image(nda, tit=''):
 
     logger.info(info_ndarr(img, 'plot_image of %s' % tit))
 
-    amin = np.quantile(img, 0.01, interpolation='lower')
-    amax = np.quantile(img, 0.99, interpolation='higher')
+    amin = quantile(img, 0.01, axis=None, method='lower')
+    amax = quantile(img, 0.99, axis=None, method='higher')
     gg.plotImageLarge(img, amp_range=(amin, amax), title=tit)
     gg.show()
 
@@ -905,9 +1197,96 @@ def common_mode_pars(src, arr_ave, arr_rms, arr_msk):
             return None
 
 
-def find_file_for_timestamp(dirname, pattern, tstamp):
+REPO_TEXT_EXTS = ('.txt', '.dat', '.data')
+SIDECAR_SUFFIX = re.compile(r'\.(txt|dat|data)\.\d+-\d+\.\w+\.npy$') # <text-file-name>.<size>-<mtime_ns>.<dtype>.npy of npy_sidecar_name
+
+
+def is_repo_file_name(name):
+    """Returns True for text repository file names and binary <prefix>_<ctype>.npy, False for .npy sidecars of text files.
+    """
+    ext = os.path.splitext(name)[-1]
+    return ext in REPO_TEXT_EXTS or (ext == '.npy' and SIDECAR_SUFFIX.search(name) is None)
+
+
+def tstamp_in_file_name(name):
+    """Returns int timestamp from file name generated by file_name_prefix or None.
+    """
+    try: return int(name.rsplit('.',1)[0].split('_',3)[2])
+    except (IndexError, ValueError): return None
+
+
+class TimestampIndex():
+    """Per-directory index of repository files sorted by timestamp coded in their names,
+       replaces os.listdir and pattern matching in each call of find_file_for_timestamp.
+       Index of the directory is re-built if directory modification time is changed
+       or if it was built within dtsafe (sec) after modification of directory, which may be missed
+       due to coarse time resolution of file system, sorted timestamps for (dirname, pattern) are searched with bisect.
+
+    Usage::
+
+      from Detector.UtilsCalib import TimestampIndex, TSTAMP_INDEX
+      tsindex = TimestampIndex() # or common TSTAMP_INDEX
+      fname = tsindex.find(dirname, pattern, tstamp)
+      tsindex.clear()
+    """
+    def __init__(self, dtsafe=2.0):
+        self.dirs = {}     # {dirname: (mtime_ns, time_of_scan, [(itstamp, name),...] sorted)}
+        self.patterns = {} # {(dirname, pattern): ([itstamp,...], [name,...]) sorted}
+        self.nscans = 0
+        self.dtsafe = dtsafe
+
+    def clear(self):
+        self.dirs.clear()
+        self.patterns.clear()
+
+    def entries(self, dirname):
+        """returns list of (itstamp, name) sorted by timestamp for repository files in directory"""
+        mtime = os.stat(dirname).st_mtime_ns
+        d = self.dirs.get(dirname, None)
+        if d is not None and d[0] == mtime and d[1] - mtime*1e-9 > self.dtsafe: return d[2]
+        self.nscans += 1
+        tscan = time()
+        lst = sorted((its, name) for its, name in\
+                     ((tstamp_in_file_name(name), name) for name in os.listdir(dirname) if is_repo_file_name(name))\
+                     if its is not None)
+        self.dirs[dirname] = (mtime, tscan, lst)
+        for k in [k for k in self.patterns if k[0] == dirname]: del self.patterns[k]
+        logger.debug('indexed %d files in %s' % (len(lst), dirname))
+        return lst
+
+    def find(self, dirname, pattern, tstamp):
+        """returns the full file name containing pattern for the nearest timestamp <= tstamp or None"""
+        from bisect import bisect_right
+        lst = self.entries(dirname)
+        k = (dirname, pattern)
+        if k not in self.patterns:
+            sel = [(its, name) for its, name in lst if pattern in name]
+            self.patterns[k] = ([its for its, name in sel], [name for its, name in sel])
+        itstamps, names = self.patterns[k]
+        i = bisect_right(itstamps, int(tstamp))
+        if i == 0:
+            logger.debug('directory %s\n          DOES NOT CONTAIN file for pattern %s and timestamp <= %s'%\
+                         (dirname,pattern,tstamp))
+            return None
+        i = bisect_right(itstamps, itstamps[i-1]-1) # the first of files with the same timestamp
+        fname = '%s/%s' % (dirname, names[i])
+        logger.debug('  selected %s for %s and %s' % (names[i],pattern,tstamp))
+        return fname
+
+
+TSTAMP_INDEX = TimestampIndex()
+
+
+def find_file_for_timestamp(dirname, pattern, tstamp, tsindex=TSTAMP_INDEX):
+    """Returns the full name of repository file in dirname containing pattern for the nearest timestamp <= tstamp or None,
+       uses per-directory TimestampIndex.
+    """
+    return tsindex.find(dirname, pattern, tstamp)
+
+
+def find_file_for_timestamp_v0(dirname, pattern, tstamp):
     # list of file names in directory, dirname, containing pattern
-    fnames = [name for name in os.listdir(dirname) if os.path.splitext(name)[-1] in ('.txt','.dat','.data') and pattern in name]
+    fnames = [name for name in os.listdir(dirname) if pattern in name and is_repo_file_name(name)]
 
     # list of int tstamps
     # !!! here we assume specific name structure generated by file_name_prefix
@@ -933,8 +1312,96 @@ def find_file_for_timestamp(dirname, pattern, tstamp):
     return None
 
 
-def merge_panels(lst):
-    """ stack of 16 (or 4 or 1) arrays from list shaped as (7, 1, 352, 384) to (7, 16, 352, 384)
+def npy_sidecar_name(fname, dtype=np.float32, dircache=DIR_NPY_CACHE):
+    """Returns name of the .npy sidecar file for text file fname, next to it or in dircache mirroring its absolute path.
+       File size, modification time in ns and dtype are coded in the name, so sidecar of changed text file is not used.
+    """
+    st = os.stat(fname)
+    name = '%s.%d-%d.%s.npy' % (fname, st.st_size, st.st_mtime_ns, np.dtype(dtype).name)
+    return name if dircache is None else os.path.join(dircache, os.path.abspath(name).lstrip('/'))
+
+
+def remove_stale_sidecars(fnpy):
+    """Removes sidecars of previous versions of the text file, which differ from fnpy by size and modification time.
+    """
+    dirnpy, name = os.path.split(fnpy)
+    ftext, sizetime, dtname, ext = name.rsplit('.', 3) # <text-file-name>.<size>-<mtime>.<dtype>.npy
+    pattern = re.compile(r'^%s\.\d+-\d+\.%s\.npy$' % (re.escape(ftext), re.escape(dtname)))
+    for fn in os.listdir(dirnpy or '.'):
+        if fn == name or not pattern.match(fn): continue
+        try:
+            os.remove(os.path.join(dirnpy, fn))
+            logger.debug('removed stale sidecar %s' % fn)
+        except OSError: pass
+
+
+def load_textfile_cached(fname, dtype=np.float32, mmap_mode='c', dircache=DIR_NPY_CACHE, fmode=0o664, **kwa):
+    """Returns array of np.loadtxt(fname, dtype, **kwa) from text file using its binary .npy sidecar cache.
+       At first call text file is parsed and array is saved in sidecar file with mode fmode
+       and sidecars of previous versions of the text file are removed, consecutive calls,
+       e.g. from many MPI ranks, get memory-mapped array from sidecar sharing page cache.
+       mmap_mode='c' - copy-on-write, modifications of returned array are not saved in file, None - array in memory.
+       If sidecar can not be saved, e.g. in read-only directory, array from text file is returned.
+    """
+    try: fnpy = npy_sidecar_name(fname, dtype, dircache)
+    except OSError: return np.loadtxt(fname, dtype=dtype, **kwa)
+
+    if os.path.exists(fnpy):
+        try:
+            nda = np.load(fnpy, mmap_mode=mmap_mode)
+            logger.debug('loaded sidecar %s' % fnpy)
+            return nda
+        except (IOError, ValueError) as err:
+            logger.warning('corrupted sidecar %s: %s' % (fnpy, err))
+
+    nda = np.loadtxt(fname, dtype=dtype, **kwa)
+    ftmp = None
+    try:
+        dirnpy = os.path.dirname(fnpy)
+        if not os.path.exists(dirnpy): os.makedirs(dirnpy)
+        fd, ftmp = tempfile.mkstemp(suffix='.tmp', dir=dirnpy) # unique for processes on all nodes
+        with os.fdopen(fd, 'wb') as f: np.save(f, nda)
+        os.chmod(ftmp, fmode)
+        os.rename(ftmp, fnpy) # atomic, concurrent readers never see partially saved file
+        logger.debug('saved sidecar %s' % fnpy)
+        remove_stale_sidecars(fnpy)
+    except (IOError, OSError) as err:
+        logger.debug('sidecar for %s is not saved: %s' % (fname, err))
+        if ftmp is not None and os.path.exists(ftmp): os.remove(ftmp)
+    return nda
+
+
+def save_repo_array(nda, fname, fmode=0o664, fmt='%.3f', umask=0o0, group='ps-users', repofmt='txt'):
+    """Saves array in repository text file fname for repofmt='txt',
+       or for repofmt='npy' in binary file with .npy in stead of fname extension.
+       Returns name of saved file.
+    """
+    if repofmt == 'txt':
+        save_ndarray_in_textfile(nda, fname, fmode, fmt, umask, group)
+        return fname
+    fnpy = os.path.splitext(fname)[0] + '.npy'
+    os.umask(umask)
+    fexists = os.path.exists(fnpy)
+    np.save(fnpy, nda)
+    if not fexists:
+        os.chmod(fnpy, fmode)
+        change_file_ownership(fnpy, user=None, group=group)
+    logger.debug('saved: %s fmode: %s' % (fnpy, oct(fmode)))
+    return fnpy
+
+
+def load_repo_array(fname, dtype=np.float32, mmap_mode='c'):
+    """Returns array from repository file - memory-mapped binary .npy or text file via load_textfile_cached.
+    """
+    if not fname.endswith('.npy'):
+        return load_textfile_cached(fname, dtype=dtype, mmap_mode=mmap_mode)
+    nda = np.load(fname, mmap_mode=mmap_mode)
+    return nda if nda.dtype == dtype else nda.astype(dtype)
+
+
+def merge_panels(lst, out=None):
+    """ stack of 16 (or 4 or 1) arrays from list shaped as (7, 1, 352, 384) to (7, 16, 352, 384),
+        out - optional output array, e.g. memory-mapped, of the merged shape.
     """
     npanels = len(lst)   # 16 or 4 or 1
     shape = lst[0].shape # (7, 1, 352, 384)
@@ -942,12 +1409,77 @@ def merge_panels(lst):
 
     logger.debug('In merge_panels: number of panels %d number of gain modes %d' % (npanels,ngmods))
 
-    # make list for merging of (352,384) blocks in right order
-    mrg_lst = []
-    for igm in range(ngmods):
-        nda1gm = np.stack([lst[ind][igm,0,:] for ind in range(npanels)])
-        mrg_lst.append(nda1gm)
-    return np.stack(mrg_lst)
+    if out is None:
+        out = np.empty((ngmods, npanels) + shape[2:], dtype=np.result_type(*lst))
+
+    # copy (352,384) blocks in right order
+    for ind, nda in enumerate(lst):
+        out[:,ind] = nda[:,0]
+    return out
+
+
+def save_npy_in_textfile(fnpy, fname, fmode, fmt, umask=0o0, group='ps-users'):
+    """Saves array from memory-mapped .npy file in text file, is used as a job in the pool of processes.
+    """
+    save_ndarray_in_textfile(np.load(fnpy, mmap_mode='r'), fname, fmode, fmt, umask, group)
+    return fname
+
+
+def save_npys_in_textfiles(jobs, nprocs=0):
+    """Saves arrays from .npy files in text files for list of jobs [(fnpy, fname, fmode, fmt, umask, group),...],
+       concurrently in the pool of nprocs processes for nprocs>1.
+    """
+    if nprocs > 1 and len(jobs) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(min(nprocs, len(jobs))) as pool:
+            return list(pool.map(save_npy_in_textfile, *zip(*jobs)))
+    return [save_npy_in_textfile(*job) for job in jobs]
+
+
+def save_merged_panels(dic_consts, fmerge_prefix, dic_fmt, fmode=0o664, umask=0o0, group='ps-users',\
+                       repofmt='txt', savetxt=True, nprocs=0):
+    """Merges per-panel constants of dic_consts {octype:[per-panel arrays]} and saves them in text files
+       <fmerge_prefix>-<octype>.txt if savetxt. For repofmt='txt' and nprocs<=1 merged arrays are kept in memory,
+       otherwise they are merged in memory-mapped files <fmerge_prefix>-<octype>.npy and
+       text files of octypes are saved concurrently in the pool of nprocs processes.
+       For repofmt='txt' .npy files of saved text files are removed.
+       Returns dict {octype:fname} of text or, if not savetxt, .npy merged file names.
+    """
+    if savetxt and repofmt == 'txt' and nprocs <= 1:
+        fnames = {}
+        for octype, lst in dic_consts.items():
+            mrg = merge_panels(lst)
+            logger.info(info_ndarr(mrg, 'merged constants for %s' % octype))
+            fnames[octype] = '%s-%s.txt' % (fmerge_prefix, octype)
+            save_ndarray_in_textfile(mrg, fnames[octype], fmode, dic_fmt.get(octype, '%.5f'), umask, group)
+        return fnames
+
+    jobs, fnames = [], {}
+    for octype, lst in dic_consts.items():
+        fnpy = '%s-%s.npy' % (fmerge_prefix, octype)
+        sh = lst[0].shape
+        os.umask(umask)
+        fexists = os.path.exists(fnpy)
+        mrg = np.lib.format.open_memmap(fnpy, mode='w+', dtype=np.result_type(*lst), shape=(sh[0], len(lst)) + sh[2:])
+        merge_panels(lst, out=mrg)
+        logger.info(info_ndarr(mrg, 'merged constants for %s' % octype))
+        mrg.flush()
+        del mrg
+        if not fexists:
+            os.chmod(fnpy, fmode)
+            change_file_ownership(fnpy, user=None, group=group)
+        fnames[octype] = fnpy
+        if savetxt:
+            fnames[octype] = '%s-%s.txt' % (fmerge_prefix, octype)
+            jobs.append((fnpy, fnames[octype], fmode, dic_fmt.get(octype, '%.5f'), umask, group))
+
+    t0_sec = time()
+    save_npys_in_textfiles(jobs, nprocs)
+    logger.info('%d merged text files saved in %.3f sec' % (len(jobs), time()-t0_sec))
+
+    if repofmt == 'txt':
+        for fnpy, fname, *_ in jobs: os.remove(fnpy)
+    return fnames
 
 
 def calib_group(dettype):
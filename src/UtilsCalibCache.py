@@ -0,0 +1,329 @@
+"""
+:py:class:`UtilsCalibCache` - cross-run cache of calibration constants and derived products
+============================================================================================
+
+Calibration constants valid for many runs are kept in memory and re-used
+while the resolved calibration files (path, mtime, size) are not changed.
+Objects are evicted in the order of least recent use when their total size exceeds the memory budget.
+
+Usage ::
+
+    from Detector.UtilsCalibCache import calib_cache, calib_files_key
+
+    key = calib_files_key(calibdir, group, src, runnum) # tuple of (ctype, path, mtime, size) or None
+    o = calib_cache.get(('jungfrau', detname, key))     # None if object is not in cache
+    calib_cache.put(('jungfrau', detname, key), o)      # nbytes of object is evaluated from its numpy arrays
+    calib_cache.remove(('jungfrau', detname, key))
+
+    calib_cache.set_max_bytes(8<<30) # memory budget, default 4GB
+    calib_cache.clear()
+    s = calib_cache.info()
+
+    # in detector-specific cache of calibration constants shaped as {detname:DetCache}
+    odc = detcache_for_run(cache.detcache_for_detname(detname), det, evt, 'jungfrau')
+    ...
+    add_detcache_to_calib_cache(odc, 'jungfrau')
+
+    # persistent pool of threads for per-segment calibration kept in odc.pool, odc.nthreads
+    thread_pool(odc, nthreads).map(lambda i: calib_segment(arr, odc, i), range(nsegs))
+    pool = new_thread_pool(nthreads) # pools are terminated at exit by close_thread_pools()
+
+    # arrays shared between processes on the node, func() is called in the first process only
+    name = shmem_name('jungfrau', detname, key, runnum, kwa) # unique name of constants
+    d = shared_arrays(name, func, dirshm=DIR_SHMEM, timeout=600, maxage=600) # dict {name:array} of read-only arrays
+
+This software was developed for the SIT project.
+If you use all or part of it, please give an appropriate acknowledgment.
+
+Created on 2026-10-18
+"""
+
+import os
+import errno
+import atexit
+import shutil
+import socket
+import weakref
+import threading
+import hashlib
+import logging
+logger = logging.getLogger(__name__)
+
+from time import time, sleep
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+import numpy as np
+
+from PSCalib.CalibFileFinder import CalibFileFinder
+
+CALIB_TYPES = ('pedestals', 'pixel_rms', 'pixel_gain', 'pixel_offset', 'pixel_mask', 'pixel_bkgd',\
+               'pixel_status', 'status_extra', 'status_data', 'common_mode')
+MAX_BYTES = 4<<30
+DIR_SHMEM = '/dev/shm'
+JOBID_ENV_VARS = ('SLURM_JOB_ID', 'PBS_JOBID', 'LSB_JOBID', 'OMPI_MCA_ess_base_jobid')
+
+
+def calib_files_key(calibdir, group, src, runnum, ctypes=CALIB_TYPES, pbits=0):
+    """Returns tuple of (ctype, path, mtime, size) for calibration files valid for run
+       or None if files are not found, i.e. constants are loaded from DCS.
+    """
+    cff = CalibFileFinder(calibdir, group, pbits)
+    recs = []
+    for ctype in ctypes:
+        fname = cff.findCalibFile(src, ctype, runnum)
+        if not fname: continue
+        try: st = os.stat(fname)
+        except OSError: continue
+        recs.append((ctype, fname, st.st_mtime, st.st_size))
+    return tuple(recs) if recs else None
+
+
+def nbytes_of(o, depth=3, seen=None):
+    """Returns total size in bytes of numpy arrays in object o, its attributes, dict values and sequences,
+       views are accounted by their base arrays, each base array is counted once.
+    """
+    if seen is None: seen = set()
+    if isinstance(o, np.ndarray):
+        while isinstance(o.base, np.ndarray): o = o.base
+        if id(o) in seen: return 0
+        seen.add(id(o))
+        return o.nbytes
+    if depth == 0: return 0
+    if isinstance(o, dict): return sum(nbytes_of(v, depth-1, seen) for v in o.values())
+    if isinstance(o, (list, tuple)): return sum(nbytes_of(v, depth-1, seen) for v in o)
+    if hasattr(o, '__dict__'): return nbytes_of(vars(o), depth, seen)
+    return 0
+
+
+class CalibCache():
+    """LRU cache of objects with calibration constants limited by total size of their numpy arrays.
+    """
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.objs = OrderedDict() # {key:(obj, nbytes)}
+        self.lock = threading.Lock() # for get/put from sub-detector threads of AreaDetectorCompound
+
+    def get(self, key):
+        with self.lock:
+            rec = self.objs.pop(key, None)
+            if rec is None: return None
+            self.objs[key] = rec # move to the end as most recently used
+            return rec[0]
+
+    def put(self, key, obj, nbytes=None):
+        nb = nbytes_of(obj) if nbytes is None else nbytes
+        with self.lock:
+            if key in self.objs: self.nbytes -= self.objs.pop(key)[1]
+            self.objs[key] = (obj, nb)
+            self.nbytes += nb
+            self._evict()
+
+    def remove(self, key):
+        with self.lock:
+            rec = self.objs.pop(key, None)
+            if rec is not None: self.nbytes -= rec[1]
+
+    def _evict(self):
+        """Removes least recently used objects, but the last one, while total size exceeds max_bytes, lock is held by caller."""
+        while self.nbytes > self.max_bytes and len(self.objs) > 1:
+            key, (obj, nb) = self.objs.popitem(last=False)
+            self.nbytes -= nb
+            logger.debug('calib_cache evicted %.1f MB for key %s' % (nb/1e6, str(key[:2])))
+
+    def evict(self):
+        """Removes least recently used objects, but the last one, while total size exceeds max_bytes."""
+        with self.lock: self._evict()
+
+    def set_max_bytes(self, max_bytes):
+        with self.lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        with self.lock:
+            self.objs.clear()
+            self.nbytes = 0
+
+    def info(self):
+        with self.lock:
+            return 'calib_cache: %d objects %.1f MB of %.1f MB budget'%\
+                   (len(self.objs), self.nbytes/1e6, self.max_bytes/1e6)
+
+calib_cache = CalibCache() # singleton
+
+
+def detcache_for_run(odc, det, evt, tag):
+    """Returns DetCache object valid for run of evt or None if it needs to be created.
+       - odc - DetCache object from detector-specific cache {detname:DetCache} or None
+       - det - AreaDetector object
+       - tag - (str) detector-specific prefix of the key in calib_cache, e.g. 'jungfrau'
+       DetCache is re-used for runs with the same calibration files, or is taken from calib_cache,
+       if calibration files are not found DetCache created at first entry is used for all runs.
+    """
+    if odc is None: return None
+    runnum = det.runnum(evt)
+    if runnum == odc.runnum: return odc
+    key = det.pyda.calib_files_key(evt)
+    if key is None or key == odc.calibkey:
+        odc.runnum = runnum
+        return odc
+    o = calib_cache.get((tag, odc.detname, key))
+    if o is not None:
+        logger.debug('DetCache for %s run %d is taken from calib_cache' % (odc.detname, runnum))
+        o.runnum = runnum
+    return o
+
+
+def add_detcache_to_calib_cache(odc, tag):
+    """Adds completely defined DetCache object to calib_cache if its calibration files are known."""
+    if odc.calibkey is None: return
+    calib_cache.put((tag, odc.detname, odc.calibkey), odc)
+    logger.debug(calib_cache.info())
+
+
+_thread_pools = weakref.WeakSet() # persistent thread pools terminated at exit
+
+
+def new_thread_pool(nthreads):
+    """Returns ThreadPool of nthreads threads which is terminated at exit of the process if not closed before."""
+    pool = ThreadPool(nthreads)
+    _thread_pools.add(pool)
+    return pool
+
+
+def close_thread_pools():
+    """Terminates persistent thread pools, is registered with atexit."""
+    for pool in list(_thread_pools): pool.terminate()
+    _thread_pools.clear()
+
+atexit.register(close_thread_pools)
+
+
+def thread_pool(odc, nthreads):
+    """Returns persistent pool of nthreads threads of DetCache odc for per-segment calibration,
+       pool is kept in odc.pool and is re-created if nthreads is changed.
+    """
+    if odc.pool is None or odc.nthreads != nthreads:
+        if odc.pool is not None: odc.pool.close()
+        odc.pool = new_thread_pool(nthreads)
+        odc.nthreads = nthreads
+        logger.debug('DetCache for %s created thread pool of %d threads' % (odc.detname, nthreads))
+    return odc.pool
+
+
+def shmem_name(tag, detname, calibkey, runnum, kwa):
+    """Returns name of constants shared between processes of the batch job on the node.
+       Name is a hash of detector, calibration files (or run number if files are unknown),
+       **kwa with arrays accounted by their content, and batch job id from environment if available.
+    """
+    h = hashlib.md5()
+    jobid = [os.environ.get(v, '') for v in JOBID_ENV_VARS]
+    for o in (tag, detname, runnum if calibkey is None else calibkey, jobid):
+        h.update(repr(o).encode())
+    for k,v in sorted(kwa.items()):
+        h.update(repr(k).encode())
+        h.update(v.tobytes() if isinstance(v, np.ndarray) else repr(v).encode())
+    return 'Detector-%s-%s' % (tag, h.hexdigest())
+
+
+def remove_shared(path):
+    shutil.rmtree(path, ignore_errors=True)
+    try: os.remove(path + '.lock')
+    except OSError: pass
+
+
+def lock_owner(flock):
+    """Returns (pid, host) of the process saved in the lock file or None if it is missing or not yet written."""
+    try:
+        with open(flock) as f: pid, host = f.read().split()
+        return int(pid), host
+    except (OSError, ValueError):
+        return None
+
+
+def is_stale_lock(flock, maxage):
+    """Returns True if the lock file is older than maxage (sec) or its owner process on this host is dead."""
+    try: age = time() - os.stat(flock).st_mtime
+    except OSError: return False # lock is removed
+    if age > maxage: return True
+    owner = lock_owner(flock)
+    if owner is None or owner[1] != socket.gethostname(): return False
+    try: os.kill(owner[0], 0)
+    except ProcessLookupError: return True
+    except PermissionError: pass # process of other user is alive
+    return False
+
+
+def take_over_lock(flock, maxage):
+    """Removes stale lock file. Lock is moved to the private name first, so only one of waiting processes removes it,
+       and it is restored if another process re-created it after the check.
+    """
+    fstale = '%s.stale-%s-%d' % (flock, socket.gethostname(), os.getpid())
+    try: os.rename(flock, fstale)
+    except OSError: return # is taken over by another process
+    if not is_stale_lock(fstale, maxage):
+        try: os.link(fstale, flock)
+        except OSError: pass
+    os.remove(fstale)
+
+
+def shared_arrays(name, func, dirshm=DIR_SHMEM, timeout=600, maxage=600):
+    """Returns dict {key:array} of read-only numpy arrays shared between processes on the node
+       through memory-mapped files <dirshm>/<name>/<key>.npy (values None are preserved).
+       The first process, which creates the lock file <dirshm>/<name>.lock with its pid and host,
+       evaluates dict of arrays by func(), saves them and removes files at exit;
+       files stay valid for attached processes until they exit. If func() fails, files are removed immediately.
+       Other processes wait for saved arrays and attach to them without evaluation,
+       or, if waiting time exceeds timeout (sec), return private arrays from func().
+       Lock of the dead process or older than maxage (sec) without saved arrays is taken over by the waiting process.
+    """
+    path = os.path.join(dirshm, name)
+    flock = path + '.lock'
+    fdone = os.path.join(path, 'DONE') # list of keys, saved after arrays
+
+    t0_sec = time()
+    while not os.path.exists(fdone):
+        try:
+            fd = os.open(flock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError as err:
+            if err.errno != errno.EEXIST: # e.g. dirshm is missing
+                logger.warning('constants are not shared: %s' % err)
+                return func()
+            if is_stale_lock(flock, maxage):
+                logger.warning('take over stale lock %s of process (pid, host): %s' % (flock, str(lock_owner(flock))))
+                take_over_lock(flock, maxage)
+                continue
+            if time() - t0_sec > timeout:
+                logger.warning('waiting time %d sec for shared constants %s is exceeded' % (timeout, path))
+                return func()
+            sleep(0.1)
+            continue
+
+        os.write(fd, ('%d %s' % (os.getpid(), socket.gethostname())).encode())
+        os.close(fd)
+        atexit.register(remove_shared, path)
+        try:
+            t1_sec = time()
+            d = func()
+            shutil.rmtree(path, ignore_errors=True) # leftover of the stale lock owner
+            os.makedirs(path)
+            for k,v in d.items():
+                if v is not None: np.save(os.path.join(path, '%s.npy' % k), v)
+            with open(fdone + '.tmp', 'w') as f:
+                f.write('\n'.join('%s %d' % (k, v is not None) for k,v in d.items()))
+            os.rename(fdone + '.tmp', fdone)
+        except Exception:
+            remove_shared(path)
+            raise
+        logger.info('constants are saved in shared memory %s time %.3f sec' % (path, time()-t1_sec))
+
+    d = {}
+    with open(fdone) as f:
+        for rec in f.read().split('\n'):
+            k, is_set = rec.split()
+            d[k] = np.load(os.path.join(path, '%s.npy' % k), mmap_mode='r') if int(is_set) else None
+    logger.debug('attached shared constants %s' % path)
+    return d
+
+# EOF
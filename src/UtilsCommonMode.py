@@ -15,6 +15,14 @@ Usage::
     ucm.common_mode_rows_hsplit_nbanks(data, mask, nbanks=4, cormax=None)
     ucm.common_mode_2d_hsplit_nbanks(data, mask, nbanks=4, cormax=None)
 
+    # vectorized engine for n-d arrays (..., rows, cols) without split/stack copies:
+    cmode, npix = ucm.median_masked(data, mask=None, axes=(-1,))
+    ucm.common_mode_rows_nbanks(data, mask=None, nbanks=4, cormax=None, npix_min=10)
+    ucm.common_mode_cols_nrbanks(data, mask=None, nrbanks=2, cormax=None, npix_min=10)
+    ucm.common_mode_2d_nbanks(data, mask=None, nrbanks=2, nbanks=4, cormax=None, npix_min=10)
+    ucm.common_mode_segments(data, mask, cmps, nbanks=16, nrbanks=2)
+    engine = ucm.common_mode_engine(cmps) # CMENGINE_VECT or CMENGINE_LOOP from cmps[4]
+
 This software was developed for the LCLS project.
 If you use all or part of it, please give an appropriate acknowledgment.
 
@@ -146,3 +154,140 @@ def common_mode_2d_hsplit_nbanks(data, mask=None, nbanks=4, cormax=None, npix_mi
     data[:] = np.hstack(bdata)[:]    
 
 #------------------------------
+
+CMENGINE_VECT = 0 # vectorized engine, default
+CMENGINE_LOOP = 1 # legacy loop over segments and banks
+
+def common_mode_engine(cmps):
+    """Returns common mode engine index from common mode parameters cmps[4], CMENGINE_VECT by default.
+    """
+    return int(cmps[4]) if cmps is not None and len(cmps)>4 else CMENGINE_VECT
+
+#------------------------------
+
+def _reshaped_view(arr, shape):
+    """Returns view of arr with new shape, raises AttributeError if data copy is required.
+    """
+    v = arr.view()
+    v.shape = shape
+    return v
+
+#------------------------------
+
+def median_masked(arr, mask=None, axes=(-1,)):
+    """Returns median of arr over axes evaluated for good pixels with mask>0 and number of good pixels,
+       both shaped as arr with removed axes. Median of group without good pixels is set to 0.
+       All groups are processed in one pass of np.partition with masked pixels substituted by nan
+       and sorting of the narrow slice between the lowest and highest median indexes over groups.
+       Results are the same as for np.median and np.ma.median.
+    """
+    nd = arr.ndim
+    axes = tuple(sorted(a % nd for a in axes))
+    keep = tuple(a for a in range(nd) if a not in axes)
+    order = keep + axes
+    shgrp = tuple(arr.shape[a] for a in keep)
+    npmax = int(np.prod([arr.shape[a] for a in axes]))
+
+    if mask is None:
+        s = np.partition(arr.transpose(order).reshape(shgrp + (npmax,)), ((npmax-1)//2, npmax//2), axis=-1)
+        npix = np.full(shgrp, npmax, dtype=np.int64)
+        return (s[...,(npmax-1)//2] + s[...,npmax//2]) / 2, npix
+
+    bmask = (mask>0).transpose(order).reshape(shgrp + (npmax,))
+    s = np.where(bmask, arr.transpose(order).reshape(shgrp + (npmax,)), np.nan)
+    npix = bmask.sum(axis=-1)
+    ilo = (np.maximum(npix,1)-1)//2
+    ihi = np.minimum(npix//2, npmax-1)
+    kmin, kmax = int(ilo.min()), int(ihi.max())
+    s.partition((kmin, kmax), axis=-1) # nan-s go to the end
+    s[...,kmin:kmax+1].sort(axis=-1) # elements with ranks kmin...kmax in sorted order
+    lo = np.take_along_axis(s, ilo[...,None], axis=-1)[...,0]
+    hi = np.take_along_axis(s, ihi[...,None], axis=-1)[...,0]
+    cmode = (lo + hi) / 2
+    cmode[npix==0] = 0
+    return cmode, npix
+
+#------------------------------
+
+def _apply_cmode(arr, mask, cmode, axes, valid=None, cormax=None):
+    """Subtracts in-place cmode broadcasted over axes from arr pixels with mask>0 for valid groups.
+    """
+    if cormax is not None:
+        lim = np.fabs(cmode) < cormax
+        valid = lim if valid is None else (valid & lim)
+    if valid is not None:
+        cmode = np.where(valid, cmode, 0).astype(cmode.dtype)
+    cm = np.expand_dims(cmode, axes)
+    if mask is None:
+        arr -= cm
+    else:
+        np.subtract(arr, cm, out=arr, where=mask>0)
+
+#------------------------------
+
+def common_mode_rows_nbanks(data, mask=None, nbanks=4, cormax=None, npix_min=10):
+    """Vectorized version of common_mode_rows_hsplit_nbanks for n-d data and mask shaped as (..., rows, cols).
+       Columns are split for nbanks and median common mode correction is applied to pixels in rows of banks
+       in-place in data for all leading dimensions (segments) at once.
+    """
+    sh = data.shape
+    shv = sh[:-1] + (nbanks, sh[-1]//nbanks)
+    v = _reshaped_view(data, shv)
+    m = None if mask is None else mask.reshape(shv)
+    axes = (v.ndim-1,)
+    cmode, npix = median_masked(v, m, axes)
+    _apply_cmode(v, m, cmode, axes, valid=(None if m is None else npix>npix_min), cormax=cormax)
+
+#------------------------------
+
+def common_mode_cols_nrbanks(data, mask=None, nrbanks=2, cormax=None, npix_min=10):
+    """Vectorized version of common_mode_cols for n-d data and mask shaped as (..., rows, cols).
+       Rows are split for nrbanks and median common mode correction is applied to pixels in columns of banks
+       in-place in data for all leading dimensions (segments) at once.
+    """
+    sh = data.shape
+    shv = sh[:-2] + (nrbanks, sh[-2]//nrbanks, sh[-1])
+    v = _reshaped_view(data, shv)
+    m = None if mask is None else mask.reshape(shv)
+    axes = (v.ndim-2,)
+    cmode, npix = median_masked(v, m, axes)
+    _apply_cmode(v, m, cmode, axes, valid=(None if m is None else npix>npix_min), cormax=cormax)
+
+#------------------------------
+
+def common_mode_2d_nbanks(data, mask=None, nrbanks=2, nbanks=4, cormax=None, npix_min=10):
+    """Vectorized version of common_mode_2d_hsplit_nbanks for n-d data and mask shaped as (..., rows, cols).
+       Rows and columns are split for nrbanks x nbanks banks and median common mode correction
+       is applied to all pixels of each bank in-place in data for all leading dimensions (segments) at once.
+       As in common_mode_2d_hsplit_nbanks, for mask=None correction is applied in rows of banks.
+    """
+    if mask is None:
+        return common_mode_rows_nbanks(data, None, nbanks, cormax, npix_min)
+    sh = data.shape
+    shv = sh[:-2] + (nrbanks, sh[-2]//nrbanks, nbanks, sh[-1]//nbanks)
+    v = _reshaped_view(data, shv)
+    m = mask.reshape(shv)
+    axes = (v.ndim-3, v.ndim-1)
+    cmode, npix = median_masked(v, m, axes)
+    _apply_cmode(v, m, cmode, axes, valid=(npix>=npix_min), cormax=cormax)
+
+#------------------------------
+
+def common_mode_segments(data, mask, cmps, nbanks=16, nrbanks=2):
+    """Applies common mode correction to data and mask shaped as (<nsegs>, rows, cols) for all segments at once.
+       The same algorithms as in per-segment loops for jungfrau (nbanks=16) and epix10ka (nbanks=8):
+       - cmps[1] - control bit-word
+         +4 - in 2-d banks (rows/nrbanks, cols/nbanks)
+         +1 - in rows of banks (cols/nbanks)
+         +2 - in columns of banks (rows/nrbanks)
+       - cmps[2] - maximal applied correction
+       - cmps[3] - minimal number of good pixels in group, default 10
+    """
+    if cmps is None: return
+    mode, cormax = int(cmps[1]), cmps[2]
+    npixmin = cmps[3] if len(cmps)>3 else 10
+    if mode & 4: common_mode_2d_nbanks(data, mask, nrbanks=nrbanks, nbanks=nbanks, cormax=cormax, npix_min=npixmin)
+    if mode & 1: common_mode_rows_nbanks(data, mask, nbanks=nbanks, cormax=cormax, npix_min=npixmin)
+    if mode & 2: common_mode_cols_nrbanks(data, mask, nrbanks=nrbanks, cormax=cormax, npix_min=npixmin)
+
+#------------------------------
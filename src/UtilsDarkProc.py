@@ -67,9 +67,11 @@ class DarkProcDet(uc.DarkProc):
         if raw is None:
             logger.info('det.raw(evt) is None in event %d' % ievt)
             return None
+        if not self.is_own_event(ievt): return self.status
         return uc.DarkProc.event(self, raw, ievt)
 
     def summary(self, evt, env):
+        if not self.reduce_stats(): return
         uc.DarkProc.summary(self)
         if self.plotim: self.show_plot_results()
         if self.savebw: self.save_results(evt, env)
@@ -134,6 +136,7 @@ def det_ndarr_raw_proc(**kwa):
     kwa['rms_lo'] = kwa['rmslow']
     kwa['rms_hi'] = kwa['rmshig']
 
+    kwa['comm'] = uc.mpi_comm() # events are split between MPI ranks if launched by mpirun
     lst_dpo = [DarkProcDet(src, **kwa) for src in source.split(',')]
 
     ds  = psana.DataSource(dsname)
@@ -195,7 +195,7 @@ def merge_status_extra(detid, fname_prefix, pattern, _tstamp, **kwa):
     merged = None
 
     for f in fnames_ct:
-        nda = np.loadtxt(f, dtype=DTYPE_STATUS_EXTRA)
+        nda = uc.load_textfile_cached(f, dtype=DTYPE_STATUS_EXTRA)
         if nda is None: continue
         elif merged is None: merged = nda
         else: merged = np.bitwise_or(merged, nda)
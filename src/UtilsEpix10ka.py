@@ -15,6 +15,8 @@ Created on 2018-11-14 by Mikhail Dubrovin
 
 import os
 import sys
+import zlib
+import threading
 import numpy as np
 from time import time
 
@@ -25,11 +27,14 @@ from Detector.PyDataAccess import get_epix_data_object, get_epix10ka_config_obje
                                   get_epix10kaquad_config_object, get_epix10ka2m_config_object,\
                                   get_epix10ka_any_config_object
 from Detector.GlobalUtils import print_ndarr, info_ndarr, divide_protected
+from Detector.UtilsCalibCache import detcache_for_run, add_detcache_to_calib_cache, shmem_name, shared_arrays,\
+                                     thread_pool
 from PSCalib.GlobalUtils import merge_masks, string_from_source
 #from PSCalib.GlobalUtils import save_textfile, string_from_source
 
 from Detector.UtilsCommonMode import common_mode_cols,\
-                                     common_mode_rows_hsplit_nbanks, common_mode_2d_hsplit_nbanks
+                                     common_mode_rows_hsplit_nbanks, common_mode_2d_hsplit_nbanks,\
+                                     common_mode_segments, common_mode_engine, CMENGINE_VECT
 ue = sys.modules[__name__]
 
 get_epix10ka_data_object = get_epix_data_object
@@ -41,6 +46,7 @@ GAIN_MODES    = ['FH','FM','FL','AHL-H','AML-M','AHL-L','AML-L']
 GAIN_MODES_IN = ['FH','FM','FL','AHL-H','AML-M']
 
 B14 = 0o40000 # 16384 or 1<<14 (15-th bit starting from 1)
+SHARED_CONSTANTS = ('peds', 'gfac', 'mask', 'aone') # DetCache arrays shared between processes
 B04 =    0o20 #    16 or 1<<4   (5-th bit starting from 1)
 B05 =    0o40 #    32 or 1<<5   (6-th bit starting from 1)
 M14 =  0x3fff # 16383 or (1<<14)-1 - 14-bit mask
@@ -90,9 +96,14 @@ def cbits_config_epix10ka(cob):
     """
     trbits = [cob.asics(i).trbit() for i in range(cob.numberOfAsics())] # 4 ASIC trbits, ex: [1,1,1,1]
     #logger.debug('In cbits_config_epix10ka cob: %s trbits: %s' %  (str(cob), str(trbits)))
+    return cbits_pixel_config(cob.asicPixelConfigArray(), trbits)
 
+
+def cbits_pixel_config(pca, trbits):
+    """Returns array of control bits shape=(352, 384) from pixel config array pca and list of 4 ASIC trbits,
+       see cbits_config_epix10ka.
+    """
     # begin to create array of control bits
-    pca = cob.asicPixelConfigArray()
     cbits = np.bitwise_and(pca,12) # 014 (bin:1100)
 
     # add trbit
@@ -141,6 +152,93 @@ def cbits_config_epix10ka_any(env, src):
     return None
 
 
+def detector_config_object(env, src):
+    """Returns detector configuration object psana.Epix.Config10ka2M*, Config10kaQuad* or Config10ka*
+       and (bool) True for composite detector epix10kaquad/2m with data shaped as (<nsegs>, 352, 384),
+       or (None, None) if configuration is missing.
+    """
+    cob = get_epix10ka2m_config_object(env, src)
+    if cob is None: cob = get_epix10kaquad_config_object(env, src)
+    if cob is not None: return cob, True
+
+    cob = get_epix10ka_config_object(env, src)
+    if cob is not None: return cob, False
+    return None, None
+
+
+def element_config_objects(cob, is_stack):
+    """Returns list of panel configuration objects psana.Epix.Config10ka* for detector configuration object cob."""
+    return [cob.elemCfg(i) for i in range(cob.numberOfElements())] if is_stack else [cob,]
+
+
+class ConfigBits():
+    """Control bits of pixels from configuration cached for a step (calib-cycle) of the run.
+       Step is signaled by the change of detector configuration object in the config store,
+       at this change configuration is identified by trbits and content of panel pixel config arrays -
+       their shapes and crc32 checksums, so control bits are not re-evaluated if configuration is the same,
+       and configuration of the next step is recognized even if its arrays are placed in the memory of previous step.
+    """
+    def __init__(self):
+        self.cob = None # detector configuration object of the cached step, reference keeps its id unique
+        self.key = None
+        self.cbits = None
+        self.gidx0 = None # gain range index for data bit 14 = 0
+        self.gxor = None  # gain range index for data bit 14 = 1 is gidx0 ^ gxor
+
+    def cbits_for_config(self, env, src):
+        """Returns cached array of control bits shape=(16, 352, 384) dtype:uint16, re-evaluated at change of configuration."""
+        cob, is_stack = detector_config_object(env, src)
+        if cob is None: return None
+        if cob is self.cob: return self.cbits # the same step, config store is not re-read
+        self.cob = cob
+        ecos = element_config_objects(cob, is_stack)
+        pcas = [o.asicPixelConfigArray() for o in ecos]
+        trbits = [tuple(o.asics(i).trbit() for i in range(o.numberOfAsics())) for o in ecos]
+        key = (is_stack, tuple(trbits), tuple((a.shape, zlib.crc32(np.ascontiguousarray(a))) for a in pcas))
+        if key != self.key:
+            cbits = [cbits_pixel_config(a, t) for a,t in zip(pcas, trbits)]
+            self.set_cbits(np.stack(cbits) if is_stack else cbits[0])
+            self.key = key
+            logger.debug(info_ndarr(self.cbits, 'ConfigBits re-evaluated cbits'))
+        return self.cbits
+
+    def set_cbits(self, cbits):
+        """Sets read-only control bits from configuration and look-up gain range index for data bit 14 = 0/1."""
+        self.cbits = cbits.astype(np.uint16)
+        self.cbits.setflags(write=False)
+        self.gidx0 = GAIN_INDEX_LUT[self.cbits]
+        self.gxor = self.gidx0 ^ GAIN_INDEX_LUT[self.cbits | B05]
+
+    def gain_index(self, data=None, out=None):
+        """Returns gain range index dtype:uint8 for cached cbits | data bit 14 moved to bit 5."""
+        if out is None: out = np.empty(self.gidx0.shape, dtype=np.uint8)
+        if data is None:
+            np.copyto(out, self.gidx0)
+            return out
+        gidx = np.right_shift(data, 14, out=out, casting='unsafe')
+        gidx &= 1
+        gidx *= self.gxor
+        gidx ^= self.gidx0
+        return gidx
+
+dic_cbits = {} # {det.name:ConfigBits()}
+
+
+def config_bits(det):
+    """Returns ConfigBits object for det with control bits valid for the current step or None if configuration is missing."""
+    o = dic_cbits.get(det.name, None)
+    if o is None: o = dic_cbits[det.name] = ConfigBits()
+    return o if o.cbits_for_config(det.env, det.source) is not None else None
+
+
+def cbits_config_cached(det):
+    """Returns array of control bits shape=(16, 352, 384) from configuration cached for the step,
+       the same as cbits_config_epix10ka_any(det.env, det.source), but read-only.
+    """
+    o = config_bits(det)
+    return None if o is None else o.cbits
+
+
 def cbits_total_epix10ka_any(det, data=None):
     """Returns array of control bits shape=(16, 352, 384)
        from any config object and data array.
@@ -155,7 +253,7 @@ def cbits_total_epix10ka_any(det, data=None):
        100000 = 1<<5 = 32 - data bit 14
     """
 
-    cbits = cbits_config_epix10ka_any(det.env, det.source)
+    cbits = cbits_config_cached(det)
     #logger.debug(info_ndarr(cbits, 'cbits', first, last))
 
     if cbits is None: return None
@@ -197,6 +295,13 @@ def gain_maps_epix10ka_any(det, data=None):
      001100 =12 - cbitsM12 - mask
     """
 
+    gidx = gain_index_epix10ka_any(det, data)
+    if gidx is None: return None
+    return gain_maps_for_index(gidx)
+
+
+def gain_maps_epix10ka_any_v0(det, data=None):
+    """Returns maps of gain groups shape=(16, 352, 384), see gain_maps_epix10ka_any"""
     cbits = cbits_total_epix10ka_any(det, data)
     if cbits is None: return None
 
@@ -216,6 +321,36 @@ def gain_maps_epix10ka_any(det, data=None):
 
 
 
+def gain_index_lut():
+    """Returns look-up table of gain range index [0:6] for 'FH','FM','FL','AHL-H','AML-M','AHL-L','AML-L'
+       for 64 values of 6 low bits of control bit array, GIND_UNDEF for undefined gain range, see gain_maps_epix10ka_any.
+    """
+    c = np.arange(64)
+    conds = ((c & 28) == 28, (c & 28) == 12, (c & 12) == 8,\
+             (c & 60) == 16, (c & 60) ==  0, (c & 60) == 48, (c & 60) == 32)
+    return np.select(conds, range(7), default=GIND_UNDEF).astype(np.uint8)
+
+GIND_UNDEF = 7 # gain range index for pixels with undefined gain range
+GAIN_INDEX_LUT = gain_index_lut()
+GIND_HM_BITS = 0b11011 # bits of gain range index 0,1,3,4 for 'FH','FM','AHL-H','AML-M' used in common mode correction
+
+
+def gain_index_epix10ka_any(det, data=None, out=None):
+    """Returns array of per pixel gain range index shape=(16, 352, 384) dtype:uint8,
+       enumerated from 0 to 6 for 'FH','FM','FL','AHL-H','AML-M','AHL-L','AML-L' and GIND_UNDEF=7 for undefined,
+       evaluated by look-up table GAIN_INDEX_LUT from cbits | databit, where control bits from configuration are cached for the step
+       together with look-up results for data bit 14 = 0/1.
+       - out (np.array) - optional preallocated output array of the same shape dtype:uint8
+    """
+    o = config_bits(det)
+    return None if o is None else o.gain_index(data, out)
+
+
+def gain_maps_for_index(gidx):
+    """Returns tuple of 7 boolean maps of gain ranges from array of gain range index, compatible with gain_maps_epix10ka_any"""
+    return tuple(gidx == i for i in range(7))
+
+
 def info_gain_mode_arrays1(gmaps, first=0, last=5):
     """ gr0, gr1, gr2, gr3, gr4, gr5, gr6 = gmaps"""
     recs = [info_ndarr(gr, 'gr%d'%i, first, last) for i,gr in enumerate(gmaps)]
@@ -408,20 +543,7 @@ def calib_epix10ka_any(det, evt, cmpars=None, **kwa): # cmpars=(7,2,10,10), mbit
                      str(np.sum(gmask, axis=(1,2), dtype=np.uint32) if gmask is not None else None))
         #logger.debug('common-mode mask massaging (sec) = %.6f' % (time()-t2_sec_cm)) # 5msec
 
-        #sh = (nsegs, 352, 384)
-        hrows = 176 # int(352/2)
-        for s in range(arrf.shape[0]):
-
-          if mode & 4: # in banks: (352/2,384/8)=(176,48) pixels
-            common_mode_2d_hsplit_nbanks(arrf[s,:hrows,:], mask=gmask[s,:hrows,:], nbanks=8, cormax=cormax, npix_min=npixmin)
-            common_mode_2d_hsplit_nbanks(arrf[s,hrows:,:], mask=gmask[s,hrows:,:], nbanks=8, cormax=cormax, npix_min=npixmin)
-
-          if mode & 1: # in rows per bank: 384/8 = 48 pixels # 190ms
-            common_mode_rows_hsplit_nbanks(arrf[s,], mask=gmask[s,], nbanks=8, cormax=cormax, npix_min=npixmin)
-
-          if mode & 2: # in cols per bank: 352/2 = 176 pixels # 150ms
-            common_mode_cols(arrf[s,:hrows,:], mask=gmask[s,:hrows,:], cormax=cormax, npix_min=npixmin)
-            common_mode_cols(arrf[s,hrows:,:], mask=gmask[s,hrows:,:], cormax=cormax, npix_min=npixmin)
+        common_mode_epix10ka(arrf, gmask, cmp)
 
         logger.debug('TIME common-mode correction = %.6f sec for cmp=%s' % (time()-t0_sec_cm, str(cmp)))
 
@@ -431,6 +553,35 @@ def calib_epix10ka_any(det, evt, cmpars=None, **kwa): # cmpars=(7,2,10,10), mbit
 calib_epix10ka = calib_epix10ka_any
 
 
+def common_mode_epix10ka(arrf, gmask, cmps):
+    """Applies in-place common mode correction to pedestal-subtracted arrf shaped as (<nsegs>, 352, 384),
+       gmask - the same shape mask of good pixels in H/M gain ranges used for correction,
+       cmps - common mode parameters, cmps[1] - control bit-word 1-in rows, 2-in columns, 4-in banks,
+              cmps[4] - engine 0/1 - vectorized for all segments/legacy loop over segments and banks.
+    """
+    mode, cormax = int(cmps[1]), cmps[2]
+    npixmin = cmps[3] if len(cmps)>3 else 10
+
+    if common_mode_engine(cmps) == CMENGINE_VECT:
+        common_mode_segments(arrf, gmask, cmps, nbanks=8, nrbanks=2)
+        return
+
+    #sh = (nsegs, 352, 384)
+    hrows = 176 # int(352/2)
+    for s in range(arrf.shape[0]):
+
+      if mode & 4: # in banks: (352/2,384/8)=(176,48) pixels
+        ue.common_mode_2d_hsplit_nbanks(arrf[s,:hrows,:], mask=gmask[s,:hrows,:], nbanks=8, cormax=cormax, npix_min=npixmin)
+        ue.common_mode_2d_hsplit_nbanks(arrf[s,hrows:,:], mask=gmask[s,hrows:,:], nbanks=8, cormax=cormax, npix_min=npixmin)
+
+      if mode & 1: # in rows per bank: 384/8 = 48 pixels # 190ms
+        ue.common_mode_rows_hsplit_nbanks(arrf[s,], mask=gmask[s,], nbanks=8, cormax=cormax, npix_min=npixmin)
+
+      if mode & 2: # in cols per bank: 352/2 = 176 pixels # 150ms
+        ue.common_mode_cols(arrf[s,:hrows,:], mask=gmask[s,:hrows,:], cormax=cormax, npix_min=npixmin)
+        ue.common_mode_cols(arrf[s,hrows:,:], mask=gmask[s,hrows:,:], cormax=cormax, npix_min=npixmin)
+
+
 
 class DetCache():
     """ Cash of calibration constants for epix10ka2m.
@@ -446,17 +597,25 @@ class DetCache():
         self.outa = None
         self.cmps = None
         self.aone = None
+        self.pcons = None # per-step pixel-major pairs (peds, gfac x mask) for data bit 14 = 0/1 for calib_epix10ka_fused
+        self.gidx0 = None # gain range index of ConfigBits for which pcons are evaluated
+        self.tls = threading.local() # per-thread segment buffers for calib_epix10ka_fused
+        self.fused = kwa.get('fused', True)
+        self.pool = None # thread pool for per-segment calibration
+        self.nthreads = 0
         self.isset = False
         self.evnum = 0
-        self.add_calibcons(det, evt)
+        self.detname = string_from_source(det.source)
+        self.runnum = det.runnum(evt)
+        self.calibkey = det.pyda.calib_files_key(evt) # resolved calibration files for calib_cache
+        self.shmem = kwa.get('shmem', False)
+        if not self.shmem: self.add_calibcons(det, evt) # otherwise constants are set by set_shared_constants
 
     def kwargs_are_the_same(self, **kwa):
         return self.kwa == kwa
 
     def add_calibcons(self, det, evt):
 
-        self.detname = string_from_source(det.source)
-
         #arr  = np.array(det.raw(evt), dtype=np.float32)
         self.peds = det.pedestals(evt) # - 4d pedestals shape:(3, 1, 512, 1024) dtype:float32
         if self.peds is None: return
@@ -472,6 +631,67 @@ class DetCache():
 
         self.isset = True
 
+    def set_shared_constants(self, det, evt, raw):
+        """Sets constants as read-only arrays in shared memory of the node.
+           Constants are evaluated in the first process for the same detector, calibration files and **kwa,
+           other processes attach to them, output buffer is allocated in each process.
+        """
+        def constants():
+            self.add_calibcons(det, evt)
+            self.mask = det.mask_total(evt, **self.kwa)
+            self.aone = np.ones_like(raw, dtype=np.int8)
+            return dict((k, getattr(self, k)) for k in SHARED_CONSTANTS)
+
+        name = shmem_name('epix10ka', self.detname, self.calibkey, self.runnum, self.kwa)
+        for k,v in shared_arrays(name, constants).items(): setattr(self, k, v)
+        if self.peds is None: return
+        self.outa = np.zeros(self.peds.shape[1:], dtype=np.float32)
+        self.isset = True
+
+    def set_step_constants(self, ocb):
+        """Sets constants for calib_epix10ka_fused at change of ConfigBits ocb, i.e. for each step of the run.
+           Within the step pixel has two gain ranges, gidx0 and gidx0 ^ gxor for data bit 14 = 0/1,
+           so pedestals and gain factors merged with mask are gathered once per step as pixel-major pairs
+           (ped, gfm) shaped as (<nsegs>, 352, 384, 2, 2) and each event needs a single 8-byte take per pixel.
+           Pixels with undefined gain range get ped=0 and gfm=mask as in calib_epix10ka_nda.
+        """
+        if ocb.gidx0 is self.gidx0: return
+        t0_sec = time()
+        sh = self.outa.shape
+        mask = self.mask
+        gfm = self.gfac if mask is None else self.gfac * mask
+        gfu = 1 if mask is None else mask
+        mhm = 1 if mask is None else mask
+        pcons = np.empty(sh + (2,2), dtype=np.float32)
+        ghm = np.empty((2,) + sh, dtype=np.uint8)
+        for b in (0,1):
+            gidx = ocb.gidx0 ^ ocb.gxor if b else ocb.gidx0
+            undef = gidx == GIND_UNDEF
+            gi = np.minimum(gidx, 6).astype(np.intp)[None,:]
+            pcons[...,b,0] = np.where(undef, 0, np.take_along_axis(self.peds, gi, axis=0)[0])
+            pcons[...,b,1] = np.where(undef, gfu, np.take_along_axis(gfm, gi, axis=0)[0])
+            ghm[b] = (np.right_shift(GIND_HM_BITS, gidx) & 1) & mhm # 1 for gain ranges FH, FM, AHL-H, AML-M
+        shseg = sh[-2:]
+        self.pcons = pcons
+        self.ucons = pcons.view(np.uint64).reshape((-1, 2*shseg[0]*shseg[1])) # per-segment pairs as 8-byte items
+        self.iflat = np.arange(0, 2*shseg[0]*shseg[1], 2, dtype=np.int64).reshape(shseg) # pixel offsets in pairs of segment
+        self.ghm0 = ghm[0].reshape((-1,) + shseg)          # common mode mask for data bit 14 = 0
+        self.ghmx = (ghm[0] ^ ghm[1]).reshape((-1,) + shseg) # its change for data bit 14 = 1
+        self.gidx0 = ocb.gidx0
+        logger.debug('DetCache for %s set step constants for fused kernel, time %.3f sec' % (self.detname, time()-t0_sec))
+
+    def segment_buffers(self):
+        """Returns per-thread buffers shaped as segment for calib_epix10ka_fused."""
+        b = getattr(self.tls, 'bufs', None)
+        if b is None:
+            sh = self.iflat.shape
+            b = self.tls.bufs = (np.empty(sh, dtype=np.uint8),  # data bit 14
+                                 np.empty(sh, dtype=np.int64),  # indexes of constants
+                                 np.empty(sh, dtype=np.uint16), # 14-bit data
+                                 np.empty(sh, dtype=np.uint64), # gathered pairs (ped, gfm)
+                                 np.empty(sh, dtype=np.uint8))  # common mode mask
+        return b
+
 
 class Cache():
     """ Wrapper around dict {detname:DetCache} for cache of calibration constants.
@@ -496,7 +716,40 @@ class Cache():
 cache = Cache() # singleton
 
 
-def calib_epix10ka_v2(det, evt, cmpars=None, **kwa): # cmpars=(7,2,10,10), mbits=None, mask=None, nda_raw=None
+def detcache_epix10ka(det, evt, raw, cmpars=None, **kwa):
+    """Returns (DetCache, first_entry) for det, DetCache is created and filled with constants at first entry,
+       raw - raw data array used to define shape of cached arrays.
+    """
+    detname = string_from_source(det.source) # str, i.e. XcsEndstation.0:Epix10ka2M.0
+    odc = detcache_for_run(cache.detcache_for_detname(detname), det, evt, 'epix10ka')
+    if odc is not None: cache.calibcons[detname] = odc
+    first_entry = odc is None
+    if first_entry:
+       t_first = time()
+       odc = cache.add_detcache(det, evt, **kwa)
+       odc.cmps = det.common_mode(evt) if cmpars is None else cmpars
+       if odc.shmem: odc.set_shared_constants(det, evt, raw)
+       else:
+         odc.mask = det.mask_total(evt, **kwa)
+         odc.aone = np.ones_like(raw, dtype=np.int8)
+       odc.loop_segs = kwa.get('loop_segs', False)
+       add_detcache_to_calib_cache(odc, 'epix10ka')
+
+       logger.info('\n  ====================== det.name: %s' % det.name\
+                   +'\n  detname from source: %s' % detname\
+                   +info_ndarr(raw,  '\n  detcache_epix10ka first entry:\n    raw ')\
+                   +info_ndarr(odc.peds, '\n    peds')\
+                   +info_ndarr(odc.gfac, '\n    gfac')\
+                   +info_ndarr(odc.mask, '\n    mask')\
+                   +info_ndarr(odc.outa, '\n    outa')\
+                   +'\n    ' + info_ndarr(odc.cmps, 'common mode parameters ')
+                   +'\n    loop over segments: %s' % odc.loop_segs
+                   +'\n    fused kernel: %s' % odc.fused
+                   +'\n    1-st entry consumed time (sec): %.3f' % (time() - t_first))
+    return odc, first_entry
+
+
+def calib_epix10ka_v2(det, evt, cmpars=None, out=None, **kwa): # cmpars=(7,2,10,10), mbits=None, mask=None, nda_raw=None
     """
     Returns calibrated epix10ka data.
     In _v2 - (bool) parameter loop_segs allows to loop or not over segments
@@ -517,11 +770,16 @@ def calib_epix10ka_v2(det, evt, cmpars=None, **kwa): # cmpars=(7,2,10,10), mbits
             alg is not used
             mode =0-correction is not applied, =1-in rows, =2-in cols-WORKS THE BEST
             i.e: cmpars=(7,0,100) or (7,2,100)
+            cmpars[4] - common mode engine 0/1 - vectorized/legacy loop over segments and banks
+    - out (np.array) - optional preallocated output array shaped as raw dtype:float32
     - **kwa - used here and passed to det.mask_comb
       - nda_raw - substitute for det.raw(evt)
       - mbits - deprecated parameter of the det.mask_comb(...), det.mask_v2 is used by default
       - mask - user defined mask passed as optional parameter
-      - loop_segs - (bool, False) on/off loop over segments - key feature of _v2
+      - loop_segs - (bool, False) on/off loop over segments - key feature of _v2, used for fused=False
+      - fused - (bool, True) use single-pass kernel calib_epix10ka_fused with per-step constants
+      - nthreads - (int, 1) number of threads in the pool of DetCache for parallel processing of segments
+      - shmem - (bool, False) share read-only constants between processes on the node, e.g. MPI ranks
     """
 
     #t00 = time()
@@ -534,27 +792,7 @@ def calib_epix10ka_v2(det, evt, cmpars=None, **kwa): # cmpars=(7,2,10,10), mbits
 
     #t01 = time()
 
-    detname = string_from_source(det.source) # str, i.e. XcsEndstation.0:Epix10ka2M.0
-    odc = cache.detcache_for_detname(detname)
-    first_entry = odc is None
-    if first_entry:
-       t_first = time()
-       odc = cache.add_detcache(det, evt, **kwa)
-       odc.cmps = det.common_mode(evt) if cmpars is None else cmpars
-       odc.mask = det.mask_total(evt, **kwa)
-       odc.aone = np.ones_like(raw, dtype=np.int8)
-       odc.loop_segs = kwa.get('loop_segs', False)
-
-       logger.info('\n  ====================== det.name: %s' % det.name\
-                   +'\n  detname from source: %s' % detname\
-                   +info_ndarr(raw,  '\n  calib_epix10ka_v2 first entry:\n    raw ')\
-                   +info_ndarr(odc.peds, '\n    peds')\
-                   +info_ndarr(odc.gfac, '\n    gfac')\
-                   +info_ndarr(odc.mask, '\n    mask')\
-                   +info_ndarr(odc.outa, '\n    outa')\
-                   +'\n    ' + info_ndarr(odc.cmps, 'common mode parameters ')
-                   +'\n    loop over segments: %s' % odc.loop_segs
-                   +'\n    1-st entry consumed time (sec): %.3f' % (time() - t_first))
+    odc, first_entry = detcache_epix10ka(det, evt, raw, cmpars, **kwa)
 
     odc.evnum += 1
     cmps = odc.cmps
@@ -565,6 +803,21 @@ def calib_epix10ka_v2(det, evt, cmpars=None, **kwa): # cmpars=(7,2,10,10), mbits
     outa = odc.outa
 
     arr = raw
+    nthreads = kwa.get('nthreads', 1)
+
+    if odc.fused:
+      ocb = config_bits(det)
+      if ocb is None:
+        if first_entry: logger.warning('configuration bits are None')
+        return None
+      odc.set_step_constants(ocb)
+      if not odc.evnum%100 and logger.isEnabledFor(logging.DEBUG):
+        logger.debug('pixel gain range index statistics: %s' % str(np.bincount(ocb.gain_index(raw).ravel(), minlength=8)))
+      if out is not None: outa = out.reshape(arr.shape)
+      if nthreads > 1 and arr.ndim > 2:
+        thread_pool(odc, nthreads).map(lambda i: calib_epix10ka_fused(arr, odc, i, out=outa), range(arr.shape[0]))
+        return outa
+      return calib_epix10ka_fused(arr, odc, out=outa)
 
     gmap = ue.gain_maps_epix10ka_any(det, raw)  #shape:(7, 16, 352, 384)
     if gmap is None:
@@ -580,43 +833,150 @@ def calib_epix10ka_v2(det, evt, cmpars=None, **kwa): # cmpars=(7,2,10,10), mbits
 
     if first_entry: logger.info(info_ndarr(gmap, 'first_entry gmap'))
 
-    if odc.loop_segs:
+    if (odc.loop_segs or nthreads > 1) and arr.ndim > 2:
       nsegs = arr.shape[0]   # 16 for epix10ka2m
       shseg = arr.shape[-2:] # (352, 384)
-      if first_entry: logger.debug('first_entry: number of segments: %d  segment shape: %s' % (nsegs, str(shseg)))
-
-      for i in range(nsegs):
-        # define per-segment arrays
-        #print('ev:%d seg:%02d' % (odc.evnum, i))
-        arr1s = arr[i,:]
-        aone1 = aone[i,:]
-        mask1 = None if mask is None else mask[i,:]
-        gfac1 = None if gfac is None else gfac[:,i,:,:]
-        peds1 = None if peds is None else peds[:,i,:,:]
-        gmap1 = None if gmap is None else gmap[:,i,:,:]
-        arr1s.shape  = (1,) + shseg
-        if mask1 is not None: mask1.shape = (1,) + shseg
-        if gfac1 is not None: gfac1.shape = (7,1,) + shseg
-        if peds1 is not None: peds1.shape = (7,1,) + shseg
-        if gmap1 is not None: gmap1.shape = (7,1,) + shseg
-        #print(info_ndarr(arr1s,  'XXX  arr1s '))
-        #print(info_ndarr(peds1, 'XXX  peds11 '))
-        #out1, t03_12 = calib_epix10ka_nda(arr1s, gfac1, peds1, mask1, cmps, gmap1, aone1)
-        out1 = calib_epix10ka_nda(arr1s, gfac1, peds1, mask1, cmps, gmap1, aone1)
-        #print(info_ndarr(out1, 'XXX  out1 '))
-        outa[i,:] = out1[0,:]
+      if first_entry: logger.debug('first_entry: number of segments: %d  segment shape: %s  nthreads: %d'%\
+                                   (nsegs, str(shseg), nthreads))
+      if out is not None: outa = out.reshape(arr.shape)
+      if nthreads > 1:
+        thread_pool(odc, nthreads).map(lambda i: calib_epix10ka_segment(arr, odc, gmap, i, outa), range(nsegs))
+      else:
+        for i in range(nsegs): calib_epix10ka_segment(arr, odc, gmap, i, outa)
       #print(info_ndarr(outa, 'XXX  outa '))
       #sys.exit('TEST EXIT')
       #return outa
     else:
       #outa, t03_12 = calib_epix10ka_nda(arr, gfac, peds, mask, cmps, gmap, aone)
       outa = calib_epix10ka_nda(arr, gfac, peds, mask, cmps, gmap, aone)
+      if out is not None:
+        np.copyto(out, outa.reshape(out.shape))
+        outa = out
 
     #t13 = time()
     #times = (t00, t01, t02) + t03_12 + (t13,)
     return outa #, times # (t00, t01, t02, t03, t04, t05, t06, t07, t08, t09, t10, t11, t12, t13)
 
 
+def calib_epix10ka_batch(det, evt, raws, cmpars=None, out=None, **kwa):
+    """Returns calibrated epix10ka data for a batch of events shaped as (<nevts>, <nsegs>, 352, 384) dtype:float32.
+       Constants and mask are taken once from DetCache and reused for all frames,
+       frames are calibrated directly in the output block.
+
+       Parameters
+
+       - det (psana.Detector) - Detector object
+       - evt (psana.Event or int run number) - defines calibration constants for the batch
+       - raws (np.array) - stack of raw data shaped as (<nevts>, <nsegs>, 352, 384) dtype:uint16
+       - cmpars (tuple) - common mode parameters, see calib_epix10ka_v2
+       - out (np.array) - optional preallocated output block shaped as raws dtype:float32
+       - **kwa - the same as for calib_epix10ka_v2, except nda_raw
+    """
+    if raws is None: return None
+    odc, first_entry = detcache_epix10ka(det, evt, raws[0], cmpars, **kwa)
+    if out is None: out = np.empty(raws.shape, dtype=np.float32)
+    nthreads = kwa.get('nthreads', 1)
+    segmented = (odc.loop_segs or nthreads > 1) and raws.ndim > 3
+    nsegs = raws.shape[1]
+
+    if odc.fused:
+        ocb = config_bits(det)
+        if ocb is None: return None
+        odc.set_step_constants(ocb)
+        pool = thread_pool(odc, nthreads) if nthreads > 1 and raws.ndim > 3 else None
+        for i in range(raws.shape[0]):
+            arr, outi = raws[i], out[i]
+            if pool is None: calib_epix10ka_fused(arr, odc, out=outi)
+            else: pool.map(lambda s: calib_epix10ka_fused(arr, odc, s, out=outi), range(nsegs))
+        return out
+
+    for i in range(raws.shape[0]):
+        arr = raws[i]
+        gmap = ue.gain_maps_epix10ka_any(det, arr)
+        if gmap is None:
+            if first_entry: logger.warning('gmap is None')
+            return None
+        gmap = np.array(gmap)
+        if not segmented:
+            out[i] = calib_epix10ka_nda(arr, odc.gfac, odc.peds, odc.mask, odc.cmps, gmap, odc.aone)
+        elif nthreads > 1:
+            thread_pool(odc, nthreads).map(lambda s: calib_epix10ka_segment(arr, odc, gmap, s, out[i]), range(nsegs))
+        else:
+            for s in range(nsegs): calib_epix10ka_segment(arr, odc, gmap, s, out[i])
+    return out
+
+
+def calib_epix10ka_segment(arr, odc, gmap, i, out=None):
+    """Calibrates segment i of raw data arr with constants from DetCache odc and gain maps gmap shape:(7, <nsegs>, 352, 384),
+       saves results in odc.outa[i,:] or in out[i,:] if out is specified.
+    """
+    gfac, peds, mask, aone = odc.gfac, odc.peds, odc.mask, odc.aone
+    shseg = arr.shape[-2:] # (352, 384)
+    # define per-segment arrays
+    #print('ev:%d seg:%02d' % (odc.evnum, i))
+    arr1s = arr[i,:]
+    aone1 = aone[i,:]
+    mask1 = None if mask is None else mask[i,:]
+    gfac1 = None if gfac is None else gfac[:,i,:,:]
+    peds1 = None if peds is None else peds[:,i,:,:]
+    gmap1 = None if gmap is None else gmap[:,i,:,:]
+    arr1s.shape  = (1,) + shseg
+    if mask1 is not None: mask1.shape = (1,) + shseg
+    if gfac1 is not None: gfac1.shape = (7,1,) + shseg
+    if peds1 is not None: peds1.shape = (7,1,) + shseg
+    if gmap1 is not None: gmap1.shape = (7,1,) + shseg
+    #print(info_ndarr(arr1s,  'XXX  arr1s '))
+    #print(info_ndarr(peds1, 'XXX  peds11 '))
+    out1 = calib_epix10ka_nda(arr1s, gfac1, peds1, mask1, odc.cmps, gmap1, aone1)
+    #print(info_ndarr(out1, 'XXX  out1 '))
+    (odc.outa if out is None else out)[i,:] = out1[0,:]
+
+
+def calib_epix10ka_fused(arr, odc, segs=None, out=None):
+    """Returns calibrated epix10ka data in the cached buffer odc.outa or in out if specified.
+       Single-pass kernel evaluating (raw & M14 - peds[g]) * gfac[g] * mask, where pair of constants
+       for gain range g is gathered by data bit 14 from per-step layout of DetCache.set_step_constants,
+       common mode mask is defined by per-step gain ranges. Results are identical to calib_epix10ka_nda.
+
+       Parameters
+       ----------
+       arr - raw data shape:(<nsegs>, 352, 384) or (352, 384) dtype:uint16
+       odc - DetCache object with step constants
+       segs - (int) segment to process, all by default; results are saved in odc.outa[segs]
+       out - optional float32 output array shaped as arr, used in stead of odc.outa
+    """
+    outa = odc.outa if out is None else out
+    sh3d = odc.ghm0.shape
+    arr3, out3 = arr.reshape(sh3d), outa.reshape(sh3d)
+    for i in (range(sh3d[0]) if segs is None else (segs,)):
+        calib_epix10ka_fused_segment(arr3[i], odc, i, out3[i])
+    return outa
+
+
+def calib_epix10ka_fused_segment(arr, odc, i, out):
+    """Calibrates segment arr shape:(352, 384) of segment index i in the per-thread buffers of DetCache odc,
+       saves results in out shaped as arr.
+    """
+    bit, indx, abuf, ucon, gmask = odc.segment_buffers()
+    cmps = odc.cmps
+
+    np.right_shift(arr, 14, out=bit, casting='unsafe')
+    bit &= 1
+    np.add(odc.iflat, bit, out=indx)
+    np.take(odc.ucons[i], indx, out=ucon, mode='clip') # indexes are in range by construction, 'clip' skips slow bound check
+    cons = ucon.view(np.float32).reshape(arr.shape + (2,)) # (ped, gfm) for gain range of pixel
+
+    np.bitwise_and(arr, M14, out=abuf)
+    np.subtract(abuf, cons[...,0], out=out)
+
+    if cmps is not None and int(cmps[1])>0:
+        np.bitwise_and(bit, odc.ghmx[i], out=gmask)
+        gmask ^= odc.ghm0[i]
+        common_mode_epix10ka(out[None,:], gmask[None,:], cmps)
+
+    np.multiply(out, cons[...,1], out=out)
+
+
 def calib_epix10ka_nda(arr, gfac, peds, mask, cmps, gmap, aone):
 
     #t03 = time()
@@ -663,26 +1023,7 @@ def calib_epix10ka_nda(arr, gfac, peds, mask, cmps, gmap, aone):
 
         #t08 = time()
 
-        #sh = (nsegs, 352, 384)
-        hrows = 176 # int(352/2)
-        for s in range(arrf.shape[0]):
-
-          #t09 = time()
-
-          if mode & 4: # in banks: (352/2,384/8)=(176,48) pixels
-            ue.common_mode_2d_hsplit_nbanks(arrf[s,:hrows,:], mask=gmask[s,:hrows,:], nbanks=8, cormax=cormax, npix_min=npixmin)
-            ue.common_mode_2d_hsplit_nbanks(arrf[s,hrows:,:], mask=gmask[s,hrows:,:], nbanks=8, cormax=cormax, npix_min=npixmin)
-
-          #t10 = time()
-
-          if mode & 1: # in rows per bank: 384/8 = 48 pixels # 190ms
-            ue.common_mode_rows_hsplit_nbanks(arrf[s,], mask=gmask[s,], nbanks=8, cormax=cormax, npix_min=npixmin)
-
-          #t11 = time()
-
-          if mode & 2: # in cols per bank: 352/2 = 176 pixels # 150ms
-            ue.common_mode_cols(arrf[s,:hrows,:], mask=gmask[s,:hrows,:], cormax=cormax, npix_min=npixmin)
-            ue.common_mode_cols(arrf[s,hrows:,:], mask=gmask[s,hrows:,:], cormax=cormax, npix_min=npixmin)
+        common_mode_epix10ka(arrf, gmask, cmps)
 
         logger.debug('TIME common-mode correction = %.6f sec for cmps=%s' % (time()-t0_sec_cm, str(cmps)))
 
@@ -10,6 +10,8 @@ CALIBRATION - TEST PULSES
 
 import os
 import sys
+import shutil
+from glob import glob
 from time import time
 
 from Detector.UtilsLogging import logging, DICT_NAME_TO_LEVEL
@@ -31,7 +33,8 @@ from Detector.GlobalUtils import info_ndarr, print_ndarr, divide_protected
 
 from Detector.UtilsCalib import evaluate_limits, tstamps_run_and_now, str_tstamp,\
        save_log_record_at_start, find_file_for_timestamp, save_ndarray_in_textfile, save_2darray_in_textfile,\
-       calib_group, env_time, TSTAMP_FORMAT, str_dsname
+       calib_group, env_time, TSTAMP_FORMAT, str_dsname, load_textfile_cached, block_gated_sums, MAX_CHUNK_BYTES,\
+       load_repo_array, save_repo_array, save_merged_panels
 
 import matplotlib
 import matplotlib.pyplot as plt
@@ -255,7 +258,7 @@ def imshow_cbar(fig, axim, axcb, img, amin=None, amax=None, extent=None,\
 
 # 2020-06 development
 
-def fit(block, evnum, display=True, prefix='fig-fit', ixoff=10, nperiods=False, savechi2=False, selpix=None, npmin=5):
+def fit_v0(block, evnum, display=True, prefix='fig-fit', ixoff=10, nperiods=False, savechi2=False, selpix=None, npmin=5):
 
     mf,my,mx=block.shape
     fits=np.zeros((my,mx,2,2))
@@ -319,8 +322,8 @@ def fit(block, evnum, display=True, prefix='fig-fit', ixoff=10, nperiods=False,
                 pf0, res0, _, _, _ = pf0
                 pf1, res1, _, _, _ = pf1
 
-                chisq0 = res0 / (x0.size - 3)
-                chisq1 = res1 / (x1.size - 3)
+                chisq0 = res0.sum() / (x0.size - 3) # residuals are returned as array shaped (1,)
+                chisq1 = res1.sum() / (x1.size - 3)
                 chi2[iy,ix,:] = (chisq0,chisq1)
 
             fits[iy,ix,:] = (pf0, pf1)
@@ -360,6 +363,193 @@ def fit(block, evnum, display=True, prefix='fig-fit', ixoff=10, nperiods=False,
     return fits,nsp,msg,chi2
 
 
+def saw_edges_block(block, evnum, gap=50):
+    """Vectorized saw_edges for all pixel traces of block shaped as (nframes, npixels).
+       Returns arrays of the first and last frame indexes of groups of frames with bit B14,
+       gfirst, glast shaped as (ngmax, npixels), and number of groups per pixel ngr shaped as (npixels,).
+       Edge j of pixel p, the same as in saw_edges, is (glast[j,p]+1, gfirst[j+1,p], glast[j+1,p]) for j < ngr[p]-1.
+    """
+    nf, npix = block.shape
+    b = (block & B14) != 0
+    cont = np.zeros_like(b) # frames with B14 which continue run from previous frame without event gap
+    cont[1:] = b[1:] & b[:-1] & (np.diff(evnum) <= gap)[:,None]
+    tb, pb = np.divmod(np.flatnonzero(b & ~cont), npix)
+    te, pe = np.divmod(np.flatnonzero(b & ~np.vstack((cont[1:], np.zeros((1,npix), dtype=bool)))), npix)
+    ob, oe = np.argsort(pb, kind='stable'), np.argsort(pe, kind='stable')
+    pp, rbeg, rend = pb[ob], tb[ob], te[oe] # runs of frames with B14 ordered by pixel and frame
+    start = np.ones(pp.size, dtype=bool) # runs which start groups
+    start[1:] = (pp[1:] != pp[:-1]) | ((evnum[rbeg[1:]] - evnum[rend[:-1]]) > gap)
+    istart = np.flatnonzero(start)
+    iend = np.append(istart[1:]-1, pp.size-1) # group ends before the next one starts
+    gp = pp[istart]
+    ngr = np.bincount(gp, minlength=npix)
+    ig = np.arange(istart.size) - (np.cumsum(ngr) - ngr)[gp] # group index for pixel
+    ngmax = int(ngr.max()) if npix else 0
+    gfirst = np.full((ngmax, npix), nf, dtype=np.int64)
+    glast = np.full((ngmax, npix), -1, dtype=np.int64)
+    gfirst[ig, gp] = rbeg[istart]
+    glast[ig, gp] = rend[iend]
+    return gfirst, glast, ngr
+
+
+def range_sums(ev, block, ranges, nchunk=256):
+    """Returns int64 array shaped as (len(ranges), 6, npixels) of sums of 1, x, y, x*x, x*y, y*y
+       over frames tbeg<=t<tend of pixel traces y in block shaped as (nframes, npixels), where x = ev[t]-e0,
+       ranges is a list of triplets (tbeg, tend, e0) of int arrays shaped as (npixels,).
+       Sums are evaluated from cumulative sums over frames by chunks of pixels.
+    """
+    nf, npix = block.shape
+    ce = np.concatenate(([0], np.cumsum(ev)))
+    ce2 = np.concatenate(([0], np.cumsum(ev*ev)))
+    cy = np.zeros((3, min(nchunk, npix), nf+1), dtype=np.int64) # cumulative sums of y, ev*y, y*y
+    sums = np.zeros((len(ranges), 6, npix), dtype=np.int64)
+    for i in range(0, npix, nchunk):
+        y = np.ascontiguousarray(block[:,i:i+nchunk].T, dtype=np.int64) # pixel-major chunk
+        nc = len(y)
+        c = slice(i, i+nc)
+        np.cumsum(y, axis=1, out=cy[0,:nc,1:])
+        np.cumsum(y*ev, axis=1, out=cy[1,:nc,1:])
+        np.cumsum(y*y, axis=1, out=cy[2,:nc,1:])
+        ic = np.arange(nc)
+        for k,(tbeg, tend, e0) in enumerate(ranges):
+            b = np.clip(tbeg[c], 0, nf)
+            e = np.clip(tend[c], b, nf)
+            n, x0 = e-b, e0[c]
+            se, se2 = ce[e]-ce[b], ce2[e]-ce2[b]
+            sy, sey, syy = cy[:,ic,e] - cy[:,ic,b]
+            sums[k,:,c] = (n, se-n*x0, sy, se2-2*x0*se+n*x0*x0, sey-x0*sy, syy)
+    return sums
+
+
+def linear_fit_sums(n, sx, sy, sxx, sxy, syy):
+    """Closed-form least squares of y = p[0]*x + p[1] from integer sums over points, all arrays are shaped as (npixels,).
+       Returns p shaped as (2, npixels) and residual sum of squares.
+    """
+    d = n*sxx - sx*sx # exact for integer sums
+    c = n*sxy - sx*sy
+    nf = n.astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(d>0, c/d.astype(np.float64), 0)
+        icept = np.where(n>0, (sy - slope*sx)/nf, 0)
+        ssr = np.where(d>0, ((n*syy - sy*sy) - c.astype(np.float64)*slope)/nf, 0)
+    return np.stack((slope, icept)), np.maximum(ssr, 0)
+
+
+def fit(block, evnum, display=True, prefix='fig-fit', ixoff=10, nperiods=False, savechi2=False, selpix=None, npmin=5):
+    """Vectorized version of fit_v0 - the same parameters and returned fits, nsp, msg, chi2.
+       Saw edges are found for all pixels at once by saw_edges_block and
+       linear fits of H/M and L gain ranges are solved from sums of x, y, x*x, x*y, y*y accumulated over edges.
+    """
+    mf,my,mx=block.shape
+    npix = my*mx
+    msg = ' fit '
+
+    logger.info('fit selpix:' + str(selpix))
+    logger.debug(info_ndarr(evnum, 'in fit evnum:'))
+    logger.debug(info_ndarr(block, 'in fit block:'))
+
+    if display:
+        plot_data_block(block, evnum, prefix, selpix)
+
+    blk = block.reshape((mf, npix))
+    tracem = blk & M14
+    ev = evnum.astype(np.int64)
+
+    gfirst, glast, ngr = saw_edges_block(blk, evnum)
+    nedges = np.maximum(ngr-1, 0)
+    noedges = nedges==0
+    nsp = np.where(noedges, 0, gfirst[1] if len(gfirst)>1 else 0).astype(np.int16)
+
+    nefit = int(nedges.max()) if npix else 0 # number of edges used in fits
+    if not nperiods: nefit = min(nefit, 1)
+
+    bounds = [] # per edge frame index arrays (ixb, ixs-ixoff, ixs+ixoff, ixe) as in fit_v0, empty ranges for missing edges
+    for j in range(nefit):
+        valid = nedges > j
+        ixb = np.where(valid, glast[j]+1, 0)
+        ixs = np.where(valid, gfirst[j+1], 0)
+        ixe = np.where(valid, glast[j+1], 0)
+        ixsb = ixs - ixoff
+        ixsb = np.where(ixsb<0, ixsb+mf, ixsb) # as stop of slice [ixb:ixs-ixoff]
+        bounds.append((ixb, np.where(valid, ixsb, 0), ixs+ixoff, ixe))
+
+    ranges = [r for ixb, ixsb, ixse, ixe in bounds for r in ((ixb, ixsb, ev[ixb]), (ixse, ixe, ev[ixb]))]
+    sums = range_sums(ev, tracem, ranges).reshape((nefit, 2, 6, npix)).sum(axis=0) if nefit else\
+           np.zeros((2, 6, npix), dtype=np.int64) # [range H/M or L, 1/x/y/xx/xy/yy, pixel]
+
+    if nefit: # protection against overflow - exclude saturated points from H/M range of the 1st edge
+        ixb, ixsb = bounds[0][:2]
+        ts, ps = np.divmod(np.flatnonzero(tracem >= ASAT), npix)
+        sel = (ts >= ixb[ps]) & (ts < ixsb[ps])
+        ps, ts = ps[sel], ts[sel]
+        x, y = ev[ts]-ev[ixb[ps]], tracem[ts,ps].astype(np.int64)
+        for i,v in enumerate((np.ones_like(x), x, y, x*x, x*y, y*y)):
+            np.subtract.at(sums[0,i], ps, v)
+
+    p0, ssr0 = linear_fit_sums(*sums[0])
+    p1, ssr1 = linear_fit_sums(*sums[1])
+    n0, n1 = sums[0,0], sums[1,0]
+
+    short = ~noedges & ((n0<npmin) | (n1<npmin))
+    if noedges.any():
+        logger.warning('pulser saw edges are not found, skip processing for %d of %d pixels' % (noedges.sum(), npix))
+    if short.any():
+        logger.warning('too short arrays x0 or x1 (<%d points), skip processing for %d of %d pixels' % (npmin, short.sum(), npix))
+    good = ~(noedges | short)
+
+    fits = np.zeros((npix,2,2))
+    chi2 = np.zeros((npix,2))
+    fits[good,0,:] = p0[:,good].T
+    fits[good,1,:] = p1[:,good].T
+    if savechi2:
+        chi2[good,0] = ssr0[good] / (n0[good] - 3)
+        chi2[good,1] = ssr1[good] / (n1[good] - 3)
+
+    fits = fits.reshape((my,mx,2,2))
+    chi2 = chi2.reshape((my,mx,2))
+    nsp = nsp.reshape((my,mx))
+
+    pixsel = np.flatnonzero(good & (np.arange(npix)%256==255)) if selpix is None else\
+             [p for p in (selpix[2]*mx+selpix[3],) if good[p]]
+
+    for p in pixsel: # for selected ix, iy
+        iy, ix = divmod(p, mx)
+        pf0, pf1 = fits[iy,ix,0], fits[iy,ix,1]
+        trace = tracem[:,p]
+        x0, y0, x1, y1 = [], [], [], []
+        for j,(ixb, ixsb, ixse, ixe) in enumerate(bounds):
+            r0, r1 = np.arange(ixb[p], ixsb[p]), np.arange(ixse[p], min(ixe[p], mf))
+            if j==0: r0 = r0[trace[r0]<ASAT]
+            x0.append(ev[r0]-ev[ixb[p]]); y0.append(trace[r0])
+            x1.append(ev[r1]-ev[ixb[p]]); y1.append(trace[r1])
+        x0, y0, x1, y1 = [np.hstack(a) for a in (x0, y0, x1, y1)]
+
+        s = '==== ibr%02d-ibc%02d:' % (iy, ix)
+        if selpix is not None: s+=' === selected pixel panel r:%03d c:%03d' % (selpix[0], selpix[1])
+        for j in range(nedges[p]):
+            ixb, ixs, ixe = glast[j,p]+1, gfirst[j+1,p], glast[j+1,p]
+            s += '\n  saw edges begin: %4d switch: %4d end: %4d period: %4d' % (ixb, ixs, ixe, ixe-ixb+1)
+        s += info_ndarr(trace,  '\n    tracem', last=10)
+        s += info_ndarr(x0,     '\n    x0', last=10)
+        s += info_ndarr(y0,     '\n    y0', last=10)
+        s += info_ndarr(x1,     '\n    x1', last=10)
+        s += info_ndarr(y1,     '\n    y1', last=10)
+        s += info_ndarr(pf0,    '\n    pf0', last=10)
+        s += info_ndarr(pf1,    '\n    pf1', last=10)
+        if savechi2:
+            s += '\n    chi2/ndof H/M %.3f' % chi2[iy,ix,0]
+            s += '\n    chi2/ndof L   %.3f' % chi2[iy,ix,1]
+        logger.debug(s)
+
+        msg+='.'
+        if display:
+            fname = '%s-fit-ibr%02d-ibc%02d.png' % (prefix, iy, ix) if selpix is None else\
+                    '%s-fit-r%03d-c%03d-ibr%02d-ibc%02d.png' % (prefix, selpix[0], selpix[1], iy, ix)
+            plot_fit(np.hstack((x0,x1)), np.hstack((y0,y1)), pf0, pf1, fname)
+
+    return fits,nsp,msg,chi2
+
+
 def shape_from_config_epix10ka(eco):
     """Returns element/panel/sensor shape (352,384) from element configuration object
        psana.Epix.Config10ka or psana.Epix.Config10kaV1
@@ -422,8 +612,7 @@ def proc_dark_block(block, **opts):
 
     fraclm     = opts.get('fraclm', 0.1)     # allowed fraction limit
     nsigma     = opts.get('nsigma', 6.0)     # number of sigmas for gated eveluation
-
-    blockdbl = np.array(block, dtype=np.double)
+    max_bytes  = opts.get('max_chunk_bytes', MAX_CHUNK_BYTES) # memory budget for pixel chunk of the block
 
     logger.debug('in proc_dark_block for exp=%s det=%s, block.shape=%s' % (exp, detname, str(block.shape)))
     nrecs, ny, nx = block.shape
@@ -432,27 +621,13 @@ def proc_dark_block(block, **opts):
     arr0       = np.zeros(shape, dtype=np.int64)
     arr1       = np.ones (shape, dtype=np.int64)
 
-    arr_sum0   = np.zeros(shape, dtype=np.int64)
-    arr_sum1   = np.zeros(shape, dtype=np.double)
-    arr_sum2   = np.zeros(shape, dtype=np.double)
-
     gate_lo    = arr1 * int_lo
     gate_hi    = arr1 * int_hi
 
     t0_sec = time()
 
-    # 1st loop over recs(non-empty events) in block
-    for nrec in range(min(nrecs,500)):
-        raw    = block[nrec,:]
-        rawdbl = blockdbl[nrec,:]
-
-        cond_lo = raw<gate_lo
-        cond_hi = raw>gate_hi
-        condlist = (np.logical_not(np.logical_or(cond_lo, cond_hi)),)
-
-        arr_sum0 += np.select(condlist, (arr1,), 0)
-        arr_sum1 += np.select(condlist, (rawdbl,), 0)
-        arr_sum2 += np.select(condlist, (np.square(rawdbl),), 0)
+    # 1st pass over recs(non-empty events) in block
+    arr_sum0, arr_sum1, arr_sum2, _, _ = block_gated_sums(block[:500,:], gate_lo, gate_hi, int_lo, int_hi, max_bytes=max_bytes)
 
     arr_av1 = divide_protected(arr_sum1, arr_sum0)
     arr_av2 = divide_protected(arr_sum2, arr_sum0)
@@ -466,38 +641,13 @@ def proc_dark_block(block, **opts):
     gate_half = nsigma*rms_ave
     logger.debug('set gate_half=%.3f for intensity gated average, which is %.3f * sigma' % (gate_half,nsigma))
 
-    # 2nd loop over recs in block to evaluate gated parameters
-
-    sta_int_lo = np.zeros(shape, dtype=np.int64)
-    sta_int_hi = np.zeros(shape, dtype=np.int64)
-
-    arr_max = np.zeros(shape, dtype=block.dtype)
-    arr_min = np.ones (shape, dtype=block.dtype) * 0x3ffff
-
-    gate_hi = np.minimum(arr_av1 + gate_half, gate_hi).astype(dtype=raw.dtype)
-    gate_lo = np.maximum(arr_av1 - gate_half, gate_lo).astype(dtype=raw.dtype)
+    # 2nd pass over recs in block to evaluate gated parameters
 
-    arr_sum0 = np.zeros(shape, dtype=np.int64)
-    arr_sum1 = np.zeros(shape, dtype=np.double)
-    arr_sum2 = np.zeros(shape, dtype=np.double)
+    gate_hi = np.minimum(arr_av1 + gate_half, gate_hi).astype(dtype=block.dtype)
+    gate_lo = np.maximum(arr_av1 - gate_half, gate_lo).astype(dtype=block.dtype)
 
-    for nrec in range(nrecs):
-        raw    = block[nrec,:]
-        rawdbl = blockdbl[nrec,:]
-
-        cond_lo = raw<gate_lo
-        cond_hi = raw>gate_hi
-        condlist = (np.logical_not(np.logical_or(cond_lo, cond_hi)),)
-
-        arr_sum0 += np.select(condlist, (arr1,), 0)
-        arr_sum1 += np.select(condlist, (rawdbl,), 0)
-        arr_sum2 += np.select(condlist, (np.square(rawdbl),), 0)
-
-        sta_int_lo += np.select((raw<int_lo,), (arr1,), 0)
-        sta_int_hi += np.select((raw>int_hi,), (arr1,), 0)
-
-        arr_max = np.maximum(arr_max, raw)
-        arr_min = np.minimum(arr_min, raw)
+    arr_sum0, arr_sum1, arr_sum2, sta_int_lo, sta_int_hi =\
+        block_gated_sums(block, gate_lo, gate_hi, int_lo, int_hi, max_bytes=max_bytes)
 
     arr_av1 = divide_protected(arr_sum1, arr_sum0)
     arr_av2 = divide_protected(arr_sum2, arr_sum0)
@@ -682,6 +832,9 @@ def step_counter(cd, det, nstep_tot, nstep_run, nspace=None): #nspace=7 - for 10
 
     if len(pvlabels)==0:
         logger.warning('CALIB-CYCLE METADATA IS NOT AVAILABLE nstep_tot:%d, nstep_run:%d' % (nstep_tot, nstep_run))
+        if nstep_tot in list_of_cc_collected(): # resumed from checkpoint, calib-cycles are identified by sequential index
+            logger.warning('CALIB-CYCLE %d HAS ALREADY BEEN PROCESSED. SKIPPING' % nstep_tot)
+            return None
         return nstep_tot
 
     detname = str(det.name).replace(':','|').replace('.','-')
@@ -734,6 +887,100 @@ def selected_pixel(pixrow, pixcol, jy, jx, ny, nx, nspace):
     return pixrow, pixcol, ibr, ibc # tuple of panel and block indexes
 
 
+def file_name_checkpoint(dir_work, fname_prefix, nspace, nstep=None):
+    """Returns name of the checkpoint file of calib-cycle nstep or glob pattern of files for all calib-cycles if nstep is None."""
+    return '%s/%s_sp%02d_ckpt-cc%s.npz' % (dir_work, fname_prefix, nspace, '*' if nstep is None else '%03d' % nstep)
+
+
+def save_checkpoint(fname, nstep, filemode=0o664, **arrs):
+    """Saves arrays evaluated in completed calib-cycle nstep, e.g. darks[nstep] or fits[sel], in the checkpoint file fname.
+       File is replaced atomically, so interrupted job restarts after the last completed calib-cycle.
+    """
+    ftmp = fname + '.tmp'
+    with open(ftmp, 'wb') as f:
+        np.savez(f, nstep=nstep, **arrs)
+    os.chmod(ftmp, filemode)
+    os.replace(ftmp, fname)
+    logger.debug('checkpoint for calib-cycle %d saved in %s' % (nstep, fname))
+
+
+def load_checkpoints(pattern):
+    """Returns dict {nstep:{name:array}} of completed calib-cycles from checkpoint files matching glob pattern."""
+    d = {}
+    for fname in sorted(glob(pattern)):
+        npz = np.load(fname)
+        d[int(npz['nstep'])] = {k:npz[k] for k in npz.files if k != 'nstep'}
+    return d
+
+
+def remove_checkpoints(pattern):
+    for fname in glob(pattern) + glob(pattern + '.tmp'): os.remove(fname)
+
+
+def charge_injection_block(nstep, nspace, ny, nx):
+    """Returns gain mode 'AML' or 'AHL', index of calib-cycle in the gain mode, block indexes jy, jx
+       and slice of pulsed pixels for charge-injection calib-cycle 5 <= nstep < 5+2*nspace**2.
+    """
+    is_aml = nstep<5+nspace**2
+    istep = nstep-5 if is_aml else nstep-5-nspace**2
+    jy, jx = istep//nspace, istep%nspace
+    return ('AML' if is_aml else 'AHL'), istep, jy, jx, np.s_[jy:ny:nspace,jx:nx:nspace]
+
+
+def restore_checkpoint(nstep, arrs, nspace, darks, fits_ml, fits_hl, nsp_ml, nsp_hl, chi2_ml, chi2_hl):
+    """Restores in-place results of calib-cycle nstep from arrays arrs saved by save_checkpoint."""
+    if 'darks' in arrs:
+        darks[nstep] = arrs['darks']
+    elif 'fits' in arrs:
+        gm, istep, jy, jx, sel = charge_injection_block(nstep, nspace, *darks.shape[1:])
+        fits, nsps, chi2s = (fits_ml, nsp_ml, chi2_ml) if gm=='AML' else (fits_hl, nsp_hl, chi2_hl)
+        fits[sel], nsps[sel], chi2s[sel] = arrs['fits'], arrs['nsp'], arrs['chi2']
+
+
+def collect_step_block(step, det, idx, block, evnum=None, sel=np.s_[:,:], mask=None, check_fid=False, proc_raw=None, gmname=''):
+    """Single pass over events of the calib-cycle step; each raw frame is decoded once
+       and its selected pixels raw[sel] (& mask) are routed in the block records, event numbers in evnum.
+       - mask - applied to block records only, proc_raw and returned frame get unmasked raw,
+       - check_fid - for charge-injection calib-cycles restarts or terminates accumulation on gap in fiducials,
+       - proc_raw(nevt, nrec, raw) - optional call for each recorded panel frame, returns string for message.
+       Returns nevt, nrec, message, and the last recorded panel frame.
+    """
+    nbs = block.shape[0]
+    nbs_half = int(nbs/2)
+    nrec, nevt, fid_old, last, msg = -1, 0, None, None, ''
+    for nevt,evt in enumerate(step.events()):
+        raw = det.raw(evt)
+        if raw is None: #skip empty frames
+            logger.warning('Ev:%04d rec:%04d panel:%02d %s raw=None' % (nevt,nrec,idx,gmname))
+            msg += 'none'
+            continue
+        if nrec>nbs-2:
+            break
+        if check_fid:
+            #---- 2021-06-10: check fiducial for consecutive events
+            fid = evt.get(EventId).fiducials()
+            if fid_old is not None:
+                dfid = fid-fid_old
+                if dfid != 3:
+                    logger.warning('TIME SYSTEM FAULT dfid!=3: Ev:%04d rec:%04d panel:%02d %s fiducials:%7d dfid:%d'%\
+                                   (nevt,nrec,idx,gmname,fid,dfid))
+                    if nrec < nbs_half:
+                        logger.info('reset statistics in block and keep accumulation')
+                        nrec = -1
+                    else:
+                        logger.info('terminate event loop and process block data')
+                        break
+            fid_old = fid
+        nrec += 1
+        if raw.ndim > 2: raw=raw[idx,:]
+        if selected_record(nevt): logger.info(info_ndarr(raw, 'Ev:%04d rec:%04d panel:%02d %s raw' % (nevt,nrec,idx,gmname)))
+        block[nrec] = raw[sel] if mask is None else (raw & mask)[sel]
+        if evnum is not None: evnum[nrec] = nevt
+        if proc_raw is not None: msg += proc_raw(nevt, nrec, raw)
+        last = raw
+    return nevt, nrec, msg, last
+
+
 def offset_calibration(*args, **opts):
 
     exp        = opts.get('exp', None)
@@ -765,7 +1012,7 @@ def offset_calibration(*args, **opts):
     logmode    = opts.get('logmode', 'DEBUG')
     errskip    = opts.get('errskip', False)
     pixrc      = opts.get('pixrc', None) # ex.: '23,123'
-    nbs_half   = int(nbs/2)
+    checkpoint = opts.get('checkpoint', True)
 
     logger.setLevel(DICT_NAME_TO_LEVEL[logmode])
 
@@ -841,6 +1088,14 @@ def offset_calibration(*args, **opts):
         fits_ml=np.zeros((ny,nx,2,2))
         fits_hl=np.zeros((ny,nx,2,2))
 
+        ckpt_pattern = file_name_checkpoint(dir_work, fname_prefix, nspace)
+        ckpts = load_checkpoints(ckpt_pattern) if checkpoint else {}
+        if ckpts:
+            logger.info('RESUME FROM CHECKPOINTS %s\n  completed calib-cycles: %s' % (ckpt_pattern, str(sorted(ckpts))))
+            for nstep, arrs in sorted(ckpts.items()):
+                restore_checkpoint(nstep, arrs, nspace, darks, fits_ml, fits_hl, nsp_ml, nsp_hl, chi2_ml, chi2_hl)
+                if nstep not in list_of_cc_collected(): list_of_cc_collected().append(nstep)
+
         ds = DataSource(dsname)
         det = Detector(detname)
         cd = Detector('ControlData')
@@ -884,41 +1139,32 @@ def offset_calibration(*args, **opts):
             figprefix = '%s-%s-seg%02d-cc%03d-%s'%\
                         (prefix_plots, detname.replace(':','-').replace('.','-'), idx, nstep, mode)
 
-            nrec,nevt = -1,0
+            ckpt = {} # results of the calib-cycle saved in its checkpoint file
+
             #First 5 Calib Cycles correspond to darks:
             if dopeds and nstep<5:
                 msg = 'DARK Calib Cycle %d ' % nstep
                 block=np.zeros((nbs,ny,nx),dtype=np.int16)
 
-                for nevt,evt in enumerate(step.events()):
-                    raw = det.raw(evt)
-                    do_print = selected_record(nevt)
-                    if raw is None: #skip empty frames
-                        logger.warning('Ev:%04d rec:%04d panel:%02d raw=None' % (nevt,nrec,idx))
-                        msg += 'none'
-                        continue
-                    if nrec>nbs-2:
-                        break
-                    else:
-                        nrec += 1
-                        if raw.ndim > 2: raw=raw[idx,:]
-                        if do_print: logger.info(info_ndarr(raw & M14, 'Ev:%04d rec:%04d panel:%02d raw & M14' % (nevt,nrec,idx)))
-                        if display and nevt<3:
-                            imsh, cbar = imshow_cbar(fig2, axim2, axcb2, raw, amin=None, amax=None, extent=None,\
-                                                     interpolation='nearest', aspect='auto', origin='upper',\
-                                                     orientation='vertical', cmap='inferno')
-                            fig2.canvas.manager.set_window_title('Run:%d calib-cycle:%d mode:%s panel:%02d' % (orun.run(), nstep, mode, idx))
-                            fname = '%s-ev%02d-img-dark' % (figprefix, nevt)
-                            axim2.set_title(fname.rsplit('/',1)[-1], fontsize=6)
-                            fig2.savefig(fname+'.png')
-                            logger.info('saved: %s' % fname+'.png')
-
-                        block[nrec]=raw & M14
-                        if nrec%200==0: msg += '.%s' % find_gain_mode(det, raw)
+                def proc_dark_raw(nevt, nrec, raw):
+                    if display and nevt<3:
+                        imsh, cbar = imshow_cbar(fig2, axim2, axcb2, raw, amin=None, amax=None, extent=None,\
+                                                 interpolation='nearest', aspect='auto', origin='upper',\
+                                                 orientation='vertical', cmap='inferno')
+                        fig2.canvas.manager.set_window_title('Run:%d calib-cycle:%d mode:%s panel:%02d' % (orun.run(), nstep, mode, idx))
+                        fname = '%s-ev%02d-img-dark' % (figprefix, nevt)
+                        axim2.set_title(fname.rsplit('/',1)[-1], fontsize=6)
+                        fig2.savefig(fname+'.png')
+                        logger.info('saved: %s' % fname+'.png')
+                    return '.%s' % find_gain_mode(det, raw) if nrec%200==0 else ''
+
+                nevt, nrec, msgc, raw = collect_step_block(step, det, idx, block, mask=M14, proc_raw=proc_dark_raw, gmname='DARK')
+                msg += msgc
 
                 print_statistics(nevt, nrec)
 
                 darks[nstep,:,:], nda_rms, nda_status = proc_dark_block(block[:nrec,:,:], **opts)
+                ckpt = {'darks':darks[nstep]}
                 logger.debug(msg)
 
                 fname = '%s_rms_%s.dat' % (prefix_rms, GAIN_MODES[nstep])
@@ -934,13 +1180,12 @@ def offset_calibration(*args, **opts):
                 continue
             ####################
 
-            #Next nspace**2 Calib Cycles correspond to pulsing in Auto Medium-to-Low
-            elif nstep>4 and nstep<5+nspace**2:
-                msg = ' AML %2d/%2d '%(nstep-5+1,nspace**2)
-
-                istep=nstep-5
-                jy=istep//nspace
-                jx=istep%nspace
+            #Next nspace**2 Calib Cycles correspond to pulsing in Auto Medium-to-Low,
+            #next nspace**2 Calib Cycles correspond to pulsing in Auto High-to-Low
+            elif nstep>4 and nstep<5+2*nspace**2:
+                gm, istep, jy, jx, sel = charge_injection_block(nstep, nspace, ny, nx)
+                is_aml = gm=='AML'
+                msg = ' %s %2d/%2d '%(gm, istep+1, nspace**2)
 
                 if pixrc is not None:
                     selpix = selected_pixel(pixrow, pixcol, jy, jx, ny, nx, nspace)
@@ -950,46 +1195,15 @@ def offset_calibration(*args, **opts):
                     else:
                         logger.info(msg + ' process selected pixel:%s' % str(selpix))
 
-                fid_old=None
-                block=np.zeros((nbs,ny,nx),dtype=np.int16)
+                # accumulate only pulsed pixels of the frame
+                block=np.zeros((nbs, len(range(jy,ny,nspace)), len(range(jx,nx,nspace))), dtype=np.int16)
                 evnum=np.zeros((nbs,),dtype=np.int16)
-                for nevt,evt in enumerate(step.events()):   #read all frames
-                    raw = det.raw(evt)
-                    do_print = selected_record(nevt)
-                    if raw is None:
-                        logger.warning('Ev:%04d rec:%04d panel:%02d AML raw=None' % (nevt,nrec,idx))
-                        msg += 'none'
-                        continue
-                    if nrec>nbs-2:
-                        break
-                    else:
-                        #---- 2021-06-10: check fiducial for consecutive events
-                        fid = evt.get(EventId).fiducials()
-                        if fid_old is not None:
-                            dfid = fid-fid_old
-                            if dfid != 3:
-                                logger.warning('TIME SYSTEM FAULT dfid!=3: Ev:%04d rec:%04d panel:%02d AML raw=None fiducials:%7d dfid:%d'%\
-                                            (nevt,nrec,idx,fid,dfid))
-                                if nrec < nbs_half:
-                                   logger.info('reset statistics in block and keep accumulation')
-                                   nrec = -1
-                                else:
-                                   logger.info('terminate event loop and process block data')
-                                   break
-                        fid_old = fid
-                        #print('nevt, nrec, fid: %04d %04d %d ' % (nevt, nrec, evt.get(EventId).fiducials()))
-                        #----
-
-                        nrec += 1
-                        if raw.ndim > 2: raw=raw[idx,:]
-                        if do_print: logger.info(info_ndarr(raw, 'Ev:%04d rec:%04d panel:%02d AML raw' % (nevt,nrec,idx)))
-                        block[nrec]=raw
-                        evnum[nrec]=nevt
-                        if nevt%200==0: msg+='.'
+                nevt, nrec, msgc, raw = collect_step_block(step, det, idx, block, evnum, sel, check_fid=True,\
+                                            proc_raw=lambda nevt, nrec, raw: '.' if nevt%200==0 else '', gmname=gm)
+                msg += msgc
 
-                if display:
-                    #imsh, cbar = imshow_cbar(fig2, axim2, axcb2, block[nrec][:100,:100], amin=None, amax=None, extent=None,\
-                    imsh, cbar = imshow_cbar(fig2, axim2, axcb2, block[nrec], amin=None, amax=None, extent=None,\
+                if display and raw is not None:
+                    imsh, cbar = imshow_cbar(fig2, axim2, axcb2, raw, amin=None, amax=None, extent=None,\
                                              interpolation='nearest', aspect='auto', origin='upper',\
                                              orientation='vertical', cmap='inferno')
                     fig2.canvas.manager.set_window_title('Run:%d calib-cycle:%d events:%d' % (orun.run(), nstep, evnum[nrec])) #, **kwargs)
@@ -1000,101 +1214,28 @@ def offset_calibration(*args, **opts):
 
                 print_statistics(nevt, nrec)
 
-                block=block[:nrec,jy:ny:nspace,jx:nx:nspace]         # select only pulsed pixels
-                evnum=evnum[:nrec]                                   # list of non-empty events
-                fits0,nsp0,msgf,chi2=fit(block,evnum,display,figprefix,ixoff,nperiods,savechi2,selpix) # fit offset, gain
-                fits_ml[jy:ny:nspace,jx:nx:nspace]=fits0             # collect results
-                nsp_ml[jy:ny:nspace,jx:nx:nspace]=nsp0               # collect switching points
-                if savechi2: chi2_ml[jy:ny:nspace,jx:nx:nspace]=chi2 # collect chi2/dof
-                s = '\n  block fit results AML'\
-                  + info_ndarr(fits0[:,:,0,0],'\n  M gain',   last=5)\
-                  + info_ndarr(fits0[:,:,1,0],'\n  L gain',   last=5)\
-                  + info_ndarr(fits0[:,:,0,1],'\n  M offset', last=5)\
-                  + info_ndarr(fits0[:,:,1,1],'\n  L offset', last=5)
-
-                logger.info(msg + msgf + s)
-
-            #Next nspace**2 Calib Cycles correspond to pulsing in Auto High-to-Low
-            elif nstep>4+nspace**2 and nstep<5+2*nspace**2:
-                msg = ' AHL %2d/%2d '%(nstep-5-nspace**2+1,nspace**2)
-
-                istep=nstep-5-nspace**2
-                jy=istep//nspace
-                jx=istep%nspace
-
-                if pixrc is not None:
-                    selpix = selected_pixel(pixrow, pixcol, jy, jx, ny, nx, nspace)
-                    if selpix is None:
-                        logger.info(msg + ' skip, due to pixrc=%s'%pixrc)
-                        continue
-
-                fid_old=None
-                block=np.zeros((nbs,ny,nx),dtype=np.int16)
-                evnum=np.zeros((nbs,),dtype=np.int16)
-                for nevt,evt in enumerate(step.events()):   #read all frames
-                    raw = det.raw(evt)
-                    do_print = selected_record(nevt)
-                    if raw is None:
-                        logger.warning('Ev:%04d rec:%04d panel:%02d AHL raw=None' % (nevt,nrec,idx))
-                        msg+='None'
-                        continue
-                    if nrec>nbs-2:
-                        break
-                    else:
-                        #---- 2021-06-10: check fiducial for consecutive events
-                        fid = evt.get(EventId).fiducials()
-                        if fid_old is not None:
-                            dfid = fid-fid_old
-                            if dfid != 3:
-                                logger.warning('TIME SYSTEM FAULT dfid!=3: Ev:%04d rec:%04d panel:%02d AML raw=None fiducials:%7d dfid:%d'%\
-                                            (nevt,nrec,idx,fid,dfid))
-                                if nrec < nbs_half:
-                                   logger.info('reset statistics in block and keep accumulation')
-                                   nrec = -1
-                                else:
-                                   logger.info('terminate event loop and process block data')
-                                   break
-                        fid_old = fid
-                        #print('nevt, nrec, fid: %04d %04d %d ' % (nevt, nrec, evt.get(EventId).fiducials()))
-                        #----
-
-                        nrec += 1
-                        if raw.ndim > 2: raw=raw[idx,:]
-                        if do_print: logger.info(info_ndarr(raw, 'Ev:%04d rec:%04d panel:%02d AHL raw' % (nevt,nrec,idx)))
-                        block[nrec]=raw
-                        evnum[nrec]=nevt
-                        if nevt%200==0: msg+='.'
-
-                if display:
-                    #imsh, cbar = imshow_cbar(fig2, axim2, axcb2, block[nrec][:100,:100], amin=None, amax=None, extent=None,\
-                    imsh, cbar = imshow_cbar(fig2, axim2, axcb2, block[nrec], amin=None, amax=None, extent=None,\
-                                             interpolation='nearest', aspect='auto', origin='upper',\
-                                             orientation='vertical', cmap='inferno')
-                    fig2.canvas.manager.set_window_title('Run:%d calib-cycle:%d events:%d' % (orun.run(), nstep, evnum[nrec])) #, **kwargs)
-                    fname = '%s-img-charge' % figprefix
-                    axim2.set_title(fname.rsplit('/',1)[-1], fontsize=6)
-                    fig2.savefig(fname+'.png')
-                    logger.info('saved: %s' % fname+'.png')
-
-                print_statistics(nevt, nrec)
-
-                block=block[:nrec,jy:ny:nspace,jx:nx:nspace]       # select only pulsed pixels
+                block=block[:nrec]                                 # pulsed pixels of non-empty events
                 evnum=evnum[:nrec]                                 # list of non-empty events
                 fits0,nsp0,msgf,chi2=fit(block,evnum,display,figprefix,ixoff,nperiods,savechi2,selpix) # fit offset, gain
-                fits_hl[jy:ny:nspace,jx:nx:nspace]=fits0           # collect results
-                nsp_hl[jy:ny:nspace,jx:nx:nspace]=nsp0
-                if savechi2: chi2_hl[jy:ny:nspace,jx:nx:nspace]=chi2 # collect chi2/dof
-                s = '\n  block fit results AHL'\
-                  + info_ndarr(fits0[:,:,0,0],'\n  H gain',   last=5)\
-                  + info_ndarr(fits0[:,:,1,0],'\n  L gain',   last=5)\
-                  + info_ndarr(fits0[:,:,0,1],'\n  H offset', last=5)\
-                  + info_ndarr(fits0[:,:,1,1],'\n  L offset', last=5)
+                fits, nsps, chi2s = (fits_ml, nsp_ml, chi2_ml) if is_aml else (fits_hl, nsp_hl, chi2_hl)
+                fits[sel]=fits0                                    # collect results
+                nsps[sel]=nsp0                                     # collect switching points
+                if savechi2: chi2s[sel]=chi2                       # collect chi2/dof
+                ckpt = {'fits':fits[sel], 'nsp':nsps[sel], 'chi2':chi2s[sel]}
+                g0 = gm[1] # M or H
+                s = '\n  block fit results %s' % gm\
+                  + info_ndarr(fits0[:,:,0,0],'\n  %s gain' % g0,   last=5)\
+                  + info_ndarr(fits0[:,:,1,0],'\n  L gain',         last=5)\
+                  + info_ndarr(fits0[:,:,0,1],'\n  %s offset' % g0, last=5)\
+                  + info_ndarr(fits0[:,:,1,1],'\n  L offset',       last=5)
                 logger.info(msg + msgf + s)
 
             elif nstep>=5+2*nspace**2:
                 break
 
             list_of_cc_collected().append(nstep)
+            if checkpoint:
+                save_checkpoint(file_name_checkpoint(dir_work, fname_prefix, nspace, nstep), nstep, filemode, **ckpt)
 
         logger.debug(info_ndarr(fits_ml, '  fits_ml', last=10)) # shape:(352, 384, 2, 2)
         logger.debug(info_ndarr(fits_hl, '  fits_hl', last=10)) # shape:(352, 384, 2, 2)
@@ -1109,6 +1250,7 @@ def offset_calibration(*args, **opts):
         np.savez_compressed(fname_work, darks=darks, fits_hl=fits_hl, fits_ml=fits_ml, nsp_hl=nsp_hl, nsp_ml=nsp_ml)
         if not fexists: os.chmod(fname_work, filemode)
         logger.info('Saved:  %s' % fname_work)
+        remove_checkpoints(ckpt_pattern)
 
     #Save gains:
     gain_ml_m = fits_ml[:,:,0,0]
@@ -1221,7 +1363,7 @@ def load_panel_constants(dir_ctype, pattern, tstamp):
     fname = find_file_for_timestamp(dir_ctype, pattern, tstamp)
     arr=None
     if fname is not None and os.path.exists(fname):
-        arr=np.loadtxt(fname)
+        arr=load_repo_array(fname, dtype=np.float64)
         logger.info('Loaded: %s' % fname)
     else:
         logger.warning('file "%s" DOES NOT EXIST for pattern: %s tstamp: %s dir_ctype: \n          %s'%\
@@ -1240,11 +1382,151 @@ def config_info_for_pedestals(dsname, detname):
     return cpdic, tstamp, panel_ids, expnum, dettype, shape
 
 
+class PanelBlocks():
+    """Per-panel blocks of raw frames shaped as (nbs, <panel-shape>) in memory-mapped .npy files in directory dirname,
+       which are opened in pool processes by file name without pickling of data.
+    """
+    def __init__(self, dirname, nbs, sh, dtype=np.int16, prefix='block'):
+        self.fnames = [os.path.join(dirname, '%s-panel%02d.npy' % (prefix, i)) for i in range(sh[0])]
+        self.blocks = [np.lib.format.open_memmap(fname, mode='w+', dtype=dtype, shape=(nbs,) + tuple(sh[1:]))\
+                       for fname in self.fnames]
+
+    def add_record(self, nrec, raw):
+        for b, r in zip(self.blocks, raw): b[nrec] = r
+
+    def flush(self):
+        for b in self.blocks: b.flush()
+
+    def remove(self):
+        self.blocks = None
+        for fname in self.fnames:
+            if os.path.exists(fname): os.remove(fname)
+
+
+def dir_panel_blocks(scratch=None, nbytes=0):
+    """Returns new private directory for memory-mapped per-panel blocks in scratch, or, if scratch is None,
+       in /dev/shm if it has at least nbytes of free space, otherwise in default temporary directory on disk.
+       Private directory is not shared with concurrent jobs and is entirely removed at the end of job.
+    """
+    import tempfile
+    prefix = 'epix10ka-darks-'
+    if scratch is not None:
+        create_directory(scratch, mode=0o2775)
+        return tempfile.mkdtemp(prefix=prefix, dir=scratch)
+    dirshm = '/dev/shm'
+    if os.path.isdir(dirshm):
+        st = os.statvfs(dirshm)
+        if st.f_bavail * st.f_frsize >= nbytes: return tempfile.mkdtemp(prefix=prefix, dir=dirshm)
+        logger.warning('free space in %s is less than %d bytes of per-panel blocks - use disk' % (dirshm, nbytes))
+    return tempfile.mkdtemp(prefix=prefix)
+
+
+def proc_dark_panel(fname, nrec, opts):
+    """Returns dark, rms, status of proc_dark_block for nrec records of per-panel block in memory-mapped file fname."""
+    return proc_dark_block(np.load(fname, mmap_mode='r')[:nrec], **opts)
+
+
+def save_pending_pedestals(pending, wait=False, maxpending=None, **opts):
+    """Saves results of calib-cycles submitted to the pool, which are completed or all if wait,
+       removes their per-panel blocks and returns list of still pending calib-cycles.
+       If maxpending is not None, waits for the oldest calib-cycles to keep at most maxpending in the list,
+       that limits number of per-panel blocks in memory.
+    """
+    from concurrent.futures import wait as wait_futures
+    nforced = len(pending) if wait else 0 if maxpending is None else len(pending) - maxpending
+    remaining = []
+    for i, rec in enumerate(pending):
+        panels, futures, panel_blocks, mode, tstamp, exp, irun = rec
+        if i >= nforced and not all(f.done() for f in futures):
+            remaining.append(rec)
+            continue
+        wait_futures(futures)
+        for (idx, panel_id), f in zip(panels, futures):
+            logger.info('\n%s\nsave results for gain mode %s panel:%02d id:%s' % (100*'=', mode, idx, panel_id))
+            dark, rms, status = f.result()
+            save_panel_pedestals(panel_id, mode, dark, rms, status, tstamp, exp, irun, **opts)
+        panel_blocks.remove()
+    return remaining
+
+
+def save_panel_pedestals(panel_id, mode, dark, rms, status, tstamp, exp, irun, **opts):
+    """Saves per-panel results of proc_dark_block for gain mode in repository files,
+       for modes AHL-H and AML-M also evaluates and saves pedestals for AHL-L and AML-L.
+    """
+    dirrepo    = opts.get('dirrepo', CALIB_REPO_EPIX10KA)
+    fmt_peds   = opts.get('fmt_peds', '%.3f')
+    fmt_rms    = opts.get('fmt_rms',  '%.3f')
+    fmt_status = opts.get('fmt_status', '%4i')
+    dirmode    = opts.get('dirmode', 0o2775)
+    filemode   = opts.get('filemode', 0o664)
+    group      = opts.get('group', 'ps-users')
+
+    dir_panel, dir_offset, dir_peds, dir_plots, dir_work, dir_gain, dir_rms, dir_status = dir_names(dirrepo, panel_id)
+    fname_prefix, panel_alias = file_name_prefix(panel_id, tstamp, exp, irun, dirrepo)
+    #prefix_offset, prefix_peds, prefix_plots, prefix_gain = path_prefixes(fname_prefix, dir_offset, dir_peds, dir_plots, dir_gain)
+    prefix_offset, prefix_peds, prefix_plots, prefix_gain, prefix_rms, prefix_status =\
+        path_prefixes(fname_prefix, dir_offset, dir_peds, dir_plots, dir_gain, dir_rms, dir_status)
+
+    #logger.debug('Directories under %s\n  SHOULD ALREADY EXIST after charge-injection offset_calibration' % dir_panel)
+    #assert os.path.exists(dir_offset), 'Directory "%s" DOES NOT EXIST' % dir_offset
+    #assert os.path.exists(dir_peds),   'Directory "%s" DOES NOT EXIST' % dir_peds
+
+    create_directory(dir_panel,  mode=dirmode, group=group)
+    create_directory(dir_peds,   mode=dirmode, group=group)
+    create_directory(dir_offset, mode=dirmode, group=group)
+    create_directory(dir_gain,   mode=dirmode, group=group)
+    create_directory(dir_rms,    mode=dirmode, group=group)
+    create_directory(dir_status, mode=dirmode, group=group)
+
+    fname = '%s_pedestals_%s.dat' % (prefix_peds, mode)
+    save_2darray_in_textfile(dark, fname, filemode, fmt_peds, umask=0o0, group=group)
+
+    fname = '%s_rms_%s.dat' % (prefix_rms, mode)
+    save_2darray_in_textfile(rms, fname, filemode, fmt_rms, umask=0o0, group=group)
+
+    fname = '%s_status_%s.dat' % (prefix_status, mode)
+    save_2darray_in_textfile(status, fname, filemode, fmt_status, umask=0o0, group=group)
+
+    #if this is an auto gain ranging mode, also calculate the corresponding _L pedestal:
+
+    if mode=='AHL-H': # evaluate AHL_L from AHL_H
+        ped_hl_h = dark #[3,:,:]
+
+        offset_hl_h = load_panel_constants(dir_offset, 'offset_AHL-H', tstamp)
+        offset_hl_l = load_panel_constants(dir_offset, 'offset_AHL-L', tstamp)
+        gain_hl_h   = load_panel_constants(dir_gain,   'gainci_AHL-H', tstamp)
+        gain_hl_l   = load_panel_constants(dir_gain,   'gainci_AHL-L', tstamp)
+
+        #if offset is not None:
+        if all([v is not None for v in (offset_hl_h, offset_hl_l, gain_hl_h, gain_hl_l)]):
+            ped_hl_l = offset_hl_l - (offset_hl_h - ped_hl_h) * divide_protected(gain_hl_l, gain_hl_h) #V3 Gabriel's
+            fname = '%s_pedestals_AHL-L.dat' % prefix_peds
+            save_2darray_in_textfile(ped_hl_l, fname, filemode, fmt_peds, umask=0o0, group=group)
+
+    elif mode=='AML-M': # evaluate AML_L from AML_M
+        ped_ml_m = dark #[4,:,:]
+
+        offset_ml_m = load_panel_constants(dir_offset, 'offset_AML-M', tstamp)
+        offset_ml_l = load_panel_constants(dir_offset, 'offset_AML-L', tstamp)
+        gain_ml_m   = load_panel_constants(dir_gain,   'gainci_AML-M', tstamp)
+        gain_ml_l   = load_panel_constants(dir_gain,   'gainci_AML-L', tstamp)
+
+        #if offset is not None:
+        if all([v is not None for v in (offset_ml_m, offset_ml_l, gain_ml_m, gain_ml_l)]):
+            ped_ml_l = offset_ml_l - (offset_ml_m - ped_ml_m) * divide_protected(gain_ml_l, gain_ml_m) #V3 Gabriel's
+            fname = '%s_pedestals_AML-L.dat' % prefix_peds
+            save_2darray_in_textfile(ped_ml_l, fname, filemode, fmt_peds, umask=0o0, group=group)
+
+
 def pedestals_calibration(*args, **opts):
     """NEWS significant ACCELERATION is acheived:
        - accumulate data for entire epix10kam_2m/quad array
        - use MPI
        all-panel or selected-panel one-calibcycle (gain range) or all calibcycles calibration of pedestals
+       - nprocs>1 - panels are processed in the pool of nprocs processes concurrently with reading of next calib-cycles,
+         per-panel blocks are accumulated in memory-mapped files in scratch or shared memory directory
+       - scratch - directory for per-panel memory-mapped blocks in stead of in-RAM block for all panels
+       - npending - maximal number of calib-cycles processed in the pool while reading the next one
     """
     exp        = opts.get('exp', None)
     detname    = opts.get('det', None)
@@ -1254,15 +1536,15 @@ def pedestals_calibration(*args, **opts):
     ccmax      = opts.get('ccmax', 5)
     dsnamex    = opts.get('dsnamex', None)
     dirrepo    = opts.get('dirrepo', CALIB_REPO_EPIX10KA)
-    fmt_peds   = opts.get('fmt_peds', '%.3f')
-    fmt_rms    = opts.get('fmt_rms',  '%.3f')
-    fmt_status = opts.get('fmt_status', '%4i')
     idx_sel    = opts.get('idx', None)
     dirmode    = opts.get('dirmode', 0o2775)
     filemode   = opts.get('filemode', 0o664)
     group      = opts.get('group', 'ps-users')
     logmode    = opts.get('logmode', 'DEBUG')
     errskip    = opts.get('errskip', False)
+    nprocs     = opts.get('nprocs', 0)
+    scratch    = opts.get('scratch', None)
+    npending   = opts.get('npending', 1)
 
     logger.setLevel(DICT_NAME_TO_LEVEL[logmode])
 
@@ -1298,155 +1580,130 @@ def pedestals_calibration(*args, **opts):
     shape_block = [nbs,] + list(sh) # [1024, 16, 352, 384]
     print('Accumulate raw frames in block shape = %s' % str(shape_block))
 
-    mode = None # gain_mode
-
-    nstep_tot = -1
-    for orun in ds.runs():
-      print('==== run:', orun.run())
-
-      for nstep_run, step in enumerate(orun.steps()): #(loop through calyb cycles, using only the first):
-        nstep_tot += 1
-        logger.info('=============== calibcycle %02d ===============' % nstep_tot)
-
-        nstep = step_counter(cd, det, nstep_tot, nstep_run)
-        if nstep is None: continue
-
-        #if size > 1:
-        #    # if MPI is on process all calibcycles, calibcycle per rank
-        #    if nstep < rank: continue
-        #    if nstep > rank: break
-
-        if nstep_tot>=ccmax: break
-
-        elif ccnum is not None:
-            # process calibcycle ccnum ONLY if ccnum is specified and MPI is not used!!!
-            if   nstep < ccnum: continue
-            elif nstep > ccnum: break
-
-        mode = find_gain_mode(det, data=None).upper()
-
-        if mode in GAIN_MODES_IN:
-            mode_in_meta = GAIN_MODES_IN[nstep]
-            logger.info('========== calibcycle %d: dark run processing for gain mode in configuration %s and metadata %s'\
-                        %(nstep, mode, mode_in_meta))
-            if mode != mode_in_meta:
-              logger.warning('INCONSISTENT GAIN MODES IN CONFIGURATION AND METADATA')
-              if not errskip: sys.exit()
-              logger.warning('FLAG ERRSKIP IS %s - keep processing next calib-cycle' % errskip)
-              continue
-        else:
-            logger.warning('UNRECOGNIZED GAIN MODE: %s, DARKS NOT UPDATED...'%mode)
-            sys.exit()
-            #return
-
-        block=np.zeros(shape_block,dtype=np.int16)
-        nrec,nevt = -1,0
+    pool, pending, dir_blocks = None, [], None # pool of processes, list of submitted calib-cycles, directory of blocks
+    if nprocs > 1 or scratch is not None:
+        # blocks of the calib-cycle in reading and of pending calib-cycles
+        nbytes = (npending + 1) * int(np.prod(shape_block)) * np.dtype(np.int16).itemsize
+        dir_blocks = dir_panel_blocks(scratch, nbytes)
+        logger.info('per-panel blocks are accumulated in memory-mapped files in %s' % dir_blocks)
+    if nprocs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(nprocs)
 
-        for nevt,evt in enumerate(step.events()):
-
-            if cpdic=={}:
-                cpdic, tstamp, panel_ids, expnum, dettype, shape = config_info_for_pedestals(dsname, detname)
-                irun = cpdic.get('runnum', None)
-                if cpdic=={}:
-                    print('XXX Ev:%04d - configuration info is not available' % nevt, end='\r')
-                else:
-                    #panel_id = get_panel_id(panel_ids, idx)
-                    logger.debug('Found panel ids:\n%s' % ('\n'.join(panel_ids)))
-
-            raw = det.raw(evt)
-            do_print = selected_record(nevt)
-            if raw is None: #skip empty frames
-                if do_print: logger.info('Ev:%04d rec:%04d raw=None' % (nevt,nrec))
-                continue
-            if nrec>nbs-2:       # stop after collecting sufficient frames
-                break
-            else:
-                #if raw.ndim > 2: raw=raw[idx,:]
-                nrec += 1
-                if do_print: logger.info(info_ndarr(raw & M14, 'Ev:%04d rec:%04d raw & M14' % (nevt,nrec)))
-                block[nrec]=raw & M14
-
-        print_statistics(nevt, nrec)
-
-        #---- process statistics in block-array for panels
-
-        for idx, panel_id in enumerate(panel_ids):
-
-            if idx_sel is not None and idx_sel != idx:
-                logger.warning('skip saving files, panel index %d is not equal to --idx=%d' % (idx, idx_sel))
-                continue # skip panels if idx_sel is specified
-
-            logger.info('\n%s\nprocess panel:%02d id:%s' % (100*'=', idx, panel_id))
+    try:
+        mode = None # gain_mode
 
-            #if mode is None:
-            #    msg = 'Gain mode for dark processing is not defined "%s" try to set option -m <gain-mode>' % mode
-            #    logger.warning(msg)
-            #    sys.exit(msg)
+        nstep_tot = -1
+        for orun in ds.runs():
+          print('==== run:', orun.run())
 
-            dir_panel, dir_offset, dir_peds, dir_plots, dir_work, dir_gain, dir_rms, dir_status = dir_names(dirrepo, panel_id)
-            fname_prefix, panel_alias = file_name_prefix(panel_id, tstamp, exp, irun, dirrepo)
-            #prefix_offset, prefix_peds, prefix_plots, prefix_gain = path_prefixes(fname_prefix, dir_offset, dir_peds, dir_plots, dir_gain)
-            prefix_offset, prefix_peds, prefix_plots, prefix_gain, prefix_rms, prefix_status =\
-                path_prefixes(fname_prefix, dir_offset, dir_peds, dir_plots, dir_gain, dir_rms, dir_status)
+          for nstep_run, step in enumerate(orun.steps()): #(loop through calyb cycles, using only the first):
+            nstep_tot += 1
+            logger.info('=============== calibcycle %02d ===============' % nstep_tot)
 
-            #logger.debug('Directories under %s\n  SHOULD ALREADY EXIST after charge-injection offset_calibration' % dir_panel)
-            #assert os.path.exists(dir_offset), 'Directory "%s" DOES NOT EXIST' % dir_offset
-            #assert os.path.exists(dir_peds),   'Directory "%s" DOES NOT EXIST' % dir_peds
+            nstep = step_counter(cd, det, nstep_tot, nstep_run)
+            if nstep is None: continue
 
-            create_directory(dir_panel,  mode=dirmode, group=group)
-            create_directory(dir_peds,   mode=dirmode, group=group)
-            create_directory(dir_offset, mode=dirmode, group=group)
-            create_directory(dir_gain,   mode=dirmode, group=group)
-            create_directory(dir_rms,    mode=dirmode, group=group)
-            create_directory(dir_status, mode=dirmode, group=group)
+            #if size > 1:
+            #    # if MPI is on process all calibcycles, calibcycle per rank
+            #    if nstep < rank: continue
+            #    if nstep > rank: break
 
-            #dark=block[:nrec,:].mean(0)  #Calculate mean
+            if nstep_tot>=ccmax: break
 
-            #block.sahpe = (1024, 16, 352, 384)
-            dark, rms, status = proc_dark_block(block[:nrec,idx,:], **opts) # process pedestals per-panel (352, 384)
+            elif ccnum is not None:
+                # process calibcycle ccnum ONLY if ccnum is specified and MPI is not used!!!
+                if   nstep < ccnum: continue
+                elif nstep > ccnum: break
 
-            fname = '%s_pedestals_%s.dat' % (prefix_peds, mode)
-            save_2darray_in_textfile(dark, fname, filemode, fmt_peds, umask=0o0, group=group)
+            mode = find_gain_mode(det, data=None).upper()
 
-            fname = '%s_rms_%s.dat' % (prefix_rms, mode)
-            save_2darray_in_textfile(rms, fname, filemode, fmt_rms, umask=0o0, group=group)
+            if mode in GAIN_MODES_IN:
+                mode_in_meta = GAIN_MODES_IN[nstep]
+                logger.info('========== calibcycle %d: dark run processing for gain mode in configuration %s and metadata %s'\
+                            %(nstep, mode, mode_in_meta))
+                if mode != mode_in_meta:
+                  logger.warning('INCONSISTENT GAIN MODES IN CONFIGURATION AND METADATA')
+                  if not errskip: sys.exit()
+                  logger.warning('FLAG ERRSKIP IS %s - keep processing next calib-cycle' % errskip)
+                  continue
+            else:
+                logger.warning('UNRECOGNIZED GAIN MODE: %s, DARKS NOT UPDATED...'%mode)
+                sys.exit()
+                #return
 
-            fname = '%s_status_%s.dat' % (prefix_status, mode)
-            save_2darray_in_textfile(status, fname, filemode, fmt_status, umask=0o0, group=group)
+            if nprocs > 1 or scratch is not None:
+                block = None
+                panel_blocks = PanelBlocks(dir_blocks, nbs, sh, prefix='block-cc%02d' % nstep_tot)
+            else:
+                block = np.zeros(shape_block,dtype=np.int16)
+                panel_blocks = None
+            nrec,nevt = -1,0
 
-            #if this is an auto gain ranging mode, also calculate the corresponding _L pedestal:
+            for nevt,evt in enumerate(step.events()):
 
-            if mode=='AHL-H': # evaluate AHL_L from AHL_H
-                ped_hl_h = dark #[3,:,:]
+                if cpdic=={}:
+                    cpdic, tstamp, panel_ids, expnum, dettype, shape = config_info_for_pedestals(dsname, detname)
+                    irun = cpdic.get('runnum', None)
+                    if cpdic=={}:
+                        print('XXX Ev:%04d - configuration info is not available' % nevt, end='\r')
+                    else:
+                        #panel_id = get_panel_id(panel_ids, idx)
+                        logger.debug('Found panel ids:\n%s' % ('\n'.join(panel_ids)))
+
+                raw = det.raw(evt)
+                do_print = selected_record(nevt)
+                if raw is None: #skip empty frames
+                    if do_print: logger.info('Ev:%04d rec:%04d raw=None' % (nevt,nrec))
+                    continue
+                if nrec>nbs-2:       # stop after collecting sufficient frames
+                    break
+                else:
+                    #if raw.ndim > 2: raw=raw[idx,:]
+                    nrec += 1
+                    if do_print: logger.info(info_ndarr(raw & M14, 'Ev:%04d rec:%04d raw & M14' % (nevt,nrec)))
+                    if panel_blocks is None: block[nrec]=raw & M14
+                    else: panel_blocks.add_record(nrec, raw & M14)
+
+            print_statistics(nevt, nrec)
+
+            if panel_blocks is not None: panel_blocks.flush()
+
+            #---- process statistics in block-array for panels
+
+            panels = []
+            for idx, panel_id in enumerate(panel_ids):
+                if idx_sel is not None and idx_sel != idx:
+                    logger.warning('skip saving files, panel index %d is not equal to --idx=%d' % (idx, idx_sel))
+                    continue # skip panels if idx_sel is specified
+                panels.append((idx, panel_id))
+
+            if pool is not None:
+                # submit panels to the pool and save results of completed calib-cycles while reading the next one
+                futures = [pool.submit(proc_dark_panel, panel_blocks.fnames[idx], nrec, opts) for idx, _ in panels]
+                pending.append((panels, futures, panel_blocks, mode, tstamp, exp, irun))
+                pending = save_pending_pedestals(pending, wait=False, maxpending=npending, **opts)
+                continue
 
-                offset_hl_h = load_panel_constants(dir_offset, 'offset_AHL-H', tstamp)
-                offset_hl_l = load_panel_constants(dir_offset, 'offset_AHL-L', tstamp)
-                gain_hl_h   = load_panel_constants(dir_gain,   'gainci_AHL-H', tstamp)
-                gain_hl_l   = load_panel_constants(dir_gain,   'gainci_AHL-L', tstamp)
+            for idx, panel_id in panels:
+                logger.info('\n%s\nprocess panel:%02d id:%s' % (100*'=', idx, panel_id))
 
-                #if offset is not None:
-                if all([v is not None for v in (offset_hl_h, offset_hl_l, gain_hl_h, gain_hl_l)]):
-                    ped_hl_l = offset_hl_l - (offset_hl_h - ped_hl_h) * divide_protected(gain_hl_l, gain_hl_h) #V3 Gabriel's
-                    fname = '%s_pedestals_AHL-L.dat' % prefix_peds
-                    save_2darray_in_textfile(ped_hl_l, fname, filemode, fmt_peds, umask=0o0, group=group)
+                #block.sahpe = (1024, 16, 352, 384)
+                panel_block = block[:nrec,idx,:] if panel_blocks is None else panel_blocks.blocks[idx][:nrec]
+                dark, rms, status = proc_dark_block(panel_block, **opts) # process pedestals per-panel (352, 384)
+                save_panel_pedestals(panel_id, mode, dark, rms, status, tstamp, exp, irun, **opts)
 
-            elif mode=='AML-M': # evaluate AML_L from AML_M
-                ped_ml_m = dark #[4,:,:]
+            if panel_blocks is not None: panel_blocks.remove()
 
-                offset_ml_m = load_panel_constants(dir_offset, 'offset_AML-M', tstamp)
-                offset_ml_l = load_panel_constants(dir_offset, 'offset_AML-L', tstamp)
-                gain_ml_m   = load_panel_constants(dir_gain,   'gainci_AML-M', tstamp)
-                gain_ml_l   = load_panel_constants(dir_gain,   'gainci_AML-L', tstamp)
+        if pool is not None:
+            save_pending_pedestals(pending, wait=True, **opts)
 
-                #if offset is not None:
-                if all([v is not None for v in (offset_ml_m, offset_ml_l, gain_ml_m, gain_ml_l)]):
-                    ped_ml_l = offset_ml_l - (offset_ml_m - ped_ml_m) * divide_protected(gain_ml_l, gain_ml_m) #V3 Gabriel's
-                    fname = '%s_pedestals_AML-L.dat' % prefix_peds
-                    save_2darray_in_textfile(ped_ml_l, fname, filemode, fmt_peds, umask=0o0, group=group)
-    #logger.info('==== Completed pedestal calibration for rank %d ==== ' % rank)
+    finally: # also at sys.exit and exceptions in pool processes
+        if pool is not None: pool.shutdown()
+        if dir_blocks is not None: shutil.rmtree(dir_blocks, ignore_errors=True)
 
 
-def merge_panel_gain_ranges(dir_ctype, panel_id, ctype, tstamp, shape, ofname, fmt='%.3f', fac_mode=0o664, errskip=True, group='ps-users'):
+def merge_panel_gain_ranges(dir_ctype, panel_id, ctype, tstamp, shape, ofname, fmt='%.3f', fac_mode=0o664, errskip=True, group='ps-users', repofmt='txt'):
 
     logger.debug('In merge_panel_gain_ranges for\n  dir_ctype: %s\n  id: %s\n  ctype=%s tstamp=%s shape=%s'%\
                  (dir_ctype, panel_id, ctype, str(tstamp), str(shape)))
@@ -1458,7 +1715,7 @@ def merge_panel_gain_ranges(dir_ctype, panel_id, ctype, tstamp, shape, ofname, f
     for igm,gm in enumerate(GAIN_MODES):
         fname = None if gm in GAIN_MODES[5:] and ctype in ('status', 'rms') else\
                 find_file_for_timestamp(dir_ctype, '%s_%s' % (ctype,gm), tstamp)
-        nda = np.loadtxt(fname, dtype=np.float32) if fname is not None else\
+        nda = load_repo_array(fname, dtype=np.float32) if fname is not None else\
               nda_def*GAIN_FACTOR_DEF[igm] if ctype in ('gain', 'gainci') else\
               nda_def
 
@@ -1532,7 +1789,7 @@ def merge_panel_gain_ranges(dir_ctype, panel_id, ctype, tstamp, shape, ofname, f
 
     nda.shape = (7, 1, 352, 384)
     logger.debug(info_ndarr(nda, 'merged %s'%ctype))
-    save_ndarray_in_textfile(nda, ofname, fac_mode, fmt, umask=0o0, group=group)
+    save_repo_array(nda, ofname, fac_mode, fmt, umask=0o0, group=group, repofmt=repofmt)
 
     nda.shape = (7, 1, 352, 384) # because save_ndarray_in_textfile changes shape
     return nda
@@ -1614,6 +1871,8 @@ def deploy_constants(*args, **opts):
     low        = opts.get('low',    0.164) # ADU/keV#Low gain: 132 ADU / 8.05 keV / 100 = 0.164 ADU/keV
     proc       = opts.get('proc', None)
     paninds    = opts.get('paninds', None)
+    repofmt    = opts.get('repofmt', 'txt')
+    nprocs     = opts.get('nprocs', 0)
 
     panel_inds = None if paninds is None else [int(i) for i in paninds.split(',')] # conv str '0,1,2,3' to list [0,1,2,3]
 
@@ -1689,7 +1948,8 @@ def deploy_constants(*args, **opts):
             fmt = CTYPE_FMT.get(octype,'%.5f')
             logger.debug('begin merging for ctype:%s, octype:%s, fmt:%s,\n  prefix:%s' % (ctype, octype, fmt, prefix))
             fname = '%s_%s.txt' % (prefix, ctype)
-            nda = merge_panel_gain_ranges(dir_ctype, panel_id, ctype, tstamp, shape, fname, fmt, filemode, errskip=errskip, group=group)
+            nda = merge_panel_gain_ranges(dir_ctype, panel_id, ctype, tstamp, shape, fname, fmt, filemode, errskip=errskip, group=group,\
+                                          repofmt=repofmt)
             if octype in dic_consts: dic_consts[octype].append(nda) # append for panel per ctype
             else:                    dic_consts[octype] = [nda,]
 
@@ -1699,13 +1959,11 @@ def deploy_constants(*args, **opts):
     create_directory(dmerge, mode=dirmode, group=group)
     fmerge_prefix = fname_prefix_merge(dmerge, detname, tstamp, exp, irun)
 
-    for octype, lst in dic_consts.items():
-        mrg_nda = merge_panels(lst)
-        logger.info(info_ndarr(mrg_nda, 'merged constants for %s' % octype))
-        fmerge = '%s-%s.txt' % (fmerge_prefix, octype)
-        fmt = CTYPE_FMT.get(octype,'%.5f')
-        save_ndarray_in_textfile(mrg_nda, fmerge, filemode, fmt, umask=0o0, group=group)
+    # merged constants are saved in text files, needed for deployment, concurrently for octypes in nprocs processes
+    fmerges = save_merged_panels(dic_consts, fmerge_prefix, CTYPE_FMT, filemode, umask=0o0, group=group,\
+                                 repofmt=repofmt, savetxt=(deploy or repofmt=='txt'), nprocs=nprocs)
 
+    for octype, fmerge in fmerges.items():
         if dircalib is not None: calibdir = dircalib
         #ctypedir = .../calib/Epix10ka::CalibV1/MfxEndstation.0:Epix10ka.0/'
         calibgrp = calib_group(dettype) # 'Epix10ka::CalibV1'
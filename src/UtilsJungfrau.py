@@ -37,8 +37,11 @@ import numpy as np
 from time import time
 from Detector.GlobalUtils import print_ndarr, info_ndarr, divide_protected
 from Detector.UtilsCommonMode import common_mode_cols,\
-                                     common_mode_rows_hsplit_nbanks, common_mode_2d_hsplit_nbanks
+                                     common_mode_rows_hsplit_nbanks, common_mode_2d_hsplit_nbanks,\
+                                     common_mode_segments, common_mode_engine, CMENGINE_VECT
 from Detector.PyDataAccess import get_jungfrau_data_object, get_jungfrau_config_object
+from Detector.UtilsCalibCache import detcache_for_run, add_detcache_to_calib_cache, shmem_name, shared_arrays,\
+                                     thread_pool
 
 from PSCalib.GlobalUtils import string_from_source, complete_detname
 
@@ -46,6 +49,7 @@ BW1 =  0o40000 # 16384 or 1<<14 (15-th bit starting from 1)
 BW2 = 0o100000 # 32768 or 2<<14 or 1<<15
 BW3 = 0o140000 # 49152 or 3<<14
 MSK =  0x3fff # 16383 or (1<<14)-1 - 14-bit mask
+SHARED_CONSTANTS = ('poff', 'gfac', 'mask', 'pcons', 'iflat') # DetCache arrays shared between processes
 
 
 class Storage():
@@ -92,16 +96,21 @@ class DetCache():
         self.mask = None
         self.outa = None
         self.cmps  = None
+        self.pcons = None # pixel-major interleaved pairs (peds+offset, gain factor x mask) for calib_jungfrau_fused
+        self.pool  = None # thread pool for per-segment calibration
+        self.nthreads = 0
         self.isset = False
-        self.add_calibcons(det, evt)
+        self.detname = string_from_source(det.source)
+        self.runnum = det.runnum(evt)
+        self.calibkey = det.pyda.calib_files_key(evt) # resolved calibration files for calib_cache
+        self.shmem = kwa.get('shmem', False)
+        if not self.shmem: self.add_calibcons(det, evt) # otherwise constants are set by set_shared_constants
 
     def kwargs_are_the_same(self, **kwa):
         return self.kwa == kwa
 
     def add_calibcons(self, det, evt):
 
-        self.detname = string_from_source(det.source)
-
         #arr  = np.array(det.raw(evt), dtype=np.float32)
         peds = det.pedestals(evt) # - 4d pedestals shape:(3, 1, 512, 1024) dtype:float32
         if peds is None: return
@@ -122,6 +131,49 @@ class DetCache():
 
         self.isset = True
 
+    def set_fused_constants(self):
+        """Sets constants and per-event buffers for calib_jungfrau_fused.
+           Should be called after self.mask is defined, because mask is merged with gain factors.
+           Constants are pixel-major pairs (poff, gfac x mask) shaped as (<nsegs>, 512, 1024, 4, 2)
+           for gain bits 00/01/10/11, so each event needs a single 8-byte take per pixel.
+        """
+        if self.poff is None: return
+        mask = self.mask
+        gfm = self.gfac if mask is None else self.gfac * mask
+        sh, npix = self.outa.shape, self.outa.size
+        pcons = np.empty(sh + (4,2), dtype=np.float32)
+        pcons[...,0] = interleaved_gain_constants(self.poff, default=0)
+        pcons[...,1] = interleaved_gain_constants(gfm, default=(1 if mask is None else mask))
+        self.pcons = pcons
+        self.iflat = np.arange(0, 4*npix, 4, dtype=fused_index_dtype(npix)).reshape(sh) # pixel offsets in interleaved constants
+        self.set_fused_buffers()
+
+    def set_fused_buffers(self):
+        """Sets per-process per-event buffers for calib_jungfrau_fused."""
+        sh = self.outa.shape
+        self.ucons = self.pcons.view(np.uint64).ravel() # pairs of constants as 8-byte items
+        self.indx = np.empty(sh, dtype=self.iflat.dtype)  # per-event indexes of constants
+        self.abuf = np.empty(sh, dtype=np.uint16) # per-event buffer for gain bits and 14-bit data
+        self.cbuf = np.empty(sh, dtype=np.uint64) # per-event buffer for gathered pairs of constants
+
+    def set_shared_constants(self, det, evt):
+        """Sets constants as read-only arrays in shared memory of the node.
+           Constants are evaluated in the first process for the same detector, calibration files and **kwa,
+           other processes attach to them, per-event buffers are allocated in each process.
+        """
+        def constants():
+            self.add_calibcons(det, evt)
+            self.mask = det.mask_total(evt, **self.kwa)
+            if self.fused: self.set_fused_constants()
+            return dict((k, getattr(self, k)) for k in SHARED_CONSTANTS)
+
+        name = shmem_name('jungfrau', self.detname, self.calibkey, self.runnum, self.kwa)
+        for k,v in shared_arrays(name, constants).items(): setattr(self, k, v)
+        if self.poff is None: return
+        self.outa = np.zeros(self.poff.shape[1:], dtype=np.float32)
+        if self.pcons is not None: self.set_fused_buffers()
+        self.isset = True
+
 
 
 
@@ -156,6 +208,100 @@ def event_constants(cons, grmaps, default=0):
     return np.select(grmaps, (cons[0,:], cons[1,:], cons[2,:]), default=default)
 
 
+def fused_index_dtype(npixels):
+    """Returns int32 dtype of indexes of interleaved constants of calib_jungfrau_fused for 4 constants per pixel
+       to halve memory traffic of index arrays, or int64 for detectors with more than 2**29 pixels.
+    """
+    return np.int32 if 4*npixels < 2**31 else np.int64
+
+
+def interleaved_gain_constants(cons, default=0):
+    """Returns pixel-major constants shaped as (<nsegs>, 512, 1024, 4) dtype:float32 for gain bits raw>>14 = 00/01/10/11,
+       where non-valid gain bits 10 are associated with default value (scalar or array shaped as raw).
+       Parameters
+       ----------
+       cons shape=(3, <nsegs>, 512, 1024) - constants for gain ranges 0,1,2
+    """
+    c = np.empty(cons.shape[1:] + (4,), dtype=np.float32)
+    c[...,0] = cons[0,:]
+    c[...,1] = cons[1,:]
+    c[...,2] = default
+    c[...,3] = cons[2,:]
+    return c
+
+
+def common_mode_jungfrau(arrf, gmask, cmps):
+    """Applies in-place common mode correction to pedestal-subtracted arrf shaped as (<nsegs>, 512, 1024),
+       gmask - the same shape mask of good pixels in the high gain range used for correction,
+       cmps - common mode parameters, cmps[1] - control bit-word 1-in rows, 2-in columns, 4-in banks,
+              cmps[4] - engine 0/1 - vectorized for all segments/legacy loop over segments and banks.
+    """
+    if cmps is None: return
+    mode, cormax = int(cmps[1]), cmps[2]
+    npixmin = cmps[3] if len(cmps)>3 else 10
+    if mode>0:
+        logger.debug(info_ndarr(gmask, 'gmask'))
+        t0_sec_cm = time()
+        if common_mode_engine(cmps) == CMENGINE_VECT:
+            common_mode_segments(arrf, gmask, cmps, nbanks=16, nrbanks=2)
+            logger.debug('TIME: common-mode correction time = %.6f sec' % (time()-t0_sec_cm))
+            return
+        #sh = (nsegs, 512, 1024)
+        hrows = 256 #512/2
+        for s in range(arrf.shape[0]):
+          if mode & 4: # in banks: (512/2,1024/16) = (256,64) pixels # 100 ms
+            common_mode_2d_hsplit_nbanks(arrf[s,:hrows,:], mask=gmask[s,:hrows,:], nbanks=16, cormax=cormax, npix_min=npixmin)
+            common_mode_2d_hsplit_nbanks(arrf[s,hrows:,:], mask=gmask[s,hrows:,:], nbanks=16, cormax=cormax, npix_min=npixmin)
+
+          if mode & 1: # in rows per bank: 1024/16 = 64 pixels # 275 ms
+            common_mode_rows_hsplit_nbanks(arrf[s,], mask=gmask[s,], nbanks=16, cormax=cormax, npix_min=npixmin)
+
+          if mode & 2: # in cols per bank: 512/2 = 256 pixels  # 290 ms
+            common_mode_cols(arrf[s,:hrows,:], mask=gmask[s,:hrows,:], cormax=cormax, npix_min=npixmin)
+            common_mode_cols(arrf[s,hrows:,:], mask=gmask[s,hrows:,:], cormax=cormax, npix_min=npixmin)
+
+        logger.debug('TIME: common-mode correction time = %.6f sec' % (time()-t0_sec_cm))
+
+
+def calib_jungfrau_fused(arr, odc, segs=slice(None), out=None):
+    """Returns calibrated jungfrau data in the cached buffer odc.outa or in out if specified.
+       Single-pass kernel evaluating (raw & MSK - poff[g]) * gfac[g] * mask
+       with pair of constants gathered by gain bits g = raw>>14 in a single 8-byte take per pixel
+       from pixel-major interleaved layout prepared in DetCache.set_fused_constants. Results are identical to calib_jungfrau_single_panel.
+
+       Parameters
+       ----------
+       arr - raw data shape:(<nsegs>, 512, 1024) dtype:uint16
+       odc - DetCache object with fused constants
+       segs - (int or slice) segment(s) to process, all by default; results are saved in odc.outa[segs]
+       out - optional float32 output array shaped as arr, used in stead of odc.outa
+    """
+    if isinstance(segs, int): segs = slice(segs, segs+1)
+    arr = arr[segs]
+    abuf, indx, cbuf = odc.abuf[segs], odc.indx[segs], odc.cbuf[segs]
+    outa = odc.outa[segs] if out is None else out[segs]
+    cmps = odc.cmps
+    mask = None if odc.mask is None else odc.mask[segs]
+
+    np.right_shift(arr, 14, out=abuf) # gain bits 00/01/10/11
+    np.add(odc.iflat[segs], abuf, out=indx)
+
+    do_cm = cmps is not None and int(cmps[1])>0
+    if do_cm:
+        gr0 = abuf == 0
+        gmask = np.bitwise_and(gr0, mask) if mask is not None else gr0
+
+    np.bitwise_and(arr, MSK, out=abuf)
+    np.take(odc.ucons, indx, out=cbuf, mode='clip') # indexes are in range by construction, 'clip' skips slow bound check
+    cons = cbuf.view(np.float32).reshape(cbuf.shape + (2,)) # (poff, gfm) for gain range of pixel
+    np.subtract(abuf, cons[...,0], out=outa)
+
+    if do_cm: common_mode_jungfrau(outa, gmask, cmps)
+
+    np.multiply(outa, cons[...,1], out=outa)
+    return outa
+
+
 def calib_jungfrau(det, evt, cmpars=(7,3,200,10), **kwa):
     """
     DEPRECATED, use calib_jungfrau_v2 with better caching of combined calib constats and less memory consumption
@@ -286,7 +432,40 @@ def calib_jungfrau(det, evt, cmpars=(7,3,200,10), **kwa):
     return arrf * factor if mask is None else arrf * factor * mask # gain correction
 
 
-def calib_jungfrau_v2(det, evt, cmpars=(7,3,200,10), **kwa):
+def detcache_jungfrau(det, evt, cmpars=(7,3,200,10), **kwa):
+    """Returns (DetCache, first_entry) for det, DetCache is created and filled with constants at first entry.
+       Warns if **kwa are different from **kwa at first entry, because constants and mask are cached.
+    """
+    #src = det.source # - src (psana.Source)   - Source object
+    detname = string_from_source(det.source)
+    #print('XXX type(detname):', type(detname))
+    odc = detcache_for_run(cache.detcache_for_detname(detname), det, evt, 'jungfrau')
+    if odc is not None: cache.calibcons[detname] = odc
+    first_entry = odc is None
+    if first_entry:
+       #print('  XXX before det.mask_total **kwa:', kwa)
+       odc = cache.add_detcache(det, evt, **kwa)
+       odc.cmps = det.common_mode(evt) if cmpars is None else cmpars
+       odc.loop_segs = kwa.get('loop_segs', True)
+       odc.fused = kwa.get('fused', True)
+       if odc.shmem: odc.set_shared_constants(det, evt)
+       else:
+         odc.mask = det.mask_total(evt, **kwa)
+         #print('  XXX after det.mask_total **kwa:', odc.mask)
+         if odc.fused: odc.set_fused_constants()
+       add_detcache_to_calib_cache(odc, 'jungfrau')
+
+    #t0_sec = time()
+    if kwa != odc.kwa:
+        logger.warning('IGNORED ATTEMPT to call det.calib/image with different **kwargs (due to caching)'\
+                       + '\n  **kwargs at first entry: %s' % str(odc.kwa)\
+                       + '\n  **kwargs at this entry: %s' % str(kwa)\
+                       + '\n  MUST BE FFIXED - please consider to use the same **kwargs during the run in all calls to det.calib/image.')
+    #print('XXX time to check **kwargs = %.6f sec' % (time()-t0_sec)) # ~3us
+    return odc, first_entry
+
+
+def calib_jungfrau_v2(det, evt, cmpars=(7,3,200,10), out=None, **kwa):
     """
     v2 - improving performance, reduce time and memory consumption, use peds-offset constants
     Returns calibrated jungfrau data
@@ -305,36 +484,24 @@ def calib_jungfrau_v2(det, evt, cmpars=(7,3,200,10), **kwa):
         - cmpars[0] - algorithm # 7-for jungfrau
         - cmpars[1] - control bit-word 1-in rows, 2-in columns
         - cmpars[2] - maximal applied correction
+        - cmpars[3] - minimal number of good pixels in group for correction
+        - cmpars[4] - common mode engine 0/1 - vectorized/legacy loop over segments and banks
+    - out (np.array) - optional preallocated output array shaped as raw dtype:float32, by default cached array is returned
     - **kwa - used here and passed to det.mask_v2 or det.mask_comb
       - nda_raw - if not None, substitutes evt.raw()
       - mbits - DEPRECATED parameter of the det.mask_comb(...)
       - mask - user defined mask passed as optional parameter
+      - fused - (bool, True) use single-pass kernel calib_jungfrau_fused, othervise loop over segments if loop_segs
+      - loop_segs - (bool, True) on/off loop over segments for fused=False
+      - nthreads - (int, 1) number of threads in the pool of DetCache for parallel processing of segments
+      - shmem - (bool, False) share read-only constants between processes on the node, e.g. MPI ranks
     """
 
     nda_raw = kwa.get('nda_raw', None)
     arr = det.raw(evt) if nda_raw is None else nda_raw # shape:(<npanels>, 512, 1024) dtype:uint16
     if arr is None: return None
 
-    #src = det.source # - src (psana.Source)   - Source object
-    detname = string_from_source(det.source)
-    #print('XXX type(detname):', type(detname))
-    odc = cache.detcache_for_detname(detname)
-    first_entry = odc is None
-    if first_entry:
-       #print('  XXX before det.mask_total **kwa:', kwa)
-       odc = cache.add_detcache(det, evt, **kwa)
-       odc.cmps = det.common_mode(evt) if cmpars is None else cmpars
-       odc.mask = det.mask_total(evt, **kwa)
-       #print('  XXX after det.mask_total **kwa:', odc.mask)
-       odc.loop_segs = kwa.get('loop_segs', True)
-
-    #t0_sec = time()
-    if kwa != odc.kwa:
-        logger.warning('IGNORED ATTEMPT to call det.calib/image with different **kwargs (due to caching)'\
-                       + '\n  **kwargs at first entry: %s' % str(odc.kwa)\
-                       + '\n  **kwargs at this entry: %s' % str(kwa)\
-                       + '\n  MUST BE FFIXED - please consider to use the same **kwargs during the run in all calls to det.calib/image.')
-    #print('XXX time to check **kwargs = %.6f sec' % (time()-t0_sec)) # ~3us
+    odc, first_entry = detcache_jungfrau(det, evt, cmpars, **kwa)
 
     poff = odc.poff # 4d pedestals + offset shape:(3, 1, 512, 1024) dtype:float32
     gfac = odc.gfac # 4d gain factors evaluated form gains
@@ -351,30 +518,92 @@ def calib_jungfrau_v2(det, evt, cmpars=(7,3,200,10), **kwa):
                    +info_ndarr(mask, '\n    mask')\
                    +info_ndarr(outa, '\n    outa')\
                    +info_ndarr(cmps, '\n    common mode parameters ')
-                   +'\n    loop over segments: %s' % odc.loop_segs)
-
-    if odc.loop_segs:
-      nsegs = arr.shape[0]
-      shseg = arr.shape[-2:] # (512, 1024)
-      for i in range(nsegs):
-        arr1  = arr[i,:]
-        mask1 = None if mask is None else mask[i,:]
-        gfac1 = None if gfac is None else gfac[:,i,:,:]
-        poff1 = None if poff is None else poff[:,i,:,:]
-        arr1.shape  = (1,) + shseg
-        if mask1 is not None: mask1.shape = (1,) + shseg
-        if gfac1 is not None: gfac1.shape = (3,1,) + shseg
-        if poff1 is not None: poff1.shape = (3,1,) + shseg
-        #print(info_ndarr(arr1,  'XXX  arr1 '))
-        #print(info_ndarr(poff1, 'XXX  poff1 '))
-        out1 = calib_jungfrau_single_panel(arr1, gfac1, poff1, mask1, cmps)
-        #print(info_ndarr(out1, 'XXX  out1 '))
-        outa[i,:] = out1[0,:]
+                   +'\n    loop over segments: %s' % odc.loop_segs\
+                   +'\n    fused kernel: %s' % odc.fused)
+
+    nthreads = kwa.get('nthreads', 1)
+    nsegs = arr.shape[0]
+
+    if out is not None: outa = out.reshape(arr.shape)
+
+    if odc.pcons is not None:
+      if nthreads > 1 and nsegs > 1:
+        thread_pool(odc, nthreads).map(lambda i: calib_jungfrau_fused(arr, odc, i, out=outa), range(nsegs))
+        return outa
+      return calib_jungfrau_fused(arr, odc, out=outa)
+
+    if odc.loop_segs or nthreads > 1:
+      if nthreads > 1:
+        thread_pool(odc, nthreads).map(lambda i: calib_jungfrau_segment(arr, odc, i, out=outa), range(nsegs))
+      else:
+        for i in range(nsegs): calib_jungfrau_segment(arr, odc, i, out=outa)
       #print(info_ndarr(outa, 'XXX  outa '))
       #sys.exit('TEST EXIT')
       return outa
     else:
-      return calib_jungfrau_single_panel(arr, gfac, poff, mask, cmps)
+      res = calib_jungfrau_single_panel(arr, gfac, poff, mask, cmps)
+      if out is None: return res
+      outa[:] = res
+      return outa
+
+
+def calib_jungfrau_batch(det, evt, raws, cmpars=(7,3,200,10), out=None, **kwa):
+    """Returns calibrated jungfrau data for a batch of events shaped as (<nevts>, <nsegs>, 512, 1024) dtype:float32.
+       Constants, mask and fused kernel buffers are gathered once from DetCache and reused for all frames,
+       frames are calibrated directly in the output block without intermediate copies.
+
+       Parameters
+
+       - det (psana.Detector) - Detector object
+       - evt (psana.Event or int run number) - defines calibration constants for the batch
+       - raws (np.array) - stack of raw data shaped as (<nevts>, <nsegs>, 512, 1024) dtype:uint16
+       - cmpars (tuple) - common mode parameters, see calib_jungfrau_v2
+       - out (np.array) - optional preallocated output block shaped as raws dtype:float32
+       - **kwa - the same as for calib_jungfrau_v2, except nda_raw
+    """
+    if raws is None: return None
+    odc, first_entry = detcache_jungfrau(det, evt, cmpars, **kwa)
+    if odc.poff is None: return None
+
+    nevts, nsegs = raws.shape[0], raws.shape[1]
+    if out is None: out = np.empty(raws.shape, dtype=np.float32)
+    nthreads = kwa.get('nthreads', 1)
+
+    if first_entry:
+        logger.debug(info_ndarr(raws, 'calib_jungfrau_batch first entry:\n    raws')\
+                     + '\n    fused kernel: %s  nthreads: %d' % (odc.fused, nthreads))
+
+    if odc.pcons is not None:
+        pool = thread_pool(odc, nthreads) if nthreads > 1 and nsegs > 1 else None
+        for i in range(nevts):
+            arr, outi = raws[i], out[i]
+            if pool is None: calib_jungfrau_fused(arr, odc, out=outi)
+            else: pool.map(lambda s: calib_jungfrau_fused(arr, odc, s, out=outi), range(nsegs))
+    else:
+        for i in range(nevts):
+            out[i] = calib_jungfrau_single_panel(raws[i], odc.gfac, odc.poff, odc.mask, odc.cmps)
+    return out
+
+
+def calib_jungfrau_segment(arr, odc, i, out=None):
+    """Calibrates segment i of raw data arr with constants from DetCache odc and saves results in odc.outa[i,:]
+       or in out[i,:] if out is specified.
+    """
+    poff, gfac, mask = odc.poff, odc.gfac, odc.mask
+    shseg = arr.shape[-2:] # (512, 1024)
+    arr1  = arr[i,:]
+    mask1 = None if mask is None else mask[i,:]
+    gfac1 = None if gfac is None else gfac[:,i,:,:]
+    poff1 = None if poff is None else poff[:,i,:,:]
+    arr1.shape  = (1,) + shseg
+    if mask1 is not None: mask1.shape = (1,) + shseg
+    if gfac1 is not None: gfac1.shape = (3,1,) + shseg
+    if poff1 is not None: poff1.shape = (3,1,) + shseg
+    #print(info_ndarr(arr1,  'XXX  arr1 '))
+    #print(info_ndarr(poff1, 'XXX  poff1 '))
+    out1 = calib_jungfrau_single_panel(arr1, gfac1, poff1, mask1, odc.cmps)
+    #print(info_ndarr(out1, 'XXX  out1 '))
+    (odc.outa if out is None else out)[i,:] = out1[0,:]
 
 
 def calib_jungfrau_single_panel(arr, gfac, poff, mask, cmps):
@@ -398,31 +627,9 @@ def calib_jungfrau_single_panel(arr, gfac, poff, mask, cmps):
     arrf = np.array(arr & MSK, dtype=np.float32)
     arrf -= pedoff
 
-    if cmps is not None:
-      mode, cormax = int(cmps[1]), cmps[2]
-      npixmin = cmps[3] if len(cmps)>3 else 10
-      if mode>0:
-        #arr1 = store.arr1
-        #grhg = np.select((gr0,  gr1), (arr1, arr1), default=0)
-        logger.debug(info_ndarr(gr0, 'gain group0'))
-        logger.debug(info_ndarr(mask, 'mask'))
-        t0_sec_cm = time()
+    if cmps is not None and int(cmps[1])>0:
         gmask = np.bitwise_and(gr0, mask) if mask is not None else gr0
-        #sh = (nsegs, 512, 1024)
-        hrows = 256 #512/2
-        for s in range(arrf.shape[0]):
-          if mode & 4: # in banks: (512/2,1024/16) = (256,64) pixels # 100 ms
-            common_mode_2d_hsplit_nbanks(arrf[s,:hrows,:], mask=gmask[s,:hrows,:], nbanks=16, cormax=cormax, npix_min=npixmin)
-            common_mode_2d_hsplit_nbanks(arrf[s,hrows:,:], mask=gmask[s,hrows:,:], nbanks=16, cormax=cormax, npix_min=npixmin)
-
-          if mode & 1: # in rows per bank: 1024/16 = 64 pixels # 275 ms
-            common_mode_rows_hsplit_nbanks(arrf[s,], mask=gmask[s,], nbanks=16, cormax=cormax, npix_min=npixmin)
-
-          if mode & 2: # in cols per bank: 512/2 = 256 pixels  # 290 ms
-            common_mode_cols(arrf[s,:hrows,:], mask=gmask[s,:hrows,:], cormax=cormax, npix_min=npixmin)
-            common_mode_cols(arrf[s,hrows:,:], mask=gmask[s,hrows:,:], cormax=cormax, npix_min=npixmin)
-
-        logger.debug('TIME: common-mode correction time = %.6f sec' % (time()-t0_sec_cm))
+        common_mode_jungfrau(arrf, gmask, cmps)
 
     return arrf * factor if mask is None else arrf * factor * mask # gain correction
 
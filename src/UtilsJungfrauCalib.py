@@ -73,7 +73,7 @@ class DarkProcJungfrau(uc.DarkProc):
     def init_proc(self):
         uc.DarkProc.init_proc(self)
         shape_raw = self.arr_med.shape
-        self.bad_switch = np.zeros(shape_raw, dtype=np.uint8)
+        self.bad_switch = self.stats.add_array('bad_switch', np.zeros(shape_raw, dtype=np.uint8), np.logical_or)
 
 
     def add_event(self, raw, irec):
@@ -194,6 +194,7 @@ def jungfrau_dark_proc(pargs, popts):
 
     dpo = None
     igm0 = None
+    kwargs['comm'] = uc.mpi_comm() # events are split between MPI ranks if launched by mpirun
     is_single_run = uc.is_single_run_dataset(dsname)
 
     nevtot = 0
@@ -300,6 +301,8 @@ def jungfrau_dark_proc(pargs, popts):
                     logger.info('det.raw(evt) is None in event %d' % ievt)
                     continue
 
+                if dpo is not None and not dpo.is_own_event(nevtot): continue
+
                 raw = (raw if segind is None else raw[segind,:]) # NO & M14 herte
 
                 nevsel += 1
@@ -339,9 +342,10 @@ def jungfrau_dark_proc(pargs, popts):
                 logger.info('reset statistics for next step')
 
                 if dpo is not None:
-                    dpo.summary()
-                    dpo.show_plot_results()
-                    save_results(dpo, **kwargs)
+                    if dpo.reduce_stats():
+                        dpo.summary()
+                        dpo.show_plot_results()
+                        save_results(dpo, **kwargs)
                     del(dpo)
                     dpo=None
 
@@ -359,9 +363,10 @@ def jungfrau_dark_proc(pargs, popts):
         #    break
 
         if dpo is not None:
-            dpo.summary()
-            dpo.show_plot_results()
-            save_results(dpo, **kwargs)
+            if dpo.reduce_stats():
+                dpo.summary()
+                dpo.show_plot_results()
+                save_results(dpo, **kwargs)
             del(dpo)
             dpo=None
 
@@ -492,7 +497,7 @@ def jungfrau_config_info(dsname, detname, idx=0):
     return cpdic
 
 
-def merge_jf_panel_gain_ranges(dir_ctype, panel_id, ctype, tstamp, shape, ofname, fmt='%.3f', fac_mode=0o664, errskip=True, group='ps-users'):
+def merge_jf_panel_gain_ranges(dir_ctype, panel_id, ctype, tstamp, shape, ofname, fmt='%.3f', fac_mode=0o664, errskip=True, group='ps-users', repofmt='txt'):
 
     logger.debug('In merge_panel_gain_ranges for\n  dir_ctype: %s\n  id: %s\n  ctype=%s tstamp=%s shape=%s'%\
                  (dir_ctype, panel_id, ctype, str(tstamp), str(shape)))
@@ -509,7 +514,7 @@ def merge_jf_panel_gain_ranges(dir_ctype, panel_id, ctype, tstamp, shape, ofname
         pattern = '%s_gm%d-%s' % (ctype,igm,gm)
         fname = uc.find_file_for_timestamp(dir_ctype, pattern, tstamp)
         if fname is not None:
-            dicnda[igm] = np.loadtxt(fname, dtype=np.float32)
+            dicnda[igm] = uc.load_repo_array(fname, dtype=np.float32)
             dic_fnames[igm] = fname
 
     # convert dict to list of gain range constants for panel
@@ -528,7 +533,7 @@ def merge_jf_panel_gain_ranges(dir_ctype, panel_id, ctype, tstamp, shape, ofname
 
     nda.shape = (3, 1, 512, 1024)
     logger.debug(info_ndarr(nda, 'merged %s'%ctype))
-    uc.save_ndarray_in_textfile(nda, ofname, fac_mode, fmt, umask=0o0, group=group)
+    uc.save_repo_array(nda, ofname, fac_mode, fmt, umask=0o0, group=group, repofmt=repofmt)
 
     nda.shape = (3, 1, 512, 1024) # because save_ndarray_in_textfile changes shape
     return nda
@@ -588,6 +593,8 @@ def jungfrau_deploy_constants(pargs, popts):
     fmt_minmax = kwa.get('fmt_status', '%6i')
     fmt_gain   = kwa.get('fmt_gain',   '%.6f')
     fmt_offset = kwa.get('fmt_offset', '%.6f')
+    repofmt    = kwa.get('repofmt', 'txt')
+    nprocs     = kwa.get('nprocs', 0)
 
     fname_aliases = fname_panel_id_aliases(dirrepo)
 
@@ -649,7 +656,8 @@ def jungfrau_deploy_constants(pargs, popts):
             dir_ctype = repoman.dir_type(panel_id, ctype)
             #logger.info('  dir_ctype: %s' % dir_ctype)
             fname = '%s/%s_%s.txt' % (dir_ctype, fname_prefix, ctype)
-            nda = merge_jf_panel_gain_ranges(dir_ctype, panel_id, ctype, tstamp, shape_panel, fname, fmt, filemode, errskip=errskip, group=group)
+            nda = merge_jf_panel_gain_ranges(dir_ctype, panel_id, ctype, tstamp, shape_panel, fname, fmt, filemode, errskip=errskip, group=group,\
+                                             repofmt=repofmt)
             logger.info('-- save array of panel constants "%s" merged for 3 gain ranges shaped as %s in file\n%s%s\n'\
                         % (ctype, str(nda.shape), 21*' ', fname))
 
@@ -663,13 +671,11 @@ def jungfrau_deploy_constants(pargs, popts):
 
     logger.info('fmerge_prefix: %s' % fmerge_prefix)
 
-    for octype,lst in dic_consts.items():
-        lst_nda = uc.merge_panels(lst)
-        logger.info(info_ndarr(lst_nda, 'merged constants for %s' % octype))
-        fmerge = '%s-%s.txt' % (fmerge_prefix, octype)
-        fmt = mpars[octype][1]
-        uc.save_ndarray_in_textfile(lst_nda, fmerge, filemode, fmt, umask=0o0, group=group)
+    # merged constants are saved in text files, needed for deployment, concurrently for octypes in nprocs processes
+    fmerges = uc.save_merged_panels(dic_consts, fmerge_prefix, {k:v[1] for k,v in mpars.items()}, filemode, umask=0o0, group=group,\
+                                    repofmt=repofmt, savetxt=(deploy or repofmt=='txt'), nprocs=nprocs)
 
+    for octype, fmerge in fmerges.items():
         if dircalib is not None: calibdir = dircalib
         #ctypedir = .../calib/Epix10ka::CalibV1/MfxEndstation.0:Epix10ka.0/'
         calibgrp = uc.calib_group(dettype) # 'Epix10ka::CalibV1'
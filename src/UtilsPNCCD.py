@@ -16,7 +16,9 @@ import numpy as np
 #from Detector.GlobalUtils import print_ndarr, divide_protected
 from Detector.UtilsCommonMode import common_mode_rows, common_mode_cols,\
      common_mode_rows_hsplit_nbanks,\
-     common_mode_2d_hsplit_nbanks
+     common_mode_2d_hsplit_nbanks,\
+     common_mode_rows_nbanks, common_mode_cols_nrbanks, common_mode_2d_nbanks,\
+     common_mode_engine, CMENGINE_VECT
 
 #------------------------------
 
@@ -55,12 +57,33 @@ def common_mode_banks_512x128(data, mask, cormax) :
 
 #------------------------------
 
-def common_mode_pnccd(data, mask, cmp=(8,1,500)) :
+def common_mode_pnccd_vect(data, mask, cmp=(8,1,500)) :
+    """Vectorized version of common_mode_pnccd for data and mask shape=(4,512,512) - all segments at once.
+    """
+    mode, cormax = int(cmp[1]), cmp[2]
+    if mode & 1 :
+      common_mode_rows_nbanks(data, mask, 4, cormax)
+    if mode & 2 :
+      common_mode_rows_nbanks(data, mask, 1, cormax)
+    if mode & 4 :
+      common_mode_cols_nrbanks(data, mask, 1, cormax)
+    if mode & 8 :
+      common_mode_2d_nbanks(data, mask, 1, 4, cormax)
+
+#------------------------------
 
+def common_mode_pnccd(data, mask, cmp=(8,1,500)) :
+    """Applies common mode correction to pnccd data and mask shape=(4,512,512),
+       cmp[1] - control bit-word +1/2/4/8 - in rows of 128 pixels/in rows/in columns/in banks 512x128,
+       cmp[2] - maximal applied correction,
+       cmp[4] - engine 0/1 - vectorized for all segments/legacy loop over segments.
+    """
     #t0_sec = time()
     if cmp is not None :
       mode, cormax = int(cmp[1]), cmp[2]
-      if mode>0 :
+      if mode>0 and common_mode_engine(cmp) == CMENGINE_VECT :
+        common_mode_pnccd_vect(data, mask, cmp)
+      elif mode>0 :
         #common_mode_2d(data, mask=gr0, cormax=cormax)
         for s in range(data.shape[0]) :
           # 2-d segment data and mask
@@ -73,6 +73,39 @@ def residuals_to_plane(a):
     res.shape = sh
     return res
 
+def plane_fit_pinv(shw):
+    """returns pseudo-inverse shaped as (3, wr*wc) of the design matrix [[x, y, 1],...] of fit_to_plane
+       for window grid of shape shw=(wr, wc), the same for all windows of this shape.
+    """
+    cs, rs = np.meshgrid(range(shw[1]), range(shw[0]))
+    A = np.stack((cs.ravel(), rs.ravel(), np.ones(cs.size)), axis=1).astype(float)
+    return np.linalg.pinv(A), A
+
+def residuals_to_plane_windows(frames, shw):
+    """returns float array shaped as frames=(..., rows, cols) of residuals to plane fits in windows of shape shw
+       with corners from corners2d, as residuals_to_plane for each window of each frame in loop.
+       All windows of all frames are fitted in a single matrix product with precomputed pseudo-inverse.
+    """
+    sh = frames.shape
+    wr, wc = shw
+    rows = np.array(edges1d(sh[-2], wr))
+    cols = np.array(edges1d(sh[-1], wc))
+    ir = rows[:,None] + np.arange(wr)  # (nwr, wr) row indexes of window pixels
+    ic = cols[:,None] + np.arange(wc)  # (nwc, wc)
+    w = frames[..., ir[:,:,None,None], ic[None,None,:,:]].astype(float) # (..., nwr, wr, nwc, wc)
+    w = np.moveaxis(w, -3, -2).reshape(sh[:-2] + (rows.size, cols.size, wr*wc))
+    pinv, A = plane_fit_pinv(shw)
+    w -= (w @ pinv.T) @ A.T
+    w = w.reshape(sh[:-2] + (rows.size, cols.size, wr, wc))
+    # overlapping pixels of the last window in row/column take its residuals, as in loop over corners
+    pr = np.arange(sh[-2])
+    pc = np.arange(sh[-1])
+    jr = np.minimum(pr//wr, rows.size-1)
+    jc = np.minimum(pc//wc, cols.size-1)
+    jr[pr >= rows[-1]] = rows.size-1
+    jc[pc >= cols[-1]] = cols.size-1
+    return w[..., jr[:,None], jc[None,:], (pr-rows[jr])[:,None], (pc-cols[jc])[None,:]]
+
 def find_outliers(arr, title='', vmin=None, vmax=None, fmt='%.3f'):
     assert isinstance(arr, np.ndarray)
     size = arr.size
@@ -252,6 +285,11 @@ class DataProc:
         return None
 
     def residuals_frame_f06(self, frame):
+        assert isinstance(frame, np.ndarray)
+        assert frame.ndim==2
+        return residuals_to_plane_windows(frame, self.shwind)
+
+    def residuals_frame_f06_v0(self, frame):
         assert isinstance(frame, np.ndarray)
         assert frame.ndim==2
         corners = corners2d(frame.shape, self.shwind)
@@ -277,12 +315,16 @@ class DataProc:
         ngframes = self.inds_good_frames.size
         shape_res = (ngframes,) + self.shape_fr
         block_res = np.zeros(shape_res, dtype=float)
+        nbatch = max(1, int(uc.MAX_CHUNK_BYTES // (8 * 2 * np.prod(self.shape_fr)))) # frames per batch of plane fits
 
-        for i, igood in enumerate(self.inds_good_frames):
-            frame = self.block[igood,:] & self.databits
-            logger.debug(info_ndarr(frame, '%04d frame data' % igood))
-            block_res[i,:] = res = self.residuals_frame_f06(frame) #  self.block[0,:])
+        for i0 in range(0, ngframes, nbatch):
+            inds = self.inds_good_frames[i0:i0+nbatch]
+            frames = self.block[inds,:] & self.databits
+            logger.debug(info_ndarr(frames, 'frames %04d-%04d data' % (inds[0], inds[-1])))
+            block_res[i0:i0+inds.size,:] = residuals_to_plane_windows(frames, self.shwind)
 
+        for i, igood in enumerate(self.inds_good_frames):
+            res = block_res[i,:]
             res_med = np.median(res)
             res_spr = np.median(np.absolute(res - res_med))
 
@@ -50,6 +50,7 @@ Usage::
 
     # access to Acqiris data
     det.set_correct_acqiris_time(correct_time=True) # (by default)
+    det.set_acqiris_dtype(dtype=np.float32) # dtype of waveforms and times, np.float64 by default
     wf, wt = det.raw(evt)
     # returns two np.array-s with shape = (nbrChannels, nbrSamples) for waveform and associated timestamps or (single) None.
 
@@ -171,6 +172,12 @@ class WFDetector():
         self.pyda.set_correct_acqiris_time(correct_time)
 
 
+    def set_acqiris_dtype(self, dtype=np.float64):
+        """Sets dtype of acqiris waveforms and times
+        """
+        self.pyda.set_acqiris_dtype(dtype)
+
+
     def set_calib_imp(self, do_calib_imp=False):
         """On/off imp calibration
         """
@@ -186,14 +193,15 @@ class WFDetector():
     def waveform(self, evt):
         """Returns np.array with waveforms
         """
-        rdata = self.raw(evt)
-
         if self.dettype == gu.ACQIRIS:
+            rdata = self.pyda.raw_data_acqiris(evt, self.env, do_wt=False)
             if rdata is None: return None
             wf, wt = rdata
             return wf
 
-        elif self.dettype == gu.IMP:
+        rdata = self.raw(evt)
+
+        if self.dettype == gu.IMP:
             return rdata # returns np.array with shape=(4,1023) or None
 
         print('WARNING! %s: data for source %s is not found'%\
@@ -204,14 +212,16 @@ class WFDetector():
     def wftime(self, evt):
         """Returns np.array with waveform sample time
         """
-        rdata = self.raw(evt)
-        if rdata is None: return None
-
         if self.dettype == gu.ACQIRIS:
+            rdata = self.pyda.raw_data_acqiris(evt, self.env, do_wf=False)
+            if rdata is None: return None
             wf, wt = rdata
             return wt
 
-        elif self.dettype == gu.IMP:
+        rdata = self.raw(evt)
+        if rdata is None: return None
+
+        if self.dettype == gu.IMP:
             return list(range(rdata.shape[1])) # returns list of integer numbers from 0 to 1022 for wf shape=(4,1023)
 
         print('WARNING! %s: data for source %s is not found'%\
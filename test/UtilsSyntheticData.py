@@ -0,0 +1,126 @@
+"""
+:py:class:`UtilsSyntheticData` - synthetic raw data and calibration constants for tests and benchmarks of calibration kernels
+===============================================================================================================================
+
+DetCache objects of jungfrau and epix10ka are created from arrays of constants w/o detector and event objects.
+Helper module of Detector/test, it is not installed with package; examples add Detector/test to sys.path.
+
+Usage ::
+
+    from UtilsSyntheticData import synthetic_jungfrau, SyntheticDetCacheJungfrau,\
+                                   synthetic_epix10ka_constants, SyntheticDetCacheEpix10ka
+
+    raw, poff, gfac, mask = synthetic_jungfrau(nsegs=8, seed=1234)
+    odc = SyntheticDetCacheJungfrau(poff, gfac, mask, cmps=(7,0,200,10))
+    res = calib_jungfrau_fused(raw, odc)
+
+    peds, gfac, mask = synthetic_epix10ka_constants(sh=(16, 352, 384), seed=1234)
+    odc = SyntheticDetCacheEpix10ka(peds, gfac, mask, cmps=(7,0,100,10))
+    odc.set_step_constants(ocb) # for ConfigBits ocb
+    res = calib_epix10ka_fused(raw, odc)
+
+    det = SyntheticDetectorEpix10ka(pcas, trbits=(1,1,1,1)) # det.env.configStore() with epix10ka2m configuration
+    ocb = config_bits(det)
+
+This software was developed for the SIT project.
+If you use all or part of it, please give an appropriate acknowledgment.
+
+Created on 2026-10-18
+"""
+
+import threading
+import numpy as np
+import Detector.UtilsJungfrau as uj
+import Detector.UtilsEpix10ka as ue
+
+
+def synthetic_jungfrau(nsegs=8, seed=1234):
+    """Returns raw with gain bits, poff, gfac, mask shaped as for <nsegs>-panel jungfrau."""
+    rng = np.random.default_rng(seed)
+    sh = (nsegs, 512, 1024)
+    gbits = rng.choice((0,1,3,2), size=sh, p=(0.9,0.05,0.04,0.01)).astype(np.uint16)
+    raw = rng.integers(2500, 3500, size=sh).astype(np.uint16) | (gbits<<14)
+    poff = rng.normal(3000, 20, size=(3,)+sh).astype(np.float32)
+    gfac = rng.normal(0.027, 0.002, size=(3,)+sh).astype(np.float32)
+    mask = (rng.random(sh) > 0.01).astype(np.uint8)
+    return raw, poff, gfac, mask
+
+
+def synthetic_epix10ka_constants(sh=(16, 352, 384), seed=1234):
+    """Returns peds, gfac for 7 gain ranges and mask shaped as sh for epix10ka panels."""
+    rng = np.random.default_rng(seed)
+    peds = rng.normal(2500, 20, size=(7,)+tuple(sh)).astype(np.float32)
+    gfac = rng.normal(0.06, 0.005, size=(7,)+tuple(sh)).astype(np.float32)
+    mask = (rng.random(sh) > 0.01).astype(np.uint8)
+    return peds, gfac, mask
+
+
+class SyntheticDetCacheJungfrau(uj.DetCache):
+    """jungfrau DetCache with constants from arrays in stead of det.pedestals/gain/offset."""
+    def __init__(self, poff, gfac, mask, cmps):
+        self.poff = poff
+        self.gfac = gfac
+        self.mask = mask
+        self.cmps = cmps
+        self.outa = np.zeros(poff.shape[1:], dtype=np.float32)
+        self.detname = 'synthetic_jungfrau'
+        self.pool = None
+        self.nthreads = 0
+        self.set_fused_constants()
+
+
+class SyntheticDetCacheEpix10ka(ue.DetCache):
+    """epix10ka DetCache with constants from arrays in stead of det.pedestals/gain and mask."""
+    def __init__(self, peds, gfac, mask, cmps):
+        self.peds = peds
+        self.gfac = gfac
+        self.mask = mask
+        self.cmps = cmps
+        self.aone = np.ones(peds.shape[1:], dtype=np.int8)
+        self.outa = np.zeros(peds.shape[1:], dtype=np.float32)
+        self.detname = 'synthetic_epix10ka'
+        self.pool = None
+        self.nthreads = 0
+        self.gidx0 = None
+        self.tls = threading.local()
+
+
+class SyntheticPanelConfig():
+    """psana.Epix.Config10ka-like panel configuration with pixel config array and ASIC trbits."""
+    def __init__(self, pca, trbits=(1,1,1,1)): self.pca, self.trbits = pca, trbits
+    def asicPixelConfigArray(self): return self.pca
+    def numberOfAsics(self): return len(self.trbits)
+    def asics(self, i): return SyntheticAsicConfig(self.trbits[i])
+
+
+class SyntheticAsicConfig():
+    def __init__(self, trbit): self._trbit = trbit
+    def trbit(self): return self._trbit
+
+
+class SyntheticDetConfig():
+    """psana.Epix.Config10ka2M-like detector configuration with panel configurations."""
+    def __init__(self, ecos): self.ecos = ecos
+    def numberOfElements(self): return len(self.ecos)
+    def elemCfg(self, i): return self.ecos[i]
+
+
+class SyntheticConfigStore():
+    """Config store returning detector configuration cob for any type, new_wrappers=True - its copy for each call."""
+    def __init__(self, cob, new_wrappers=False): self.cob, self.new_wrappers = cob, new_wrappers
+    def get(self, t, src): return SyntheticDetConfig(self.cob.ecos) if self.new_wrappers else self.cob
+
+
+class SyntheticEnv():
+    def __init__(self, store): self.store = store
+    def configStore(self): return self.store
+
+
+class SyntheticDetectorEpix10ka():
+    """Detector-like object with name, source and env of epix10ka2m configuration for pixel config arrays pcas."""
+    def __init__(self, pcas, trbits=(1,1,1,1), new_wrappers=False, name='synthetic_epix10ka'):
+        cob = SyntheticDetConfig([SyntheticPanelConfig(pca, trbits) for pca in pcas])
+        self.env = SyntheticEnv(SyntheticConfigStore(cob, new_wrappers))
+        self.name = self.source = name
+
+# EOF
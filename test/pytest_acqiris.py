@@ -0,0 +1,82 @@
+"""
+   Regression test of vectorized PyDetectorAccess.raw_data_acqiris against the per-segment loop raw_data_acqiris_v0
+   with mock Acqiris data and config objects.
+
+   Usage::
+   pytest Detector/test/pytest_acqiris.py
+
+   # for debugging
+   python Detector/test/pytest_acqiris.py
+"""
+import sys
+from Detector.GlobalUtils import np, info_ndarr
+import Detector.PyDetectorAccess as pyda
+
+
+class Mock():
+    """object with methods returning values of keyword arguments, e.g. Mock(pos=1.5).pos() returns 1.5"""
+    def __init__(self, **kwa):
+        for k, v in kwa.items(): setattr(self, k, lambda v=v: v)
+
+
+def mock_acqiris(nchan=3, nseg=4, nsis=100, ifp=5, si=1e-9, seed=1234):
+    """returns mock data and config objects with segment positions shifting segments by up to 3 samples,
+       so the last segment is clipped by nbrSamples.
+    """
+    rng = np.random.default_rng(seed)
+    elems = [Mock(nbrSegments=nseg, nbrSamplesInSeg=nsis, indexFirstPoint=ifp,\
+                  timestamp=[Mock(pos=p) for p in rng.uniform(0, 3*si, size=nseg)],\
+                  waveforms=rng.integers(-2000, 2000, size=(nseg, nsis+ifp)).astype(np.int16)) for ch in range(nchan)]
+    d = Mock()
+    d.data = lambda ch: elems[ch]
+    c = Mock(nbrChannels=nchan, horiz=Mock(sampInterval=si, nbrSamples=nseg*nsis),\
+             vert=[Mock(slope=rng.uniform(0.001, 0.01), offset=rng.uniform(-0.1, 0.1)) for ch in range(nchan)])
+    return d, c
+
+
+def pyda_acqiris(monkeypatch, **kwa):
+    d, c = mock_acqiris(**kwa)
+    monkeypatch.setattr(pyda.pda, 'get_acqiris_data_object', lambda evt, src: d)
+    monkeypatch.setattr(pyda.pda, 'get_acqiris_config_object', lambda env, src: c)
+    o = pyda.PyDetectorAccess.__new__(pyda.PyDetectorAccess)
+    o.source, o.pbits = None, 0
+    o.correct_time = True
+    o.acqiris_tgrid_key = None
+    o.set_acqiris_dtype(np.float64)
+    return o
+
+
+def test_raw_data_acqiris(monkeypatch):
+    print(sys._getframe().f_code.co_name)
+    o = pyda_acqiris(monkeypatch)
+    for correct_time in (True, False):
+        o.set_correct_acqiris_time(correct_time)
+        wf0, wt0 = o.raw_data_acqiris_v0(None, None)
+        wf, wt = o.raw_data_acqiris(None, None)
+        print(info_ndarr(wf, 'wf'))
+        assert np.array_equal(wf, wf0)
+        assert np.array_equal(wt, wt0)
+
+
+def test_raw_data_acqiris_out(monkeypatch):
+    print(sys._getframe().f_code.co_name)
+    o = pyda_acqiris(monkeypatch)
+    wf0, wt0 = o.raw_data_acqiris_v0(None, None)
+    o.set_acqiris_dtype(np.float32)
+    out = (np.ones(wf0.shape, dtype=np.float32), np.ones(wt0.shape, dtype=np.float32))
+    wf, wt = o.raw_data_acqiris(None, None, out=out)
+    assert wf is out[0] and wt is out[1]
+    assert np.array_equal(wf, wf0.astype(np.float32))
+    assert np.array_equal(wt, wt0.astype(np.float32))
+    wf, wt = o.raw_data_acqiris(None, None, do_wt=False)
+    assert wt is None and wf.dtype == np.float32
+    wf, wt = o.raw_data_acqiris(None, None, out=out, do_wf=False)
+    assert wf is None and wt is out[1]
+
+
+if __name__ == '__main__':
+  """DEBUGGING, WORKS ONLY FOR COMMAND: python Detector/test/pytest_acqiris.py"""
+  import pytest
+  pytest.main([__file__])
+
+# EOF
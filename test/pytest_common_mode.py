@@ -0,0 +1,68 @@
+"""
+   Test of bit-identity of vectorized common mode correction UtilsCommonMode.common_mode_segments
+   (np.partition-based median_masked) against legacy loop over segments and banks for jungfrau and epix10ka.
+
+   Usage::
+   pytest Detector/test/pytest_common_mode.py
+
+   # for debugging
+   python Detector/test/pytest_common_mode.py
+"""
+import sys
+from Detector.GlobalUtils import np, info_ndarr
+import Detector.UtilsCommonMode as ucm
+import Detector.UtilsJungfrau as uj
+import Detector.UtilsEpix10ka as ue
+
+
+def synthetic_data(sh, seed=1234):
+    """Returns pedestal-subtracted data with common mode offsets per row and mask of good pixels."""
+    rng = np.random.default_rng(seed)
+    arrf = rng.normal(0, 5, size=sh).astype(np.float32)
+    arrf += rng.normal(0, 20, size=sh[:-1]+(1,)).astype(np.float32)
+    gmask = rng.random(sh) > 0.05
+    gmask[0,:3,:] = False # rows w/o good pixels
+    return arrf, gmask
+
+
+def vect_vs_loop(func, sh, mode, cormax=100, npixmin=10):
+    print(sys._getframe().f_code.co_name, func.__name__, 'mode:', mode)
+    arrf, gmask = synthetic_data(sh)
+    res = arrf.copy()
+    ref = arrf.copy()
+    func(res, gmask, (7, mode, cormax, npixmin, ucm.CMENGINE_VECT))
+    func(ref, gmask, (7, mode, cormax, npixmin, ucm.CMENGINE_LOOP))
+    print(info_ndarr(res-arrf, 'common mode'))
+    assert not np.array_equal(res, arrf)
+    assert res.dtype == ref.dtype and np.array_equal(res, ref)
+
+
+def test_median_masked():
+    print(sys._getframe().f_code.co_name)
+    arrf, gmask = synthetic_data((2, 176, 48))
+    for axes in ((-1,), (-2,), (-2,-1)):
+        med, npix = ucm.median_masked(arrf, gmask, axes=axes)
+        ref = np.ma.median(np.ma.array(arrf, mask=~gmask), axis=axes).filled(0)
+        assert np.array_equal(med, ref)
+        assert np.array_equal(npix, gmask.sum(axis=axes))
+        med, npix = ucm.median_masked(arrf, axes=axes)
+        assert np.array_equal(med, np.median(arrf, axis=axes))
+
+
+def test_common_mode_jungfrau():
+    for mode in (1, 2, 4, 7):
+        vect_vs_loop(uj.common_mode_jungfrau, (2, 512, 1024), mode)
+
+
+def test_common_mode_epix10ka():
+    for mode in (1, 2, 4, 7):
+        vect_vs_loop(ue.common_mode_epix10ka, (2, 352, 384), mode)
+
+
+if __name__ == '__main__':
+  """DEBUGGING, WORKS ONLY FOR COMMAND: python Detector/test/pytest_common_mode.py"""
+  test_median_masked()
+  test_common_mode_jungfrau()
+  test_common_mode_epix10ka()
+
+# EOF
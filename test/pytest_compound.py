@@ -0,0 +1,105 @@
+"""
+   Tests of AreaDetectorCompound output buffers, sub-detector calls in threads and cached image plan
+   with mock sub-detectors in stead of AreaDetector.
+
+   Usage::
+   pytest Detector/test/pytest_compound.py
+
+   # for debugging
+   python Detector/test/pytest_compound.py
+"""
+import sys
+from Detector.GlobalUtils import np, info_ndarr
+import Detector.AreaDetectorCompound as adc
+import Detector.UtilsCalibCache as ucc
+
+
+class MockDetector():
+    """AreaDetector-like object with raw, calib, pedestals and indexes_xy for name like 'nsegs:seed'."""
+    def __init__(self, name, env):
+        nsegs, seed = [int(v) for v in name.split(':')]
+        rng = np.random.default_rng(seed)
+        self.sh = (nsegs, 8, 12)
+        self.peds = rng.normal(100, 10, size=(3,)+self.sh).astype(np.float32)
+        self.ix = (rng.permutation(nsegs*96).reshape(self.sh) % 40 + 40*seed)
+        self.iy = np.arange(nsegs*96).reshape(self.sh) % 30
+        self.ncalls_xy = 0
+
+    def do_reshape_2d_to_3d(self, flag=False): pass
+
+    def _out_(self, out, nda):
+        if out is None: return nda
+        np.copyto(out, nda)
+        return out
+
+    def raw(self, evt, out=None):
+        return self._out_(out, (np.arange(np.prod(self.sh)).reshape(self.sh) + evt).astype(np.uint16))
+
+    def calib(self, evt, cmpars=None, out=None, **kwargs):
+        return self._out_(out, self.raw(evt) - self.peds[0])
+
+    def pedestals(self, par):
+        return self.peds
+
+    def indexes_xy(self, evt, pix_scale_size_um=None, xy0_off_pix=None, do_update=False):
+        self.ncalls_xy += 1
+        return self.ix, self.iy
+
+
+def compound(monkeypatch, **kwa):
+    monkeypatch.setattr(adc, 'AreaDetector', MockDetector)
+    return adc.AreaDetectorCompound(['2:1', '1:2'], None, **kwa)
+
+
+def test_compound_buffers(monkeypatch):
+    print(sys._getframe().f_code.co_name)
+    det = compound(monkeypatch)
+    refs = [np.concatenate([o.calib(evt) for o in det.list_dets]) for evt in (0, 1, 2)]
+    peds = np.concatenate([o.peds for o in det.list_dets], axis=1)
+    assert np.array_equal(det.calib(0), refs[0])
+    assert np.array_equal(det.pedestals(0), peds)
+    for nthreads in (0, 2):
+        det.set_nthreads(nthreads)
+        det.set_use_buffers(True)
+        res = [det.calib(evt) for evt in (0, 1, 2)]
+        assert res[2] is res[0] and res[2] is det.buffer('calib', (3, 8, 12))
+        assert np.array_equal(res[2], refs[2])
+        assert np.array_equal(det.pedestals(0), peds)
+        assert det.pedestals(0) is det.pedestals(1)
+    det.set_use_buffers(False)
+    out = np.empty((3, 8, 12), dtype=np.float32)
+    assert det.calib(1, out=out) is out
+    assert np.array_equal(out, refs[1])
+    res = det.calib(1)
+    assert res is not out and np.array_equal(res, refs[1])
+    assert det.pool in ucc._thread_pools
+    ucc.close_thread_pools() # as at exit
+    assert not ucc._thread_pools
+    try:
+        det.pool.apply(len, ((),))
+        assert False, 'thread pool is not terminated'
+    except ValueError: pass
+
+
+def test_compound_image(monkeypatch):
+    print(sys._getframe().f_code.co_name)
+    det = compound(monkeypatch)
+    raw = det.raw(0)
+    ix = np.concatenate([o.ix for o in det.list_dets])
+    iy = np.concatenate([o.iy for o in det.list_dets])
+    img = det.image(0, nda_in=raw)
+    ref = np.zeros(img.shape, dtype=np.float32)
+    ref[ix.ravel(), iy.ravel()] = raw.ravel()
+    print(info_ndarr(img, 'image'))
+    assert np.array_equal(img, ref)
+    inds = det._img_plans['image'][1]
+    assert np.array_equal(det.image(1, nda_in=raw, out=img), ref)
+    assert det._img_plans['image'][1] is inds
+
+
+if __name__ == '__main__':
+  """DEBUGGING, WORKS ONLY FOR COMMAND: python Detector/test/pytest_compound.py"""
+  import pytest
+  pytest.main([__file__])
+
+# EOF
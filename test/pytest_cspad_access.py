@@ -0,0 +1,84 @@
+"""
+   Tests of CSPAD raw data assembly plan and vectorized gain mask unpacking in PyDetectorAccess
+   against the per-segment loops of previous implementation with mock data and config objects.
+
+   Usage::
+   pytest Detector/test/pytest_cspad_access.py
+
+   # for debugging
+   python Detector/test/pytest_cspad_access.py
+"""
+import sys
+from Detector.GlobalUtils import np, info_ndarr
+import Detector.PyDetectorAccess as pyda
+
+
+def gain_mask_2x1s_v0(gm, n2x1):
+    """gain mask unpacked in loop over 2x1s as in PyDetectorAccess.cspad_gain_mask before vectorization"""
+    res = np.zeros((n2x1,185,388), dtype=np.uint8)
+    asic1 = np.ones((185,194), dtype=np.uint8)
+    gm = np.array(gm)
+    for i2x1 in range(n2x1):
+        gmasic0 = gm & 1
+        gm = np.right_shift(gm, asic1)
+        res[i2x1] = np.logical_not(np.hstack((gmasic0, gm & 1)))
+        if i2x1 < n2x1-1: gm = np.right_shift(gm, asic1)
+    return res
+
+
+class MockQuad():
+    def __init__(self, qnum, data): self.qnum, self.qdata = qnum, data
+    def quad(self): return self.qnum
+    def data(self): return self.qdata
+
+
+class MockData():
+    def __init__(self, quads): self.lst = quads
+    def quads_shape(self): return (len(self.lst),)
+    def quads(self, i): return self.lst[i]
+
+
+class MockConfig():
+    def __init__(self, roims): self.roims = roims
+    def numQuads(self): return len(self.roims)
+    def roiMask(self, q): return self.roims[q]
+
+
+def test_gain_mask_2x1s():
+    print(sys._getframe().f_code.co_name)
+    rng = np.random.default_rng(1234)
+    for n2x1 in (8, 2):
+        gm = rng.integers(0, 1<<(2*n2x1), size=(185,194)).astype(np.uint16)
+        res = pyda.gain_mask_2x1s(gm, n2x1)
+        print(info_ndarr(res, 'gain mask n2x1=%d' % n2x1))
+        assert res.dtype == np.uint8
+        assert np.array_equal(res, gain_mask_2x1s_v0(gm, n2x1))
+
+
+def test_raw_data_cspad_plan(monkeypatch):
+    print(sys._getframe().f_code.co_name)
+    rng = np.random.default_rng(1234)
+    roims = (0o377, 0o375, 0o377, 0o017)
+    quads = [MockQuad(q, rng.integers(0, 1<<14, size=(bin(m).count('1'),185,388)).astype(np.int16))\
+             for q, m in enumerate(roims)][::-1]
+    d, c = MockData(quads), MockConfig(roims)
+    monkeypatch.setattr(pyda.pda, 'get_cspad_data_object', lambda evt, src: d)
+    monkeypatch.setattr(pyda.pda, 'get_cspad_config_object', lambda env, src: c)
+    o = pyda.PyDetectorAccess.__new__(pyda.PyDetectorAccess)
+    o.source, o.pbits, o.cspad_plan = None, 0, {}
+    ref = o.raw_data_cspad_v0(None, None)
+    out = np.full((32,185,388), 7, dtype=np.int16)
+    for i in range(2):
+        res = o.raw_data_cspad(None, None, out=out)
+        assert np.shares_memory(res, out)
+        assert np.array_equal(res.reshape(4,8,185,388)[::-1], ref.reshape(4,8,185,388)) # v0 stacks quads in data order
+    assert sorted(o.cspad_plan.keys()) == [0o017, 0o375]
+
+
+if __name__ == '__main__':
+  """DEBUGGING, WORKS ONLY FOR COMMAND: python Detector/test/pytest_cspad_access.py"""
+  test_gain_mask_2x1s()
+  import pytest
+  pytest.main([__file__, '-k', 'test_raw_data_cspad_plan'])
+
+# EOF
@@ -0,0 +1,169 @@
+"""
+   Tests of streaming mode of UtilsCalib.DarkProc against processing with the block of nrecs1 frames
+   and of statistics merged from DarkProc objects for subsets of events
+   on synthetic dark frames with gaussian noise, hot and cold pixels,
+   chunked block quantiles and gated sums against np.quantile and per-record loop.
+
+   Usage::
+   pytest Detector/test/pytest_darkproc.py
+
+   # for debugging
+   python Detector/test/pytest_darkproc.py
+"""
+import sys
+from Detector.GlobalUtils import np, info_ndarr
+import Detector.UtilsCalib as uc
+
+
+def synthetic_darks(nrecs=500, sh=(32, 48), seed=1234):
+    """Returns list of uint16 dark frames with random pedestals and noise, noisy, hot and dead pixels."""
+    rng = np.random.default_rng(seed)
+    peds = rng.normal(3000, 100, size=sh)
+    sigma = rng.normal(10, 1, size=sh)
+    sigma[3,:5] = 100 # noisy
+    frames = [rng.normal(peds, sigma) for i in range(nrecs)]
+    for f in frames:
+        f[5,:5] = 16300 # saturated
+        f[7,:5] = 0     # dead
+    return [np.clip(f, 0, 0x3fff).astype(np.uint16) for f in frames]
+
+
+def dark_proc(frames, summary=True, selected=None, nrecs=None, **kwa):
+    dpo = uc.DarkProc(nrecs=len(frames) if nrecs is None else nrecs, nrecs1=100, plotim=0, **kwa)
+    for i, raw in enumerate(frames):
+        if selected is not None and not selected(i): continue # e.g. evcode or evskip selection
+        if not dpo.is_own_event(i): continue
+        if dpo.event(raw, i) == 2: break
+    if summary: dpo.summary()
+    return dpo
+
+
+def test_dark_proc_stream():
+    print(sys._getframe().f_code.co_name)
+    frames = synthetic_darks()
+    o1 = dark_proc(frames)
+    o2 = dark_proc(frames, stream=True, nrecs0=10)
+    print(info_ndarr(o2.arr_av1 - o1.arr_av1, 'stream - block arr_av1'))
+    assert o2.block is None
+    good = o1.arr_sta == 0
+    dav1 = np.abs(o2.arr_av1 - o1.arr_av1)[good] # statistical error of gated average ~0.5 ADU
+    assert dav1.mean() < 0.5 and dav1.max() < 2.5
+    rrms = o2.arr_rms[good] / o1.arr_rms[good] # rms of gated statistics depends on gates
+    print(info_ndarr(rrms, 'stream / block arr_rms'))
+    assert abs(np.median(rrms) - 1) < 0.02 and np.mean(np.abs(rrms - 1) < 0.15) > 0.99
+    assert np.allclose(o2.arr_med[good], o1.arr_med[good], atol=6.)
+    assert np.mean(o2.arr_sta == o1.arr_sta) > 0.99
+    for r in (3,5,7): assert np.all(o2.arr_sta[r,:5] > 0)
+    block = np.array(frames[:10])
+    o2.init_stream(block) # streaming quantiles are initialized as in proc_block
+    assert np.array_equal(o2.arr_qlo, uc.quantile(block, o2.fraclo, method='lower').astype(np.float32))
+    assert np.array_equal(o2.arr_qhi, uc.quantile(block, o2.frachi, method='higher').astype(np.float32))
+
+
+def update_gates_v0(o, raw):
+    """reference: former update of streaming estimators with full-frame temporaries."""
+    o.nstream += 1
+    step = np.maximum(o.abs_dev, 0.5) * np.float32(1.4826/o.nstream)
+    clo, cmed, chi, cdev = o.sa_coefs
+    adev = np.abs(raw - o.arr_med)
+    for q, p, c, x in ((o.arr_qlo, o.fraclo, clo, raw), (o.arr_med, 0.5, cmed, raw),\
+                       (o.arr_qhi, o.frachi, chi, raw), (o.abs_dev, 0.5, cdev, adev)):
+        q += step * np.float32(c) * (np.float32(p) - (x < q))
+    np.copyto(o.gate_lo, np.maximum(np.floor(o.arr_qlo), o.int_lo), casting='unsafe')
+    np.copyto(o.gate_hi, np.minimum(np.ceil(o.arr_qhi), o.int_hi), casting='unsafe')
+    o.gate_hi[o.gate_hi <= o.gate_lo] += 1
+
+
+def test_update_gates(monkeypatch):
+    print(sys._getframe().f_code.co_name)
+    monkeypatch.setattr(uc, 'SA_CHUNK_PIXELS', 500) # 1536 pixels in 4 chunks, the last is partial
+    frames = synthetic_darks(nrecs=60)
+    lst = []
+    for i in range(2):
+        o = dark_proc(frames[:11], summary=False, nrecs=100, stream=True, nrecs0=10)
+        assert o.sa_bufs[0].shape == (500,)
+        lst.append(o)
+    for raw in frames[11:]:
+        _raw = raw & lst[0].datbits
+        lst[0].update_gates(_raw)
+        update_gates_v0(lst[1], _raw)
+    for k in ('arr_qlo', 'arr_med', 'arr_qhi', 'abs_dev', 'gate_lo', 'gate_hi'):
+        assert np.array_equal(getattr(lst[0], k), getattr(lst[1], k)), k
+
+
+def test_dark_proc_merged(tmp_path):
+    print(sys._getframe().f_code.co_name)
+    frames = synthetic_darks()
+    o1 = dark_proc(frames)
+    lst = [dark_proc(frames, summary=False, rank=r, nranks=3) for r in range(3)]
+    assert sum(o.stats.nrecs for o in lst) == len(frames)
+    fname = str(tmp_path / 'stats.npz')
+    lst[2].stats.save(fname)
+    o2 = lst[0]
+    o2.merge_stats(uc.DarkStats.deserialize(lst[1].stats.serialize()))
+    o2.merge_stats(uc.DarkStats.load(fname))
+    o2.summary()
+    assert o2.counter == o1.counter
+    for k in ('arr_sum0', 'sta_int_lo', 'sta_int_hi', 'arr_max', 'arr_min', 'arr_sta'):
+        assert np.array_equal(getattr(o2, k), getattr(o1, k)), k
+    assert np.allclose(o2.arr_av1, o1.arr_av1, rtol=1e-12)
+    assert np.allclose(o2.arr_rms, o1.arr_rms, rtol=1e-6)
+
+
+def test_block_quantiles():
+    print(sys._getframe().f_code.co_name)
+    block = np.array(synthetic_darks(nrecs=101))
+    qpars = ((0.5, 'linear'), (0.05, 'lower'), (0.95, 'higher'), (0.3, 'linear'))
+    for max_bytes in (uc.MAX_CHUNK_BYTES, 5000):
+        res = uc.block_quantiles(block, qpars, datbits=0x3fff, abs_dev=True, max_bytes=max_bytes)
+        for r, (q, method) in zip(res, qpars):
+            assert np.array_equal(r, uc.quantile(block & 0x3fff, q, axis=0, method=method)), (q, method)
+        assert np.array_equal(res[-1], np.median(np.abs(block - res[0]), axis=0))
+        med = np.median(block[:50], axis=0) + 0.25
+        assert np.array_equal(uc.block_median_abs_dev(block, med, max_bytes=max_bytes), np.median(np.abs(block - med), axis=0))
+
+
+def test_block_gated_sums():
+    print(sys._getframe().f_code.co_name)
+    block = np.array(synthetic_darks(nrecs=101))
+    gate_lo = np.full(block.shape[1:], 2950, dtype=np.uint16)
+    gate_hi = np.full(block.shape[1:], 3050, dtype=np.uint16)
+    res = uc.block_gated_sums(block, gate_lo, gate_hi, 1, 16000, max_bytes=5000)
+    stats = uc.DarkStats(block.shape[1:])
+    for raw in block: stats.add(raw, gate_lo, gate_hi, 1, 16000)
+    for k, r in zip(('arr_sum0', 'arr_sum1', 'arr_sum2', 'sta_int_lo', 'sta_int_hi'), res):
+        assert np.array_equal(r, stats.arrays[k]), k
+
+
+def test_dark_proc_merged_selected():
+    """events dropped by selection in all ranks do not unbalance ranks"""
+    print(sys._getframe().f_code.co_name)
+    frames = synthetic_darks(nrecs=600)
+    nrecs = 200
+    sel = lambda i: i % 3 == 0
+    o1 = dark_proc(frames, selected=sel, nrecs=nrecs)
+    assert o1.stats.nrecs == nrecs
+    lst = [dark_proc(frames, summary=False, selected=sel, nrecs=nrecs, rank=r, nranks=3) for r in range(3)]
+    for o in lst: print('rank %d nrecs %d' % (o.rank, o.stats.nrecs))
+    assert all(o.stats is not None and o.stats.nrecs > 0 for o in lst[1:])
+    assert sum(o.stats.nrecs for o in lst) == nrecs
+    o2 = lst[0]
+    for o in lst[1:]: o2.merge_stats(o.stats)
+    o2.summary()
+    for k in ('arr_sum0', 'arr_max', 'arr_min', 'arr_sta'):
+        assert np.array_equal(getattr(o2, k), getattr(o1, k)), k
+    assert np.allclose(o2.arr_av1, o1.arr_av1, rtol=1e-12)
+
+
+if __name__ == '__main__':
+  """DEBUGGING, WORKS ONLY FOR COMMAND: python Detector/test/pytest_darkproc.py"""
+  test_dark_proc_stream()
+  import pytest
+  with pytest.MonkeyPatch.context() as mp: test_update_gates(mp)
+  test_block_quantiles()
+  test_block_gated_sums()
+  import tempfile, pathlib
+  test_dark_proc_merged(pathlib.Path(tempfile.mkdtemp()))
+  test_dark_proc_merged_selected()
+
+# EOF
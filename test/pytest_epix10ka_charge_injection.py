@@ -0,0 +1,164 @@
+"""
+   Test of single-pass calib-cycle collector and checkpoint of UtilsEpix10kaCalib.offset_calibration.
+
+   Usage::
+   pytest Detector/test/pytest_epix10ka_charge_injection.py
+
+   # for debugging
+   python Detector/test/pytest_epix10ka_charge_injection.py
+"""
+import os
+import sys
+from glob import glob
+from Detector.GlobalUtils import np, info_ndarr
+import Detector.UtilsEpix10kaCalib as uec
+
+
+class EventIdMock():
+    def __init__(self, fid): self.fid = fid
+    def fiducials(self): return self.fid
+
+
+class EventMock():
+    def __init__(self, raw, fid): self.raw, self.fid = raw, fid
+    def get(self, t): return EventIdMock(self.fid)
+
+
+class StepMock():
+    def __init__(self, evts): self.evts = evts
+    def events(self): return iter(self.evts)
+
+
+class DetMock():
+    ncalls = 0
+    def raw(self, evt):
+        DetMock.ncalls += 1
+        return evt.raw
+
+
+def step_mock(nevts, sh=(2, 35, 42), fid_gap=None):
+    rng = np.random.default_rng(4321)
+    evts, fid = [], 1000
+    for i in range(nevts):
+        fid += 6 if i == fid_gap else 3
+        raw = None if i in (5, 17) else rng.integers(0, 1<<15, size=sh, dtype=np.uint16).astype(np.int16)
+        evts.append(EventMock(raw, fid))
+    return StepMock(evts)
+
+
+def collect_v0(step, idx, nbs, jy, jx, nspace):
+    """reference: former loop of offset_calibration accumulating full frames."""
+    nbs_half = int(nbs/2)
+    nrec, fid_old = -1, None
+    block = np.zeros((nbs,) + step.evts[0].raw.shape[1:], dtype=np.int16)
+    evnum = np.zeros((nbs,), dtype=np.int16)
+    for nevt, evt in enumerate(step.events()):
+        raw = evt.raw
+        if raw is None: continue
+        if nrec>nbs-2: break
+        fid = evt.get(None).fiducials()
+        if fid_old is not None and fid-fid_old != 3:
+            if nrec < nbs_half: nrec = -1
+            else: break
+        fid_old = fid
+        nrec += 1
+        block[nrec] = raw[idx,:]
+        evnum[nrec] = nevt
+    ny, nx = block.shape[1:]
+    return block[:nrec,jy:ny:nspace,jx:nx:nspace], evnum[:nrec]
+
+
+def test_collect_step_block():
+    print(sys._getframe().f_code.co_name)
+    idx, nbs, nspace, jy, jx = 1, 64, 7, 3, 5
+    for nevts, fid_gap in ((50, None), (50, 10), (100, 40), (100, None)):
+        step = step_mock(nevts, fid_gap=fid_gap)
+        ny, nx = step.evts[0].raw.shape[1:]
+        ref_block, ref_evnum = collect_v0(step, idx, nbs, jy, jx, nspace)
+        sel = np.s_[jy:ny:nspace,jx:nx:nspace]
+        block = np.zeros((nbs, len(range(jy,ny,nspace)), len(range(jx,nx,nspace))), dtype=np.int16)
+        evnum = np.zeros((nbs,), dtype=np.int16)
+        DetMock.ncalls = 0
+        nevt, nrec, msg, raw = uec.collect_step_block(step, DetMock(), idx, block, evnum, sel, check_fid=True,\
+                                                      proc_raw=lambda nevt, nrec, raw: '.', gmname='AML')
+        print(info_ndarr(block[:nrec], 'nevts:%d fid_gap:%s nrec:%d block' % (nevts, str(fid_gap), nrec)))
+        assert DetMock.ncalls == nevt+1
+        assert np.array_equal(block[:nrec], ref_block)
+        assert np.array_equal(evnum[:nrec], ref_evnum)
+        assert raw.shape == (ny, nx)
+
+
+def test_collect_step_block_mask():
+    print(sys._getframe().f_code.co_name)
+    idx, nbs, mask = 0, 16, 0x3fff
+    step = step_mock(12)
+    sel = np.s_[:,:]
+    block = np.zeros((nbs,) + step.evts[0].raw.shape[1:], dtype=np.int16)
+    raws = []
+    def proc_raw(nevt, nrec, raw):
+        raws.append(raw)
+        return '.'
+    nevt, nrec, msg, last = uec.collect_step_block(step, DetMock(), idx, block, sel=sel, mask=mask, proc_raw=proc_raw)
+    ref = [e.raw[idx,:] for e in step.evts if e.raw is not None]
+    assert len(raws) == len(ref) == nrec+1
+    for rec, (raw, r) in enumerate(zip(raws, ref)):
+        assert np.array_equal(raw, r)
+        assert np.array_equal(block[rec], r & mask)
+    assert np.array_equal(last, ref[-1])
+    assert np.any(ref[-1] & ~mask)
+
+
+def test_checkpoint(tmp_path):
+    print(sys._getframe().f_code.co_name)
+    nspace, ny, nx = 7, 20, 30
+    prefix = 'epix10ka_0001_20260101000000_exp_r0001'
+    pattern = uec.file_name_checkpoint(str(tmp_path), prefix, nspace)
+    assert uec.load_checkpoints(pattern) == {}
+    rng = np.random.default_rng(1234)
+    ref = [rng.random((7,ny,nx)), rng.random((ny,nx,2,2)), rng.random((ny,nx,2,2)),\
+           rng.integers(0, 100, size=(ny,nx)).astype(np.int16), rng.integers(0, 100, size=(ny,nx)).astype(np.int16),\
+           rng.random((ny,nx,2)), rng.random((ny,nx,2))]
+    darks, fits_ml, fits_hl, nsp_ml, nsp_hl, chi2_ml, chi2_hl = ref
+    cycles = (0, 3, 5, 12, 5+nspace**2, 4+2*nspace**2, 1) # 1 - w/o results, e.g. darks are not processed
+    for nstep in cycles:
+        arrs = {}
+        if nstep in (0, 3): arrs = {'darks':darks[nstep]}
+        elif nstep > 4:
+            gm, istep, jy, jx, sel = uec.charge_injection_block(nstep, nspace, ny, nx)
+            fits, nsps, chi2s = (fits_ml, nsp_ml, chi2_ml) if gm=='AML' else (fits_hl, nsp_hl, chi2_hl)
+            arrs = {'fits':fits[sel], 'nsp':nsps[sel], 'chi2':chi2s[sel]}
+        uec.save_checkpoint(uec.file_name_checkpoint(str(tmp_path), prefix, nspace, nstep), nstep, **arrs)
+    ckpts = uec.load_checkpoints(pattern)
+    assert sorted(ckpts) == sorted(cycles)
+    assert sum(os.path.getsize(f) for f in glob(pattern)) < 7*ny*nx*8 # only results of the calib-cycles are saved
+    res = [np.zeros_like(a) for a in ref]
+    for nstep, arrs in ckpts.items():
+        uec.restore_checkpoint(nstep, arrs, nspace, *res)
+    for a, r in zip(res, ref):
+        assert a.dtype == r.dtype
+        assert np.array_equal(a[a != 0], r[a != 0])
+    assert np.array_equal(res[0][(0,3),], darks[(0,3),]) and not res[0][(1,2,4),].any()
+    uec.remove_checkpoints(pattern)
+    assert not list(tmp_path.iterdir())
+
+
+def test_step_counter_wo_metadata():
+    print(sys._getframe().f_code.co_name)
+    class ControlDataMock():
+        def pvLabels(self): return []
+    collected = uec.list_of_cc_collected()
+    collected[:] = [0, 1, 2]
+    assert uec.step_counter(ControlDataMock, None, 2, 2, 7) is None # resumed calib-cycle is skipped
+    assert uec.step_counter(ControlDataMock, None, 3, 3, 7) == 3
+    collected[:] = []
+
+
+if __name__ == '__main__':
+  """DEBUGGING, WORKS ONLY FOR COMMAND: python Detector/test/pytest_epix10ka_charge_injection.py"""
+  import tempfile, pathlib
+  test_collect_step_block()
+  test_collect_step_block_mask()
+  test_checkpoint(pathlib.Path(tempfile.mkdtemp()))
+  test_step_counter_wo_metadata()
+
+# EOF
@@ -0,0 +1,139 @@
+"""
+   Test of per-panel dark block processing of UtilsEpix10kaCalib.pedestals_calibration
+   in the pool of processes over memory-mapped per-panel blocks against proc_dark_block for in-RAM block,
+   saving of pending calib-cycles and pool path of pedestals_calibration with mock data source.
+
+   Usage::
+   pytest Detector/test/pytest_epix10ka_darks.py
+
+   # for debugging
+   python Detector/test/pytest_epix10ka_darks.py
+"""
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from Detector.GlobalUtils import np, info_ndarr
+import Detector.UtilsEpix10kaCalib as uec
+
+
+def test_panel_blocks_in_pool(tmp_path):
+    print(sys._getframe().f_code.co_name)
+    rng = np.random.default_rng(1234)
+    nbs, sh = 200, (3, 32, 48)
+    block = np.zeros((nbs,) + sh, dtype=np.int16)
+    pbs = uec.PanelBlocks(str(tmp_path), nbs, sh, prefix='block-cc00')
+    nrec = 150
+    for irec in range(nrec):
+        raw = rng.normal(3000, 10, size=sh).astype(np.int16) & uec.M14
+        block[irec] = raw
+        pbs.add_record(irec, raw)
+    pbs.flush()
+    opts = {'int_lo':1, 'int_hi':16000}
+    with ProcessPoolExecutor(2) as pool:
+        futures = [pool.submit(uec.proc_dark_panel, pbs.fnames[idx], nrec, opts) for idx in range(sh[0])]
+        for idx, f in enumerate(futures):
+            ref = uec.proc_dark_block(block[:nrec,idx,:], **opts)
+            res = f.result()
+            print(info_ndarr(res[0], 'panel %d dark' % idx))
+            for r0, r1 in zip(ref, res): assert np.array_equal(r0, r1)
+    pbs.remove()
+    assert not any(p.exists() for p in tmp_path.iterdir())
+
+
+def panel_blocks_of_calib_cycles(dirname, ncc=3, nrec=50, sh=(2, 16, 24)):
+    rng = np.random.default_rng(4321)
+    lst = []
+    for icc in range(ncc):
+        pbs = uec.PanelBlocks(dirname, nrec, sh, prefix='block-cc%02d' % icc)
+        for irec in range(nrec): pbs.add_record(irec, rng.normal(3000+100*icc, 10, size=sh).astype(np.int16))
+        pbs.flush()
+        lst.append(pbs)
+    return lst
+
+
+def test_save_pending_pedestals(monkeypatch, tmp_path):
+    print(sys._getframe().f_code.co_name)
+    saved = []
+    monkeypatch.setattr(uec, 'save_panel_pedestals', lambda panel_id, mode, dark, rms, status, *args, **opts:\
+                        saved.append((mode, panel_id, dark.mean())))
+    nrec, opts = 50, {'int_lo':1, 'int_hi':16000}
+    lst = panel_blocks_of_calib_cycles(str(tmp_path), nrec=nrec)
+    panels = [(0, 'id0'), (1, 'id1')]
+    with ProcessPoolExecutor(2) as pool:
+        pending = []
+        for icc, pbs in enumerate(lst):
+            futures = [pool.submit(uec.proc_dark_panel, pbs.fnames[idx], nrec, opts) for idx, _ in panels]
+            pending.append((panels, futures, pbs, uec.GAIN_MODES_IN[icc], '20260101000000', 'exp', 1))
+            pending = uec.save_pending_pedestals(pending, wait=False, maxpending=1, **opts)
+            assert len(pending) <= 1
+        uec.save_pending_pedestals(pending, wait=True, **opts)
+    print(saved)
+    assert [(mode, pid) for mode, pid, _ in saved] == [(m, pid) for m in uec.GAIN_MODES_IN[:3] for _, pid in panels]
+    for (mode, pid, dark), icc in zip(saved, (0, 0, 1, 1, 2, 2)): assert abs(dark - 3000 - 100*icc) < 1
+    assert not os.listdir(str(tmp_path))
+
+
+class MockStep():
+    def __init__(self, icc, nevts, sh):
+        self.rng, self.icc, self.nevts, self.sh = np.random.default_rng(icc), icc, nevts, sh
+    def events(self):
+        for i in range(self.nevts):
+            yield None if i == 3 else self.rng.normal(3000+100*self.icc, 10, size=self.sh).astype(np.int16)
+
+
+class MockRun():
+    def __init__(self, ncc, nevts, sh): self.ncc, self.nevts, self.sh = ncc, nevts, sh
+    def run(self): return 1
+    def steps(self): return [MockStep(icc, self.nevts, self.sh) for icc in range(self.ncc)]
+
+
+def mock_pedestals_calibration(monkeypatch, ncc=3, nevts=40, sh=(2, 16, 24), modes=uec.GAIN_MODES_IN):
+    """Returns dict {(mode, panel_id): (dark, rms, status)} saved by pedestals_calibration for mock data source."""
+    class MockDetector():
+        def __init__(self, name): pass
+        def shape(self): return sh
+        def raw(self, evt): return evt
+    saved, steps = {}, []
+    def find_gain_mode(det, data=None):
+        steps.append(len(steps))
+        return modes[steps[-1]]
+    monkeypatch.setattr(uec, 'DataSource', lambda dsname: type('MockDataSource', (), {'runs':lambda self: [MockRun(ncc, nevts, sh)]})())
+    monkeypatch.setattr(uec, 'Detector', MockDetector)
+    monkeypatch.setattr(uec, 'config_info_for_pedestals', lambda dsname, detname:\
+                        ({'runnum':1}, '20260101000000', ['id%d' % i for i in range(sh[0])], 1, 'epix10ka', sh[1:]))
+    monkeypatch.setattr(uec, 'step_counter', lambda cd, det, nstep_tot, nstep_run, nspace=None: nstep_tot)
+    monkeypatch.setattr(uec, 'find_gain_mode', find_gain_mode)
+    monkeypatch.setattr(uec, 'save_panel_pedestals', lambda panel_id, mode, dark, rms, status, *args, **opts:\
+                        saved.__setitem__((mode, panel_id), (dark, rms, status)))
+    return saved
+
+
+def test_pedestals_calibration_pool(monkeypatch, tmp_path):
+    print(sys._getframe().f_code.co_name)
+    opts = {'exp':'exp', 'run':'1', 'det':'epix', 'nbs':30, 'logmode':'INFO', 'int_lo':1, 'int_hi':16000}
+    ref = mock_pedestals_calibration(monkeypatch)
+    uec.pedestals_calibration(**opts)
+    scratch = str(tmp_path / 'scratch')
+    os.makedirs(scratch)
+    res = mock_pedestals_calibration(monkeypatch)
+    uec.pedestals_calibration(nprocs=2, scratch=scratch, npending=1, **opts)
+    assert sorted(res.keys()) == sorted(ref.keys()) and len(res) == 6
+    for k, v in ref.items():
+        for r0, r1 in zip(v, res[k]): assert np.array_equal(r0, r1), k
+    assert not os.listdir(scratch) # private directory of blocks is removed
+    # sys.exit for unrecognized gain mode in the second calib-cycle also removes blocks
+    res = mock_pedestals_calibration(monkeypatch, modes=('FH', 'XX', 'FL'))
+    try:
+        uec.pedestals_calibration(nprocs=2, scratch=scratch, **opts)
+        assert False, 'sys.exit is not called'
+    except SystemExit: pass
+    assert not os.listdir(scratch)
+
+
+if __name__ == '__main__':
+  """DEBUGGING, WORKS ONLY FOR COMMAND: python Detector/test/pytest_epix10ka_darks.py"""
+  import tempfile, pathlib
+  test_panel_blocks_in_pool(pathlib.Path(tempfile.mkdtemp()))
+  print('tests with monkeypatch run in pytest only')
+
+# EOF
@@ -0,0 +1,69 @@
+"""
+   Regression test of vectorized UtilsEpix10kaCalib.fit against per-pixel loop fit_v0
+   on synthetic saw-tooth charge injection block.
+
+   Usage::
+   pytest Detector/test/pytest_epix10ka_fit.py
+
+   # for debugging
+   python Detector/test/pytest_epix10ka_fit.py
+"""
+import sys
+from Detector.GlobalUtils import np, info_ndarr
+import Detector.UtilsEpix10kaCalib as uec
+
+
+def synthetic_block(nframes=2000, my=12, mx=16, period=500, seed=1234):
+    """Returns block of frames shaped as (nframes, my, mx) and evnum, where traces of pixels are saw-tooth
+       with random phase, switching point, slopes and offsets of gain ranges, some dropped events,
+       saturated H/M range, pixel without gain switch and pixel with a single group of switched frames.
+    """
+    rng = np.random.default_rng(seed)
+    evnum = np.arange(nframes, dtype=np.int16)
+    evnum = evnum[rng.random(nframes) > 0.02]
+    nf = evnum.size
+    sh = (my, mx)
+    phase = (evnum[:,None,None] + rng.integers(0, period, size=sh)) % period
+    hi = phase >= rng.integers(period//2, 3*period//4, size=sh)
+    v = np.where(hi, rng.normal(3, 0.3, size=sh)*phase + rng.normal(3000, 50, size=sh),\
+                     rng.normal(50, 5, size=sh)*phase + rng.normal(1000, 50, size=sh))\
+      + rng.normal(0, 5, size=phase.shape)
+    block = np.clip(v, 0, uec.M14).astype(np.int16) | np.where(hi, uec.B14, 0).astype(np.int16)
+    block[:,0,0] &= uec.M14
+    block[:nf-100,1,1] &= uec.M14
+    return block, evnum
+
+
+def compare_fits(**kwa):
+    print(sys._getframe().f_code.co_name, kwa)
+    block, evnum = synthetic_block()
+    fits0, nsp0, msg0, chi20 = uec.fit_v0(block, evnum, display=False, **kwa)
+    fits1, nsp1, msg1, chi21 = uec.fit(block, evnum, display=False, **kwa)
+    print(info_ndarr(fits1, 'fits', last=8))
+    assert np.array_equal(nsp0, nsp1)
+    assert np.allclose(fits0, fits1, rtol=1e-6, atol=1e-6)
+    assert np.allclose(chi20, chi21, rtol=1e-5, atol=1e-6)
+    assert msg0 == msg1
+
+
+def test_fit():
+    compare_fits()
+
+def test_fit_chi2():
+    compare_fits(savechi2=True)
+
+def test_fit_nperiods():
+    compare_fits(nperiods=True, savechi2=True)
+
+def test_fit_ixoff_npmin():
+    compare_fits(ixoff=3, npmin=300)
+
+
+if __name__ == '__main__':
+  """DEBUGGING, WORKS ONLY FOR COMMAND: python Detector/test/pytest_epix10ka_fit.py"""
+  test_fit()
+  test_fit_chi2()
+  test_fit_nperiods()
+  test_fit_ixoff_npmin()
+
+# EOF
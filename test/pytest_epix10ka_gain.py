@@ -0,0 +1,123 @@
+"""
+   Tests of epix10ka gain range index evaluated from control bits of configuration and data bit 14.
+
+   Usage::
+   pytest Detector/test/pytest_epix10ka_gain.py
+
+   # for debugging
+   python Detector/test/pytest_epix10ka_gain.py
+"""
+import sys
+from Detector.GlobalUtils import np, info_ndarr
+import Detector.UtilsEpix10ka as ue
+from UtilsSyntheticData import synthetic_epix10ka_constants, SyntheticDetCacheEpix10ka
+
+
+def synthetic_cbits_raw(nsegs=4, seed=1234):
+    """Returns random control bits from configuration and raw data with data bit 14 shaped as (nsegs, 352, 384)"""
+    rng = np.random.default_rng(seed)
+    sh = (nsegs, 352, 384)
+    cbits = (rng.integers(0, 16, size=sh) & 12) | (rng.integers(0, 2, size=sh) << 4)
+    raw = (rng.integers(0, 1<<14, size=sh) | (rng.integers(0, 2, size=sh) << 14)).astype(np.uint16)
+    return cbits, raw
+
+
+def test_gain_index_lut():
+    print(sys._getframe().f_code.co_name)
+    # bits: data bit 14, trbit, F/A, H,M/L - see gain_maps_epix10ka_any
+    expected = {28:0, 60:0, 12:1, 44:1, 8:2, 24:2, 40:2, 56:2, 16:3, 0:4, 48:5, 32:6}
+    for c in range(64):
+        assert ue.GAIN_INDEX_LUT[c] == expected.get(c & 60, ue.GIND_UNDEF), 'cbits: %d' % c
+
+
+def test_gain_index_for_step():
+    print(sys._getframe().f_code.co_name)
+    cbits, raw = synthetic_cbits_raw()
+    o = ue.ConfigBits()
+    o.set_cbits(cbits)
+    gidx = o.gain_index(raw)
+    print(info_ndarr(gidx, 'gidx'))
+    assert gidx.dtype == np.uint8
+    assert np.array_equal(gidx, ue.GAIN_INDEX_LUT[cbits | ((raw & ue.B14) >> 9)])
+    assert np.array_equal(o.gain_index(), ue.GAIN_INDEX_LUT[cbits])
+    out = np.empty(raw.shape, dtype=np.uint8)
+    assert o.gain_index(raw, out=out) is out and np.array_equal(out, gidx)
+    gmaps = ue.gain_maps_for_index(gidx)
+    assert np.array_equal(ue.map_pixel_gain_mode1(gmaps), np.where(gidx==ue.GIND_UNDEF, -1, gidx.astype(np.int16)))
+
+
+class MockPanelConfig():
+    """psana.Epix.Config10ka-like panel configuration with pixel config array and ASIC trbits."""
+    def __init__(self, pca, trbits=(1,1,1,1)): self.pca, self.trbits = pca, trbits
+    def asicPixelConfigArray(self): return self.pca
+    def numberOfAsics(self): return len(self.trbits)
+    def asics(self, i): return type('MockAsic', (), {'trbit':lambda s: self.trbits[i]})()
+
+
+class MockDetConfig():
+    """psana.Epix.Config10ka2M-like detector configuration with panel configurations, counts calls of elemCfg."""
+    ncalls = 0
+    def __init__(self, ecos): self.ecos = ecos
+    def numberOfElements(self): return len(self.ecos)
+    def elemCfg(self, i):
+        MockDetConfig.ncalls += 1
+        return self.ecos[i]
+
+
+def test_config_bits_for_step(monkeypatch):
+    print(sys._getframe().f_code.co_name)
+    cbits, raw = synthetic_cbits_raw()
+    pcas = cbits.astype(np.uint16) # pixel config arrays of all panels in the same memory for all steps
+    ecos = [MockPanelConfig(pca) for pca in pcas]
+    store = {'cob':MockDetConfig(ecos)} # config store content of the step
+    monkeypatch.setattr(ue, 'detector_config_object', lambda env, src: (store['cob'], True))
+    o = ue.ConfigBits()
+    cb1 = o.cbits_for_config(None, None)
+    assert np.array_equal(cb1, ue.cbits_pixel_config(pcas, (1,1,1,1)))
+    MockDetConfig.ncalls = 0
+    assert o.cbits_for_config(None, None) is cb1 # the same step
+    assert MockDetConfig.ncalls == 0 # config store is not re-read within the step
+    store['cob'] = MockDetConfig(ecos) # the next step with the same configuration
+    assert o.cbits_for_config(None, None) is cb1 and MockDetConfig.ncalls == len(ecos)
+    pcas ^= 4 # configuration of the next step in the same memory
+    store['cob'] = MockDetConfig(ecos)
+    cb2 = o.cbits_for_config(None, None)
+    assert cb2 is not cb1 and np.array_equal(cb2, ue.cbits_pixel_config(pcas, (1,1,1,1)))
+    ecos[0].trbits = (0,0,0,0)
+    store['cob'] = MockDetConfig(ecos)
+    assert not np.array_equal(o.cbits_for_config(None, None)[0], cb2[0])
+
+
+def calib_fused_vs_nda(cmode):
+    print(sys._getframe().f_code.co_name, 'cmode:', cmode)
+    cbits, raw = synthetic_cbits_raw()
+    odc = SyntheticDetCacheEpix10ka(*synthetic_epix10ka_constants(raw.shape), cmps=(7, cmode, 100, 10))
+    o = ue.ConfigBits()
+    o.set_cbits(cbits)
+    odc.set_step_constants(o)
+    gmaps = np.array(ue.gain_maps_for_index(o.gain_index(raw)))
+    ref = ue.calib_epix10ka_nda(raw, odc.gfac, odc.peds, odc.mask, odc.cmps, gmaps, odc.aone)
+    res = ue.calib_epix10ka_fused(raw, odc)
+    print(info_ndarr(res, 'res'))
+    assert np.array_equal(ref, res)
+    out = np.zeros_like(res)
+    for i in range(raw.shape[0]): ue.calib_epix10ka_fused(raw, odc, i, out=out)
+    assert np.array_equal(ref, out)
+
+
+def test_calib_fused():
+    calib_fused_vs_nda(0)
+
+def test_calib_fused_cm():
+    calib_fused_vs_nda(7)
+
+
+if __name__ == '__main__':
+  """DEBUGGING, WORKS ONLY FOR COMMAND: python Detector/test/pytest_epix10ka_gain.py"""
+  test_gain_index_lut()
+  test_gain_index_for_step()
+  print('test_config_bits_for_step runs with monkeypatch in pytest only')
+  test_calib_fused()
+  test_calib_fused_cm()
+
+# EOF
@@ -0,0 +1,189 @@
+"""
+   Test of geometry cache of PyDetectorAccess shared across runs with the same geometry source
+   and on-disk cache of pixel coordinate and index arrays with mock geometry and calib file finder,
+   size of lazily loaded calibration constants in calib_cache, calib_cache get/put from threads.
+
+   Usage::
+   pytest Detector/test/pytest_geo_cache.py
+
+   # for debugging
+   python Detector/test/pytest_geo_cache.py
+"""
+import os
+import sys
+from multiprocessing.pool import ThreadPool
+from Detector.GlobalUtils import np, info_ndarr
+import Detector.PyDetectorAccess as pyda
+from Detector.UtilsCalibCache import CalibCache
+
+
+class MockEnv():
+    def __init__(self, calibdir): self.cdir = calibdir
+    def calibDir(self): return self.cdir
+
+
+class MockGeometryAccess():
+    ncreated, ncalls = 0, 0
+    def __init__(self, fname=None, pbits=0):
+        MockGeometryAccess.ncreated += 1
+        self.fname, self.valid, self.dx = fname, True, 0
+    def get_pixel_coord_indexes(self, **kwa):
+        MockGeometryAccess.ncalls += 1
+        iX = (np.arange(32*185*388, dtype=np.uint32) + self.dx) % 1000
+        return iX, iX[::-1].copy()
+    def get_pixel_coords(self, cframe=0):
+        MockGeometryAccess.ncalls += 1
+        x = np.linspace(-1e5, 1e5, 32*185*388) + self.dx
+        return x, x[::-1].copy(), np.zeros_like(x)
+    def move_geo(self, oname, oindex, dx, dy, dz): self.dx += dx
+
+
+DETTYPE_CSPAD = 1
+
+
+def mock_detector(monkeypatch, tmp_path, dic_run_fname):
+    class MockCalibFileFinder():
+        def __init__(self, *args): pass
+        def findCalibFile(self, src, ctype, runnum): return dic_run_fname.get(runnum, '')
+    monkeypatch.setattr(pyda, 'CalibFileFinder', MockCalibFileFinder)
+    monkeypatch.setattr(pyda, 'GeometryAccess', MockGeometryAccess)
+    monkeypatch.setattr(pyda.gu, 'det_type_from_source', lambda src: DETTYPE_CSPAD, raising=False)
+    monkeypatch.setattr(pyda.gu, 'dic_det_type_to_calib_group', {DETTYPE_CSPAD:'CsPad::CalibV1'}, raising=False)
+    pyda.calib_cache.clear()
+    MockGeometryAccess.ncreated, MockGeometryAccess.ncalls = 0, 0
+    return pyda.PyDetectorAccess('DetInfo(CxiDs2.0:Cspad.0)', MockEnv(str(tmp_path)))
+
+
+def geometry_files(tmp_path, names=('0-9.data', '10-end.data')):
+    fnames = []
+    for name in names:
+        fname = os.path.join(str(tmp_path), name)
+        open(fname, 'w').write(name)
+        fnames.append(fname)
+    return fnames
+
+
+def test_geo_cache_across_runs(monkeypatch, tmp_path):
+    print(sys._getframe().f_code.co_name)
+    fa, fb = geometry_files(tmp_path)
+    o = mock_detector(monkeypatch, tmp_path, {1:fa, 2:fa, 3:fa, 11:fb, 12:fb})
+    iX1, iY1 = o.indexes_xy(1)
+    for run in (2, 3):
+        iX, iY = o.indexes_xy(run)
+        assert iX is iX1
+    assert MockGeometryAccess.ncreated == 1 and MockGeometryAccess.ncalls == 1
+    iX11, iY11 = o.indexes_xy(11)
+    assert MockGeometryAccess.ncreated == 2 and MockGeometryAccess.ncalls == 2
+    iX, iY = o.indexes_xy(2) # geometry of run 1 from calib_cache
+    assert iX is iX1 and MockGeometryAccess.ncreated == 2 and MockGeometryAccess.ncalls == 2
+    iX, iY = o.indexes_xy(12)
+    assert iX is iX11 and MockGeometryAccess.ncreated == 2
+    print(pyda.calib_cache.info())
+
+    # moved geometry is a private copy, shared geometry is not changed for other runs and detector objects
+    o2 = pyda.PyDetectorAccess('DetInfo(CxiDs2.0:Cspad.0)', MockEnv(str(tmp_path)))
+    assert o2.indexes_xy(12)[0] is iX11
+    o.move_geo(12, 10, 0, 0)
+    iX = o.indexes_xy(12, do_update=True)[0]
+    assert iX[0] == 10
+    assert o2.geo.dx == 0 and o2.indexes_xy(12, do_update=True)[0][0] == 0
+    iX = o.indexes_xy(11)[0]
+    assert iX[0] == 0 and MockGeometryAccess.ncreated == 2
+
+
+def test_geo_cache_on_disk(monkeypatch, tmp_path):
+    print(sys._getframe().f_code.co_name)
+    fa, = geometry_files(tmp_path, names=('0-end.data',))
+    dircache = os.path.join(str(tmp_path), 'geo-cache')
+    ref = None
+    for i in range(2): # the second detector object, e.g. in the next job, loads arrays from disk
+        o = mock_detector(monkeypatch, tmp_path, {1:fa})
+        o.set_geo_cache_dir(dircache)
+        iX, iY = o.indexes_xy(1)
+        x, y, z = o.coords_xyz(1)
+        print(info_ndarr(iX, 'detector %d iX' % i))
+        if ref is None: ref = (iX, iY, x, y, z)
+        assert all(np.array_equal(a, r) for a, r in zip((iX, iY, x, y, z), ref))
+        assert MockGeometryAccess.ncalls == (2 if i == 0 else 0)
+    assert len(os.listdir(dircache)) == 2
+    assert all((os.stat(os.path.join(dircache, name)).st_mode & 0o777) == 0o664 for name in os.listdir(dircache))
+
+
+class MockCalibParsStore():
+    ncreated = 0
+    def size(self, ctype): return 32*185*388
+    @staticmethod
+    def CreateForEvtEnv(*args):
+        MockCalibParsStore.ncreated += 1
+        return MockCalibParsStore()
+
+
+def mock_cpstore(monkeypatch, tmp_path, ctypes):
+    fnames = geometry_files(tmp_path, names=['0-end.%s' % ctype for ctype in ctypes])
+    o = mock_detector(monkeypatch, tmp_path, {})
+    monkeypatch.setattr(pyda, 'cps', MockCalibParsStore)
+    monkeypatch.setattr(pyda.gu, 'dic_calib_name_to_type', {c:i for i, c in enumerate(pyda.CPSTORE_CALIB_TYPES)}, raising=False)
+    monkeypatch.setattr(pyda.gu, 'dic_calib_type_to_dtype', {0:np.float32, 4:np.uint16}, raising=False)
+    monkeypatch.setattr(pyda, 'calib_files_key', lambda *args: tuple((c, f, 0, 1) for c, f in zip(ctypes, fnames)))
+    MockCalibParsStore.ncreated = 0
+    return o
+
+
+def test_cpstore_nbytes(monkeypatch, tmp_path):
+    print(sys._getframe().f_code.co_name)
+    o = mock_cpstore(monkeypatch, tmp_path, pyda.CPSTORE_CALIB_TYPES)
+    cpst = o.cpstore(1)
+    print(pyda.calib_cache.info())
+    nb = sum(np.dtype(pyda.gu.dic_calib_type_to_dtype.get(i, np.float64)).itemsize for i in range(len(pyda.CPSTORE_CALIB_TYPES)))
+    assert pyda.calib_cache.objs[('cpstore', o.str_src, o.cps_key)] == (cpst, 32*185*388*nb)
+    assert o.cpstore(2) is cpst and MockCalibParsStore.ncreated == 1 # all constants from files, store is shared by runs
+
+
+def test_cpstore_dcs(monkeypatch, tmp_path):
+    """constants which are not found in files are loaded by CalibParsStore from DCS for event time"""
+    print(sys._getframe().f_code.co_name)
+    o = mock_cpstore(monkeypatch, tmp_path, ('pedestals', 'pixel_mask'))
+    class MockEvent():
+        def __init__(self, run): self.runnum = run
+        def run(self): return self.runnum
+    monkeypatch.setattr(pyda._psana, 'Event', MockEvent, raising=False)
+    cpst = o.cpstore(1) # run number - DCS constants are not known, store is not shared between runs
+    assert o.cps_key is None and not pyda.calib_cache.objs
+    assert o.cpstore(2) is not cpst and MockCalibParsStore.ncreated == 2
+
+    dcs = {'pixel_status':np.zeros((4,5), dtype=np.uint16)}
+    class MockDCMethods():
+        @staticmethod
+        def get_constants(evt, env, src, ctype, **kwa):
+            return dcs.get(pyda.CPSTORE_CALIB_TYPES[ctype], None)
+    monkeypatch.setitem(sys.modules, 'PSCalib.DCMethods', MockDCMethods)
+    cpst = o.cpstore(MockEvent(3))
+    assert ('pixel_status', 'dcs', pyda.hashlib.md5(dcs['pixel_status']).hexdigest(), 0) in o.cps_key
+    assert ('pixel_bkgd', 'dcs', None, 0) in o.cps_key
+    assert o.cpstore(MockEvent(4)) is cpst and MockCalibParsStore.ncreated == 3 # the same DCS constants
+    dcs['pixel_status'] = np.ones((4,5), dtype=np.uint16) # DCS constants are changed for run 5
+    assert o.cpstore(MockEvent(5)) is not cpst and MockCalibParsStore.ncreated == 4
+    assert o.cpstore(MockEvent(6)) is not cpst and MockCalibParsStore.ncreated == 4
+
+
+def test_calib_cache_threads():
+    print(sys._getframe().f_code.co_name)
+    o = CalibCache(max_bytes=1000)
+    def put_get(i):
+        for j in range(200):
+            o.put(('t', i, j % 7), None, nbytes=10+j % 5)
+            o.get(('t', (i+1) % 8, j % 7))
+            if j % 11 == 0: o.remove(('t', i, (j+3) % 7))
+    pool = ThreadPool(8)
+    pool.map(put_get, range(8))
+    pool.terminate()
+    print(o.info())
+    assert o.nbytes == sum(nb for obj, nb in o.objs.values()) and o.nbytes <= 1000
+
+
+if __name__ == '__main__':
+  """DEBUGGING, WORKS ONLY FOR COMMAND: python Detector/test/pytest_geo_cache.py"""
+  import pytest
+  pytest.main([__file__, '-s'])
+
+# EOF
@@ -0,0 +1,52 @@
+"""
+   Test of bit-identity of fused jungfrau calibration kernel UtilsJungfrau.calib_jungfrau_fused
+   against legacy calib_jungfrau_single_panel on synthetic data with and without common mode correction.
+
+   Usage::
+   pytest Detector/test/pytest_jungfrau_fused.py
+
+   # for debugging
+   python Detector/test/pytest_jungfrau_fused.py
+"""
+import sys
+from Detector.GlobalUtils import np, info_ndarr
+import Detector.UtilsJungfrau as uj
+from Detector.UtilsCalibCache import thread_pool
+from UtilsSyntheticData import synthetic_jungfrau, SyntheticDetCacheJungfrau
+
+
+def calib_fused_vs_legacy(cmode, nsegs=2):
+    print(sys._getframe().f_code.co_name, 'cmode:', cmode)
+    cmps = (7, cmode, 200, 10)
+    raw, poff, gfac, mask = synthetic_jungfrau(nsegs)
+    odc = SyntheticDetCacheJungfrau(poff, gfac, mask, cmps)
+    assert odc.iflat.dtype == np.int32 and odc.indx.dtype == np.int32
+    ref = uj.calib_jungfrau_single_panel(raw, gfac, poff, mask, cmps)
+    res = uj.calib_jungfrau_fused(raw, odc)
+    print(info_ndarr(res, 'res'))
+    assert res.dtype == ref.dtype and np.array_equal(ref, res)
+    out = np.zeros_like(res)
+    for i in range(nsegs): uj.calib_jungfrau_fused(raw, odc, i, out=out)
+    assert np.array_equal(ref, out)
+    out[:] = 0
+    pool = thread_pool(odc, 2)
+    pool.map(lambda i: uj.calib_jungfrau_fused(raw, odc, i, out=out), range(nsegs))
+    assert np.array_equal(ref, out)
+    assert thread_pool(odc, 2) is pool and thread_pool(odc, 3) is not pool and odc.nthreads == 3
+    odc.pool.close()
+
+
+def test_calib_fused():
+    calib_fused_vs_legacy(0)
+
+
+def test_calib_fused_cm():
+    calib_fused_vs_legacy(7)
+
+
+if __name__ == '__main__':
+  """DEBUGGING, WORKS ONLY FOR COMMAND: python Detector/test/pytest_jungfrau_fused.py"""
+  test_calib_fused()
+  test_calib_fused_cm()
+
+# EOF
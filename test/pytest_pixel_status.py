@@ -0,0 +1,59 @@
+"""
+   Regression test of batched UtilsPixelStatus.residuals_to_plane_windows against loop over window corners
+   with residuals_to_plane as in DataProc.residuals_frame_f06_v0 on synthetic frames.
+
+   Usage::
+   pytest Detector/test/pytest_pixel_status.py
+
+   # for debugging
+   python Detector/test/pytest_pixel_status.py
+"""
+import sys
+from time import time
+from Detector.GlobalUtils import np, info_ndarr
+import Detector.UtilsPixelStatus as us
+
+
+def residuals_loop(frame, shw):
+    """residuals to plane fits in windows of frame evaluated in loop as in DataProc.residuals_frame_f06_v0"""
+    residuals = np.zeros_like(frame, dtype=float)
+    wr, wc = shw
+    for r,c in us.corners2d(frame.shape, shw):
+        sl = np.s_[r:r+wr, c:c+wc]
+        residuals[sl] = us.residuals_to_plane(frame[sl])
+    return residuals
+
+
+def compare_residuals(sh=(3, 40, 50), shw=(15, 15), seed=1234):
+    print(sys._getframe().f_code.co_name, sh, shw)
+    rng = np.random.default_rng(seed)
+    frames = rng.integers(0, 0x3fff, size=sh).astype(np.uint16)
+    t0_sec = time()
+    res = us.residuals_to_plane_windows(frames, shw)
+    dt_batch = time() - t0_sec
+    t0_sec = time()
+    ref = np.array([residuals_loop(f, shw) for f in frames])
+    dt_loop = time() - t0_sec
+    print(info_ndarr(res, 'residuals', last=5))
+    print('time (sec) loop: %.4f batched: %.4f' % (dt_loop, dt_batch))
+    assert res.shape == frames.shape
+    assert np.allclose(res, ref, rtol=1e-6, atol=1e-6)
+
+
+def test_residuals_overlapping_windows():
+    compare_residuals()
+
+def test_residuals_aligned_windows():
+    compare_residuals(sh=(2, 30, 45), shw=(10, 15))
+
+def test_residuals_rectangular_windows():
+    compare_residuals(sh=(1, 352, 384), shw=(7, 20))
+
+
+if __name__ == '__main__':
+  """DEBUGGING, WORKS ONLY FOR COMMAND: python Detector/test/pytest_pixel_status.py"""
+  test_residuals_overlapping_windows()
+  test_residuals_aligned_windows()
+  test_residuals_rectangular_windows()
+
+# EOF
@@ -0,0 +1,81 @@
+"""
+   Test of resolved type cache in PyDataAccess with mock event and config store objects.
+
+   Usage::
+   pytest Detector/test/pytest_pydataaccess.py
+
+   # for debugging
+   python Detector/test/pytest_pydataaccess.py
+"""
+import sys
+import Detector.PyDataAccess as pda
+
+
+class MockStore():
+    """evt/configStore-like object with get(type, src) returning object for available type and counting calls."""
+    def __init__(self, dic):
+        self.dic = dic  # {(type, src): object}
+        self.ncalls = 0
+    def get(self, t, src):
+        self.ncalls += 1
+        return self.dic.get((t, src), None)
+    def configStore(self):
+        return self
+
+
+TYPES = ('ConfigV5', 'ConfigV4', 'ConfigV3', 'ConfigV2')
+
+
+def test_resolved_type_cache():
+    print(sys._getframe().f_code.co_name)
+    pda.reset_resolved_types()
+    pda.set_probe_stats(True)
+    env = MockStore({('ConfigV3', 'src1'): 'o3', ('ConfigV2', 'src2'): 'o2'})
+    assert pda.config_object(env, 'src1', TYPES) == 'o3'
+    assert env.ncalls == 3
+    for i in range(5): assert pda.config_object(env, 'src1', TYPES) == 'o3'
+    assert env.ncalls == 8
+    assert pda.config_object(env, 'src2', TYPES) == 'o2'
+    stats = pda.probe_stats()
+    assert stats[(TYPES, 'src1')] == [5, 1]
+    assert stats[(TYPES, 'src2')] == [0, 1]
+
+
+def test_resolved_type_miss():
+    print(sys._getframe().f_code.co_name)
+    pda.reset_resolved_types()
+    pda.set_probe_stats(True)
+    evt = MockStore({('ConfigV3', 'src1'): 'o3'})
+    assert pda.data_object(evt, 'src1', TYPES) == 'o3'
+    evt.dic = {('ConfigV5', 'src1'): 'o5'} # type changed, e.g. in the next run
+    evt.ncalls = 0
+    assert pda.data_object(evt, 'src1', TYPES) == 'o5'
+    assert evt.ncalls == 2
+    evt.dic = {}
+    evt.ncalls = 0
+    assert pda.data_object(evt, 'src1', TYPES) is None
+    assert evt.ncalls == 4
+    assert pda.probe_stats()[(TYPES, 'src1')] == [0, 3]
+    pda.set_probe_stats(False)
+
+
+def test_resolved_type_single_and_unhashable():
+    print(sys._getframe().f_code.co_name)
+    pda.reset_resolved_types()
+    evt = MockStore({('ConfigV3', 'src1'): 'o3'})
+    assert pda.data_object(evt, 'src1', ('ConfigV3',)) == 'o3'
+    assert not pda.dic_resolved_types and not pda.probe_stats() # single type is not cached, stats are off
+    src = ['src1'] # unhashable src is keyed by its string
+    evt.dic = {('ConfigV3', src[0]): 'o3'}
+    evt.get = lambda t, s: evt.dic.get((t, s[0]), None)
+    assert pda.data_object(evt, src, TYPES) == 'o3'
+    assert pda.dic_resolved_types == {(TYPES, str(src)): 'ConfigV3'}
+
+
+if __name__ == '__main__':
+  """DEBUGGING, WORKS ONLY FOR COMMAND: python Detector/test/pytest_pydataaccess.py"""
+  test_resolved_type_cache()
+  test_resolved_type_miss()
+  test_resolved_type_single_and_unhashable()
+
+# EOF
@@ -0,0 +1,153 @@
+"""
+   Test of binary calibration repository format, merging of panel constants and timestamp index of UtilsCalib.
+
+   Usage::
+   pytest Detector/test/pytest_repo_format.py
+
+   # for debugging
+   python Detector/test/pytest_repo_format.py
+"""
+import os
+import sys
+from Detector.GlobalUtils import np, info_ndarr
+import Detector.UtilsCalib as uc
+
+
+def panel_constants(npanels=4, sh=(7, 1, 35, 38)):
+    rng = np.random.default_rng(1357)
+    return [rng.normal(3000, 10, size=sh).astype(np.float32) for i in range(npanels)]
+
+
+def test_repo_array(tmp_path):
+    print(sys._getframe().f_code.co_name)
+    d = str(tmp_path)
+    nda = panel_constants(1)[0]
+    for repofmt, tstamp in (('txt', '20260101000000'), ('npy', '20260201000000')):
+        fname = '%s/epix10ka_0001_%s_exp_r0001_pedestals_FH.dat' % (d, tstamp)
+        fsaved = uc.save_repo_array(nda, fname, fmt='%.3f', group=None, repofmt=repofmt)
+        assert fsaved.endswith('.dat' if repofmt=='txt' else '.npy')
+        res = uc.load_repo_array(fsaved)
+        print(info_ndarr(res, 'repofmt:%s loaded from %s' % (repofmt, fsaved)))
+        assert np.allclose(res.reshape(nda.shape), nda, atol=0.001)
+    # .npy sidecar of the text file is not selected as a repository file
+    assert any('.float32.npy' in name for name in os.listdir(d))
+    assert uc.find_file_for_timestamp(d, 'pedestals_FH', '20260115000000').endswith('20260101000000_exp_r0001_pedestals_FH.dat')
+    assert uc.find_file_for_timestamp(d, 'pedestals_FH', '20260301000000').endswith('20260201000000_exp_r0001_pedestals_FH.npy')
+
+
+def test_load_textfile_cached(tmp_path):
+    print(sys._getframe().f_code.co_name)
+    d = str(tmp_path)
+    fname = '%s/pixel_gain.data' % d
+    nda = panel_constants(1, sh=(3, 4))[0]
+    np.savetxt(fname, nda, fmt='%.3f')
+    sidecars = lambda: [name for name in os.listdir(d) if name.endswith('.npy')]
+    for i in range(2):
+        res = uc.load_textfile_cached(fname)
+        assert np.allclose(res, nda, atol=0.001)
+    fnpy, = sidecars()
+    assert fnpy == os.path.basename(uc.npy_sidecar_name(fname))
+    assert '-%d.' % os.stat(fname).st_mtime_ns in fnpy
+    assert (os.stat(os.path.join(d, fnpy)).st_mode & 0o777) == 0o664
+    np.savetxt(fname, 2*nda, fmt='%.3f') # new version of the text file
+    os.utime(fname, ns=(0, os.stat(fname).st_mtime_ns + 1000))
+    assert np.allclose(uc.load_textfile_cached(fname), 2*nda, atol=0.002)
+    assert sidecars() == [os.path.basename(uc.npy_sidecar_name(fname))] # sidecar of the previous version is removed
+    assert len(os.listdir(d)) == 2 # no temporary files
+
+
+def test_merge_panels():
+    print(sys._getframe().f_code.co_name)
+    lst = panel_constants()
+    ref = np.stack([np.stack([nda[igm,0,:] for nda in lst]) for igm in range(lst[0].shape[0])])
+    res = uc.merge_panels(lst)
+    print(info_ndarr(res, 'merged'))
+    assert res.shape == ref.shape and np.array_equal(res, ref)
+
+
+def test_save_merged_panels(tmp_path, monkeypatch):
+    print(sys._getframe().f_code.co_name)
+    dic_consts = {'pedestals':panel_constants(), 'pixel_status':[np.floor(nda/1000) for nda in panel_constants()]}
+    dic_fmt = {'pedestals':'%.3f', 'pixel_status':'%4i'}
+    open_memmap, memmaps = np.lib.format.open_memmap, []
+    monkeypatch.setattr(np.lib.format, 'open_memmap', lambda fname, *a, **k: memmaps.append(fname) or open_memmap(fname, *a, **k))
+    for nprocs, repofmt in ((0, 'txt'), (2, 'txt'), (2, 'npy')):
+        prefix = '%s/det-%d-%s' % (str(tmp_path), nprocs, repofmt)
+        del memmaps[:]
+        fnames = uc.save_merged_panels(dic_consts, prefix, dic_fmt, group=None, repofmt=repofmt, nprocs=nprocs)
+        assert len(memmaps) == (0 if nprocs <= 1 and repofmt == 'txt' else len(dic_consts)) # in-memory merge by default
+        for octype, fname in fnames.items():
+            fref = '%s-ref-%s.txt' % (prefix, octype)
+            uc.save_ndarray_in_textfile(uc.merge_panels(dic_consts[octype]), fref, 0o664, dic_fmt[octype], group=None)
+            with open(fname) as f, open(fref) as fr: assert f.read() == fr.read()
+            fnpy = fname[:-4] + '.npy'
+            assert os.path.exists(fnpy) == (repofmt == 'npy')
+    fnames = uc.save_merged_panels(dic_consts, '%s/det-notxt' % str(tmp_path), dic_fmt, group=None, repofmt='npy', savetxt=False)
+    assert all(fname.endswith('.npy') for fname in fnames.values())
+    assert np.array_equal(uc.load_repo_array(fnames['pedestals']), uc.merge_panels(dic_consts['pedestals']))
+
+
+def test_timestamp_index(tmp_path):
+    print(sys._getframe().f_code.co_name)
+    d = str(tmp_path)
+    tstamps = ('20250101000000', '20250301120000', '20250612000000', '20260101000000')
+    for ts in tstamps:
+        for gm in ('FH', 'FM', 'AHL-H'):
+            open('%s/epix10ka_0001_%s_exp_r0001_pedestals_%s.dat' % (d, ts, gm), 'w').close()
+    open('%s/epix10ka_0001_%s_exp_r0001_pedestals_FH.dat.1-2.float32.npy' % (d, tstamps[-1]), 'w').close()
+    open('%s/README.txt' % d, 'w').close()
+    mtime = os.stat(d).st_mtime_ns - 10**10 # directory is not modified during 10 sec before indexing
+    os.utime(d, ns=(0, mtime))
+    tsindex = uc.TimestampIndex()
+    repoman = uc.RepoManager(d, tsindex=tsindex)
+    for tstamp in ('20241231000000', '20250101000000', '20250401000000', '20251231235959', '20270101000000'):
+        for pattern in ('pedestals_FH', 'pedestals_AHL-H', 'rms_FH'):
+            fname = repoman.find_file_for_timestamp(d, pattern, tstamp)
+            assert fname == uc.find_file_for_timestamp_v0(d, pattern, tstamp)
+    assert tsindex.nscans == 1
+    fnew = '%s/epix10ka_0001_20260201000000_exp_r0001_pedestals_FH.dat' % d
+    open(fnew, 'w').close()
+    os.utime(d, ns=(0, mtime + 1000)) # coarse mtime of file systems
+    assert tsindex.find(d, 'pedestals_FH', '20270101000000') == fnew
+    assert tsindex.nscans == 2
+
+
+def test_timestamp_index_recent_mtime(tmp_path):
+    """index built within dtsafe after modification of directory is not trusted even if mtime is not changed"""
+    print(sys._getframe().f_code.co_name)
+    d = str(tmp_path)
+    open('%s/epix10ka_0001_20250101000000_exp_r0001_pedestals_FH.dat' % d, 'w').close()
+    mtime = os.stat(d).st_mtime_ns
+    tsindex = uc.TimestampIndex()
+    assert tsindex.find(d, 'pedestals_FH', '20270101000000').endswith('20250101000000_exp_r0001_pedestals_FH.dat')
+    fnew = '%s/epix10ka_0001_20260201000000_exp_r0001_pedestals_FH.dat' % d
+    open(fnew, 'w').close()
+    os.utime(d, ns=(0, mtime)) # file is added within the time resolution of directory mtime
+    assert tsindex.find(d, 'pedestals_FH', '20270101000000') == fnew
+    assert tsindex.nscans == 2
+
+
+def test_is_repo_file_name():
+    print(sys._getframe().f_code.co_name)
+    for name in ('epix10ka_0001_20250101000000_exp_r0001_pedestals_FH.dat', 'README.txt', '0-end.data',\
+                 'epix10ka_0001_20250101000000_exp_r0001_pedestals.npy', 'jungfrau_0001_20250101000000_exp.v2_r0001_pedestals.npy'):
+        assert uc.is_repo_file_name(name), name
+    for name in ('epix10ka_0001_20250101000000_exp_r0001_pedestals_FH.dat.1234-1767225600123456789.float32.npy',\
+                 'jungfrau_0001_20250101000000_exp.v2_r0001_pedestals.txt.56-1767225600000000000.float64.npy',\
+                 'geometry.data.1-2.float32.npy', 'README.md', 'pedestals.npz'):
+        assert not uc.is_repo_file_name(name), name
+
+
+if __name__ == '__main__':
+  """DEBUGGING, WORKS ONLY FOR COMMAND: python Detector/test/pytest_repo_format.py"""
+  import tempfile, pathlib
+  test_repo_array(pathlib.Path(tempfile.mkdtemp()))
+  test_load_textfile_cached(pathlib.Path(tempfile.mkdtemp()))
+  test_merge_panels()
+  import pytest
+  with pytest.MonkeyPatch.context() as mp: test_save_merged_panels(pathlib.Path(tempfile.mkdtemp()), mp)
+  test_timestamp_index(pathlib.Path(tempfile.mkdtemp()))
+  test_timestamp_index_recent_mtime(pathlib.Path(tempfile.mkdtemp()))
+  test_is_repo_file_name()
+
+# EOF
@@ -0,0 +1,78 @@
+"""
+   Tests of UtilsCalibCache.shared_arrays - constants shared between processes on the node,
+   lock file of the creator, take over of stale lock and clean up after failure of the creator.
+
+   Usage::
+   pytest Detector/test/pytest_shared_arrays.py
+
+   # for debugging
+   python Detector/test/pytest_shared_arrays.py
+"""
+import os
+import sys
+import socket
+import subprocess
+from Detector.GlobalUtils import np
+import Detector.UtilsCalibCache as ucc
+
+
+def constants():
+    return {'peds':np.arange(12, dtype=np.float32).reshape((3,4)), 'gain':None}
+
+
+def dead_pid():
+    p = subprocess.Popen([sys.executable, '-c', 'pass'])
+    p.wait()
+    return p.pid
+
+
+def test_shared_arrays_creator(tmp_path):
+    print(sys._getframe().f_code.co_name)
+    d = ucc.shared_arrays('test-creator', constants, dirshm=str(tmp_path))
+    assert np.array_equal(d['peds'], constants()['peds']) and d['gain'] is None
+    assert ucc.lock_owner(str(tmp_path / 'test-creator.lock')) == (os.getpid(), socket.gethostname())
+    d = ucc.shared_arrays('test-creator', lambda: None, dirshm=str(tmp_path)) # attached, func is not called
+    assert isinstance(d['peds'], np.memmap)
+    ucc.remove_shared(str(tmp_path / 'test-creator'))
+
+
+def test_shared_arrays_stale_lock(tmp_path):
+    print(sys._getframe().f_code.co_name)
+    flock = str(tmp_path / 'test-stale.lock')
+    with open(flock, 'w') as f: f.write('%d %s' % (dead_pid(), socket.gethostname()))
+    os.makedirs(str(tmp_path / 'test-stale')) # partially saved constants of the crashed creator
+    open(str(tmp_path / 'test-stale' / 'peds.npy'), 'w').close()
+    assert ucc.is_stale_lock(flock, maxage=600)
+    d = ucc.shared_arrays('test-stale', constants, dirshm=str(tmp_path), timeout=5)
+    assert isinstance(d['peds'], np.memmap) and np.array_equal(d['peds'], constants()['peds'])
+    assert ucc.lock_owner(flock)[0] == os.getpid()
+    # lock of alive process is stale if it is older than maxage
+    with open(flock, 'w') as f: f.write('%d %s' % (os.getppid(), socket.gethostname()))
+    assert not ucc.is_stale_lock(flock, maxage=600)
+    os.utime(flock, (0, os.stat(flock).st_mtime - 700))
+    assert ucc.is_stale_lock(flock, maxage=600)
+    assert not [name for name in os.listdir(str(tmp_path)) if '.stale-' in name]
+    ucc.remove_shared(str(tmp_path / 'test-stale'))
+
+
+def test_shared_arrays_creator_failure(tmp_path):
+    print(sys._getframe().f_code.co_name)
+    def failed(): raise IOError('missing constants')
+    try:
+        ucc.shared_arrays('test-failed', failed, dirshm=str(tmp_path))
+        assert False, 'exception is not re-raised'
+    except IOError: pass
+    assert not os.listdir(str(tmp_path))
+    d = ucc.shared_arrays('test-failed', constants, dirshm=str(tmp_path), timeout=5)
+    assert isinstance(d['peds'], np.memmap)
+    ucc.remove_shared(str(tmp_path / 'test-failed'))
+
+
+if __name__ == '__main__':
+  """DEBUGGING, WORKS ONLY FOR COMMAND: python Detector/test/pytest_shared_arrays.py"""
+  import tempfile, pathlib
+  test_shared_arrays_creator(pathlib.Path(tempfile.mkdtemp()))
+  test_shared_arrays_stale_lock(pathlib.Path(tempfile.mkdtemp()))
+  test_shared_arrays_creator_failure(pathlib.Path(tempfile.mkdtemp()))
+
+# EOF